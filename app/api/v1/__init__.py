@@ -6,7 +6,7 @@ Version 1 of the REST API endpoints.
 """
 
 from fastapi import APIRouter
-from .endpoints import auth, users, devices, ingest, tenants, audit, ws, users_admin, devices_admin, ota, admin_console, admin_enhanced
+from .endpoints import auth, users, devices, ingest, tenants, audit, ws, users_admin, devices_admin, ota, admin_console, admin_enhanced, dead_letters, alert_rules
 
 api_router = APIRouter()
 
@@ -14,6 +14,7 @@ api_router = APIRouter()
 api_router.include_router(auth.router, prefix="/auth", tags=["authentication"])
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(devices.router, prefix="/devices", tags=["devices"])
+api_router.include_router(alert_rules.router, prefix="/alert-rules", tags=["alert rules"])
 api_router.include_router(ingest.router, prefix="/ingest", tags=["data ingestion"])
 api_router.include_router(tenants.router, prefix="/tenants", tags=["tenants"])
 api_router.include_router(audit.router, prefix="/audit", tags=["audit"])
@@ -25,5 +26,6 @@ api_router.include_router(users_admin.router, prefix="/admin/users", tags=["admi
 api_router.include_router(devices_admin.router, prefix="/admin/devices", tags=["admin-devices"])
 api_router.include_router(audit.router, prefix="/admin/audit", tags=["admin-audit"])
 api_router.include_router(ota.router, prefix="/admin/ota", tags=["admin-ota"])
+api_router.include_router(dead_letters.router, prefix="/admin/dead-letters", tags=["admin-ingest"])
 api_router.include_router(admin_console.router, prefix="/admin", tags=["admin-console"])
 api_router.include_router(admin_enhanced.router, prefix="/admin", tags=["admin-enhanced"])
\ No newline at end of file
@@ -0,0 +1,174 @@
+# app/api/v1/endpoints/alert_rules.py
+"""
+Alert rule endpoints (tenant scoped).
+
+• CRUD for the tenant's alert rules, e.g. "temperature > 40 for 5 minutes".
+• Rules are checked by compiling them as the worker will; every change
+  tells the workers to reload the tenant's rules (`app.ingestion.alerts`).
+• Fired and resolved alerts are published on the `alert_new` Redis channel
+  and recorded in the audit log.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, List
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_current_user, get_session
+from app.core.config import settings
+from app.core.rbac import log_audit_event
+from app.core.redis import publish_alert_rules_changed
+from app.ingestion.alerts import compile_rule
+from app.models.alert import AlertRule
+from app.models.device import Device
+from app.models.user import User
+from app.schemas.alerts import AlertRuleCreate, AlertRuleOut, AlertRuleUpdate
+
+router = APIRouter()
+
+
+async def get_tenant_rule(session: AsyncSession, rule_id: UUID, current_user: User) -> AlertRule:
+    """The rule if it belongs to the user's tenant, else 404."""
+    result = await session.execute(
+        select(AlertRule).where(
+            AlertRule.id == rule_id,
+            AlertRule.tenant_id == current_user.tenant_id
+        )
+    )
+    rule = result.scalar_one_or_none()
+    if not rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Alert rule not found"
+        )
+    return rule
+
+
+async def check_rule(session: AsyncSession, rule: AlertRule, current_user: User) -> None:
+    """400 unless the rule compiles and its device belongs to the tenant."""
+    try:
+        compile_rule(rule)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if rule.device_id is not None:
+        result = await session.execute(
+            select(Device.id).where(
+                Device.id == UUID(rule.device_id),
+                Device.tenant_id == current_user.tenant_id
+            )
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Device not found"
+            )
+
+
+@router.get("", response_model=List[AlertRuleOut], tags=["Customer"])
+async def list_alert_rules(
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """Alert rules of the current tenant."""
+    result = await session.execute(
+        select(AlertRule)
+        .where(AlertRule.tenant_id == current_user.tenant_id)
+        .order_by(AlertRule.created_at)
+    )
+    return result.scalars().all()
+
+
+@router.post("", response_model=AlertRuleOut, status_code=status.HTTP_201_CREATED, tags=["Customer"])
+async def create_alert_rule(
+    body: AlertRuleCreate,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """Create an alert rule; the ingest workers pick it up within moments."""
+    count = (await session.execute(
+        select(func.count()).select_from(AlertRule).where(AlertRule.tenant_id == current_user.tenant_id)
+    )).scalar()
+    if count >= settings.ALERT_RULES_MAX_PER_TENANT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A tenant may define at most {settings.ALERT_RULES_MAX_PER_TENANT} alert rules"
+        )
+
+    values = body.model_dump()
+    if values["device_id"] is not None:
+        values["device_id"] = str(values["device_id"])
+    rule = AlertRule(tenant_id=current_user.tenant_id, **values)
+    await check_rule(session, rule, current_user)
+    session.add(rule)
+    await session.commit()
+    await session.refresh(rule)
+
+    await asyncio.to_thread(publish_alert_rules_changed, current_user.tenant_id)
+    await log_audit_event(
+        request, session, current_user, "create_alert_rule", "alert_rule", str(rule.id),
+        {"name": rule.name, "sensor_type": rule.sensor_type}
+    )
+    return rule
+
+
+@router.get("/{rule_id}", response_model=AlertRuleOut, tags=["Customer"])
+async def get_alert_rule(
+    rule_id: UUID,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """Get one alert rule."""
+    return await get_tenant_rule(session, rule_id, current_user)
+
+
+@router.put("/{rule_id}", response_model=AlertRuleOut, tags=["Customer"])
+async def update_alert_rule(
+    rule_id: UUID,
+    body: AlertRuleUpdate,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """Update an alert rule; its windowed state starts over."""
+    rule = await get_tenant_rule(session, rule_id, current_user)
+    changes = body.model_dump(exclude_unset=True)
+    if changes.get("device_id") is not None:
+        changes["device_id"] = str(changes["device_id"])
+    for field, value in changes.items():
+        setattr(rule, field, value)
+    rule.updated_at = datetime.utcnow()
+    await check_rule(session, rule, current_user)
+    await session.commit()
+    await session.refresh(rule)
+
+    await asyncio.to_thread(publish_alert_rules_changed, current_user.tenant_id)
+    await log_audit_event(
+        request, session, current_user, "update_alert_rule", "alert_rule", str(rule.id),
+        {"fields": sorted(changes)}
+    )
+    return rule
+
+
+@router.delete("/{rule_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Customer"])
+async def delete_alert_rule(
+    rule_id: UUID,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Response:
+    """Delete an alert rule."""
+    rule = await get_tenant_rule(session, rule_id, current_user)
+    await session.delete(rule)
+    await session.commit()
+
+    await asyncio.to_thread(publish_alert_rules_changed, current_user.tenant_id)
+    await log_audit_event(
+        request, session, current_user, "delete_alert_rule", "alert_rule", str(rule_id),
+        {"name": rule.name}
+    )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,145 @@
+# app/api/v1/endpoints/dead_letters.py
+"""
+Ingest dead-letter queue endpoints (system admin only).
+
+• Inspect MQTT messages the ingest worker rejected, with reason codes.
+• Bulk-replay them through the normal pipeline after a fix, rate-limited.
+• Purge entries that should never be replayed.
+"""
+
+import base64
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import redis.asyncio as aioredis
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_session, require_sys_admin
+from app.core.config import settings
+from app.core.rbac import log_audit_event
+from app.ingestion.deadletter import REASONS, DeadLetterQueue, mqtt_publisher
+from app.models.user import User
+from app.schemas.admin import (
+    DeadLetterList, DeadLetterOut, DeadLetterReplayRequest, DeadLetterReplayResult
+)
+
+limiter = Limiter(key_func=get_remote_address)
+
+router = APIRouter()
+
+PREVIEW_BYTES = 256
+
+
+async def get_dead_letter_queue() -> AsyncIterator[DeadLetterQueue]:
+    """Dead-letter queue on a short-lived async Redis connection."""
+    redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        yield DeadLetterQueue(redis_client)
+    finally:
+        await redis_client.aclose()
+
+
+def get_replay_publisher():
+    """Publisher context used to re-send dead letters (overridable in tests)."""
+    return mqtt_publisher()
+
+
+def check_reason(reason: Optional[str]) -> None:
+    if reason is not None and reason not in REASONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown reason code: {reason}"
+        )
+
+
+def to_dead_letter_out(entry: Dict[str, Any]) -> DeadLetterOut:
+    payload = entry["payload"]
+    return DeadLetterOut(
+        id=entry["id"],
+        topic=entry["topic"],
+        reason=entry["reason"],
+        error=entry["error"],
+        content_type=entry["content_type"],
+        received_at=entry["received_at"],
+        payload_size=len(payload),
+        payload_preview=payload[:PREVIEW_BYTES].decode("utf-8", errors="replace"),
+        payload_b64=base64.b64encode(payload).decode("ascii"),
+    )
+
+
+@router.get("", response_model=DeadLetterList)
+@limiter.limit("10/second")
+async def list_dead_letters(
+    request: Request,
+    reason: Optional[str] = Query(None, description="Filter by reason code"),
+    start: str = Query("-", description="Stream id to start from (inclusive)"),
+    limit: int = Query(100, ge=1, le=1000, description="Number of entries to return"),
+    queue: DeadLetterQueue = Depends(get_dead_letter_queue),
+    current_user: User = Depends(require_sys_admin)
+):
+    """List dead-lettered ingest messages, oldest first (system admin only)."""
+    check_reason(reason)
+    entries = await queue.entries(limit, reason, start)
+    return DeadLetterList(
+        total=await queue.size(),
+        items=[to_dead_letter_out(entry) for entry in entries]
+    )
+
+
+@router.post("/replay", response_model=DeadLetterReplayResult)
+@limiter.limit("1/second")
+async def replay_dead_letters(
+    request: Request,
+    body: DeadLetterReplayRequest,
+    queue: DeadLetterQueue = Depends(get_dead_letter_queue),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(require_sys_admin)
+):
+    """Re-publish dead letters to the broker at a bounded rate (system admin only)."""
+    check_reason(body.reason)
+    async with get_replay_publisher() as publish:
+        result = await queue.replay(
+            publish, count=body.limit, reason=body.reason, ids=body.ids, rate=body.rate
+        )
+
+    await log_audit_event(
+        request=request,
+        session=session,
+        user=current_user,
+        action="replay_dead_letters",
+        resource_type="dead_letter",
+        details={"reason": body.reason, "ids": body.ids, "limit": body.limit, **result}
+    )
+
+    return DeadLetterReplayResult(**result)
+
+
+@router.delete("", response_model=DeadLetterReplayResult)
+@limiter.limit("5/second")
+async def purge_dead_letters(
+    request: Request,
+    ids: Optional[List[str]] = Query(None, description="Specific entry ids"),
+    reason: Optional[str] = Query(None, description="Only entries with this reason code"),
+    limit: int = Query(1000, ge=1, le=10000, description="Max entries to delete"),
+    queue: DeadLetterQueue = Depends(get_dead_letter_queue),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(require_sys_admin)
+):
+    """Delete dead letters by id or reason (system admin only)."""
+    check_reason(reason)
+    if not ids:
+        ids = [entry["id"] for entry in await queue.entries(limit, reason)]
+    deleted = await queue.delete(ids)
+
+    await log_audit_event(
+        request=request,
+        session=session,
+        user=current_user,
+        action="purge_dead_letters",
+        resource_type="dead_letter",
+        details={"reason": reason, "deleted": deleted}
+    )
+
+    return DeadLetterReplayResult(deleted=deleted)
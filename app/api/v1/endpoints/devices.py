@@ -3,20 +3,35 @@
 Device management endpoints.
 
 • CRUD operations for IoT devices.
-• Device status monitoring.
+• Device status monitoring; current state of all devices from the shadow.
 • Device registration and configuration.
+• Telemetry history: raw rows, 1m/1h/1d rollups and time-bucket aggregates.
+• Last-N-minutes series, from in-memory ring buffers when they cover it.
+• Streaming history export as CSV, NDJSON, Arrow or Parquet.
+• History reads merge rows moved to the Parquet archive
+  (`app.ingestion.archive`) with the database.
 """
 
 from typing import Any, List, Optional, Dict
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import Session, select
 
 from app.api.deps import get_session, get_current_user, log_audit_event
+from app.core.config import settings
+from app.ingestion.archive import sensor_data_history_page
+from app.ingestion.readings import as_naive_utc
+from app.ingestion.rollups import DEFAULT_WINDOWS, RESOLUTIONS, query_rollups, to_columns
+from app.ingestion.shadow import get_device_shadow
 from app.models.device import Device
 from app.models.sensor import SensorData
 from app.models.user import User
+from app.services.downsample import downsample_sensor_data
+from app.services.export import FORMATS, format_available, stream_export
+from app.services.telemetry import aggregate_telemetry, from_epoch, parse_aggregates, parse_width, recent_readings
 
 router = APIRouter()
 
@@ -99,6 +114,47 @@ def create_device(
     }
 
 
+@router.get("/state", tags=["Customer"])
+async def get_devices_state(
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Current state of every device of the tenant in one call.
+
+    Latest value per sensor type and `last_seen` come from the device
+    shadow, so this is one device query and one shadow lookup whatever the
+    number of devices. Devices that have not reported since the shadow
+    started have `last_seen: null` and no sensors.
+    """
+    shadow = get_device_shadow()
+    if shadow is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Device shadow is disabled"
+        )
+    result = await session.execute(
+        select(Device.id, Device.name, Device.is_active)
+        .where(Device.tenant_id == current_user.tenant_id)
+        .order_by(Device.name)
+    )
+    devices = result.all()
+    states = await shadow.get_many([str(device_id) for device_id, _, _ in devices])
+    
+    return {
+        "devices": [
+            {
+                "id": str(device_id),
+                "name": name,
+                "is_active": is_active,
+                **states.get(str(device_id), {"last_seen": None, "sensors": {}})
+            }
+            for device_id, name, is_active in devices
+        ],
+        "total": len(devices)
+    }
+
+
 @router.get("/{device_id}", tags=["Customer"])
 def get_device(
     device_id: UUID,
@@ -250,54 +306,267 @@ def delete_device(
 
 
 @router.get("/{device_id}/sensor-data", tags=["Customer"])
-def get_device_sensor_data(
+async def get_device_sensor_data(
     device_id: UUID,
     from_time: Optional[datetime] = Query(None, description="Start time for data range"),
     to_time: Optional[datetime] = Query(None, description="End time for data range"),
-    limit: int = Query(100, le=1000, description="Maximum number of records to return"),
-    session: Session = Depends(get_session),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    sensor_type: Optional[str] = Query(None, description="Reading to downsample on (with max_points)"),
+    max_points: Optional[int] = Query(
+        None, ge=4, le=settings.DOWNSAMPLE_MAX_POINTS, description="Downsample the whole range to this many rows"
+    ),
+    downsample: str = Query("lttb", pattern="^(lttb|minmax)$", description="Downsampling algorithm"),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ) -> Any:
-    """Get sensor data history for a specific device."""
+    """
+    Get sensor data history for a specific device, newest first.
+
+    Pages with keyset cursors: pass `next_cursor` back as `cursor` to get
+    the following page; it is null on the last one.
+
+    With `max_points` (and `sensor_type`) the whole time range is instead
+    downsampled to at most `max_points` rows that keep the shape of that
+    reading's series, for charts; `limit` and `cursor` are then ignored.
+    """
     # First verify the device belongs to the user's tenant
-    device = session.exec(
+    device = await get_tenant_device(session, device_id, current_user)
+    from_time = as_naive_utc(from_time)
+    to_time = as_naive_utc(to_time)
+    
+    source_points = None
+    next_cursor = None
+    if max_points is not None:
+        if not sensor_type:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="max_points requires sensor_type"
+            )
+        sensor_data, source_points = await downsample_sensor_data(
+            session, str(device_id), sensor_type, max_points, downsample, from_time, to_time,
+            tenant_id=device.tenant_id
+        )
+    else:
+        # Build query for sensor data
+        query = select(SensorData).where(SensorData.device_id == str(device_id))
+        
+        # Add time range filters if provided
+        if from_time:
+            query = query.where(SensorData.timestamp >= from_time)
+        if to_time:
+            query = query.where(SensorData.timestamp <= to_time)
+        
+        try:
+            sensor_data, next_cursor = await sensor_data_history_page(
+                session, query, device.tenant_id, str(device_id), from_time, to_time, cursor, limit
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    
+    response = {
+        "device_id": str(device_id),
+        "device_name": device.name,
+        "data": [
+            {
+                "id": str(data.id),
+                "payload": data.payload,
+                "timestamp": data.timestamp.isoformat(),
+                "created_at": data.created_at.isoformat()
+            }
+            for data in sensor_data
+        ],
+        "total": len(sensor_data),
+        "next_cursor": next_cursor
+    }
+    if source_points is not None:
+        response["downsampled_from"] = source_points
+    return response
+
+
+async def get_tenant_device(session: AsyncSession, device_id: UUID, current_user: User) -> Device:
+    """The device if it belongs to the user's tenant, else 404."""
+    result = await session.execute(
         select(Device).where(
             Device.id == device_id,
             Device.tenant_id == current_user.tenant_id
         )
-    ).first()
-    
+    )
+    device = result.scalar_one_or_none()
     if not device:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Device not found"
         )
+    return device
+
+
+@router.get("/{device_id}/sensor-data/rollups", tags=["Customer"])
+async def get_device_sensor_rollups(
+    device_id: UUID,
+    resolution: str = Query("1h", pattern="^(1m|1h|1d)$", description="Bucket width: 1m, 1h or 1d"),
+    from_time: Optional[datetime] = Query(None, description="Start time (default depends on resolution)"),
+    to_time: Optional[datetime] = Query(None, description="End time (default now)"),
+    sensor_type: Optional[str] = Query(None, description="Only this sensor type"),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Pre-aggregated sensor history for charts.
+
+    Served from the incrementally maintained rollups, so the cost depends on
+    the number of buckets, not of raw readings. Each series is columnar:
+    parallel `bucket`, `count`, `min`, `max`, `avg`, `sum` and `last` arrays.
+    """
+    device = await get_tenant_device(session, device_id, current_user)
     
-    # Build query for sensor data
-    query = select(SensorData).where(SensorData.device_id == str(device_id))
+    to_time = as_naive_utc(to_time) or datetime.utcnow()
+    from_time = as_naive_utc(from_time) or to_time - DEFAULT_WINDOWS[resolution]
+    if from_time >= to_time:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from_time must be before to_time"
+        )
+    buckets = (to_time - from_time) / RESOLUTIONS[resolution]
+    if buckets > settings.ROLLUP_QUERY_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range spans {int(buckets)} buckets; max {settings.ROLLUP_QUERY_MAX_BUCKETS} at {resolution}"
+        )
     
-    # Add time range filters if provided
-    if from_time:
-        query = query.where(SensorData.timestamp >= from_time)
-    if to_time:
-        query = query.where(SensorData.timestamp <= to_time)
+    rollups = await query_rollups(session, str(device_id), resolution, from_time, to_time, sensor_type)
+    return {
+        "device_id": str(device_id),
+        "device_name": device.name,
+        "resolution": resolution,
+        "from_time": from_time.isoformat(),
+        "to_time": to_time.isoformat(),
+        "series": to_columns(rollups)
+    }
+
+
+@router.get("/{device_id}/sensor-data/aggregate", tags=["Customer"])
+async def get_device_sensor_aggregate(
+    device_id: UUID,
+    sensor_type: str = Query(..., description="Sensor type to aggregate"),
+    bucket: str = Query("5m", description="Bucket width, e.g. 30s, 5m, 1h, 1d or seconds"),
+    aggregates: str = Query("avg,min,max,count", description="Comma-separated: avg, min, max, sum, count, pNN"),
+    from_time: Optional[datetime] = Query(None, description="Start time (default 24 hours before to_time)"),
+    to_time: Optional[datetime] = Query(None, description="End time (default now)"),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Aggregate one sensor type into fixed-width time buckets.
+
+    Whole-minute widths without percentiles are merged from the rollups;
+    anything else is aggregated in the database on PostgreSQL, or in the API
+    when the range reaches rows moved to the Parquet archive. The response
+    is columnar: `bucket` plus one parallel array per requested aggregate.
+    """
+    device = await get_tenant_device(session, device_id, current_user)
     
-    # Order by timestamp descending and limit results
-    query = query.order_by(SensorData.timestamp.desc()).limit(limit)
+    try:
+        width = parse_width(bucket)
+        names = parse_aggregates(aggregates)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    to_time = as_naive_utc(to_time) or datetime.utcnow()
+    from_time = as_naive_utc(from_time) or to_time - timedelta(days=1)
+    if from_time >= to_time:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from_time must be before to_time"
+        )
+    buckets = (to_time - from_time).total_seconds() / width
+    if buckets > settings.ROLLUP_QUERY_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range spans {int(buckets)} buckets; max {settings.ROLLUP_QUERY_MAX_BUCKETS}"
+        )
     
-    sensor_data = session.exec(query).all()
+    result = await aggregate_telemetry(
+        session, str(device_id), sensor_type, from_time, to_time, width, names, tenant_id=device.tenant_id
+    )
+    return {
+        "device_id": str(device_id),
+        "device_name": device.name,
+        "sensor_type": sensor_type,
+        "bucket_seconds": width,
+        "from_time": from_time.isoformat(),
+        "to_time": to_time.isoformat(),
+        **result
+    }
+
+
+@router.get("/{device_id}/sensor-data/recent", tags=["Customer"])
+async def get_device_recent_readings(
+    device_id: UUID,
+    sensor_type: str = Query(..., description="Sensor type to read"),
+    minutes: int = Query(15, ge=1, le=1440, description="How far back to read"),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Raw readings of one sensor type over the last `minutes`, oldest first.
+
+    Answered from the API's in-memory ring buffers when they hold the whole
+    range (`source` is "memory"), otherwise from the database. The response
+    is columnar: parallel `timestamp` and `value` arrays.
+    """
+    device = await get_tenant_device(session, device_id, current_user)
     
+    to_time = datetime.utcnow()
+    from_time = to_time - timedelta(minutes=minutes)
+    source, epochs, values = await recent_readings(session, str(device_id), sensor_type, from_time, to_time)
     return {
         "device_id": str(device_id),
         "device_name": device.name,
-        "data": [
-            {
-                "id": str(data.id),
-                "payload": data.payload,
-                "timestamp": data.timestamp.isoformat(),
-                "created_at": data.created_at.isoformat()
-            }
-            for data in sensor_data
-        ],
-        "total": len(sensor_data)
-    }
\ No newline at end of file
+        "sensor_type": sensor_type,
+        "from_time": from_time.isoformat(),
+        "to_time": to_time.isoformat(),
+        "source": source,
+        "timestamp": [from_epoch(epoch).isoformat() for epoch in epochs],
+        "value": values
+    }
+
+
+@router.get("/{device_id}/sensor-data/export", tags=["Customer"])
+async def export_device_sensor_data(
+    device_id: UUID,
+    format: str = Query("csv", pattern="^(csv|ndjson|arrow|parquet)$", description="csv, ndjson, arrow or parquet"),
+    from_time: Optional[datetime] = Query(None, description="Start time (default: all history)"),
+    to_time: Optional[datetime] = Query(None, description="End time (default: now)"),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Stream a device's complete sensor history, oldest first.
+
+    Rows are read through a server-side cursor and streamed chunk by chunk,
+    so there is no row cap and memory stays constant. Closing the
+    connection cancels the export. Archived rows come first.
+    """
+    device = await get_tenant_device(session, device_id, current_user)
+    
+    if not format_available(format):
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=f"{format} export requires pyarrow"
+        )
+    from_time = as_naive_utc(from_time)
+    to_time = as_naive_utc(to_time)
+    media_type, extension = FORMATS[format]
+    return StreamingResponse(
+        stream_export(
+            session, format, str(device_id), from_time, to_time, settings.EXPORT_CHUNK_ROWS, tenant_id=device.tenant_id
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="sensor-data-{device_id}.{extension}"'}
+    )
\ No newline at end of file
@@ -7,6 +7,7 @@ Admin device management endpoints.
 • Tenant-scoped device administration.
 """
 
+import asyncio
 import json
 from typing import Any, List, Optional, Dict
 from uuid import UUID
@@ -18,6 +19,7 @@ from app.api.deps import get_session, get_current_user, require_admin
 from app.models.device import Device
 from app.models.user import User
 from app.core.rbac import log_audit_event
+from app.core.redis import publish_cache_invalidation
 
 router = APIRouter()
 
@@ -188,6 +190,7 @@ async def update_device(
     session.add(device)
     await session.commit()
     await session.refresh(device)
+    await asyncio.to_thread(publish_cache_invalidation, "device", str(device_id))
     
     await log_audit_event(
         request=request,
@@ -235,6 +238,7 @@ async def delete_device(
     
     await session.delete(device)
     await session.commit()
+    await asyncio.to_thread(publish_cache_invalidation, "device", str(device_id))
     
     await log_audit_event(
         request=request,
@@ -5,20 +5,79 @@ Data ingestion endpoints.
 • Receive sensor data from IoT devices.
 • Store sensor readings in database.
 • Validate and process incoming data.
+• Request bodies are decoded by Content-Type through the codec registry.
+• `/batch` takes many readings for many devices as a JSON array or an
+  NDJSON stream, validated with one query and stored with one INSERT.
+• Request bodies may be gzip/deflate/zstd compressed (`Content-Encoding`);
+  they are inflated while streaming, with a decompressed-size cap.
+• With write-behind enabled, `/ingest` and the health beacon answer
+  202 Accepted once the reading is buffered; it is stored in bulk later.
+• Reading history pages with keyset cursors (`app.db.pagination`), or is
+  downsampled for charts with `max_points`; compacted readings
+  (`app.ingestion.blocks`) are merged in transparently.
 """
 
-from typing import Any
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_session, get_current_user
+from app.core.codecs import codec_for_content_type, is_ndjson, iter_ndjson
+from app.core.compression import DecompressingRoute
+from app.core.config import settings
+from app.ingestion.blocks import sensor_history_page
+from app.ingestion.readings import (
+    as_naive_utc, build_reading_row, fetch_device_status, insert_readings, readings_committed
+)
+from app.ingestion.write_behind import WriteBehindFlusher, get_write_behind
 from app.models.sensor import Sensor
+from app.services.downsample import downsample_sensors
 from app.models.device import Device
 from sqlmodel import select
 from uuid import UUID
 from datetime import datetime
 
-router = APIRouter()
+router = APIRouter(route_class=DecompressingRoute)
+
+
+async def decode_body(request: Request) -> dict:
+    """Decode the request body with the codec matching its Content-Type."""
+    try:
+        codec = codec_for_content_type(request.headers.get("content-type"))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(e)
+        )
+    raw = await request.body()
+    try:
+        body = codec.decode(raw)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid {codec.name} body"
+        )
+    if not isinstance(body, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Request body must be an object"
+        )
+    return body
+
+
+async def enqueue_readings(write_behind: WriteBehindFlusher, rows: List[Dict[str, Any]], response: Response) -> None:
+    """Buffer rows for a bulk write and mark the response 202 Accepted."""
+    try:
+        accepted = await write_behind.enqueue(rows)
+    except Exception:
+        accepted = False
+    if not accepted:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingest buffer is full, retry later",
+            headers={"Retry-After": "1"}
+        )
+    response.status_code = status.HTTP_202_ACCEPTED
 
 
 @router.post("/ingest")
@@ -26,11 +85,17 @@ async def ingest_sensor_data(
     device_id: str,
     sensor_type: str,
     value: float,
+    response: Response,
     unit: str = "",
     metadata: str = None,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    write_behind: Optional[WriteBehindFlusher] = Depends(get_write_behind)
 ) -> Any:
-    """Ingest sensor data from IoT devices."""
+    """
+    Ingest sensor data from IoT devices.
+
+    In write-behind mode the reading is buffered and 202 is returned.
+    """
     
     try:
         device_uuid = UUID(device_id)
@@ -56,6 +121,25 @@ async def ingest_sensor_data(
             detail="Device is not active"
         )
     
+    if write_behind is not None:
+        row = build_reading_row({
+            "device_id": device_id,
+            "sensor_type": sensor_type,
+            "value": value,
+            "unit": unit,
+            "metadata": metadata,
+        })
+        await enqueue_readings(write_behind, [row], response)
+        return {
+            "id": str(row["id"]),
+            "device_id": row["device_id"],
+            "sensor_type": row["sensor_type"],
+            "value": row["value"],
+            "unit": row["unit"],
+            "timestamp": row["timestamp"],
+            "status": "accepted"
+        }
+    
     # Create sensor reading
     sensor = Sensor(
         device_id=str(device_uuid),
@@ -65,9 +149,10 @@ async def ingest_sensor_data(
         sensor_metadata=metadata
     )
     
-    session.add(sensor)
+    # Stored through the set-based writer so the rollups follow
+    inserted = await insert_readings(session, [sensor.model_dump()])
     await session.commit()
-    await session.refresh(sensor)
+    await readings_committed(inserted)
     
     return {
         "id": str(sensor.id),
@@ -81,7 +166,7 @@ async def ingest_sensor_data(
 
 @router.post("/")
 async def ingest_sensor_data_json(
-    payload: dict = Body(...),
+    payload: dict = Depends(decode_body),
     session: AsyncSession = Depends(get_session),
     current_user = Depends(get_current_user)
 ) -> Any:
@@ -130,10 +215,11 @@ async def ingest_sensor_data_json(
             unit=sensor_data.get("unit", ""),
             sensor_metadata=str(sensor_data.get("metadata", ""))
         )
-        session.add(sensor)
         sensors.append(sensor)
     
+    inserted = await insert_readings(session, [sensor.model_dump() for sensor in sensors])
     await session.commit()
+    await readings_committed(inserted)
     
     return {
         "status": "success",
@@ -143,17 +229,117 @@ async def ingest_sensor_data_json(
     }
 
 
+async def read_batch_items(request: Request) -> List[Any]:
+    """Read batch items from an NDJSON stream or an encoded array body."""
+    max_items = settings.INGEST_HTTP_BATCH_MAX_ITEMS
+    content_type = request.headers.get("content-type")
+    if is_ndjson(content_type):
+        items = []
+        try:
+            async for item in iter_ndjson(request.stream()):
+                items.append(item)
+                if len(items) > max_items:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Batch exceeds {max_items} items"
+                    )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return items
+
+    try:
+        codec = codec_for_content_type(content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    raw = await request.body()
+    try:
+        items = codec.decode(raw)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid {codec.name} body")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request body must be an array")
+    if len(items) > max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {max_items} items"
+        )
+    return items
+
+
+@router.post("/batch")
+async def ingest_sensor_data_batch(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    current_user = Depends(get_current_user)
+) -> Any:
+    """
+    Ingest readings for many devices in one request.
+
+    The body is a JSON (or MessagePack/CBOR) array, or an NDJSON stream with
+    one reading per line. Each item gets its own status; valid readings for
+    existing, active devices are stored even when other items fail.
+    """
+    items = await read_batch_items(request)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    
+    # Validate items
+    candidates = []
+    for index, item in enumerate(items):
+        try:
+            candidates.append((index, build_reading_row(item)))
+        except ValueError as e:
+            results[index] = {"index": index, "status": "error", "detail": str(e)}
+    
+    # Verify all devices with one set-based query
+    devices = await fetch_device_status(session, {row["device_id"] for _, row in candidates})
+    rows = []
+    for index, row in candidates:
+        is_active = devices.get(row["device_id"])
+        if is_active is None:
+            results[index] = {"index": index, "status": "error", "detail": "Device not found"}
+        elif not is_active:
+            results[index] = {"index": index, "status": "error", "detail": "Device is not active"}
+        else:
+            rows.append(row)
+            results[index] = {"index": index, "status": "ok", "id": str(row["id"])}
+    
+    # Store all accepted readings with one bulk insert
+    inserted = await insert_readings(session, rows)
+    await session.commit()
+    await readings_committed(inserted)
+    
+    return {
+        "accepted": len(rows),
+        "rejected": len(items) - len(rows),
+        "items": results
+    }
+
+
 @router.get("/sensors/{device_id}")
 async def get_device_sensors(
     device_id: str,
+    response: Response,
     sensor_type: str = None,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    from_time: Optional[datetime] = Query(None, description="Start time (with max_points)"),
+    to_time: Optional[datetime] = Query(None, description="End time (with max_points)"),
+    max_points: Optional[int] = Query(
+        None, ge=4, le=settings.DOWNSAMPLE_MAX_POINTS, description="Downsample the whole range to this many readings"
+    ),
+    downsample: str = Query("lttb", pattern="^(lttb|minmax)$", description="Downsampling algorithm"),
     session: AsyncSession = Depends(get_session)
 ) -> Any:
-    """Get sensor readings for a specific device."""
-    from sqlmodel import select
-    from uuid import UUID
-    
+    """
+    Get sensor readings for a specific device, newest first.
+
+    Pages with keyset cursors; the cursor of the next page is returned in
+    the `X-Next-Cursor` header (absent on the last page).
+
+    With `max_points` (and `sensor_type`) the readings between `from_time`
+    and `to_time` are instead downsampled to at most `max_points` for
+    charts; `X-Downsampled-From` gives the number of readings in the range.
+    """
     try:
         device_uuid = UUID(device_id)
     except ValueError:
@@ -162,15 +348,34 @@ async def get_device_sensors(
             detail="Invalid device ID format"
         )
     
-    # Build query
-    query = select(Sensor).where(Sensor.device_id == device_uuid)
-    if sensor_type:
-        query = query.where(Sensor.sensor_type == sensor_type)
-    
-    query = query.order_by(Sensor.timestamp.desc()).limit(limit)
-    
-    result = await session.execute(query)
-    sensors = result.scalars().all()
+    if max_points is not None:
+        if not sensor_type:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="max_points requires sensor_type"
+            )
+        sensors, source_points = await downsample_sensors(
+            session, str(device_uuid), sensor_type, max_points, downsample,
+            as_naive_utc(from_time), as_naive_utc(to_time)
+        )
+        response.headers["X-Downsampled-From"] = str(source_points)
+    else:
+        # Build query
+        query = select(Sensor).where(Sensor.device_id == str(device_uuid))
+        if sensor_type:
+            query = query.where(Sensor.sensor_type == sensor_type)
+        
+        try:
+            sensors, next_cursor = await sensor_history_page(
+                session, query, str(device_uuid), sensor_type, cursor, limit
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = next_cursor
     
     return [
         {
@@ -187,8 +392,10 @@ async def get_device_sensors(
 
 @router.post("/root/v1/health")
 async def post_health_beacon(
-    body: dict = Body(...),
-    session: AsyncSession = Depends(get_session)
+    response: Response,
+    body: dict = Depends(decode_body),
+    session: AsyncSession = Depends(get_session),
+    write_behind: Optional[WriteBehindFlusher] = Depends(get_write_behind)
 ) -> Any:
     """Accept health beacon data from root-app and store as sensor readings."""
     # Validate required fields
@@ -209,12 +416,21 @@ async def post_health_beacon(
         raise HTTPException(status_code=400, detail="Device is not active")
     # Store each health metric as a sensor reading
     now = datetime.utcnow()
+    if write_behind is not None:
+        rows = [
+            build_reading_row({"device_id": str(device_uuid), "sensor_type": sensor_type, "value": float(body.get(field) or 0.0), "unit": unit})
+            for field, sensor_type, unit in (("batteryPercent", "battery", "%"), ("lteRssi", "lteRssi", "dBm"), ("wifiRssi", "wifiRssi", "dBm"))
+        ]
+        for row in rows:
+            row["timestamp"] = now
+        await enqueue_readings(write_behind, rows, response)
+        return {"status": "accepted"}
     readings = [
         Sensor(device_id=str(device_uuid), sensor_type="battery", value=float(body.get("batteryPercent") or 0.0), unit="%", timestamp=now),
         Sensor(device_id=str(device_uuid), sensor_type="lteRssi", value=float(body.get("lteRssi") or 0.0), unit="dBm", timestamp=now),
         Sensor(device_id=str(device_uuid), sensor_type="wifiRssi", value=float(body.get("wifiRssi") or 0.0), unit="dBm", timestamp=now),
     ]
-    for sensor in readings:
-        session.add(sensor)
+    inserted = await insert_readings(session, [sensor.model_dump() for sensor in readings])
     await session.commit()
+    await readings_committed(inserted)
     return {"status": "ok"}
\ No newline at end of file
@@ -9,6 +9,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlmodel import Session, select
 
 from app.api.deps import get_session, require_sys_admin, log_audit_event
+from app.core.redis import publish_cache_invalidation
 from app.models.tenant import Tenant
 from app.models.user import User
 
@@ -104,12 +105,16 @@ def update_tenant(
             )
     
     # Update fields
+    old_name = tenant.name
     tenant.name = tenant_update.name
     tenant.plan = tenant_update.plan
     
     session.add(tenant)
     session.commit()
     session.refresh(tenant)
+    publish_cache_invalidation("tenant", old_name)
+    if tenant.name != old_name:
+        publish_cache_invalidation("tenant", tenant.name)
     
     if request:
         log_audit_event(
@@ -155,6 +160,7 @@ def delete_tenant(
     
     session.delete(tenant)
     session.commit()
+    publish_cache_invalidation("tenant", tenant.name)
     
     if request:
         log_audit_event(
@@ -0,0 +1,243 @@
+# app/core/codecs.py
+"""
+Payload codec registry.
+
+• JSON (orjson when installed), MessagePack and CBOR (when installed).
+• "compact": fixed-layout binary struct for constrained devices.
+• Codecs are looked up by name (MQTT topic suffix) or by content type.
+• NDJSON streams are parsed incrementally, one JSON value per line.
+"""
+
+import json
+import struct
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on installed extras
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depends on installed extras
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover - depends on installed extras
+    cbor2 = None
+
+
+# ─────────────────── Fast JSON ─────────────────────────── #
+
+if orjson is not None:
+    def json_loads(data: Any) -> Any:
+        """Parse JSON from str or bytes."""
+        return orjson.loads(data)
+
+    def json_dumps(obj: Any) -> str:
+        """Serialize to a compact JSON string."""
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    def json_loads(data: Any) -> Any:
+        """Parse JSON from str or bytes."""
+        return json.loads(data)
+
+    def json_dumps(obj: Any) -> str:
+        """Serialize to a compact JSON string."""
+        return json.dumps(obj, separators=(",", ":"))
+
+
+# ─────────────────── Registry ──────────────────────────── #
+
+class Codec:
+    """
+    A named payload format with its MIME content types.
+
+    `generic` codecs can encode any JSON-compatible value; the others only
+    encode the ingest payload shape.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        content_types: List[str],
+        decode: Callable[[bytes], Any],
+        encode: Callable[[Any], bytes],
+        binary: bool = True,
+        generic: bool = True,
+    ):
+        self.name = name
+        self.content_types = content_types
+        self.decode = decode
+        self.encode = encode
+        self.binary = binary
+        self.generic = generic
+
+
+_codecs: Dict[str, Codec] = {}
+_content_types: Dict[str, Codec] = {}
+
+DEFAULT_CODEC = "json"
+
+
+def register_codec(codec: Codec) -> None:
+    """Make a codec available by name and by each of its content types."""
+    _codecs[codec.name] = codec
+    for content_type in codec.content_types:
+        _content_types[content_type] = codec
+
+
+def available_codecs(generic_only: bool = False) -> List[str]:
+    """Names of all registered codecs, optionally only the generic ones."""
+    return sorted(name for name, codec in _codecs.items() if codec.generic or not generic_only)
+
+
+def get_codec(name: Optional[str] = None) -> Codec:
+    """Look up a codec by name; None selects JSON. Raises ValueError if unknown."""
+    codec = _codecs.get((name or DEFAULT_CODEC).lower())
+    if codec is None:
+        raise ValueError(f"Unsupported codec: {name}")
+    return codec
+
+
+def codec_for_content_type(content_type: Optional[str]) -> Codec:
+    """Look up a codec by Content-Type header (parameters ignored); None selects JSON."""
+    if not content_type:
+        return get_codec()
+    mime = content_type.split(";", 1)[0].strip().lower()
+    codec = _content_types.get(mime)
+    if codec is None:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    return codec
+
+
+# ─────────────────── NDJSON streams ────────────────────── #
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def is_ndjson(content_type: Optional[str]) -> bool:
+    """True if a Content-Type header names newline-delimited JSON."""
+    return bool(content_type) and content_type.split(";", 1)[0].strip().lower() in NDJSON_CONTENT_TYPES
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """
+    Yield one decoded value per non-blank line of a chunked byte stream.
+
+    Raises ValueError naming the line number of the first invalid line.
+    """
+    buffer = b""
+    line_no = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                try:
+                    yield json_loads(line)
+                except ValueError as e:
+                    raise ValueError(f"Invalid JSON on line {line_no}: {e}")
+    if buffer.strip():
+        try:
+            yield json_loads(buffer)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON on line {line_no + 1}: {e}")
+
+
+# ─────────────────── Compact struct format ─────────────── #
+#
+# Little-endian layout:
+#   uint8   version (1)
+#   uint32  unix timestamp (seconds)
+#   uint8   reading count N
+#   N × (uint8 sensor type code, float32 value)
+#
+# 6 + 5·N bytes, versus ~60 bytes per reading as JSON.
+
+COMPACT_VERSION = 1
+COMPACT_HEADER = struct.Struct("<BIB")
+COMPACT_READING = struct.Struct("<Bf")
+COMPACT_SENSOR_TYPES = {
+    1: "temperature",
+    2: "humidity",
+    3: "battery",
+    4: "motion",
+    5: "lteRssi",
+    6: "wifiRssi",
+    7: "pressure",
+    8: "voltage",
+}
+COMPACT_SENSOR_CODES = {name: code for code, name in COMPACT_SENSOR_TYPES.items()}
+
+
+def decode_compact(data: bytes) -> Dict[str, Any]:
+    """Decode a compact struct payload into the JSON ingest shape."""
+    try:
+        version, timestamp, count = COMPACT_HEADER.unpack_from(data, 0)
+    except struct.error as e:
+        raise ValueError(f"Invalid compact payload: {e}")
+    if version != COMPACT_VERSION:
+        raise ValueError(f"Unsupported compact payload version: {version}")
+    if len(data) != COMPACT_HEADER.size + count * COMPACT_READING.size:
+        raise ValueError("Invalid compact payload length")
+
+    sensor_data = []
+    for code, value in COMPACT_READING.iter_unpack(data[COMPACT_HEADER.size:]):
+        sensor_data.append({
+            "sensor_type": COMPACT_SENSOR_TYPES.get(code, f"type_{code}"),
+            "value": value,
+        })
+    return {
+        "timestamp": datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat(),
+        "sensor_data": sensor_data,
+    }
+
+
+def encode_compact(payload: Dict[str, Any]) -> bytes:
+    """Encode `{"timestamp", "sensor_data": [{"sensor_type", "value"}]}` as compact struct."""
+    timestamp = payload.get("timestamp")
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+    elif isinstance(timestamp, datetime):
+        timestamp = timestamp.timestamp()
+    readings = payload.get("sensor_data", [])
+
+    parts = [COMPACT_HEADER.pack(COMPACT_VERSION, int(timestamp or 0), len(readings))]
+    for reading in readings:
+        code = COMPACT_SENSOR_CODES.get(reading["sensor_type"])
+        if code is None:
+            raise ValueError(f"Sensor type not encodable in compact format: {reading['sensor_type']}")
+        parts.append(COMPACT_READING.pack(code, float(reading["value"])))
+    return b"".join(parts)
+
+
+# ─────────────────── Built-in codecs ───────────────────── #
+
+register_codec(Codec(
+    "json", ["application/json", "text/json"],
+    decode=json_loads,
+    encode=lambda obj: json_dumps(obj).encode("utf-8"),
+    binary=False,
+))
+register_codec(Codec(
+    "compact", ["application/vnd.smartsecurity.compact"],
+    decode=decode_compact,
+    encode=encode_compact,
+    generic=False,
+))
+if msgpack is not None:
+    register_codec(Codec(
+        "msgpack", ["application/msgpack", "application/x-msgpack", "application/vnd.msgpack"],
+        decode=lambda data: msgpack.unpackb(data, raw=False),
+        encode=lambda obj: msgpack.packb(obj, use_bin_type=True),
+    ))
+if cbor2 is not None:
+    register_codec(Codec(
+        "cbor", ["application/cbor"],
+        decode=cbor2.loads,
+        encode=cbor2.dumps,
+    ))
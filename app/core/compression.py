@@ -0,0 +1,263 @@
+# app/core/compression.py
+"""
+Transparent request-body decompression (`Content-Encoding`).
+
+• gzip and deflate always; zstd when the `zstandard` package is installed.
+• Streaming: bodies are inflated chunk by chunk as they arrive, so NDJSON
+  consumers keep their incremental parsing.
+• Zip-bomb guard: output is produced in bounded pieces and the request is
+  rejected with 413 as soon as it would exceed the decompressed-size cap.
+• `DecompressingRoute` applies this to every route of a router.
+"""
+
+import zlib
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+from fastapi import HTTPException, Request, status
+from fastapi.routing import APIRoute
+
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on installed extras
+    zstandard = None
+
+# Largest piece of output produced from one step of a decompressor
+OUTPUT_CHUNK = 64 * 1024
+
+DECOMPRESS_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+class DecompressedTooLarge(Exception):
+    """Raised when a body inflates past the configured size cap."""
+
+
+class _ZlibDecoder:
+    """gzip/deflate decoder whose output per step is bounded by `OUTPUT_CHUNK`."""
+
+    def __init__(self, wbits: int):
+        self._inflater = zlib.decompressobj(wbits)
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        while data:
+            out = self._inflater.decompress(data, OUTPUT_CHUNK)
+            data = self._inflater.unconsumed_tail
+            if out:
+                yield out
+
+    def finish(self) -> Iterator[bytes]:
+        out = self._inflater.flush()
+        if out:
+            yield out
+        if not self._inflater.eof:
+            raise zlib.error("Truncated compressed body")
+
+
+ZSTD_MAGIC = 0xFD2FB528
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A50  # low 4 bits are free
+
+
+class _ZstdFrames:
+    """Walks zstd frame and block headers to tell whether the input ends on a frame boundary."""
+
+    def __init__(self):
+        self._state = "magic"
+        self._need = 4  # size of the header being collected
+        self._header = b""
+        self._skip = 0  # block or skippable-frame bytes still to pass over
+        self._checksum = False
+        self.frames = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.frames > 0 and self._state == "magic" and not self._header and not self._skip
+
+    def feed(self, data: bytes) -> None:
+        pos = 0
+        while pos < len(data):
+            if self._skip:
+                step = min(self._skip, len(data) - pos)
+                self._skip -= step
+                pos += step
+                continue
+            take = min(self._need - len(self._header), len(data) - pos)
+            self._header += data[pos:pos + take]
+            pos += take
+            if len(self._header) == self._need:
+                header, self._header = self._header, b""
+                self._advance(header)
+
+    def _expect(self, state: str, need: int) -> None:
+        self._state, self._need = state, need
+
+    def _advance(self, header: bytes) -> None:
+        value = int.from_bytes(header, "little")
+        if self._state == "magic":
+            if value == ZSTD_MAGIC:
+                self._expect("descriptor", 1)
+            elif value & ~0xF == ZSTD_SKIPPABLE_MAGIC:
+                self._expect("skippable", 4)
+            else:
+                raise zstandard.ZstdError("Unknown zstd frame")
+        elif self._state == "skippable":
+            self._skip = value
+            self._expect("magic", 4)
+        elif self._state == "descriptor":
+            single_segment = value >> 5 & 1
+            self._checksum = bool(value >> 2 & 1)
+            rest = (
+                (0 if single_segment else 1)  # window descriptor
+                + (0, 1, 2, 4)[value & 3]  # dictionary id
+                + (single_segment, 2, 4, 8)[value >> 6]  # content size
+            )
+            if rest:
+                self._expect("header", rest)
+            else:
+                self._expect("block", 3)
+        elif self._state == "header":
+            self._expect("block", 3)
+        elif self._state == "block":
+            # RLE blocks carry one byte; raw and compressed blocks their size
+            self._skip = 1 if value >> 1 & 3 == 1 else value >> 3
+            if not value & 1:
+                self._expect("block", 3)
+            elif self._checksum:
+                self._expect("checksum", 4)
+            else:
+                self.frames += 1
+                self._expect("magic", 4)
+        else:  # checksum
+            self.frames += 1
+            self._expect("magic", 4)
+
+
+class _ZstdDecoder:
+    """zstd decoder; its output sink raises as soon as the cap is crossed."""
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._total = 0
+        self._pending: List[bytes] = []
+        self._writer = zstandard.ZstdDecompressor().stream_writer(self, write_size=OUTPUT_CHUNK)
+        # The writer does not report the end of a frame
+        self._frames = _ZstdFrames()
+
+    def write(self, data: bytes) -> int:
+        self._total += len(data)
+        if self._total > self._limit:
+            raise DecompressedTooLarge()
+        self._pending.append(data)
+        return len(data)
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        self._writer.write(data)
+        self._frames.feed(data)
+        pending, self._pending = self._pending, []
+        return iter(pending)
+
+    def finish(self) -> Iterator[bytes]:
+        if not self._frames.complete:
+            raise zstandard.ZstdError("Truncated compressed body")
+        return iter(())
+
+
+def _decoder_factories() -> dict:
+    factories = {
+        "gzip": lambda limit: _ZlibDecoder(16 + zlib.MAX_WBITS),
+        "x-gzip": lambda limit: _ZlibDecoder(16 + zlib.MAX_WBITS),
+        # RFC 9110 "deflate" is zlib-wrapped; a gzip header is tolerated too
+        "deflate": lambda limit: _ZlibDecoder(32 + zlib.MAX_WBITS),
+    }
+    if zstandard is not None:
+        factories["zstd"] = _ZstdDecoder
+    return factories
+
+
+DECODERS = _decoder_factories()
+
+
+def supported_encodings() -> List[str]:
+    """Content-Encoding values the ingest endpoints accept."""
+    return sorted(DECODERS)
+
+
+def parse_content_encoding(header: Optional[str]) -> List[str]:
+    """Codings in the order they were applied, without "identity"."""
+    if not header:
+        return []
+    codings = [coding.strip().lower() for coding in header.split(",")]
+    return [coding for coding in codings if coding and coding != "identity"]
+
+
+async def decompress_stream(chunks: AsyncIterator[bytes], coding: str, limit: int) -> AsyncIterator[bytes]:
+    """
+    Inflate an async stream of compressed chunks.
+
+    Raises ValueError for an unknown coding or corrupt data and
+    DecompressedTooLarge once more than `limit` bytes would be produced.
+    """
+    factory: Optional[Callable] = DECODERS.get(coding)
+    if factory is None:
+        raise ValueError(f"Unsupported Content-Encoding: {coding}")
+    decoder = factory(limit)
+    total = 0
+    try:
+        async for chunk in chunks:
+            for out in decoder.feed(chunk):
+                total += len(out)
+                if total > limit:
+                    raise DecompressedTooLarge()
+                yield out
+        for out in decoder.finish():
+            total += len(out)
+            if total > limit:
+                raise DecompressedTooLarge()
+            yield out
+    except DECOMPRESS_ERRORS as e:
+        raise ValueError(f"Invalid {coding} body: {e}")
+
+
+class DecompressedRequest(Request):
+    """Request whose body stream is transparently decompressed."""
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        codings = parse_content_encoding(self.headers.get("content-encoding"))
+        if not codings or hasattr(self, "_body"):
+            async for chunk in super().stream():
+                yield chunk
+            return
+
+        unsupported = [coding for coding in codings if coding not in DECODERS]
+        if unsupported:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Unsupported Content-Encoding: {', '.join(unsupported)}",
+                headers={"Accept-Encoding": ", ".join(supported_encodings())}
+            )
+        limit = settings.INGEST_MAX_DECOMPRESSED_BYTES
+        chunks = super().stream()
+        for coding in reversed(codings):  # undo the last coding applied first
+            chunks = decompress_stream(chunks, coding, limit)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except DecompressedTooLarge:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Decompressed body exceeds {limit} bytes"
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+class DecompressingRoute(APIRoute):
+    """Route class that hands endpoints a `DecompressedRequest`."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def decompressing_handler(request: Request):
+            return await handler(DecompressedRequest(request.scope, request.receive))
+
+        return decompressing_handler
@@ -8,7 +8,7 @@ Application configuration settings.
 """
 
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -51,6 +51,98 @@ class Settings(BaseSettings):
     MQTT_USERNAME: Optional[str] = None
     MQTT_PASSWORD: Optional[str] = None
 
+    # ─────────────────── Ingestion Worker ──────────────── #
+    INGEST_BATCH_SIZE: int = 500  # Max rows per bulk INSERT/COPY
+    INGEST_BATCH_LINGER_MS: int = 50  # Max time a row waits for its batch
+    INGEST_USE_COPY: bool = True  # Use COPY on PostgreSQL (asyncpg)
+    INGEST_CACHE_MAX_ENTRIES: int = 100000  # Tenant/device lookups kept in memory
+    INGEST_CACHE_TTL_SECONDS: int = 300  # Lifetime of a cached lookup
+    INGEST_WORKERS: int = 1  # Consumer processes started by `python -m app.worker`
+    INGEST_SHARD_MODE: str = "hash"  # "shared" (MQTT v5 $share) or "hash" (v3)
+    INGEST_SHARD_GROUP: str = "ingest"  # Shared-subscription group / client id prefix
+    INGEST_RECEIVE_BUFFER: int = 0  # MQTT client buffer, 0 = unbounded; a bound loses data (overflow is acked, then discarded)
+    INGEST_QUEUE_SIZE: int = 1000  # Bound of each pipeline stage queue
+    INGEST_DECODE_CONCURRENCY: int = 1  # Decode/validate tasks (keyed by topic)
+    INGEST_PERSIST_CONCURRENCY: int = 1  # Persist tasks, i.e. concurrent bulk flushes
+    INGEST_FANOUT_CONCURRENCY: int = 1  # Redis fan-out tasks
+    INGEST_FANOUT_FRAMED: bool = False  # One multi-event message per tenant per batch
+    INGEST_METRICS_INTERVAL_SECONDS: int = 10  # How often queue depths go to Redis
+    INGEST_WRITE_TIMEOUT_SECONDS: float = 10.0  # A bulk write taking longer is spooled
+    INGEST_SPOOL_ENABLED: bool = True  # Spool failed writes to disk instead of dropping
+    INGEST_SPOOL_DIR: str = "./data/spool"  # One sub-directory per worker process
+    INGEST_SPOOL_MAX_BYTES: int = 1073741824  # Spool size cap (1 GiB); beyond it rows drop
+    INGEST_SPOOL_SEGMENT_BYTES: int = 16777216  # Segment rotation size (16 MiB)
+    INGEST_SPOOL_FSYNC_INTERVAL_MS: int = 200  # Max time spooled rows stay unsynced
+    INGEST_SPOOL_REPLAY_ROWS_PER_SEC: int = 5000  # Replay rate once the DB recovers
+    INGEST_DEAD_LETTER_ENABLED: bool = True  # Keep rejected MQTT messages for replay
+    INGEST_DEAD_LETTER_STREAM: str = "ingest:deadletter"  # Redis Stream key
+    INGEST_DEAD_LETTER_MAXLEN: int = 100000  # Approximate cap on stored dead letters
+    INGEST_DEAD_LETTER_REPLAY_RATE: float = 100.0  # Replay rate limit (messages/second)
+    INGEST_DEDUP_ENABLED: bool = True  # Drop QoS 1 redeliveries before the DB write
+    INGEST_DEDUP_WINDOW_SECONDS: int = 600  # How long a message id is remembered
+    INGEST_DEDUP_CAPACITY: int = 1000000  # Messages per window the in-process filter is sized for
+    INGEST_DEDUP_ERROR_RATE: float = 0.001  # Filter false-positive rate (each costs one Redis check)
+    INGEST_DEDUP_SEQUENCE_FIELD: str = "seq"  # Payload field with a device sequence number
+    INGEST_DEDUP_HASH_WINDOW_SECONDS: int = 0  # >0: also dedup payloads without one, by content hash, this long
+    INGEST_THROTTLE_ENABLED: bool = False  # Token-bucket limits per device and tenant (opt in: limits drop data)
+    INGEST_THROTTLE_POLICY: str = "drop"  # Over-limit messages: "drop", "sample" or "aggregate"
+    INGEST_THROTTLE_SAMPLE_EVERY: int = 10  # "sample": keep 1 of every N over-limit messages
+    INGEST_THROTTLE_AGGREGATE_INTERVAL_SECONDS: int = 5  # "aggregate": how often held readings are stored
+    INGEST_THROTTLE_MAX_DEVICES: int = 100000  # Device buckets kept in memory (LRU)
+    INGEST_THROTTLE_PLAN_LIMITS: Dict[str, List[float]] = {}  # Per-plan overrides: [device rate, device burst, tenant rate, tenant burst]
+    INGEST_HTTP_BATCH_MAX_ITEMS: int = 10000  # Max readings per /ingest/batch request
+    INGEST_MAX_DECOMPRESSED_BYTES: int = 16 * 1024 * 1024  # Cap on inflated gzip/deflate/zstd request bodies (413 above)
+
+    # ─────────────────── Time-series Storage ───────────── #
+    SENSOR_PARTITION_INTERVAL: str = "day"  # PostgreSQL range partitions of sensors/sensor_data: "day" or "week"
+    SENSOR_PARTITION_PREMAKE: int = 7  # Future partitions kept created ahead of time
+    SENSOR_RETENTION_DAYS: int = 0  # Expire partitions older than this (0 = keep forever)
+    SENSOR_RETENTION_ACTION: str = "drop"  # "drop" expired partitions, or "detach" them for archiving
+    SENSOR_PARTITION_MAINTENANCE_SECONDS: int = 3600  # How often the API runs partition maintenance
+    ROLLUPS_ENABLED: bool = True  # Maintain 1m/1h/1d rollups as readings are written
+    ROLLUP_REPAIR_LOOKBACK_MINUTES: int = 120  # Trailing window recomputed to pick up late rows
+    ROLLUP_REPAIR_INTERVAL_SECONDS: int = 600  # How often the API runs the repair (0 = never)
+    ROLLUP_REPAIR_LINGER_SECONDS: int = 60  # Recently closed buckets left to in-flight writes
+    ROLLUP_QUERY_MAX_BUCKETS: int = 10000  # Max buckets per series a rollup or aggregate query may span
+    EXPORT_CHUNK_ROWS: int = 5000  # Rows fetched, encoded and streamed per step of a history export
+    DOWNSAMPLE_MAX_POINTS: int = 5000  # Upper bound for max_points on the history endpoints
+    DEVICE_SHADOW_BACKEND: str = "memory"  # Latest value per device/sensor: "memory" (API process only), "redis" (shared with the worker) or "off"
+    DEVICE_SHADOW_MAX_DEVICES: int = 100000  # Devices held by the "memory" shadow; least recently updated ones are evicted
+    SENSOR_COMPACTION_ENABLED: bool = False  # Compress closed days of sensors rows into sensor_blocks
+    SENSOR_COMPACTION_AFTER_DAYS: int = 7  # Days a reading stays a raw row before compaction
+    SENSOR_COMPACTION_INTERVAL_SECONDS: int = 3600  # How often the API runs a compaction pass
+    SENSOR_COMPACTION_DEVICES_PER_PASS: int = 500  # Devices compacted per transaction
+    RECENT_BUFFER_ENABLED: bool = True  # Serve last-N-minutes reads from in-memory ring buffers (MQTT readings and this process's HTTP writes)
+    RECENT_BUFFER_SERIES_POINTS: int = 4096  # Readings kept per device and sensor type
+    RECENT_BUFFER_MAX_POINTS: int = 2000000  # Readings kept per API process (16 bytes each); least recently used devices are evicted
+    SENSOR_ARCHIVE_ENABLED: bool = False  # Move closed days of sensor_data rows to Parquet files (needs pyarrow)
+    SENSOR_ARCHIVE_DIR: str = "./data/archive"  # Archive root, laid out as tenant/device/day
+    SENSOR_ARCHIVE_AFTER_DAYS: int = 90  # Days a sensor_data row stays in the database before archiving
+    SENSOR_ARCHIVE_INTERVAL_SECONDS: int = 3600  # How often the API runs an archiving pass
+    SENSOR_ARCHIVE_DEVICES_PER_PASS: int = 500  # Devices archived per transaction
+    SENSOR_ARCHIVE_ROW_GROUP_ROWS: int = 10000  # Parquet row group size; time ranges prune whole row groups
+    INGEST_WRITE_BEHIND_ENABLED: bool = False  # /ingest/ingest and the health beacon answer 202 and write in bulk later
+    INGEST_WRITE_BEHIND_BACKEND: str = "memory"  # "memory" (lost on crash) or "redis" (stream, survives restarts)
+    INGEST_WRITE_BEHIND_MAX_ROWS: int = 100000  # Buffer capacity; requests get 503 when full
+    INGEST_WRITE_BEHIND_BATCH_SIZE: int = 500  # Max rows per bulk insert
+    INGEST_WRITE_BEHIND_LINGER_MS: int = 100  # How long a flush waits for its batch to fill
+    INGEST_WRITE_BEHIND_STREAM: str = "ingest:write-behind"  # Redis Stream for the "redis" backend
+    INGEST_WRITE_BEHIND_CLAIM_IDLE_SECONDS: int = 60  # Take over rows left pending by a crashed API process
+    ANOMALY_DETECTION_ENABLED: bool = False  # Score stored readings in the MQTT worker and emit anomaly events (needs numpy)
+    ANOMALY_EWMA_ALPHA: float = 0.05  # Weight of each new reading in a series' mean, variance and robust centre
+    ANOMALY_Z_THRESHOLD: float = 4.0  # EWMA (and, once warmed up, seasonal) z-score a reading must exceed
+    ANOMALY_ROBUST_Z_THRESHOLD: float = 3.5  # Modified z-score (median/MAD) a reading must also exceed
+    ANOMALY_WARMUP_READINGS: int = 30  # Readings a series (or seasonal slot) needs before it is scored
+    ANOMALY_SEASON_SLOTS: int = 24  # Seasonal baseline slots per cycle; 1 disables the seasonal check
+    ANOMALY_SEASON_SLOT_SECONDS: int = 3600  # Slot width; 24 one-hour slots give a daily cycle
+    ANOMALY_SEASON_ALPHA: float = 0.01  # Weight of each new reading in its seasonal slot
+    ANOMALY_COOLDOWN_SECONDS: int = 300  # Minimum time between two events of one series
+    ANOMALY_MAX_SERIES: int = 50000  # Series tracked per worker process; further ones are not scored
+    ANOMALY_QUEUE_SIZE: int = 100  # Stored batches waiting for the detector; further ones are skipped
+    ALERT_RULES_ENABLED: bool = True  # Evaluate tenants' alert rules on readings stored by the MQTT worker
+    ALERT_RULES_RELOAD_SECONDS: int = 300  # Full rule reload interval, besides per-tenant reloads on change
+    ALERT_RULES_MAX_PER_TENANT: int = 200  # Rules a tenant may define
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         
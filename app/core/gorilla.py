@@ -0,0 +1,189 @@
+# app/core/gorilla.py
+"""
+Gorilla-style compression of (timestamp, float) series.
+
+• Timestamps (integer microseconds) are delta-of-delta encoded: regular
+  sampling costs one bit per reading, jitter a few bits more.
+• Values are XOR-ed with their predecessor and only the meaningful bits
+  are stored, reusing the previous leading/trailing-zero window when it
+  fits: repeated values cost one bit, slowly changing ones a dozen or so.
+• Lossless: decoding returns exactly the encoded integers and floats.
+
+Layout: 4-byte big-endian count, then one bit stream holding all
+timestamps followed by all values.
+"""
+
+import struct
+from typing import List, Sequence, Tuple
+
+# Delta-of-delta classes: (prefix, prefix bits, payload bits).
+# Gorilla's second-granularity ranges, widened for microseconds.
+DOD_CLASSES = (
+    (0b10, 2, 7),
+    (0b110, 3, 12),
+    (0b1110, 4, 20),
+    (0b11110, 5, 32),
+    (0b11111, 5, 64),
+)
+
+
+class BitWriter:
+    """Append-only bit stream."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pending = 0
+        self._pending_bits = 0
+
+    def write(self, value: int, bits: int) -> None:
+        self._pending = (self._pending << bits) | (value & ((1 << bits) - 1))
+        self._pending_bits += bits
+        while self._pending_bits >= 8:
+            self._pending_bits -= 8
+            self._buffer.append((self._pending >> self._pending_bits) & 0xFF)
+        self._pending &= (1 << self._pending_bits) - 1
+
+    def getvalue(self) -> bytes:
+        if self._pending_bits:
+            return bytes(self._buffer) + bytes([(self._pending << (8 - self._pending_bits)) & 0xFF])
+        return bytes(self._buffer)
+
+
+class BitReader:
+    """Sequential reader over a bit stream."""
+
+    def __init__(self, data: bytes, offset: int = 0):
+        self._data = data
+        self._position = offset * 8
+
+    def read(self, bits: int) -> int:
+        start = self._position >> 3
+        end = (self._position + bits + 7) >> 3
+        chunk = int.from_bytes(self._data[start:end], "big")
+        extra = (end - start) * 8 - (self._position & 7) - bits
+        self._position += bits
+        return (chunk >> extra) & ((1 << bits) - 1)
+
+    def read_bit(self) -> int:
+        byte = self._data[self._position >> 3]
+        bit = (byte >> (7 - (self._position & 7))) & 1
+        self._position += 1
+        return bit
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+def _float_bits(value: float) -> int:
+    return struct.unpack(">Q", struct.pack(">d", value))[0]
+
+
+def _bits_float(bits: int) -> float:
+    return struct.unpack(">d", bits.to_bytes(8, "big"))[0]
+
+
+def _write_timestamps(writer: BitWriter, timestamps: Sequence[int]) -> None:
+    writer.write(timestamps[0], 64)
+    if len(timestamps) == 1:
+        return
+    delta = timestamps[1] - timestamps[0]
+    writer.write(delta, 64)
+    previous = timestamps[1]
+    for timestamp in timestamps[2:]:
+        new_delta = timestamp - previous
+        dod = new_delta - delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, bits in DOD_CLASSES:
+                if -(1 << (bits - 1)) <= dod < (1 << (bits - 1)):
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod, bits)
+                    break
+        delta, previous = new_delta, timestamp
+
+
+def _read_timestamps(reader: BitReader, count: int) -> List[int]:
+    timestamps = [_signed(reader.read(64), 64)]
+    if count == 1:
+        return timestamps
+    delta = _signed(reader.read(64), 64)
+    timestamps.append(timestamps[0] + delta)
+    for _ in range(count - 2):
+        ones = 0
+        while ones < 4 and reader.read_bit():
+            ones += 1
+        if ones:
+            bits = DOD_CLASSES[ones - 1][2] if ones < 4 else (64 if reader.read_bit() else 32)
+            delta += _signed(reader.read(bits), bits)
+        timestamps.append(timestamps[-1] + delta)
+    return timestamps
+
+
+def _write_values(writer: BitWriter, values: Sequence[float]) -> None:
+    previous = _float_bits(values[0])
+    writer.write(previous, 64)
+    leading, trailing = 65, 65  # no window yet
+    for value in values[1:]:
+        current = _float_bits(value)
+        xor = current ^ previous
+        previous = current
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+        new_leading = min(64 - xor.bit_length(), 31)
+        new_trailing = (xor & -xor).bit_length() - 1
+        if new_leading >= leading and new_trailing >= trailing:
+            # Fits the previous window
+            writer.write(0b10, 2)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = new_leading, new_trailing
+            meaningful = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(meaningful & 63, 6)  # 64 is stored as 0
+            writer.write(xor >> trailing, meaningful)
+
+
+def _read_values(reader: BitReader, count: int) -> List[float]:
+    previous = reader.read(64)
+    values = [_bits_float(previous)]
+    leading = trailing = 0
+    for _ in range(count - 1):
+        if reader.read_bit():
+            if reader.read_bit():
+                leading = reader.read(5)
+                meaningful = reader.read(6) or 64
+                trailing = 64 - leading - meaningful
+            previous ^= reader.read(64 - leading - trailing) << trailing
+        values.append(_bits_float(previous))
+    return values
+
+
+def encode_series(timestamps: Sequence[int], values: Sequence[float]) -> bytes:
+    """Compress a series of integer timestamps (ascending) and floats."""
+    if len(timestamps) != len(values):
+        raise ValueError("timestamps and values differ in length")
+    writer = BitWriter()
+    if timestamps:
+        _write_timestamps(writer, timestamps)
+        _write_values(writer, values)
+    return struct.pack(">I", len(timestamps)) + writer.getvalue()
+
+
+def decode_series(data: bytes) -> Tuple[List[int], List[float]]:
+    """Inverse of `encode_series`; ValueError on truncated input."""
+    if len(data) < 4:
+        raise ValueError("Truncated series block")
+    (count,) = struct.unpack_from(">I", data)
+    if count == 0:
+        return [], []
+    reader = BitReader(data, offset=4)
+    try:
+        timestamps = _read_timestamps(reader, count)
+        values = _read_values(reader, count)
+    except IndexError:
+        raise ValueError("Truncated series block")
+    return timestamps, values
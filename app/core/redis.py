@@ -7,10 +7,16 @@ Redis client configuration for MESSS framework.
 • Health checks and monitoring
 """
 
+import json
 import redis
 from typing import Optional
 from app.core.config import settings
 
+# Pub/sub channel the worker listens on to drop cached tenant/device lookups
+CACHE_INVALIDATION_CHANNEL = "cache_invalidate"
+# Pub/sub channel the worker listens on to reload a tenant's alert rules
+ALERT_RULES_CHANNEL = "alert_rules_changed"
+
 
 def get_redis_client() -> redis.Redis:
     """Get Redis client instance."""
@@ -112,4 +118,34 @@ class RedisManager:
 
 
 # Global Redis manager instance
-redis_manager = RedisManager() 
\ No newline at end of file
+redis_manager = RedisManager()
+
+
+def publish_cache_invalidation(kind: str, key: Optional[str] = None) -> bool:
+    """
+    Tell ingestion workers that a cached tenant or device mapping is stale.
+
+    `kind` is "tenant" (keyed by tenant name) or "device" (keyed by device id);
+    a key of None invalidates every entry of that kind. Blocking (connects on
+    first use); call through `asyncio.to_thread` from async code.
+    """
+    client = redis_manager.get_client()
+    if not client:
+        return False
+    try:
+        client.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({"kind": kind, "key": key}))
+        return True
+    except Exception:
+        return False
+
+
+def publish_alert_rules_changed(tenant_id: str) -> bool:
+    """Tell ingestion workers to reload the alert rules of a tenant. Blocking, like the above."""
+    client = redis_manager.get_client()
+    if not client:
+        return False
+    try:
+        client.publish(ALERT_RULES_CHANNEL, tenant_id)
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,78 @@
+# app/db/pagination.py
+"""
+Keyset (cursor) pagination over time-ordered tables.
+
+• Pages are ordered by `(timestamp, id)` and continue strictly after the
+  last row of the previous page, so each page is one index range scan
+  whatever its depth (no OFFSET).
+• Cursors are opaque URL-safe strings encoding that last `(timestamp, id)`.
+• `keyset_page` fetches one page plus the cursor of the next one;
+  `iter_keyset_pages` walks every page, e.g. for exports.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(timestamp: datetime, row_id: UUID) -> str:
+    """Opaque cursor pointing just past the row `(timestamp, row_id)`."""
+    raw = json.dumps([timestamp.isoformat(), row_id.hex], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Inverse of `encode_cursor`; ValueError for anything else."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), UUID(hex=row_id)
+    except (binascii.Error, TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def apply_keyset(statement, model, cursor: Optional[str], limit: int, descending: bool = True):
+    """
+    Order `statement` by `(model.timestamp, model.id)` and restrict it to the
+    rows after `cursor`. Fetches one extra row to tell whether more follow.
+    """
+    key = tuple_(model.timestamp, model.id)
+    if cursor:
+        position = tuple_(*decode_cursor(cursor))
+        statement = statement.where(key < position if descending else key > position)
+    if descending:
+        statement = statement.order_by(model.timestamp.desc(), model.id.desc())
+    else:
+        statement = statement.order_by(model.timestamp, model.id)
+    return statement.limit(limit + 1)
+
+
+async def keyset_page(
+    session, statement, model, cursor: Optional[str], limit: int, descending: bool = True
+) -> Tuple[List[Any], Optional[str]]:
+    """One page of `model` rows and the cursor of the next page (None at the end)."""
+    result = await session.execute(apply_keyset(statement, model, cursor, limit, descending))
+    rows = list(result.scalars().all())
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+
+async def iter_keyset_pages(
+    session, statement, model, page_size: int = 1000, cursor: Optional[str] = None, descending: bool = False
+) -> AsyncIterator[List[Any]]:
+    """Every page of `statement`, oldest first by default."""
+    while True:
+        rows, cursor = await keyset_page(session, statement, model, cursor, page_size, descending)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+        # Pages are independent queries; drop the previous one from the identity map
+        session.expunge_all()
@@ -0,0 +1,240 @@
+# app/db/partitions.py
+"""
+Time-range partitioning of the sensor tables on PostgreSQL.
+
+• `sensors` and `sensor_data` are created `PARTITION BY RANGE (timestamp)`
+  on PostgreSQL; SQLite (dev mode) keeps each as a single plain table.
+• `PartitionManager` pre-creates daily or weekly partitions ahead of time
+  and drops (or detaches, to archive) partitions past the retention period.
+• A DEFAULT partition per table catches rows outside every range, so an
+  insert never fails because maintenance fell behind.
+• Runs at API startup and then periodically; `python -m app.db.partitions`
+  runs one pass (e.g. from cron).
+
+Tables created before partitioning was introduced stay plain heap tables;
+they are reported and left alone.
+"""
+
+import argparse
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import text
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("sensors", "sensor_data")
+INTERVALS = ("day", "week")
+RETENTION_ACTIONS = ("drop", "detach")
+
+# Arbitrary constant namespacing the maintenance advisory lock
+ADVISORY_LOCK_ID = 0x5E4504
+
+
+class Partition(NamedTuple):
+    """One range partition: `[start, end)` on `timestamp`."""
+    name: str
+    start: date
+    end: date
+
+
+def partition_start(day: date, interval: str) -> date:
+    """First day of the partition holding `day` (weeks start on Monday)."""
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def partition_for(table: str, day: date, interval: str) -> Partition:
+    """The partition of `table` that holds `day`."""
+    start = partition_start(day, interval)
+    end = start + timedelta(days=7 if interval == "week" else 1)
+    return Partition(f"{table}_p{start:%Y%m%d}", start, end)
+
+
+def parse_partition(table: str, name: str, interval: str) -> Optional[Partition]:
+    """Partition described by a managed partition name; None for other tables."""
+    match = re.fullmatch(rf"{re.escape(table)}_p(\d{{8}})", name)
+    if match is None:
+        return None
+    return partition_for(table, datetime.strptime(match.group(1), "%Y%m%d").date(), interval)
+
+
+def plan_partitions(
+    table: str,
+    existing: Sequence[str],
+    today: date,
+    interval: str = "day",
+    premake: int = 7,
+    retention_days: int = 0,
+):
+    """
+    Partitions to create (current one plus `premake` ahead) and managed
+    partitions wholly older than `retention_days` (0 keeps everything).
+    """
+    step = timedelta(days=7 if interval == "week" else 1)
+    wanted = [partition_for(table, today + step * i, interval) for i in range(premake + 1)]
+    existing = set(existing)
+    to_create = [partition for partition in wanted if partition.name not in existing]
+
+    to_expire: List[Partition] = []
+    if retention_days > 0:
+        cutoff = today - timedelta(days=retention_days)
+        for name in sorted(existing):
+            partition = parse_partition(table, name, interval)
+            if partition is not None and partition.end <= cutoff:
+                to_expire.append(partition)
+    return to_create, to_expire
+
+
+class PartitionManager:
+    """Keeps the partitions of the sensor tables ahead of time and within retention."""
+
+    def __init__(
+        self,
+        engine,
+        interval: str = "day",
+        premake: int = 7,
+        retention_days: int = 0,
+        retention_action: str = "drop",
+        tables: Sequence[str] = PARTITIONED_TABLES,
+    ):
+        if interval not in INTERVALS:
+            raise ValueError(f"Unknown partition interval: {interval}")
+        if retention_action not in RETENTION_ACTIONS:
+            raise ValueError(f"Unknown retention action: {retention_action}")
+        self.engine = engine
+        self.interval = interval
+        self.premake = max(0, premake)
+        self.retention_days = max(0, retention_days)
+        self.retention_action = retention_action
+        self.tables = tuple(tables)
+
+    @classmethod
+    def from_settings(cls, engine) -> "PartitionManager":
+        return cls(
+            engine,
+            interval=settings.SENSOR_PARTITION_INTERVAL,
+            premake=settings.SENSOR_PARTITION_PREMAKE,
+            retention_days=settings.SENSOR_RETENTION_DAYS,
+            retention_action=settings.SENSOR_RETENTION_ACTION,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Partitioning only exists on PostgreSQL."""
+        return self.engine is not None and self.engine.dialect.name == "postgresql"
+
+    async def _is_partitioned(self, conn, table: str) -> bool:
+        result = await conn.execute(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+            {"table": table},
+        )
+        return result.first() is not None
+
+    async def _partitions(self, conn, table: str) -> List[str]:
+        result = await conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:table)"
+            ),
+            {"table": table},
+        )
+        return [name for (name,) in result.all()]
+
+    async def maintain_table(self, conn, table: str, today: date) -> Dict[str, List[str]]:
+        """Create upcoming and expire old partitions of one table."""
+        report: Dict[str, List[str]] = {"created": [], "expired": []}
+        if not await self._is_partitioned(conn, table):
+            logger.warning(f"Table {table} is not partitioned; skipping partition maintenance")
+            return report
+
+        existing = await self._partitions(conn, table)
+        if f"{table}_default" not in existing:
+            await conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+        to_create, to_expire = plan_partitions(
+            table, existing, today, self.interval, self.premake, self.retention_days
+        )
+        for partition in to_create:
+            try:
+                # A savepoint per partition: rows already in DEFAULT for this
+                # range make PostgreSQL refuse it, which must not stop the rest
+                async with conn.begin_nested():
+                    await conn.execute(text(
+                        f'CREATE TABLE IF NOT EXISTS "{partition.name}" PARTITION OF "{table}" '
+                        f"FOR VALUES FROM ('{partition.start.isoformat()}') TO ('{partition.end.isoformat()}')"
+                    ))
+                report["created"].append(partition.name)
+            except Exception as e:
+                logger.error(f"Could not create partition {partition.name}: {e}")
+
+        for partition in to_expire:
+            if self.retention_action == "detach":
+                await conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{partition.name}"'))
+            else:
+                await conn.execute(text(f'DROP TABLE IF EXISTS "{partition.name}"'))
+            report["expired"].append(partition.name)
+        return report
+
+    async def maintain(self, today: Optional[date] = None) -> Dict[str, Dict[str, List[str]]]:
+        """One maintenance pass over all tables; a no-op outside PostgreSQL."""
+        if not self.enabled:
+            return {}
+        today = today or datetime.utcnow().date()
+        reports = {}
+        async with self.engine.begin() as conn:
+            # Serialize passes from concurrent API processes
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+            for table in self.tables:
+                reports[table] = await self.maintain_table(conn, table, today)
+        for table, report in reports.items():
+            if report["created"] or report["expired"]:
+                logger.info(
+                    f"Partitions of {table}: created {report['created']}, "
+                    f"expired ({self.retention_action}) {report['expired']}"
+                )
+        return reports
+
+    async def run(self, interval_seconds: float) -> None:
+        """Run maintenance passes forever."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.maintain()
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {e}")
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Run one sensor-table partition maintenance pass")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the plan for today")
+    args = parser.parse_args()
+
+    from app.db.session import engine
+
+    manager = PartitionManager.from_settings(engine)
+    if not manager.enabled:
+        print("Partitioning requires PostgreSQL; nothing to do")
+        return
+    if args.dry_run:
+        async with engine.connect() as conn:
+            for table in manager.tables:
+                to_create, to_expire = plan_partitions(
+                    table, await manager._partitions(conn, table), datetime.utcnow().date(),
+                    manager.interval, manager.premake, manager.retention_days,
+                )
+                print(f"{table}: create {[p.name for p in to_create]}, "
+                      f"{manager.retention_action} {[p.name for p in to_expire]}")
+        return
+    for table, report in (await manager.maintain()).items():
+        print(f"{table}: created {report['created']}, expired ({manager.retention_action}) {report['expired']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,6 @@
+# app/ingestion/__init__.py
+"""
+Sensor data ingestion pipeline.
+
+Batching, caching, and delivery helpers used by the MQTT worker.
+"""
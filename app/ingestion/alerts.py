@@ -0,0 +1,359 @@
+# app/ingestion/alerts.py
+"""
+Per-tenant alert rules evaluated on stored readings (MQTT worker).
+
+• Rules (`AlertRule` rows) are compiled on load into closures: a bound
+  predicate such as `value > 40` plus a windowed condition:
+  – "threshold": the predicate has held for `duration_seconds`;
+  – "count": it matched at least `min_count` times in `window_seconds`;
+  – "rate": the change per minute over `window_seconds` satisfies it.
+• Compiled rules are indexed by (tenant, sensor_type), so a reading only
+  runs the rules that can match it, and rows of tenants without rules are
+  not even decoded.
+• State is kept per (rule, device). An event is emitted when a rule starts
+  firing for a device and when it resolves. Events go to the `alert_new`
+  Redis channel and the audit log.
+• Rules reload per tenant when the API announces a change on
+  `alert_rules_changed`, and in full every `ALERT_RULES_RELOAD_SECONDS`.
+  The state of unchanged rules survives a reload; an edited rule starts
+  over.
+• Readings written over HTTP (`insert_readings`) bypass the worker and are
+  not evaluated. With sharded workers each one evaluates the devices it
+  receives.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+
+from app.core.codecs import json_loads
+from app.core.redis import ALERT_RULES_CHANNEL
+from app.ingestion.events import audit_events, audit_row, publish_events
+from app.ingestion.recent import to_epoch
+from app.ingestion.rollups import extract_readings
+from app.models.alert import AlertRule
+
+logger = logging.getLogger(__name__)
+
+ALERT_CHANNEL = "alert_new"
+KINDS = ("threshold", "count", "rate")
+FIRING = "firing"
+RESOLVED = "resolved"
+
+# Each factory binds a threshold into a one-argument predicate
+PREDICATES: Dict[str, Callable[[float], Callable[[float], bool]]] = {
+    ">": lambda threshold: lambda value: value > threshold,
+    ">=": lambda threshold: lambda value: value >= threshold,
+    "<": lambda threshold: lambda value: value < threshold,
+    "<=": lambda threshold: lambda value: value <= threshold,
+    "==": lambda threshold: lambda value: value == threshold,
+    "!=": lambda threshold: lambda value: value != threshold,
+}
+OPERATORS = tuple(PREDICATES)
+
+Step = Callable[[Any, float, float], bool]
+
+
+def threshold_condition(test: Callable[[float], bool], duration: float) -> Tuple[Callable[[], Any], Step]:
+    """Active once `test` has held for `duration` seconds; state is [since]."""
+    def step(state, epoch, value):
+        if not test(value):
+            state[0] = None
+            return False
+        if state[0] is None:
+            state[0] = epoch
+        return epoch - state[0] >= duration
+    return lambda: [None], step
+
+
+def count_condition(test: Callable[[float], bool], window: float, min_count: int) -> Tuple[Callable[[], Any], Step]:
+    """Active while `test` matched `min_count` times in the last `window` seconds."""
+    def step(matches, epoch, value):
+        if test(value):
+            matches.append(epoch)
+        horizon = epoch - window
+        while matches and matches[0] <= horizon:
+            matches.popleft()
+        return len(matches) >= min_count
+    return deque, step
+
+
+def rate_condition(test: Callable[[float], bool], window: float) -> Tuple[Callable[[], Any], Step]:
+    """Active while the change per minute since the oldest reading in `window` passes `test`."""
+    def step(points, epoch, value):
+        points.append((epoch, value))
+        horizon = epoch - window
+        while points[0][0] < horizon:
+            points.popleft()
+        first_epoch, first_value = points[0]
+        if epoch <= first_epoch:
+            return False
+        return test((value - first_value) * 60.0 / (epoch - first_epoch))
+    return deque, step
+
+
+class CompiledRule:
+    """A rule ready to evaluate, with its per-device state."""
+
+    __slots__ = ("id", "tenant_id", "name", "sensor_type", "device_id", "version", "new_state", "step", "states")
+
+    def __init__(self, rule: Any, new_state: Callable[[], Any], step: Step):
+        self.id = str(rule.id)
+        self.tenant_id = str(rule.tenant_id)
+        self.name = rule.name
+        self.sensor_type = rule.sensor_type
+        self.device_id = str(rule.device_id) if rule.device_id else None
+        self.version = rule.updated_at
+        self.new_state = new_state
+        self.step = step
+        self.states: Dict[str, list] = {}  # device id -> [condition state, firing]
+
+
+def compile_rule(rule: Any) -> CompiledRule:
+    """
+    Compile an `AlertRule` (or anything with its fields).
+
+    Raises ValueError when the rule cannot be evaluated.
+    """
+    factory = PREDICATES.get(rule.operator)
+    if factory is None:
+        raise ValueError(f"Unknown operator {rule.operator!r}; expected one of {', '.join(OPERATORS)}")
+    test = factory(float(rule.threshold))
+    if rule.kind == "threshold":
+        if rule.duration_seconds < 0:
+            raise ValueError("duration_seconds must not be negative")
+        new_state, step = threshold_condition(test, rule.duration_seconds)
+    elif rule.kind == "count":
+        if rule.window_seconds <= 0 or rule.min_count < 1:
+            raise ValueError("count rules need window_seconds > 0 and min_count >= 1")
+        new_state, step = count_condition(test, rule.window_seconds, rule.min_count)
+    elif rule.kind == "rate":
+        if rule.window_seconds <= 0:
+            raise ValueError("rate rules need window_seconds > 0")
+        new_state, step = rate_condition(test, rule.window_seconds)
+    else:
+        raise ValueError(f"Unknown rule kind {rule.kind!r}; expected one of {', '.join(KINDS)}")
+    return CompiledRule(rule, new_state, step)
+
+
+class AlertEngine:
+    """Compiled rules indexed by (tenant, sensor_type) and their evaluation."""
+
+    def __init__(self):
+        self._tenants: Dict[str, List[CompiledRule]] = {}
+        self._index: Dict[Tuple[str, str], List[CompiledRule]] = {}
+        self.readings = 0
+        self.evaluations = 0
+        self.fired = 0
+        self.resolved = 0
+        self.invalid_rules = 0
+
+    @property
+    def rule_count(self) -> int:
+        return sum(len(rules) for rules in self._tenants.values())
+
+    def load(self, rules: Iterable[Any], tenant_id: Optional[str] = None) -> int:
+        """
+        Compile and install rules: all of them, or only `tenant_id`'s.
+
+        Unchanged rules (same `updated_at`) are kept as compiled, with their
+        state. Returns the number installed.
+        """
+        previous = {
+            rule.id: rule
+            for tenant, compiled in self._tenants.items()
+            if tenant_id is None or tenant == tenant_id
+            for rule in compiled
+        }
+        tenants: Dict[str, List[CompiledRule]] = {}
+        for rule in rules:
+            compiled = previous.get(str(rule.id))
+            if compiled is None or compiled.version != rule.updated_at:
+                try:
+                    compiled = compile_rule(rule)
+                except ValueError as e:
+                    self.invalid_rules += 1
+                    logger.warning(f"Skipping alert rule {rule.id}: {e}")
+                    continue
+            tenants.setdefault(compiled.tenant_id, []).append(compiled)
+
+        if tenant_id is None:
+            self._tenants = tenants
+            index: Dict[Tuple[str, str], List[CompiledRule]] = {}
+        else:
+            tenants = {tenant_id: tenants.get(tenant_id, [])}
+            index = {key: rules for key, rules in self._index.items() if key[0] != tenant_id}
+            self._tenants = {**self._tenants, **tenants}
+            if not tenants[tenant_id]:
+                del self._tenants[tenant_id]
+        for compiled_rules in tenants.values():
+            for rule in compiled_rules:
+                index.setdefault((rule.tenant_id, rule.sensor_type), []).append(rule)
+        # Swapped in whole: evaluation never sees a half-built index
+        self._index = index
+        return sum(len(compiled_rules) for compiled_rules in tenants.values())
+
+    def evaluate(
+        self,
+        tenant_id: str,
+        device_id: str,
+        sensor_type: str,
+        value: float,
+        epoch: float,
+        timestamp: datetime,
+        events: List[Dict[str, Any]],
+    ) -> None:
+        """Run one reading through the rules that can match it, appending state changes to `events`."""
+        rules = self._index.get((tenant_id, sensor_type))
+        if rules is None:
+            return
+        for rule in rules:
+            if rule.device_id is not None and rule.device_id != device_id:
+                continue
+            self.evaluations += 1
+            state = rule.states.get(device_id)
+            if state is None:
+                state = rule.states[device_id] = [rule.new_state(), False]
+            active = rule.step(state[0], epoch, value)
+            if active != state[1]:
+                state[1] = active
+                if active:
+                    self.fired += 1
+                else:
+                    self.resolved += 1
+                events.append({
+                    "type": "alert",
+                    "state": FIRING if active else RESOLVED,
+                    "rule_id": rule.id,
+                    "rule_name": rule.name,
+                    "tenant_id": tenant_id,
+                    "device_id": device_id,
+                    "sensor_type": sensor_type,
+                    "value": value,
+                    "timestamp": timestamp.isoformat(),
+                })
+
+    def evaluate_rows(self, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Evaluate stored `sensor_data` rows; returns alert events."""
+        events: List[Dict[str, Any]] = []
+        tenants = self._tenants
+        for row in rows:
+            tenant_id = row.get("tenant_id")
+            if tenant_id is None or str(tenant_id) not in tenants:
+                continue
+            payload = row["payload"]
+            if isinstance(payload, (str, bytes)):
+                try:
+                    payload = json_loads(payload)
+                except ValueError:
+                    continue
+            timestamp = row["timestamp"]
+            epoch = to_epoch(timestamp)
+            for sensor_type, value in extract_readings(payload):
+                self.readings += 1
+                self.evaluate(str(tenant_id), row["device_id"], sensor_type, value, epoch, timestamp, events)
+        return events
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "tenants": len(self._tenants),
+            "rules": self.rule_count,
+            "readings": self.readings,
+            "evaluations": self.evaluations,
+            "fired": self.fired,
+            "resolved": self.resolved,
+            "invalid_rules": self.invalid_rules,
+        }
+
+
+async def fetch_rules(session_factory, tenant_id: Optional[str] = None) -> List[Any]:
+    """Active rules of every tenant, or of one, as plain rows (no ORM objects to build)."""
+    table = AlertRule.__table__
+    statement = select(table).where(table.c.is_active == True)  # noqa: E712
+    if tenant_id is not None:
+        statement = statement.where(table.c.tenant_id == tenant_id)
+    async with session_factory() as session:
+        return list((await session.execute(statement)).all())
+
+
+class AlertMonitor:
+    """Keeps an engine's rules current and emits the events it produces."""
+
+    def __init__(self, engine: AlertEngine, session_factory, redis_client=None, reload_seconds: float = 300.0):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.redis = redis_client
+        self.reload_seconds = reload_seconds
+        self.events = 0
+        self.errors = 0
+        self.reloads = 0
+        self.last_reload_ms = 0.0
+
+    async def reload(self, tenant_id: Optional[str] = None) -> int:
+        started = time.perf_counter()
+        installed = self.engine.load(await fetch_rules(self.session_factory, tenant_id), tenant_id)
+        self.reloads += 1
+        self.last_reload_ms = (time.perf_counter() - started) * 1000
+        return installed
+
+    async def process(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        try:
+            events = self.engine.evaluate_rows(rows)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Alert rule evaluation failed: {e}")
+            return []
+        if events:
+            self.events += len(events)
+            if self.redis is not None:
+                await publish_events(self.redis, ALERT_CHANNEL, events)
+            await audit_events(
+                self.session_factory, [audit_row(f"alert_{event['state']}", event) for event in events]
+            )
+        return events
+
+    async def run(self) -> None:
+        """Full reload on a timer, in case a change notification was missed."""
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.warning(f"Alert rule reload failed: {e}")
+
+    async def listen(self, redis_client) -> None:
+        """Reload a tenant's rules when the API announces a change; everything after a disconnect."""
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(ALERT_RULES_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        await self.reload(message["data"] or None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Alert rule listener error: {e}")
+            finally:
+                await pubsub.close()
+
+            await asyncio.sleep(5)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.warning(f"Alert rule reload failed: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        metrics: Dict[str, Any] = self.engine.metrics()
+        metrics.update({
+            "events": self.events,
+            "errors": self.errors,
+            "reloads": self.reloads,
+            "last_reload_ms": round(self.last_reload_ms, 3),
+        })
+        return metrics
@@ -0,0 +1,394 @@
+# app/ingestion/anomaly.py
+"""
+Streaming anomaly detection over stored readings (MQTT worker).
+
+• One series per (device, sensor_type), tracked with:
+  – an exponentially weighted mean and variance (bias corrected, so new
+    series need no special start-up);
+  – a robust centre and spread (streaming median and median absolute
+    deviation), giving a modified z-score that a burst of outliers barely
+    moves;
+  – a seasonal baseline: weighted mean and variance per slot of a cycle
+    (by default each hour of the day).
+• A reading is anomalous once its series has seen `warmup` readings and
+  both the EWMA z-score and the robust z-score exceed their thresholds;
+  when its seasonal slot is also warmed up, it must be unusual for that
+  time of the cycle as well. Repeats within `cooldown_seconds` of the
+  series' last event are suppressed.
+• Each stored batch is scored against the state before it, then folded in
+  with vectorized NumPy group operations, with no Python loop per reading.
+  State lives in NumPy arrays (about 50 bytes per series plus 24 bytes per
+  seasonal slot), capped at `max_series`.
+• Events go to the `anomaly_new` Redis channel and the audit log. The state
+  is per worker process and starts cold after a restart. With shared
+  subscriptions one device's readings are split between shards, each
+  keeping its own statistics.
+• Needs numpy; without it the worker runs without detection.
+"""
+
+import asyncio
+import logging
+import math
+from typing import Any, Dict, List, Sequence, Tuple
+
+from app.core.codecs import json_loads
+from app.core.config import settings
+from app.ingestion.events import audit_events, audit_row, publish_events
+from app.ingestion.recent import to_epoch
+from app.ingestion.rollups import extract_readings
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on installed extras
+    np = None
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_CHANNEL = "anomaly_new"
+AUDIT_ACTION = "anomaly_detected"
+# The MAD of normally distributed data is 0.6745 standard deviations
+MAD_SCALE = 0.6745
+# Smallest spread, relative to the series level, so constant sensors do not divide by zero
+MIN_SCALE_FRACTION = 1e-3
+MIN_SCALE = 1e-9
+
+
+def detector_available() -> bool:
+    return np is not None
+
+
+def _groups(keys, epochs):
+    """
+    Group readings by key, oldest first within a group.
+
+    Returns the distinct keys, each reading's group number, the group sizes
+    and, per reading, how many newer readings of its group follow it.
+    """
+    order = np.lexsort((epochs, keys))
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(keys)])
+    group = np.repeat(np.arange(len(starts)), sizes)
+    inverse = np.empty(len(keys), dtype=np.int64)
+    inverse[order] = group
+    later = np.empty(len(keys), dtype=np.int64)
+    later[order] = (starts + sizes - 1)[group] - np.arange(len(keys))
+    return sorted_keys[starts], inverse, sizes, later
+
+
+class WeightedMoments:
+    """Bias-corrected exponentially weighted mean and variance per key."""
+
+    def __init__(self, alpha: float, capacity: int):
+        self.alpha = alpha
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.weight = np.zeros(capacity)
+        self.m1 = np.zeros(capacity)
+        self.m2 = np.zeros(capacity)
+
+    def grow(self, capacity: int) -> None:
+        for name in ("count", "weight", "m1", "m2"):
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate([column, np.zeros(capacity - len(column), dtype=column.dtype)]))
+
+    def estimate(self, keys) -> Tuple[Any, Any]:
+        """Mean and variance of each key (NaN where nothing was seen)."""
+        weight = self.weight[keys]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(weight > 0, self.m1[keys] / weight, np.nan)
+            variance = np.maximum(self.m2[keys] / weight - mean * mean, 0.0)
+        return mean, variance
+
+    def update(self, keys, epochs, values, groups=None) -> None:
+        """Fold readings in time order; `groups` is `_groups(keys, epochs)` if already known."""
+        unique, inverse, sizes, later = groups or _groups(keys, epochs)
+        decay = 1.0 - self.alpha
+        # Sequential EWMA in closed form: the k-th newest reading of a group weighs alpha·decay^k
+        weights = self.alpha * decay ** later
+        carry = decay ** sizes
+        self.count[unique] += sizes
+        self.weight[unique] = self.weight[unique] * carry + (1.0 - carry)
+        self.m1[unique] = self.m1[unique] * carry + np.bincount(inverse, weights * values, len(unique))
+        self.m2[unique] = self.m2[unique] * carry + np.bincount(inverse, weights * values * values, len(unique))
+
+
+class AnomalyDetector:
+    """Online statistics per (device, sensor_type) and batch scoring."""
+
+    def __init__(
+        self,
+        alpha: float = 0.05,
+        z_threshold: float = 4.0,
+        robust_z_threshold: float = 3.5,
+        warmup: int = 30,
+        season_slots: int = 24,
+        season_slot_seconds: int = 3600,
+        season_alpha: float = 0.01,
+        cooldown_seconds: float = 300.0,
+        max_series: int = 50_000,
+        capacity: int = 1024,
+    ):
+        if np is None:
+            raise RuntimeError("Anomaly detection needs numpy")
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.robust_z_threshold = robust_z_threshold
+        self.warmup = max(1, warmup)
+        self.season_slots = max(1, season_slots)
+        self.season_slot_seconds = max(1, season_slot_seconds)
+        self.cooldown_seconds = cooldown_seconds
+        self.max_series = max(1, max_series)
+        self._index: Dict[Tuple[str, str], int] = {}
+        self.names: List[Tuple[str, str]] = []
+        capacity = min(max(1, capacity), self.max_series)
+        # Readings are centred on each series' first value to keep m2 - m1² accurate
+        self.reference = np.zeros(capacity)
+        self.median = np.zeros(capacity)
+        self.mad = np.zeros(capacity)
+        self.last_event = np.full(capacity, -np.inf)
+        self.moments = WeightedMoments(alpha, capacity)
+        self.seasonal = WeightedMoments(season_alpha, capacity * self.season_slots) if self.season_slots > 1 else None
+        self.readings = 0
+        self.anomalies = 0
+        self.suppressed = 0
+        self.untracked = 0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def series(self, device_id: str, sensor_type: str, first_value: float) -> int:
+        """Index of a series, created on first sight; -1 once `max_series` are tracked."""
+        key = (device_id, sensor_type)
+        index = self._index.get(key)
+        if index is not None:
+            return index
+        index = len(self.names)
+        if index >= self.max_series:
+            self.untracked += 1
+            return -1
+        if index >= len(self.reference):
+            self._grow(min(self.max_series, 2 * len(self.reference)))
+        self._index[key] = index
+        self.names.append(key)
+        self.reference[index] = first_value
+        return index
+
+    def _grow(self, capacity: int) -> None:
+        extra = capacity - len(self.reference)
+        self.reference = np.concatenate([self.reference, np.zeros(extra)])
+        self.median = np.concatenate([self.median, np.zeros(extra)])
+        self.mad = np.concatenate([self.mad, np.zeros(extra)])
+        self.last_event = np.concatenate([self.last_event, np.full(extra, -np.inf)])
+        self.moments.grow(capacity)
+        if self.seasonal is not None:
+            # Slots of a series are contiguous, so the new series' slots are simply appended
+            self.seasonal.grow(capacity * self.season_slots)
+
+    def update(self, series, epochs, values) -> Dict[str, Any]:
+        """
+        Score a batch of readings against the state before it, then fold it in.
+
+        `series`, `epochs` (seconds) and `values` are equally long arrays.
+        Returns per-reading arrays: `anomalous` (after cooldown), `z`,
+        `robust_z`, `seasonal_z` (NaN where the slot is not warmed up) and
+        `expected` (the EWMA mean).
+        """
+        series = np.asarray(series, dtype=np.int64)
+        epochs = np.asarray(epochs, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        centred = values - self.reference[series]
+
+        mean, variance = self.moments.estimate(series)
+        floor = MIN_SCALE + MIN_SCALE_FRACTION * np.abs(self.reference[series] + np.nan_to_num(mean))
+        std = np.maximum(np.sqrt(variance), floor)
+        warm = self.moments.count[series] >= self.warmup
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = np.where(warm, (centred - mean) / std, 0.0)
+            robust_z = np.where(
+                warm, MAD_SCALE * (centred - self.median[series]) / np.maximum(self.mad[series], floor), 0.0
+            )
+        anomalous = warm & (np.abs(z) >= self.z_threshold) & (np.abs(robust_z) >= self.robust_z_threshold)
+
+        seasonal_z = np.full(len(series), np.nan)
+        if self.seasonal is not None:
+            slots = series * self.season_slots + (epochs // self.season_slot_seconds).astype(np.int64) % self.season_slots
+            slot_mean, slot_variance = self.seasonal.estimate(slots)
+            slot_warm = self.seasonal.count[slots] >= self.warmup
+            with np.errstate(invalid="ignore"):
+                seasonal_z[slot_warm] = (
+                    (centred - slot_mean) / np.maximum(np.sqrt(slot_variance), floor)
+                )[slot_warm]
+            anomalous &= ~slot_warm | (np.abs(seasonal_z) >= self.z_threshold)
+            self.seasonal.update(slots, epochs, centred)
+
+        groups = _groups(series, epochs)
+        # Series still warming up when the batch arrived take their robust state from the moments
+        warming = groups[0][self.moments.count[groups[0]] < self.warmup]
+        self._fold_robust(series, centred, groups)
+        self.moments.update(series, epochs, centred, groups)
+        if len(warming):
+            seed_mean, seed_variance = self.moments.estimate(warming)
+            self.median[warming] = seed_mean
+            self.mad[warming] = MAD_SCALE * np.sqrt(seed_variance)
+
+        anomalous = self._cooldown(anomalous, series, epochs)
+        self.readings += len(series)
+        self.anomalies += int(anomalous.sum())
+        return {
+            "anomalous": anomalous,
+            "z": z,
+            "robust_z": robust_z,
+            "seasonal_z": seasonal_z,
+            "expected": self.reference[series] + mean,
+        }
+
+    def _fold_robust(self, series, centred, groups) -> None:
+        """Frugal streaming median and MAD: step towards each reading by a fraction of the spread."""
+        unique, inverse, _, _ = groups
+        residual = centred - self.median[series]
+        toward = np.bincount(inverse, np.sign(residual), len(unique))
+        wider = np.bincount(inverse, np.sign(np.abs(residual) - self.mad[series]), len(unique))
+        self.median[unique] += self.alpha * self.mad[unique] * toward
+        self.mad[unique] *= np.exp(self.alpha * np.clip(wider, -50, 50))
+
+    def _cooldown(self, anomalous, series, epochs):
+        """Keep the first anomaly per series and batch, and only after its cooldown."""
+        flagged = np.flatnonzero(anomalous)
+        if not len(flagged):
+            return anomalous
+        flagged = flagged[np.lexsort((epochs[flagged], series[flagged]))]
+        _, first = np.unique(series[flagged], return_index=True)
+        keep = flagged[first]
+        keep = keep[epochs[keep] - self.last_event[series[keep]] >= self.cooldown_seconds]
+        self.last_event[series[keep]] = epochs[keep]
+        result = np.zeros(len(series), dtype=bool)
+        result[keep] = True
+        self.suppressed += len(flagged) - len(keep)
+        return result
+
+    def observe_rows(self, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Score stored `sensor_data` rows; returns anomaly events."""
+        series: List[int] = []
+        epochs: List[float] = []
+        values: List[float] = []
+        owners: List[int] = []
+        for position, row in enumerate(rows):
+            payload = row["payload"]
+            if isinstance(payload, (str, bytes)):
+                try:
+                    payload = json_loads(payload)
+                except ValueError:
+                    continue
+            epoch = to_epoch(row["timestamp"])
+            for sensor_type, value in extract_readings(payload):
+                index = self._index.get((row["device_id"], sensor_type))
+                if index is None:
+                    index = self.series(row["device_id"], sensor_type, value)
+                    if index < 0:
+                        continue
+                series.append(index)
+                epochs.append(epoch)
+                values.append(value)
+                owners.append(position)
+        if not series:
+            return []
+        scores = self.update(series, epochs, values)
+        events = []
+        for reading in np.flatnonzero(scores["anomalous"]).tolist():
+            row = rows[owners[reading]]
+            seasonal_z = float(scores["seasonal_z"][reading])
+            events.append({
+                "type": "anomaly",
+                "tenant_id": row.get("tenant_id"),
+                "device_id": row["device_id"],
+                "sensor_type": self.names[series[reading]][1],
+                "value": values[reading],
+                "expected": float(scores["expected"][reading]),
+                "z": round(float(scores["z"][reading]), 3),
+                "robust_z": round(float(scores["robust_z"][reading]), 3),
+                "seasonal_z": None if math.isnan(seasonal_z) else round(seasonal_z, 3),
+                "timestamp": row["timestamp"].isoformat(),
+            })
+        return events
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "series": len(self.names),
+            "readings": self.readings,
+            "anomalies": self.anomalies,
+            "suppressed": self.suppressed,
+            "untracked": self.untracked,
+        }
+
+    @classmethod
+    def from_settings(cls) -> "AnomalyDetector":
+        return cls(
+            alpha=settings.ANOMALY_EWMA_ALPHA,
+            z_threshold=settings.ANOMALY_Z_THRESHOLD,
+            robust_z_threshold=settings.ANOMALY_ROBUST_Z_THRESHOLD,
+            warmup=settings.ANOMALY_WARMUP_READINGS,
+            season_slots=settings.ANOMALY_SEASON_SLOTS,
+            season_slot_seconds=settings.ANOMALY_SEASON_SLOT_SECONDS,
+            season_alpha=settings.ANOMALY_SEASON_ALPHA,
+            cooldown_seconds=settings.ANOMALY_COOLDOWN_SECONDS,
+            max_series=settings.ANOMALY_MAX_SERIES,
+        )
+
+
+class AnomalyMonitor:
+    """
+    Runs a detector next to the ingest pipeline: stored batches are queued
+    by the fan-out stage and scored by one background task.
+
+    A full queue drops batches (counted) rather than slowing ingestion.
+    """
+
+    def __init__(self, detector: AnomalyDetector, redis_client=None, session_factory=None, queue_size: int = 100):
+        self.detector = detector
+        self.redis = redis_client
+        self.session_factory = session_factory
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self.events = 0
+        self.dropped_rows = 0
+        self.errors = 0
+
+    def submit(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            self.queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            self.dropped_rows += len(rows)
+
+    async def process(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        events = self.detector.observe_rows(rows)
+        if events:
+            await self.emit(events)
+        return events
+
+    async def run(self) -> None:
+        while True:
+            rows = await self.queue.get()
+            try:
+                await self.process(rows)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Anomaly detection failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def emit(self, events: List[Dict[str, Any]]) -> None:
+        """Publish events to Redis and record them in the audit log; each is best effort."""
+        self.events += len(events)
+        if self.redis is not None:
+            await publish_events(self.redis, ANOMALY_CHANNEL, events)
+        if self.session_factory is not None:
+            await audit_events(self.session_factory, [audit_row(AUDIT_ACTION, event) for event in events])
+
+    def metrics(self) -> Dict[str, int]:
+        metrics = self.detector.metrics()
+        metrics.update({
+            "events": self.events,
+            "queued": self.queue.qsize(),
+            "dropped_rows": self.dropped_rows,
+            "errors": self.errors,
+        })
+        return metrics
@@ -0,0 +1,398 @@
+# app/ingestion/archive.py
+"""
+Hot/cold tiering of `sensor_data` to local Parquet archives.
+
+• `SensorArchiver` moves each closed day of `sensor_data` rows older than
+  `SENSOR_ARCHIVE_AFTER_DAYS` to Parquet files under `SENSOR_ARCHIVE_DIR`,
+  laid out as `{tenant}/{device}/{YYYY-MM-DD}/{part}.parquet`, and deletes
+  the rows once the files are on disk. Late rows for an archived day go
+  to another part file of that day on the next pass.
+• Rows are sorted by `(timestamp, id)` and written in row groups of
+  `SENSOR_ARCHIVE_ROW_GROUP_ROWS`, so time ranges prune whole day
+  directories and then row groups by their timestamp statistics; reads
+  only decode the columns they ask for.
+• `sensor_data_history_page` merges database rows and archive reads for
+  the history endpoint; rows stored without a tenant live under `_`.
+• Needs the optional `pyarrow` package. Runs periodically in the API when
+  enabled; `python -m app.ingestion.archive` runs one pass (e.g. from cron).
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import uuid
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import delete, func, select, text
+
+from app.core.config import settings
+from app.db.pagination import apply_keyset, decode_cursor, encode_cursor
+from app.models.sensor import SensorData
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on installed extras
+    pa = None
+    pc = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("id", "timestamp", "created_at", "payload")
+NO_TENANT = "_"
+PART_SUFFIX = ".parquet"
+
+# Arbitrary constant namespacing the archiver advisory lock
+ADVISORY_LOCK_ID = 0x5E4DA7A0
+
+
+def archive_available() -> bool:
+    """Whether archives can be written and read with the installed packages."""
+    return pq is not None
+
+
+def _path_part(value: str) -> str:
+    name = quote(value, safe="")
+    return name.replace(".", "%2E") if not name.strip(".") else name
+
+
+def device_dir(root: Path, tenant_id: Optional[str], device_id: str) -> Path:
+    return root / (_path_part(tenant_id) if tenant_id else NO_TENANT) / _path_part(device_id)
+
+
+def archive_schema():
+    return pa.schema([
+        ("id", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+        ("created_at", pa.timestamp("us")),
+        ("payload", pa.string()),
+    ])
+
+
+def write_day(
+    root: Path, tenant_id: Optional[str], device_id: str, day: date, rows: Sequence[Tuple], row_group_rows: int
+) -> Path:
+    """
+    Write `(id, timestamp, created_at, payload)` rows of one device-day,
+    sorted by `(timestamp, id)`, as a new part file. Blocking.
+    """
+    directory = device_dir(root, tenant_id, device_id) / day.isoformat()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{uuid.uuid4().hex}{PART_SUFFIX}"
+    columns = list(zip(*rows))
+    table = pa.table(
+        [
+            pa.array([str(row_id) for row_id in columns[0]], pa.string()),
+            pa.array(columns[1], pa.timestamp("us")),
+            pa.array(columns[2], pa.timestamp("us")),
+            pa.array(columns[3], pa.string()),
+        ],
+        schema=archive_schema(),
+    )
+    partial = path.with_suffix(".tmp")
+    pq.write_table(table, partial, row_group_size=max(1, row_group_rows), compression="zstd")
+    with open(partial, "rb") as handle:
+        os.fsync(handle.fileno())
+    os.replace(partial, path)
+    return path
+
+
+def archived_days(root: Path, tenant_id: Optional[str], device_id: str) -> List[Tuple[date, Path]]:
+    """Archived days of a device (and its tenant-less rows), oldest first."""
+    days: Dict[date, List[Path]] = {}
+    for tenant in dict.fromkeys([tenant_id, None]):
+        directory = device_dir(root, tenant, device_id)
+        if not directory.is_dir():
+            continue
+        for entry in directory.iterdir():
+            try:
+                day = date.fromisoformat(entry.name)
+            except ValueError:
+                continue
+            days.setdefault(day, []).extend(sorted(entry.glob(f"*{PART_SUFFIX}")))
+    return [(day, part) for day in sorted(days) for part in days[day]]
+
+
+def _overlaps(day: date, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    day_start = datetime.combine(day, time.min)
+    return (start is None or start < day_start + timedelta(days=1)) and (end is None or end >= day_start)
+
+
+def read_part(
+    path: Path, start: Optional[datetime], end: Optional[datetime], columns: Sequence[str] = COLUMNS
+):
+    """Rows of one part file in `[start, end]`, reading only overlapping row groups. Blocking."""
+    parquet = pq.ParquetFile(path)
+    index = parquet.schema_arrow.get_field_index("timestamp")
+    groups = []
+    for i in range(parquet.metadata.num_row_groups):
+        statistics = parquet.metadata.row_group(i).column(index).statistics
+        if statistics is not None and statistics.has_min_max:
+            if (start is not None and statistics.max < start) or (end is not None and statistics.min > end):
+                continue
+        groups.append(i)
+    read_columns = list(dict.fromkeys([*columns, "timestamp"]))
+    if not groups:
+        return parquet.schema_arrow.empty_table().select(list(columns))
+    table = parquet.read_row_groups(groups, columns=read_columns)
+    if start is not None:
+        table = table.filter(pc.greater_equal(table["timestamp"], pa.scalar(start, pa.timestamp("us"))))
+    if end is not None:
+        table = table.filter(pc.less_equal(table["timestamp"], pa.scalar(end, pa.timestamp("us"))))
+    return table.select(list(columns))
+
+
+def read_archive(
+    root: Path,
+    tenant_id: Optional[str],
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    columns: Sequence[str] = COLUMNS,
+) -> List[Dict[str, Any]]:
+    """Archived rows of a device in `[start, end]` as dicts of `columns`, unordered. Blocking."""
+    if pq is None:
+        return []
+    rows: List[Dict[str, Any]] = []
+    for day, part in archived_days(root, tenant_id, device_id):
+        if _overlaps(day, start, end):
+            rows.extend(read_part(part, start, end, columns).to_pylist())
+    return rows
+
+
+def to_sensor_data(row: Dict[str, Any], tenant_id: Optional[str], device_id: str) -> SensorData:
+    return SensorData(
+        id=uuid.UUID(row["id"]), tenant_id=tenant_id, device_id=device_id, payload=row["payload"],
+        timestamp=row["timestamp"], created_at=row["created_at"],
+    )
+
+
+def archive_root() -> Path:
+    return Path(settings.SENSOR_ARCHIVE_DIR)
+
+
+def archived_before(now: Optional[datetime] = None) -> datetime:
+    """Rows older than this may have moved to the archive."""
+    now = now or datetime.utcnow()
+    return datetime.combine(now.date(), time.min) - timedelta(days=settings.SENSOR_ARCHIVE_AFTER_DAYS)
+
+
+def _page_keys(
+    root: Path,
+    tenant_id: Optional[str],
+    device_id: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    position: Optional[Tuple[datetime, uuid.UUID]],
+    newer: List[datetime],
+    limit: int,
+) -> List[Tuple[datetime, uuid.UUID]]:
+    """
+    `(timestamp, id)` of archived rows in `[start, end]` before `position`,
+    newest days first, until no older day can reach the first `limit + 1`
+    rows. Blocking.
+    """
+    if position is not None and (end is None or position[0] < end):
+        end = position[0]
+    days = [(day, part) for day, part in archived_days(root, tenant_id, device_id) if _overlaps(day, start, end)]
+    keys: List[Tuple[datetime, uuid.UUID]] = []
+    for day, part in reversed(days):
+        day_end = datetime.combine(day, time.min) + timedelta(days=1)
+        if sum(1 for timestamp in newer if timestamp >= day_end) + sum(1 for key in keys if key[0] >= day_end) > limit:
+            break
+        table = read_part(part, start, end, ("id", "timestamp"))
+        for row_id, timestamp in zip(table["id"].to_pylist(), table["timestamp"].to_pylist()):
+            key = (timestamp, uuid.UUID(row_id))
+            if position is None or key < position:
+                keys.append(key)
+    return keys
+
+
+async def sensor_data_history_page(
+    session,
+    statement,
+    tenant_id: Optional[str],
+    device_id: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    cursor: Optional[str],
+    limit: int,
+) -> Tuple[List[SensorData], Optional[str]]:
+    """
+    `keyset_page` over `sensor_data` rows and archived rows merged, newest
+    first by `(timestamp, id)`. The archive is scanned for keys only, then
+    payloads are read for the time span of the page.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    result = await session.execute(apply_keyset(statement, SensorData, cursor, limit))
+    rows: List[Any] = list(result.scalars().all())
+    keys: List[Tuple[datetime, uuid.UUID]] = []
+    if pq is not None:
+        keys = await asyncio.to_thread(
+            _page_keys, archive_root(), tenant_id, device_id, start, end, position,
+            [row.timestamp for row in rows], limit,
+        )
+
+    if keys:
+        # Keep only the archived keys that make it into this page
+        merged = sorted([*((row.timestamp, row.id) for row in rows), *keys], reverse=True)[:limit + 1]
+        chosen = set(merged) & set(keys)
+        if chosen:
+            low, high = min(chosen)[0], max(chosen)[0]
+            archived = await asyncio.to_thread(read_archive, archive_root(), tenant_id, device_id, low, high)
+            rows.extend(
+                to_sensor_data(row, tenant_id, device_id)
+                for row in archived
+                if (row["timestamp"], uuid.UUID(row["id"])) in chosen
+            )
+            rows.sort(key=lambda data: (data.timestamp, data.id), reverse=True)
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+
+class SensorArchiver:
+    """Moves closed days of `sensor_data` rows to Parquet archives."""
+
+    def __init__(
+        self,
+        session_factory,
+        root: Path,
+        after_days: int = 90,
+        interval_seconds: float = 3600,
+        devices_per_pass: int = 500,
+        row_group_rows: int = 10000,
+    ):
+        self.session_factory = session_factory
+        self.root = Path(root)
+        self.after = timedelta(days=max(1, after_days))
+        self.interval_seconds = interval_seconds
+        self.devices_per_pass = max(1, devices_per_pass)
+        self.row_group_rows = max(1, row_group_rows)
+
+    @classmethod
+    def from_settings(cls, session_factory) -> "SensorArchiver":
+        return cls(
+            session_factory,
+            archive_root(),
+            after_days=settings.SENSOR_ARCHIVE_AFTER_DAYS,
+            interval_seconds=settings.SENSOR_ARCHIVE_INTERVAL_SECONDS,
+            devices_per_pass=settings.SENSOR_ARCHIVE_DEVICES_PER_PASS,
+            row_group_rows=settings.SENSOR_ARCHIVE_ROW_GROUP_ROWS,
+        )
+
+    def cutoff(self, now: datetime) -> datetime:
+        """Only days ending at or before this instant are moved."""
+        return datetime.combine(now.date(), time.min) - self.after
+
+    async def archive_window(self, session, start: datetime, end: datetime, written: List[Path]) -> Dict[str, int]:
+        """
+        Archive up to `devices_per_pass` devices of `[start, end)`, adding
+        the files written to `written` (caller commits, or removes them).
+        """
+        window = (SensorData.timestamp >= start, SensorData.timestamp < end)
+        result = await session.execute(
+            select(SensorData.device_id).where(*window).distinct().limit(self.devices_per_pass)
+        )
+        devices = [device_id for (device_id,) in result.all()]
+        if not devices:
+            return {"files": 0, "rows": 0}
+
+        result = await session.execute(
+            select(
+                SensorData.id, SensorData.tenant_id, SensorData.device_id,
+                SensorData.timestamp, SensorData.created_at, SensorData.payload,
+            )
+            .where(SensorData.device_id.in_(devices), *window)
+            .order_by(SensorData.timestamp, SensorData.id)
+        )
+        groups: Dict[Tuple[Optional[str], str], List[Tuple]] = {}
+        ids = []
+        for row_id, tenant_id, device_id, timestamp, created_at, payload in result.all():
+            groups.setdefault((tenant_id, device_id), []).append((row_id, timestamp, created_at, payload))
+            ids.append(row_id)
+
+        for (tenant_id, device_id), rows in groups.items():
+            written.append(await asyncio.to_thread(
+                write_day, self.root, tenant_id, device_id, start.date(), rows, self.row_group_rows
+            ))
+        # Delete exactly the rows that were written; rows arriving meanwhile stay in the database
+        for i in range(0, len(ids), 5000):
+            await session.execute(
+                delete(SensorData).where(
+                    SensorData.id.in_(ids[i:i + 5000]), SensorData.timestamp >= start, SensorData.timestamp < end
+                )
+            )
+        return {"files": len(groups), "rows": len(ids)}
+
+    async def archive_once(self, now: Optional[datetime] = None, max_windows: int = 24) -> Optional[Dict[str, int]]:
+        """
+        Archive the oldest eligible days, one transaction per (day, device
+        batch); None when another process holds the lock.
+        """
+        if pq is None:
+            raise RuntimeError("Sensor archiving requires pyarrow")
+        cutoff = self.cutoff(now or datetime.utcnow())
+        totals = {"files": 0, "rows": 0}
+        for _ in range(max_windows):
+            async with self.session_factory() as session:
+                if session.bind.dialect.name == "postgresql":
+                    locked = await session.execute(
+                        text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID}
+                    )
+                    if not locked.scalar():
+                        return None
+                oldest = (await session.execute(
+                    select(func.min(SensorData.timestamp)).where(SensorData.timestamp < cutoff)
+                )).scalar()
+                if oldest is None:
+                    break
+                start = datetime.combine(oldest.date(), time.min)
+                written: List[Path] = []
+                try:
+                    counts = await self.archive_window(session, start, start + timedelta(days=1), written)
+                    await session.commit()
+                except BaseException:
+                    # The rows stay in the database; don't leave copies in the archive
+                    for path in written:
+                        path.unlink(missing_ok=True)
+                    raise
+            totals["files"] += counts["files"]
+            totals["rows"] += counts["rows"]
+        if totals["rows"]:
+            logger.info(f"Archived {totals['rows']} sensor_data rows into {totals['files']} Parquet files")
+        return totals
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.archive_once()
+            except Exception as e:
+                logger.error(f"Sensor archiving failed: {e}")
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Move cold sensor_data rows to Parquet archives")
+    parser.add_argument("--max-windows", type=int, default=24, help="Day/device batches to archive in this pass")
+    args = parser.parse_args()
+
+    from app.db.session import AsyncSessionLocal
+
+    totals = await SensorArchiver.from_settings(AsyncSessionLocal).archive_once(max_windows=args.max_windows)
+    if totals is None:
+        print("Another archiving pass is running")
+    else:
+        print(f"Archived {totals['rows']} rows into {totals['files']} files")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,172 @@
+# app/ingestion/batching.py
+"""
+Micro-batched bulk writer for sensor data.
+
+• Buffers `SensorData` rows until a size or linger-time threshold is hit.
+• Writes each batch with one multi-row INSERT (COPY on PostgreSQL/asyncpg).
+• Folds each batch into the 1m/1h/1d rollups in the same transaction.
+• Notifies an optional callback with the rows of every successful flush.
+• Batches that fail or time out go to an optional disk spool instead of
+  being dropped.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.ingestion.rollups import RollupAccumulator, apply_rollups
+from app.ingestion.spool import Spool
+from app.models.sensor import SensorData
+
+logger = logging.getLogger(__name__)
+
+FlushCallback = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+SENSOR_DATA_COLUMNS = ["id", "tenant_id", "device_id", "payload", "timestamp", "created_at"]
+
+
+def insert_statement(table, dialect_name: str, ignore_conflicts: bool = False):
+    """Multi-row INSERT for `table`, skipping rows whose key exists if asked (PostgreSQL/SQLite)."""
+    key = [column.name for column in table.primary_key.columns]
+    if ignore_conflicts and dialect_name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing(index_elements=key)
+    if ignore_conflicts and dialect_name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=key)
+    return insert(table)
+
+
+class BulkWriter:
+    """Collect sensor rows and persist them in batches."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any],
+        batch_size: int = 500,
+        linger_ms: int = 50,
+        use_copy: bool = True,
+        on_flush: Optional[FlushCallback] = None,
+        spool: Optional[Spool] = None,
+        write_timeout: Optional[float] = None,
+        rollups: bool = True,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.linger = max(0, linger_ms) / 1000.0
+        self.use_copy = use_copy
+        self.on_flush = on_flush
+        self.spool = spool
+        self.write_timeout = write_timeout or None
+        self.rollups = rollups
+
+        self._rows: List[Dict[str, Any]] = []
+        self._first_row_at: Optional[float] = None
+
+        self.rows_written = 0
+        self.rows_spooled = 0
+        self.flush_count = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of rows waiting for the next flush."""
+        return len(self._rows)
+
+    async def add(self, row: Dict[str, Any]) -> None:
+        """Buffer a row, flushing immediately once the batch is full."""
+        if not self._rows:
+            self._first_row_at = time.monotonic()
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Write all buffered rows in one statement and return the row count.
+
+        The buffer is swapped out before the first await, so concurrent
+        callers each write a distinct batch. With a spool configured, a failed
+        or timed-out write is spooled and 0 is returned; without one it raises.
+        """
+        if not self._rows:
+            return 0
+        rows = self._rows
+        self._rows = []
+        self._first_row_at = None
+
+        try:
+            await self.write_rows(rows)
+        except Exception as e:
+            if self.spool is None:
+                raise
+            logger.warning(f"Bulk flush failed, spooling {len(rows)} rows: {e!r}")
+            await asyncio.to_thread(self.spool.append, rows)
+            self.rows_spooled += len(rows)
+            return 0
+
+        self.rows_written += len(rows)
+        self.flush_count += 1
+
+        if self.on_flush is not None:
+            try:
+                await self.on_flush(rows)
+            except Exception as e:
+                logger.warning(f"Flush callback failed: {e}")
+
+        return len(rows)
+
+    async def run(self) -> None:
+        """Flush batches whose oldest row has waited longer than the linger time."""
+        interval = self.linger or 0.01
+        while True:
+            await asyncio.sleep(interval)
+            if self._first_row_at is None:
+                continue
+            if time.monotonic() - self._first_row_at >= self.linger:
+                try:
+                    # Shielded so that stopping the loop never aborts a write mid-commit
+                    await asyncio.shield(self.flush())
+                except Exception as e:
+                    logger.error(f"Bulk flush failed: {e}")
+
+    async def write_rows(self, rows: List[Dict[str, Any]], ignore_conflicts: bool = False) -> None:
+        """
+        Write rows in one transaction, bounded by `write_timeout`.
+
+        `ignore_conflicts` skips rows whose id already exists, which makes
+        replaying spooled batches idempotent.
+        """
+        async def write():
+            async with self.session_factory() as session:
+                await self._write(session, rows, ignore_conflicts)
+                await session.commit()
+
+        await asyncio.wait_for(write(), timeout=self.write_timeout)
+
+    async def _write(self, session, rows: List[Dict[str, Any]], ignore_conflicts: bool = False) -> None:
+        """Insert rows using COPY when the driver supports it."""
+        dialect = session.bind.dialect
+        if ignore_conflicts and self.rollups:
+            # Only rows actually inserted may reach the rollups
+            statement = insert_statement(SensorData.__table__, dialect.name, True)
+            result = await session.execute(statement.returning(SensorData.__table__.c.id), rows)
+            inserted = {row_id for (row_id,) in result.all()}
+            rows = [row for row in rows if row["id"] in inserted]
+        elif ignore_conflicts:
+            await session.execute(insert_statement(SensorData.__table__, dialect.name, True), rows)
+        elif self.use_copy and dialect.driver == "asyncpg":
+            connection = await session.connection()
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                SensorData.__tablename__,
+                records=[tuple(row[c] for c in SENSOR_DATA_COLUMNS) for row in rows],
+                columns=SENSOR_DATA_COLUMNS,
+            )
+        else:
+            await session.execute(insert(SensorData.__table__), rows)
+        if self.rollups:
+            rollups = RollupAccumulator()
+            rollups.add_payload_rows(rows)
+            await apply_rollups(session, rollups)
@@ -0,0 +1,350 @@
+# app/ingestion/blocks.py
+"""
+Compressed block storage for cold `sensors` history.
+
+• `SensorCompactor` turns each closed day of `sensors` rows older than
+  `SENSOR_COMPACTION_AFTER_DAYS` into one `sensor_blocks` row per
+  (device, sensor_type, unit), Gorilla-encoded (`app.core.gorilla`), and
+  deletes the raw rows in the same transaction. Rows carrying metadata
+  stay raw. Late rows for a compacted day are merged into its block on
+  the next pass.
+• Read helpers decode blocks transparently for the history, downsampling,
+  aggregation and rollup-recompute paths. Compacted readings get stable
+  ids derived from their series and timestamp; their `created_at` is
+  their timestamp.
+• Runs periodically in the API when enabled; `python -m
+  app.ingestion.blocks` runs one pass (e.g. from cron).
+"""
+
+import argparse
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, select, text
+
+from app.core.config import settings
+from app.core.gorilla import decode_series, encode_series
+from app.db.pagination import apply_keyset, decode_cursor, encode_cursor
+from app.models.sensor import Sensor, SensorBlock
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+WINDOW = timedelta(days=1)
+
+# Namespace of the derived ids of compacted readings
+BLOCK_ID_NAMESPACE = uuid.UUID("5e4b10c4-0000-4000-8000-000000000000")
+
+# Arbitrary constant namespacing the compaction advisory lock
+ADVISORY_LOCK_ID = 0x5E4B10C4
+
+
+def to_micros(timestamp: datetime) -> int:
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+@lru_cache(maxsize=64)
+def decode_block(data: bytes) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+    """Decoded (timestamps, values) of a block; recently read blocks are cached."""
+    timestamps, values = decode_series(data)
+    return tuple(timestamps), tuple(values)
+
+
+class BlockPoint(NamedTuple):
+    """One compacted reading; `dup` numbers readings sharing a timestamp."""
+    device_id: str
+    sensor_type: str
+    unit: str
+    micros: int
+    value: float
+    dup: int
+
+    @property
+    def timestamp(self) -> datetime:
+        return from_micros(self.micros)
+
+    @property
+    def id(self) -> uuid.UUID:
+        return uuid.uuid5(
+            BLOCK_ID_NAMESPACE, f"{self.device_id}|{self.sensor_type}|{self.unit}|{self.micros}|{self.dup}"
+        )
+
+    def to_sensor(self) -> Sensor:
+        timestamp = self.timestamp
+        return Sensor(
+            id=self.id, device_id=self.device_id, sensor_type=self.sensor_type, value=self.value,
+            unit=self.unit, timestamp=timestamp, created_at=timestamp,
+        )
+
+
+def block_points(
+    block: SensorBlock,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    end_exclusive: bool = False,
+) -> List[BlockPoint]:
+    """Readings of `block` within `[start, end]` (or `[start, end)`), oldest first."""
+    timestamps, values = decode_block(block.data)
+    low = to_micros(start) if start is not None else None
+    high = to_micros(end) if end is not None else None
+    points = []
+    previous, dup = None, 0
+    for micros, value in zip(timestamps, values):
+        dup = dup + 1 if micros == previous else 0
+        previous = micros
+        if low is not None and micros < low:
+            continue
+        if high is not None and (micros > high or (end_exclusive and micros == high)):
+            break
+        points.append(BlockPoint(block.device_id, block.sensor_type, block.unit, micros, value, dup))
+    return points
+
+
+async def iter_blocks(
+    session,
+    device_id: Optional[str] = None,
+    sensor_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    newest_first: bool = False,
+) -> AsyncIterator[SensorBlock]:
+    """Blocks overlapping `[start, end]`, streamed in time order."""
+    statement = select(SensorBlock)
+    if device_id is not None:
+        statement = statement.where(SensorBlock.device_id == device_id)
+    if sensor_type is not None:
+        statement = statement.where(SensorBlock.sensor_type == sensor_type)
+    if start is not None:
+        statement = statement.where(SensorBlock.last_timestamp >= start)
+    if end is not None:
+        statement = statement.where(SensorBlock.first_timestamp <= end)
+    if newest_first:
+        statement = statement.order_by(SensorBlock.last_timestamp.desc())
+    else:
+        statement = statement.order_by(SensorBlock.first_timestamp)
+    result = await session.stream(statement.execution_options(yield_per=16))
+    try:
+        async for (block,) in result:
+            yield block
+    finally:
+        await result.close()
+
+
+async def read_block_points(
+    session,
+    device_id: Optional[str] = None,
+    sensor_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    end_exclusive: bool = False,
+) -> List[BlockPoint]:
+    """All compacted readings in a range (unordered across series)."""
+    points: List[BlockPoint] = []
+    async for block in iter_blocks(session, device_id, sensor_type, start, end):
+        points.extend(block_points(block, start, end, end_exclusive))
+    return points
+
+
+async def has_blocks(session, device_id: str, sensor_type: str, start: datetime, end: datetime) -> bool:
+    """Whether any compacted readings of the series may fall in `[start, end]`."""
+    result = await session.execute(
+        select(SensorBlock.start_time).where(
+            SensorBlock.device_id == device_id,
+            SensorBlock.sensor_type == sensor_type,
+            SensorBlock.last_timestamp >= start,
+            SensorBlock.first_timestamp <= end,
+        ).limit(1)
+    )
+    return result.first() is not None
+
+
+async def sensor_history_page(
+    session, statement, device_id: str, sensor_type: Optional[str], cursor: Optional[str], limit: int
+) -> Tuple[List[Sensor], Optional[str]]:
+    """
+    `keyset_page` over `sensors` rows and compacted readings merged, newest
+    first by `(timestamp, id)`.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    result = await session.execute(apply_keyset(statement, Sensor, cursor, limit))
+    rows: List[Any] = list(result.scalars().all())
+
+    # Newest compacted readings past the cursor, until no older block can
+    # contribute to the first `limit + 1`
+    candidates: List[BlockPoint] = []
+    async for block in iter_blocks(session, device_id, sensor_type, end=position[0] if position else None,
+                                   newest_first=True):
+        newer = sum(1 for point in candidates if point.timestamp > block.last_timestamp)
+        newer += sum(1 for row in rows if row.timestamp > block.last_timestamp)
+        if newer > limit:
+            break
+        candidates.extend(block_points(block, end=position[0] if position else None))
+    if candidates:
+        candidates.sort(key=lambda point: point.micros, reverse=True)
+        # Ties with the cursor timestamp may still be filtered out below
+        ties = sum(1 for point in candidates if position is not None and point.timestamp == position[0])
+        cut = min(len(candidates), limit + 1 + ties)
+        while cut < len(candidates) and candidates[cut].micros == candidates[cut - 1].micros:
+            cut += 1
+        chosen = [point.to_sensor() for point in candidates[:cut]]
+        if position is not None:
+            chosen = [sensor for sensor in chosen if (sensor.timestamp, sensor.id) < position]
+        rows = sorted(rows + chosen, key=lambda sensor: (sensor.timestamp, sensor.id), reverse=True)
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+
+def merge_series(block: Optional[SensorBlock], rows: List[Tuple[datetime, float]]) -> Tuple[List[int], List[float]]:
+    """Readings of an existing block plus raw `(timestamp, value)` rows, time ordered."""
+    points = [(to_micros(timestamp), value) for timestamp, value in rows]
+    if block is not None:
+        timestamps, values = decode_block(block.data)
+        points.extend(zip(timestamps, values))
+    points.sort(key=lambda point: point[0])
+    return [micros for micros, _ in points], [value for _, value in points]
+
+
+class SensorCompactor:
+    """Compacts closed days of `sensors` rows into `sensor_blocks`."""
+
+    def __init__(
+        self,
+        session_factory,
+        after_days: int = 7,
+        interval_seconds: float = 3600,
+        devices_per_pass: int = 500,
+    ):
+        self.session_factory = session_factory
+        self.after = timedelta(days=max(1, after_days))
+        self.interval_seconds = interval_seconds
+        self.devices_per_pass = max(1, devices_per_pass)
+
+    @classmethod
+    def from_settings(cls, session_factory) -> "SensorCompactor":
+        return cls(
+            session_factory,
+            after_days=settings.SENSOR_COMPACTION_AFTER_DAYS,
+            interval_seconds=settings.SENSOR_COMPACTION_INTERVAL_SECONDS,
+            devices_per_pass=settings.SENSOR_COMPACTION_DEVICES_PER_PASS,
+        )
+
+    def cutoff(self, now: datetime) -> datetime:
+        """Only days ending at or before this instant are closed."""
+        return datetime.combine(now.date(), datetime.min.time()) - self.after
+
+    async def compact_window(self, session, start: datetime, end: datetime) -> Dict[str, int]:
+        """Compact up to `devices_per_pass` devices of `[start, end)` (caller commits)."""
+        eligible = (Sensor.timestamp >= start, Sensor.timestamp < end, Sensor.sensor_metadata.is_(None))
+        result = await session.execute(
+            select(Sensor.device_id).where(*eligible).distinct().limit(self.devices_per_pass)
+        )
+        devices = [device_id for (device_id,) in result.all()]
+        if not devices:
+            return {"blocks": 0, "rows": 0}
+
+        result = await session.execute(
+            select(Sensor.id, Sensor.device_id, Sensor.sensor_type, Sensor.unit, Sensor.timestamp, Sensor.value)
+            .where(Sensor.device_id.in_(devices), *eligible)
+            .order_by(Sensor.timestamp, Sensor.id)
+        )
+        series: Dict[Tuple[str, str, str], List[Tuple[datetime, float]]] = {}
+        ids = []
+        for row_id, device_id, sensor_type, unit, timestamp, value in result.all():
+            series.setdefault((device_id, sensor_type, unit or ""), []).append((timestamp, value))
+            ids.append(row_id)
+
+        existing = await session.execute(
+            select(SensorBlock).where(SensorBlock.device_id.in_(devices), SensorBlock.start_time == start)
+        )
+        blocks = {(block.device_id, block.sensor_type, block.unit): block for block in existing.scalars().all()}
+
+        for (device_id, sensor_type, unit), rows in series.items():
+            block = blocks.get((device_id, sensor_type, unit))
+            timestamps, values = merge_series(block, rows)
+            if block is None:
+                block = SensorBlock(device_id=device_id, sensor_type=sensor_type, unit=unit, start_time=start)
+                session.add(block)
+            block.end_time = end
+            block.first_timestamp = from_micros(timestamps[0])
+            block.last_timestamp = from_micros(timestamps[-1])
+            block.count = len(timestamps)
+            block.min_value = min(values)
+            block.max_value = max(values)
+            block.data = encode_series(timestamps, values)
+            block.created_at = datetime.utcnow()
+        await session.flush()
+
+        # Delete exactly the rows that were encoded; rows arriving meanwhile stay raw
+        for i in range(0, len(ids), 5000):
+            await session.execute(
+                delete(Sensor).where(Sensor.id.in_(ids[i:i + 5000]), Sensor.timestamp >= start, Sensor.timestamp < end)
+            )
+        return {"blocks": len(series), "rows": len(ids)}
+
+    async def compact_once(self, now: Optional[datetime] = None, max_windows: int = 24) -> Optional[Dict[str, int]]:
+        """
+        Compact the oldest eligible days, one transaction per
+        (day, device batch); None when another process holds the lock.
+        """
+        cutoff = self.cutoff(now or datetime.utcnow())
+        totals = {"blocks": 0, "rows": 0}
+        for _ in range(max_windows):
+            async with self.session_factory() as session:
+                if session.bind.dialect.name == "postgresql":
+                    locked = await session.execute(
+                        text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID}
+                    )
+                    if not locked.scalar():
+                        return None
+                oldest = (await session.execute(
+                    select(func.min(Sensor.timestamp)).where(
+                        Sensor.timestamp < cutoff, Sensor.sensor_metadata.is_(None)
+                    )
+                )).scalar()
+                if oldest is None:
+                    break
+                start = datetime.combine(oldest.date(), datetime.min.time())
+                counts = await self.compact_window(session, start, start + WINDOW)
+                await session.commit()
+            totals["blocks"] += counts["blocks"]
+            totals["rows"] += counts["rows"]
+        if totals["rows"]:
+            logger.info(f"Compacted {totals['rows']} sensor rows into {totals['blocks']} blocks")
+        return totals
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.compact_once()
+            except Exception as e:
+                logger.error(f"Sensor compaction failed: {e}")
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Compact cold sensor rows into compressed blocks")
+    parser.add_argument("--max-windows", type=int, default=24, help="Day/device batches to compact in this pass")
+    args = parser.parse_args()
+
+    from app.db.session import AsyncSessionLocal
+
+    totals = await SensorCompactor.from_settings(AsyncSessionLocal).compact_once(max_windows=args.max_windows)
+    if totals is None:
+        print("Another compaction is running")
+    else:
+        print(f"Compacted {totals['rows']} rows into {totals['blocks']} blocks")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,177 @@
+# app/ingestion/cache.py
+"""
+In-process tenant/device resolution cache for the worker.
+
+• Bounded LRU with per-entry TTL.
+• Maps topic tenant names to tenant ids and remembers known device ids.
+• Invalidated over Redis pub/sub when tenants or devices change.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+
+from app.core.redis import CACHE_INVALIDATION_CHANNEL
+from app.models.device import Device
+from app.models.tenant import Tenant
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Least-recently-used cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a live value and mark it recently used, or None."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """Drop a single entry if present."""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self._data.clear()
+
+
+class DeviceResolver:
+    """Resolve MQTT topic tenant/device names, creating records on first sight."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any],
+        max_entries: int = 100000,
+        ttl_seconds: float = 300.0,
+    ):
+        self.session_factory = session_factory
+        self.tenants = TTLCache(max_entries, ttl_seconds)  # tenant name -> tenant id
+        self.plans = TTLCache(max_entries, ttl_seconds)  # tenant name -> plan
+        self.devices = TTLCache(max_entries, ttl_seconds)  # device id -> tenant id
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, tenant_name: str, device_id: str) -> str:
+        """
+        Return the tenant id for a topic, touching the database only on a miss.
+
+        Raises ValueError when `device_id` is not a valid UUID.
+        """
+        tenant_id = self.tenants.get(tenant_name)
+        if tenant_id is not None and self.devices.get(device_id) is not None:
+            self.hits += 1
+            return tenant_id
+
+        self.misses += 1
+        async with self.session_factory() as session:
+            if tenant_id is None:
+                # Get tenant by name
+                result = await session.execute(select(Tenant).where(Tenant.name == tenant_name))
+                tenant = result.scalar_one_or_none()
+
+                if not tenant:
+                    # Create tenant if it doesn't exist
+                    tenant = Tenant(name=tenant_name, plan="free")
+                    session.add(tenant)
+                    await session.commit()
+                    await session.refresh(tenant)
+                    logger.info(f"Created new tenant: {tenant_name}")
+
+                tenant_id = str(tenant.id)
+                self.tenants.set(tenant_name, tenant_id)
+                self.plans.set(tenant_name, tenant.plan)
+
+            # Check if device exists
+            device_uuid = UUID(device_id)
+            result = await session.execute(select(Device).where(Device.id == device_uuid))
+            device = result.scalar_one_or_none()
+
+            if not device:
+                # Create device if it doesn't exist
+                device = Device(
+                    id=device_uuid,
+                    name=f"Device-{device_id[:8]}",
+                    tenant_id=tenant_id,
+                    is_active=True
+                )
+                session.add(device)
+                await session.commit()
+                logger.info(f"Created new device: {device_id}")
+
+            self.devices.set(device_id, tenant_id)
+
+        return tenant_id
+
+    def cached_plan(self, tenant_name: str) -> Optional[str]:
+        """Plan of a tenant seen recently, without touching the database."""
+        return self.plans.get(tenant_name)
+
+    def invalidate(self, kind: str, key: Optional[str] = None) -> None:
+        """Drop a tenant or device entry; a missing key clears that whole map."""
+        caches = {"tenant": [self.tenants, self.plans], "device": [self.devices]}.get(kind)
+        if caches is None:
+            logger.warning(f"Unknown cache invalidation kind: {kind}")
+            return
+        for cache in caches:
+            if key is None:
+                cache.clear()
+            else:
+                cache.pop(key)
+
+    def handle_message(self, data: str) -> None:
+        """Apply an invalidation message published by the API."""
+        try:
+            message: Dict[str, Any] = json.loads(data)
+            self.invalidate(message["kind"], message.get("key"))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Invalid cache invalidation message: {e}")
+
+    async def listen(self, redis_client) -> None:
+        """Follow the invalidation channel, flushing everything after a disconnect."""
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.handle_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error: {e}")
+            finally:
+                await pubsub.close()
+
+            # Invalidations may have been missed while disconnected
+            self.tenants.clear()
+            self.plans.clear()
+            self.devices.clear()
+            await asyncio.sleep(5)
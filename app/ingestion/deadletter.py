@@ -0,0 +1,222 @@
+# app/ingestion/deadletter.py
+"""
+Dead-letter queue for MQTT messages the ingest pipeline cannot accept.
+
+• Rejected messages go to a capped Redis Stream (XADD MAXLEN ~) with a
+  reason code, the error text and the original topic, payload and content type.
+• Entries can be listed, purged, or replayed by re-publishing them to the
+  broker, so they go through the normal (sharded) pipeline again.
+• Replay is rate-limited so a large backlog does not starve live traffic.
+
+CLI:
+    python -m app.ingestion.deadletter list [--reason R] [--count N]
+    python -m app.ingestion.deadletter replay [--reason R] [--count N] [--rate R]
+    python -m app.ingestion.deadletter purge [--reason R] [--count N]
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import redis.asyncio as redis
+from aiomqtt import Client, ProtocolVersion
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Reason codes
+INVALID_TOPIC = "invalid_topic"
+UNSUPPORTED_CODEC = "unsupported_codec"
+DECODE_ERROR = "decode_error"
+INVALID_DEVICE_ID = "invalid_device_id"
+RESOLVE_ERROR = "resolve_error"
+ENCODE_ERROR = "encode_error"  # decoded, but not storable as JSON
+REASONS = (INVALID_TOPIC, UNSUPPORTED_CODEC, DECODE_ERROR, INVALID_DEVICE_ID, RESOLVE_ERROR, ENCODE_ERROR)
+
+PAGE_SIZE = 500
+
+Publisher = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class DeadLetterQueue:
+    """Redis Stream–backed store of rejected ingest messages."""
+
+    def __init__(self, redis_client, stream: Optional[str] = None, maxlen: Optional[int] = None):
+        self.redis = redis_client
+        self.stream = stream or settings.INGEST_DEAD_LETTER_STREAM
+        self.maxlen = maxlen or settings.INGEST_DEAD_LETTER_MAXLEN
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    async def add(
+        self,
+        topic: str,
+        payload: bytes,
+        reason: str,
+        error: str = "",
+        content_type: Optional[str] = None,
+    ) -> Optional[str]:
+        """Store a rejected message; returns its stream id, or None if Redis failed."""
+        self.counts[reason] += 1
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        fields = {
+            "topic": topic,
+            "payload": base64.b64encode(payload or b"").decode("ascii"),
+            "reason": reason,
+            "error": error[:500],
+            "content_type": content_type or "",
+            "received_at": datetime.utcnow().isoformat(),
+        }
+        try:
+            return await self.redis.xadd(self.stream, fields, maxlen=self.maxlen, approximate=True)
+        except Exception as e:
+            logger.warning(f"Failed to store dead letter ({reason}): {e}")
+            return None
+
+    async def size(self) -> int:
+        """Number of entries in the stream."""
+        return await self.redis.xlen(self.stream)
+
+    async def entries(
+        self,
+        count: int = 100,
+        reason: Optional[str] = None,
+        start: str = "-",
+    ) -> List[Dict[str, Any]]:
+        """Oldest-first entries from `start`, optionally only those with `reason`."""
+        found: List[Dict[str, Any]] = []
+        cursor = start
+        while len(found) < count:
+            page = await self.redis.xrange(self.stream, min=cursor, max="+", count=PAGE_SIZE)
+            if not page:
+                break
+            for entry_id, fields in page:
+                if reason is None or fields.get("reason") == reason:
+                    found.append(_entry(entry_id, fields))
+                    if len(found) == count:
+                        break
+            if len(page) < PAGE_SIZE:
+                break
+            cursor = "(" + page[-1][0]
+        return found
+
+    async def get(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """Entries with the given ids; unknown ids are skipped."""
+        found = []
+        for entry_id in ids:
+            page = await self.redis.xrange(self.stream, min=entry_id, max=entry_id, count=1)
+            found.extend(_entry(i, fields) for i, fields in page)
+        return found
+
+    async def delete(self, ids: List[str]) -> int:
+        """Remove entries by id."""
+        if not ids:
+            return 0
+        return await self.redis.xdel(self.stream, *ids)
+
+    async def replay(
+        self,
+        publish: Publisher,
+        count: int = 100,
+        reason: Optional[str] = None,
+        ids: Optional[List[str]] = None,
+        rate: Optional[float] = None,
+    ) -> Dict[str, int]:
+        """
+        Re-publish entries oldest-first at no more than `rate` messages/second.
+
+        Each entry is deleted once published; failed entries stay in the queue.
+        """
+        rate = rate or settings.INGEST_DEAD_LETTER_REPLAY_RATE
+        entries = await self.get(ids) if ids else await self.entries(count, reason)
+        replayed = failed = 0
+        for entry in entries:
+            started = time.monotonic()
+            try:
+                await publish(entry)
+                await self.redis.xdel(self.stream, entry["id"])
+                replayed += 1
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Failed to replay dead letter {entry['id']}: {e}")
+            delay = 1.0 / rate - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        logger.info(f"Dead-letter replay: {replayed} replayed, {failed} failed")
+        return {"replayed": replayed, "failed": failed}
+
+
+def _entry(entry_id: str, fields: Dict[str, str]) -> Dict[str, Any]:
+    """Decode a stream entry into a dead-letter dict with raw payload bytes."""
+    return {
+        "id": entry_id,
+        "topic": fields.get("topic", ""),
+        "payload": base64.b64decode(fields.get("payload", "")),
+        "reason": fields.get("reason", ""),
+        "error": fields.get("error", ""),
+        "content_type": fields.get("content_type") or None,
+        "received_at": fields.get("received_at"),
+    }
+
+
+@asynccontextmanager
+async def mqtt_publisher() -> AsyncIterator[Publisher]:
+    """Yield a publisher that re-sends dead letters to the MQTT broker."""
+    async with Client(
+        settings.MQTT_BROKER, port=settings.MQTT_PORT, protocol=ProtocolVersion.V5
+    ) as client:
+        async def publish(entry: Dict[str, Any]) -> None:
+            properties = None
+            if entry["content_type"]:
+                properties = Properties(PacketTypes.PUBLISH)
+                properties.ContentType = entry["content_type"]
+            await client.publish(entry["topic"], entry["payload"], qos=1, properties=properties)
+
+        yield publish
+
+
+async def run_cli(args: argparse.Namespace) -> None:
+    """Execute one CLI command against the configured Redis and broker."""
+    redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+    queue = DeadLetterQueue(redis_client)
+    try:
+        if args.command == "list":
+            print(f"{await queue.size()} dead letters in {queue.stream}")
+            for entry in await queue.entries(args.count, args.reason):
+                preview = entry["payload"][:80].decode("utf-8", errors="replace")
+                print(f"{entry['id']}  {entry['reason']:<18} {entry['topic']}  {entry['error']}  {preview!r}")
+        elif args.command == "replay":
+            async with mqtt_publisher() as publish:
+                result = await queue.replay(publish, args.count, args.reason, rate=args.rate)
+            print(f"Replayed {result['replayed']}, failed {result['failed']}")
+        elif args.command == "purge":
+            entries = await queue.entries(args.count, args.reason)
+            print(f"Purged {await queue.delete([e['id'] for e in entries])} dead letters")
+    finally:
+        await redis_client.aclose()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Inspect, replay or purge dead-lettered ingest messages."""
+    parser = argparse.ArgumentParser(description="Ingest dead-letter queue tool")
+    parser.add_argument("command", choices=("list", "replay", "purge"))
+    parser.add_argument("--reason", choices=REASONS, help="Only entries with this reason code")
+    parser.add_argument("--count", type=int, default=100, help="Max entries to process")
+    parser.add_argument(
+        "--rate", type=float, default=settings.INGEST_DEAD_LETTER_REPLAY_RATE,
+        help="Replay rate limit in messages per second",
+    )
+    asyncio.run(run_cli(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
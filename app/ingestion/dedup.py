@@ -0,0 +1,189 @@
+# app/ingestion/dedup.py
+"""
+Idempotency layer for at-least-once MQTT delivery.
+
+• Messages are keyed on (device_id, sequence number). Payloads without
+  one are not deduplicated unless content hashing is enabled; then they
+  are keyed on (device_id, hash of the raw payload) and remembered only
+  for `hash_window_seconds`, long enough to cover a QoS 1 redelivery but
+  not a device legitimately repeating a reading.
+• A time-windowed Bloom filter (two rotating generations, fixed size) answers
+  "definitely new" in process, with no I/O.
+• Suspected duplicates are confirmed exactly against Redis (`SET NX EX`); keys
+  of new messages are written to Redis in pipelined batches.
+• The filter only knows this process's messages. Where a redelivery may
+  reach another worker (shared subscriptions) every new key is claimed in
+  Redis first, one round trip per message; otherwise only during the first
+  window after start, when the predecessor's keys are still in Redis only.
+  Batched keys that turn out to be stored already are counted as
+  `late_duplicates`.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "ingest:dedup:"
+
+
+def message_key(
+    device_id: str, payload: Any, raw: bytes, sequence_field: str = "seq", hash_payloads: bool = False
+) -> Optional[str]:
+    """Idempotency key for one message, or None if it cannot be deduplicated."""
+    if isinstance(payload, dict) and payload.get(sequence_field) is not None:
+        return f"{device_id}:s:{payload[sequence_field]}"
+    if not hash_payloads:
+        return None
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    return f"{device_id}:h:{hashlib.blake2b(raw or b'', digest_size=16).hexdigest()}"
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` items at `error_rate`."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class Deduplicator:
+    """Drop redelivered messages seen within the dedup window."""
+
+    def __init__(
+        self,
+        redis_client,
+        window_seconds: int = 600,
+        capacity: int = 1_000_000,
+        error_rate: float = 0.001,
+        batch_size: int = 500,
+        hash_window_seconds: int = 0,
+        shared: bool = False,
+        cold_seconds: Optional[float] = None,
+    ):
+        self.redis = redis_client
+        self.window = window_seconds
+        self.hash_window = hash_window_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.batch_size = batch_size
+        self.shared = shared
+        self._cold_until = time.monotonic() + (window_seconds if cold_seconds is None else cold_seconds)
+
+        # Keys live for one to two windows: the current and the previous generation
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._rotated_at = time.monotonic()
+        # New keys not yet written to Redis, with their expiry in seconds
+        self._pending: Dict[str, int] = {}
+
+        self.checked = 0
+        self.suppressed = 0
+        self.false_positives = 0
+        self.late_duplicates = 0
+
+    def _rotate(self) -> None:
+        if time.monotonic() - self._rotated_at >= self.window:
+            self._previous = self._current
+            self._current = BloomFilter(self.capacity, self.error_rate)
+            self._rotated_at = time.monotonic()
+
+    def _expiry(self, key: str) -> int:
+        """Redis TTL of a key: one to two windows, or the hash window for content hashes."""
+        if self.hash_window > 0 and ":h:" in key:
+            return self.hash_window
+        return self.window * 2
+
+    async def _claim(self, key: str) -> Optional[bool]:
+        """`SET NX` one key: True if this call stored it, None when Redis failed."""
+        try:
+            return bool(await self.redis.set(KEY_PREFIX + key, 1, nx=True, ex=self._expiry(key)))
+        except Exception as e:
+            # Without the exact check, prefer a possible duplicate row to losing data
+            logger.warning(f"Dedup check failed, accepting message: {e}")
+            return None
+
+    async def is_duplicate(self, key: str) -> bool:
+        """Return True for a message already seen; otherwise remember it."""
+        self.checked += 1
+        self._rotate()
+
+        if key not in self._current and key not in self._previous:
+            self._current.add(key)
+            if not self.shared and time.monotonic() >= self._cold_until:
+                self._pending[key] = self._expiry(key)
+                if len(self._pending) >= self.batch_size:
+                    await self.flush()
+                return False
+            # Another worker, or this one before a restart, may have stored it
+            if await self._claim(key) is False:
+                self.suppressed += 1
+                return True
+            return False
+
+        # Suspected duplicate: confirm exactly
+        if key in self._pending:
+            self.suppressed += 1
+            return True
+        # Redis is the exact record; the filter may remember a content hash longer than its window
+        created = await self._claim(key)
+        if created is None:
+            return False
+        if created:
+            self.false_positives += 1
+            return False
+        self.suppressed += 1
+        return True
+
+    async def flush(self) -> None:
+        """Write remembered keys to Redis in one pipelined round trip."""
+        if not self._pending:
+            return
+        keys = self._pending
+        self._pending = {}
+        pipe = self.redis.pipeline(transaction=False)
+        for key, expiry in keys.items():
+            pipe.set(KEY_PREFIX + key, 1, nx=True, ex=expiry)
+        try:
+            created = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to store {len(keys)} dedup keys: {e}")
+            return
+        # Already stored by another process: a duplicate this one let through
+        self.late_duplicates += sum(1 for stored in created if not stored)
+
+    async def run(self, interval: float = 1.0) -> None:
+        """Flush remembered keys periodically, for suspected duplicates and restarts to find."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def metrics(self) -> Dict[str, int]:
+        """Dedup counters for monitoring."""
+        return {
+            "checked": self.checked,
+            "suppressed": self.suppressed,
+            "false_positives": self.false_positives,
+            "late_duplicates": self.late_duplicates,
+            "pending": len(self._pending),
+        }
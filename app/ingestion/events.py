@@ -0,0 +1,53 @@
+# app/ingestion/events.py
+"""
+Delivery of events the worker derives from stored readings (anomalies,
+alerts): one pipelined Redis round trip for publishing, one bulk insert
+into the audit log. Both are best effort.
+"""
+
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import insert
+
+from app.core.codecs import json_dumps
+from app.models.audit import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+def audit_row(action: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    """`audit_logs` row recording one device event."""
+    return {
+        "id": uuid.uuid4(),
+        "tenant_id": event.get("tenant_id"),
+        "user_id": None,
+        "action": action,
+        "resource_type": "device",
+        "resource_id": event["device_id"],
+        "details": json_dumps(event),
+        "ip_address": None,
+        "user_agent": None,
+        "created_at": datetime.utcnow(),
+    }
+
+
+async def publish_events(redis_client, channel: str, events: List[Dict[str, Any]]) -> None:
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for event in events:
+            pipe.publish(channel, json_dumps(event))
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to publish {channel} events: {e}")
+
+
+async def audit_events(session_factory, rows: List[Dict[str, Any]]) -> None:
+    try:
+        async with session_factory() as session:
+            await session.execute(insert(AuditLog.__table__), rows)
+            await session.commit()
+    except Exception as e:
+        logger.warning(f"Failed to audit events: {e}")
@@ -0,0 +1,69 @@
+# app/ingestion/fanout.py
+"""
+Batched Redis fan-out of new sensor data.
+
+• One Redis pipeline (one round trip) per stored batch.
+• Optional framing: one multi-event message per tenant instead of one per row.
+• `unpack_events()` lets subscribers handle both plain and framed messages.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from app.core.codecs import json_dumps, json_loads
+
+SENSOR_CHANNEL = "sensor_new"
+FRAME_TYPE = "sensor_batch"
+
+
+def sensor_event(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Real-time event published for one stored `sensor_data` row."""
+    return {
+        "device_id": row["device_id"],
+        "tenant_id": row["tenant_id"],
+        "payload": json_loads(row["payload"]),
+        "timestamp": row["timestamp"].isoformat()
+    }
+
+
+async def publish_batch(redis_client, rows: List[Dict[str, Any]], framed: bool = False) -> int:
+    """
+    Publish a batch of rows through a single non-transactional pipeline.
+
+    Returns the number of PUBLISH commands sent.
+    """
+    if not rows:
+        return 0
+
+    pipe = redis_client.pipeline(transaction=False)
+    if framed:
+        by_tenant: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for row in rows:
+            by_tenant[row["tenant_id"]].append(sensor_event(row))
+        for tenant_id, events in by_tenant.items():
+            pipe.publish(
+                SENSOR_CHANNEL,
+                json_dumps({"type": FRAME_TYPE, "tenant_id": tenant_id, "events": events}),
+            )
+        count = len(by_tenant)
+    else:
+        for row in rows:
+            pipe.publish(SENSOR_CHANNEL, json_dumps(sensor_event(row)))
+        count = len(rows)
+
+    await pipe.execute()
+    return count
+
+
+def unpack_events(data: str) -> List[Tuple[str, str]]:
+    """
+    Split a `sensor_new` message into `(tenant_id, event_json)` pairs.
+
+    Plain messages yield themselves; framed messages yield one pair per event.
+    Raises ValueError on invalid JSON.
+    """
+    message = json_loads(data)
+    if message.get("type") == FRAME_TYPE:
+        tenant_id = message.get("tenant_id")
+        return [(tenant_id, json_dumps(event)) for event in message.get("events", [])]
+    return [(message.get("tenant_id"), data)]
@@ -0,0 +1,187 @@
+# app/ingestion/pipeline.py
+"""
+Staged ingest pipeline with bounded queues.
+
+• receive → decode/validate → persist → fan-out, each stage fed by a bounded
+  `asyncio.Queue` and drained by a configurable number of worker tasks.
+• A full queue blocks the stage in front of it, so a slow database stops
+  the worker taking messages from the MQTT client. The client itself keeps
+  reading from the broker (aiomqtt has no flow control), so they pile up
+  in its receive buffer: unbounded by default, and discarded once full
+  when INGEST_RECEIVE_BUFFER sets a bound.
+• Keyed stages route items by a stable hash so that per-device ordering
+  survives stage concurrency.
+"""
+
+import asyncio
+import logging
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.ingestion.batching import BulkWriter
+from app.ingestion.sharding import device_from_topic
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = "ingest:metrics:"
+
+Handler = Callable[[Any], Awaitable[Any]]
+KeyFunc = Callable[[Any], str]
+
+
+class PipelineStage:
+    """A pool of worker tasks draining bounded queues through one handler."""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Handler,
+        concurrency: int = 1,
+        queue_size: int = 1000,
+        key: Optional[KeyFunc] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.key = key
+        # Keyed stages get one queue per worker so items with the same key stay in order
+        queue_count = self.concurrency if key is not None else 1
+        self.queues: List[asyncio.Queue] = [
+            asyncio.Queue(maxsize=max(1, queue_size)) for _ in range(queue_count)
+        ]
+        self.processed = 0
+        self.errors = 0
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        """Items waiting in this stage's queues."""
+        return sum(queue.qsize() for queue in self.queues)
+
+    @property
+    def capacity(self) -> int:
+        """Total number of items this stage can buffer."""
+        return sum(queue.maxsize for queue in self.queues)
+
+    async def put(self, item: Any) -> None:
+        """Enqueue an item, waiting while the target queue is full."""
+        if len(self.queues) == 1:
+            queue = self.queues[0]
+        else:
+            queue = self.queues[zlib.crc32(self.key(item).encode("utf-8")) % len(self.queues)]
+        await queue.put(item)
+
+    def start(self) -> None:
+        """Spawn the stage's worker tasks."""
+        for index in range(self.concurrency):
+            queue = self.queues[index % len(self.queues)]
+            self._tasks.append(
+                asyncio.create_task(self._work(queue), name=f"{self.name}-{index}")
+            )
+
+    async def join(self) -> None:
+        """Wait until every queued item has been handled."""
+        for queue in self.queues:
+            await queue.join()
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            item = await queue.get()
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error in {self.name} stage: {e}")
+            finally:
+                queue.task_done()
+
+    def metrics(self) -> Dict[str, int]:
+        """Queue depth and throughput counters for this stage."""
+        return {
+            "depth": self.depth,
+            "capacity": self.capacity,
+            "concurrency": self.concurrency,
+            "processed": self.processed,
+            "errors": self.errors,
+        }
+
+
+class IngestPipeline:
+    """Wire the decode, persist and fan-out stages around a bulk writer."""
+
+    def __init__(
+        self,
+        decode: Callable[[Any], Awaitable[Optional[Dict[str, Any]]]],
+        writer: BulkWriter,
+        publish: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+        queue_size: int = 1000,
+        decode_concurrency: int = 1,
+        persist_concurrency: int = 1,
+        fanout_concurrency: int = 1,
+    ):
+        self.decode_message = decode
+        self.writer = writer
+        self.decode = PipelineStage(
+            "decode", self._decode, decode_concurrency, queue_size,
+            key=lambda message: device_from_topic(message.topic.value) or message.topic.value,
+        )
+        self.persist = PipelineStage(
+            "persist", writer.add, persist_concurrency, queue_size,
+            key=lambda row: row["device_id"],
+        )
+        self.fanout = PipelineStage("fanout", publish, fanout_concurrency, queue_size)
+        # Stored batches are handed to fan-out; a slow publisher backs up persistence
+        self.writer.on_flush = self.fanout.put
+        self._linger_task: Optional[asyncio.Task] = None
+
+    @property
+    def stages(self) -> List[PipelineStage]:
+        return [self.decode, self.persist, self.fanout]
+
+    async def submit(self, message: Any) -> None:
+        """Receive stage hand-off: blocks while the decode queue is full."""
+        await self.decode.put(message)
+
+    async def _decode(self, message: Any) -> None:
+        row = await self.decode_message(message)
+        if row is not None:
+            await self.persist.put(row)
+
+    def start(self) -> None:
+        """Start every stage and the writer's linger flush loop."""
+        for stage in self.stages:
+            stage.start()
+        self._linger_task = asyncio.create_task(self.writer.run(), name="bulk-linger")
+
+    async def stop(self) -> None:
+        """Drain in-flight items through every stage, then stop the workers."""
+        await self.decode.join()
+        await self.persist.join()
+        if self._linger_task is not None:
+            self._linger_task.cancel()
+            await asyncio.gather(self._linger_task, return_exceptions=True)
+        try:
+            await self.writer.flush()
+        except Exception as e:
+            logger.error(f"Final flush failed: {e}")
+        await self.fanout.join()
+        for stage in self.stages:
+            await stage.stop()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per-stage queue depths and counters, plus writer and spool state."""
+        metrics: Dict[str, Any] = {stage.name: stage.metrics() for stage in self.stages}
+        metrics["persist"]["batch_pending"] = self.writer.pending
+        metrics["persist"]["rows_written"] = self.writer.rows_written
+        metrics["persist"]["rows_spooled"] = self.writer.rows_spooled
+        if self.writer.spool is not None:
+            metrics["spool"] = self.writer.spool.stats()
+        return metrics
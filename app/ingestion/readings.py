@@ -0,0 +1,131 @@
+# app/ingestion/readings.py
+"""
+Set-based helpers for HTTP sensor reading ingestion.
+
+• Validate reading items and turn them into `sensors` rows.
+• Check many device ids with a single query.
+• Insert many rows with a single multi-row INSERT, folding them into the
+  rollups in the same transaction; once committed, `readings_committed`
+  folds them into the device shadow and the recent-reading buffers.
+"""
+
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+
+from app.core.codecs import json_dumps
+from app.core.config import settings
+from app.ingestion.batching import insert_statement
+from app.ingestion.recent import get_recent_buffers
+from app.ingestion.rollups import RollupAccumulator, apply_rollups
+from app.ingestion.shadow import apply_observations, get_device_shadow, observe_sensor_rows
+from app.models.device import Device
+from app.models.sensor import Sensor
+
+
+def parse_timestamp(value: Any) -> datetime:
+    """Parse an ISO-8601 string or unix seconds into a naive UTC datetime."""
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC; convert aware query parameters."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def build_reading_row(item: Any) -> Dict[str, Any]:
+    """
+    Validate one reading and build a `sensors` row.
+
+    Items look like `{"device_id", "sensor_type", "value", "unit"?,
+    "metadata"?, "timestamp"?}`. Raises ValueError on invalid input.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Item must be an object")
+    for field in ("device_id", "sensor_type", "value"):
+        if item.get(field) is None:
+            raise ValueError(f"Missing required field: {field}")
+    try:
+        device_id = str(UUID(str(item["device_id"])))
+    except ValueError:
+        raise ValueError("Invalid device ID format")
+    try:
+        value = float(item["value"])
+    except (TypeError, ValueError):
+        raise ValueError("Invalid value")
+    try:
+        timestamp = parse_timestamp(item["timestamp"]) if item.get("timestamp") is not None else None
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("Invalid timestamp")
+
+    metadata = item.get("metadata")
+    if metadata is not None and not isinstance(metadata, str):
+        metadata = json_dumps(metadata)
+    now = datetime.utcnow()
+    return {
+        "id": uuid.uuid4(),
+        "device_id": device_id,
+        "sensor_type": str(item["sensor_type"]),
+        "value": value,
+        "unit": str(item.get("unit") or ""),
+        "sensor_metadata": metadata,
+        "timestamp": timestamp or now,
+        "created_at": now,
+    }
+
+
+async def fetch_device_status(session, device_ids: Iterable[str]) -> Dict[str, bool]:
+    """Map each existing device id to its `is_active` flag, in one query."""
+    uuids = {UUID(device_id) for device_id in device_ids}
+    if not uuids:
+        return {}
+    result = await session.execute(
+        select(Device.id, Device.is_active).where(Device.id.in_(uuids))
+    )
+    return {str(device_id): bool(is_active) for device_id, is_active in result.all()}
+
+
+async def insert_readings(
+    session, rows: List[Dict[str, Any]], ignore_conflicts: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Insert `sensors` rows with one multi-row statement (caller commits, then
+    passes the returned rows to `readings_committed`).
+
+    `ignore_conflicts` skips rows whose id already exists, for retried batches;
+    only rows actually inserted reach the rollups.
+    """
+    if not rows:
+        return rows
+    statement = insert_statement(Sensor.__table__, session.bind.dialect.name, ignore_conflicts)
+    if ignore_conflicts and settings.ROLLUPS_ENABLED:
+        result = await session.execute(statement.returning(Sensor.__table__.c.id), rows)
+        inserted = {row_id for (row_id,) in result.all()}
+        rows = [row for row in rows if row["id"] in inserted]
+    else:
+        await session.execute(statement, rows)
+    if settings.ROLLUPS_ENABLED:
+        rollups = RollupAccumulator()
+        rollups.add_sensor_rows(rows)
+        await apply_rollups(session, rollups)
+    return rows
+
+
+async def readings_committed(rows: List[Dict[str, Any]]) -> None:
+    """Fold committed `sensors` rows into the device shadow and the recent-reading buffers."""
+    if not rows:
+        return
+    await apply_observations(get_device_shadow(), observe_sensor_rows(rows))
+    buffers = get_recent_buffers()
+    if buffers is not None:
+        buffers.add_sensor_rows(rows)
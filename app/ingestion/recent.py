@@ -0,0 +1,266 @@
+# app/ingestion/recent.py
+"""
+In-memory ring buffers of recent readings for last-N-minutes queries.
+
+• One `SeriesRing` per (device, sensor_type): epoch seconds and values in
+  two fixed-capacity `array('d')` columns (16 bytes per reading); once
+  full, the oldest reading is overwritten.
+• Fed in the API process by the `sensor_new` subscription (readings the
+  MQTT worker stored) and by this process's own committed writes
+  (`readings_committed`).
+  Readings replayed from a worker spool are not published and so are
+  missing here.
+• A device's buffer holds every reading timestamped at or after its
+  creation, minus what was overwritten since. A range starting inside
+  that coverage is answered from memory, anything else misses and the
+  caller reads the database. Buffers serve only while the subscription
+  is up, and are dropped when it ends.
+• Memory is capped at `RECENT_BUFFER_MAX_POINTS` readings by evicting the
+  least recently used devices. Hits, misses and evictions are published
+  with the API metrics for the admin health overview.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import socket
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from app.core.codecs import json_dumps
+from app.core.config import settings
+from app.ingestion.pipeline import METRICS_KEY_PREFIX
+from app.ingestion.rollups import extract_readings
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+BYTES_PER_POINT = 16
+
+
+def to_epoch(timestamp: datetime) -> float:
+    return (timestamp - EPOCH) / timedelta(seconds=1)
+
+
+class SeriesRing:
+    """Fixed-capacity ring of (epoch, value) readings of one series."""
+
+    __slots__ = ("capacity", "epochs", "values", "head", "covered_since", "ordered")
+
+    def __init__(self, capacity: int, covered_since: float):
+        self.capacity = max(1, capacity)
+        self.epochs = array("d")
+        self.values = array("d")
+        self.head = 0  # oldest slot once full
+        self.covered_since = covered_since
+        self.ordered = True
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    def append(self, epoch: float, value: float) -> bool:
+        """Add a reading; True if it took a new slot, False if it overwrote one."""
+        if len(self.epochs) < self.capacity:
+            if self.epochs and epoch < self.epochs[-1]:
+                self.ordered = False
+            self.epochs.append(epoch)
+            self.values.append(value)
+            return True
+        if epoch < self.epochs[self.head - 1]:
+            self.ordered = False
+        # Readings up to the overwritten one are no longer all here
+        self.covered_since = max(self.covered_since, math.nextafter(self.epochs[self.head], math.inf))
+        self.epochs[self.head] = epoch
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        return False
+
+    def _linearize(self) -> None:
+        """Rewrite the ring oldest-first from slot 0, sorted by time."""
+        epochs = self.epochs[self.head:] + self.epochs[:self.head]
+        values = self.values[self.head:] + self.values[:self.head]
+        if not self.ordered:
+            pairs = sorted(zip(epochs, values))
+            epochs = array("d", (epoch for epoch, _ in pairs))
+            values = array("d", (value for _, value in pairs))
+        self.epochs, self.values, self.head, self.ordered = epochs, values, 0, True
+
+    def window(self, start: float, end: float) -> Tuple[List[float], List[float]]:
+        """Epochs and values in `[start, end)`, oldest first."""
+        if self.head or not self.ordered:
+            self._linearize()
+        low = bisect_left(self.epochs, start)
+        high = bisect_left(self.epochs, end)
+        return self.epochs[low:high].tolist(), self.values[low:high].tolist()
+
+
+class DeviceBuffer:
+    """Rings of one device and the time from which they are complete."""
+
+    __slots__ = ("covered_since", "series")
+
+    def __init__(self, covered_since: float):
+        self.covered_since = covered_since
+        self.series: Dict[str, SeriesRing] = {}
+
+    def points(self) -> int:
+        return sum(len(ring) for ring in self.series.values())
+
+
+class RecentBuffers:
+    """Per-device ring buffers under an LRU cap on the total readings held."""
+
+    def __init__(self, series_points: int = 4096, max_points: int = 2_000_000):
+        self.series_points = max(1, series_points)
+        self.max_points = max(1, max_points)
+        self._devices: "OrderedDict[str, DeviceBuffer]" = OrderedDict()
+        self.points = 0
+        self.live = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def set_live(self, live: bool) -> None:
+        """Start or stop serving; stopping drops everything held."""
+        self.live = live
+        if not live:
+            self._devices.clear()
+            self.points = 0
+
+    def add(self, device_id: str, sensor_type: str, timestamp: datetime, value: float,
+            now: Optional[datetime] = None) -> None:
+        if not self.live:
+            return
+        device = self._devices.get(device_id)
+        if device is None:
+            device = self._devices[device_id] = DeviceBuffer(to_epoch(now or datetime.utcnow()))
+        else:
+            self._devices.move_to_end(device_id)
+        epoch = to_epoch(timestamp)
+        if epoch < device.covered_since:
+            return  # stored before this buffer existed; the database has it
+        ring = device.series.get(sensor_type)
+        if ring is None:
+            ring = device.series[sensor_type] = SeriesRing(self.series_points, device.covered_since)
+        if ring.append(epoch, value):
+            self.points += 1
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.points > self.max_points and len(self._devices) > 1:
+            _, device = self._devices.popitem(last=False)
+            self.points -= device.points()
+            self.evictions += 1
+
+    def add_event(self, event: Dict[str, Any]) -> None:
+        """Fold one `sensor_new` event (a stored `sensor_data` row)."""
+        payload = event.get("payload")
+        device_id = event.get("device_id")
+        if not device_id or not isinstance(payload, (dict, list)) or not event.get("timestamp"):
+            return
+        timestamp = datetime.fromisoformat(event["timestamp"])
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        for sensor_type, value in extract_readings(payload):
+            self.add(device_id, sensor_type, timestamp, value)
+
+    def add_sensor_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Fold stored `sensors` rows."""
+        for row in rows:
+            self.add(row["device_id"], row["sensor_type"], row["timestamp"], row["value"])
+
+    def query(self, device_id: str, sensor_type: str, start: datetime, end: datetime
+              ) -> Optional[Tuple[List[float], List[float]]]:
+        """Epoch seconds and values in `[start, end)`, or None if memory cannot answer."""
+        device = self._devices.get(device_id) if self.live else None
+        start_epoch = to_epoch(start)
+        if device is None or start_epoch < device.covered_since:
+            self.misses += 1
+            return None
+        ring = device.series.get(sensor_type)
+        if ring is not None and start_epoch < ring.covered_since:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._devices.move_to_end(device_id)
+        if ring is None:
+            return [], []
+        return ring.window(start_epoch, to_epoch(end))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "live": self.live,
+            "devices": len(self._devices),
+            "series": sum(len(device.series) for device in self._devices.values()),
+            "points": self.points,
+            "max_points": self.max_points,
+            "bytes": self.points * BYTES_PER_POINT,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    async def report_metrics(self, redis_client, interval: float) -> None:
+        """Periodically publish metrics where the admin health overview reads them."""
+        key = f"{METRICS_KEY_PREFIX}api-recent-{socket.gethostname()}-{os.getpid()}"
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await redis_client.set(key, json_dumps({"recent_buffers": self.metrics()}), ex=int(interval * 3))
+            except Exception as e:
+                logger.warning(f"Failed to report recent buffer metrics: {e}")
+
+
+# ─────────────────── Process-wide instance (API) ───────── #
+
+_buffers: Optional[RecentBuffers] = None
+_redis_client = None
+_metrics_task: Optional[asyncio.Task] = None
+
+
+def get_recent_buffers() -> Optional[RecentBuffers]:
+    """The API's recent-reading buffers, or None when disabled."""
+    return _buffers
+
+
+def set_recent_buffers(buffers: Optional[RecentBuffers]) -> None:
+    global _buffers
+    _buffers = buffers
+
+
+async def start_recent_buffers() -> Optional[RecentBuffers]:
+    """
+    Create the buffers if enabled and start reporting their metrics (API
+    startup); they serve once the subscription is up.
+    """
+    global _redis_client, _metrics_task
+    if not settings.RECENT_BUFFER_ENABLED:
+        return None
+    buffers = RecentBuffers(
+        series_points=settings.RECENT_BUFFER_SERIES_POINTS,
+        max_points=settings.RECENT_BUFFER_MAX_POINTS,
+    )
+    _redis_client = aioredis.from_url(settings.REDIS_URL)
+    _metrics_task = asyncio.create_task(
+        buffers.report_metrics(_redis_client, settings.INGEST_METRICS_INTERVAL_SECONDS)
+    )
+    set_recent_buffers(buffers)
+    logger.info("Recent reading buffers enabled")
+    return buffers
+
+
+async def stop_recent_buffers() -> None:
+    global _redis_client, _metrics_task
+    set_recent_buffers(None)
+    if _metrics_task is not None:
+        _metrics_task.cancel()
+        _metrics_task = None
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
@@ -0,0 +1,363 @@
+# app/ingestion/rollups.py
+"""
+Incrementally maintained rollups of sensor readings (1m / 1h / 1d).
+
+• Per (device, sensor_type, resolution, bucket): count, min, max, sum and
+  the latest value, all mergeable.
+• Writers fold each committed batch into the rollups inside the same
+  transaction with one multi-row upsert, so rollups never count a row the
+  raw tables do not hold.
+• `sensors` rows contribute their `value`. `sensor_data` payloads contribute
+  each `sensor_data[]` item, or else every top-level numeric field (named by
+  its key).
+• `recompute_rollups` rebuilds the closed buckets of a window from raw rows
+  (compacted blocks included), and coarser buckets from finer ones,
+  overwriting them with an upsert. `RollupRepairer` runs it over a
+  trailing window to pick up late-arriving data, stopping short of the
+  buckets writers are still folding into.
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.core.codecs import json_loads
+from app.core.config import settings
+from app.ingestion.blocks import read_block_points
+from app.models.sensor import Sensor, SensorData, SensorRollup
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS: Dict[str, timedelta] = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+# Range served when a query gives no start time
+DEFAULT_WINDOWS: Dict[str, timedelta] = {
+    "1m": timedelta(days=1),
+    "1h": timedelta(days=7),
+    "1d": timedelta(days=90),
+}
+
+# Top-level payload fields that are not readings
+NON_READING_FIELDS = {"timestamp", "throttled_count"}
+
+# Arbitrary constant namespacing the repair advisory lock
+ADVISORY_LOCK_ID = 0x5E4505
+
+RollupKey = Tuple[str, str, str, datetime]
+
+
+def truncate(timestamp: datetime, resolution: str) -> datetime:
+    """Start of the `resolution` bucket holding `timestamp`."""
+    if resolution == "1m":
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == "1h":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def extract_readings(payload: Any) -> Iterator[Tuple[str, float]]:
+    """(sensor_type, value) pairs of a `sensor_data` payload."""
+    if not isinstance(payload, dict):
+        return
+    items = payload.get("sensor_data")
+    if isinstance(items, list):
+        for item in items:
+            if not isinstance(item, dict) or not item.get("sensor_type"):
+                continue
+            value = item.get("value")
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield str(item["sensor_type"]), float(value)
+        return
+    skip = NON_READING_FIELDS | {settings.INGEST_DEDUP_SEQUENCE_FIELD}
+    for key, value in payload.items():
+        if key not in skip and isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield key, float(value)
+
+
+class RollupAccumulator:
+    """Folds readings into per-bucket aggregates before they are upserted."""
+
+    def __init__(self, resolutions: Sequence[str] = tuple(RESOLUTIONS)):
+        self.resolutions = tuple(resolutions)
+        # key → [count, min, max, sum, last value, last timestamp]
+        self._buckets: Dict[RollupKey, List[Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def merge(self, key: RollupKey, count: int, low: float, high: float, total: float,
+              last: float, last_timestamp: datetime) -> None:
+        """Fold an already aggregated bucket into `key`."""
+        agg = self._buckets.get(key)
+        if agg is None:
+            self._buckets[key] = [count, low, high, total, last, last_timestamp]
+            return
+        agg[0] += count
+        agg[1] = min(agg[1], low)
+        agg[2] = max(agg[2], high)
+        agg[3] += total
+        if last_timestamp >= agg[5]:
+            agg[4], agg[5] = last, last_timestamp
+
+    def add(self, device_id: str, sensor_type: str, value: float, timestamp: datetime) -> None:
+        """Fold one reading into its bucket at every resolution."""
+        for resolution in self.resolutions:
+            key = (device_id, sensor_type, resolution, truncate(timestamp, resolution))
+            self.merge(key, 1, value, value, value, value, timestamp)
+
+    def add_sensor_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Fold `sensors` rows (HTTP ingestion)."""
+        for row in rows:
+            self.add(str(row["device_id"]), row["sensor_type"], float(row["value"]), row["timestamp"])
+
+    def add_payload_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Fold the numeric readings of `sensor_data` rows (MQTT ingestion)."""
+        for row in rows:
+            try:
+                payload = json_loads(row["payload"])
+            except ValueError:
+                continue
+            for sensor_type, value in extract_readings(payload):
+                self.add(str(row["device_id"]), sensor_type, value, row["timestamp"])
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """`sensor_rollups` rows, in key order so concurrent upserts lock alike."""
+        return [
+            {
+                "device_id": key[0],
+                "sensor_type": key[1],
+                "resolution": key[2],
+                "bucket": key[3],
+                "count": agg[0],
+                "min_value": agg[1],
+                "max_value": agg[2],
+                "sum_value": agg[3],
+                "last_value": agg[4],
+                "last_timestamp": agg[5],
+            }
+            for key, agg in sorted(self._buckets.items())
+        ]
+
+
+def _insert(dialect_name: str):
+    table = SensorRollup.__table__
+    if dialect_name == "postgresql":
+        return postgresql.insert(table), func.least, func.greatest
+    if dialect_name == "sqlite":
+        return sqlite.insert(table), func.min, func.max  # scalar with two arguments
+    raise ValueError(f"Rollups are not supported on {dialect_name}")
+
+
+def upsert_statement(dialect_name: str):
+    """INSERT … ON CONFLICT that merges new aggregates into existing buckets."""
+    table = SensorRollup.__table__
+    statement, least, greatest = _insert(dialect_name)
+    new = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key.columns],
+        set_={
+            "count": table.c.count + new.count,
+            "min_value": least(table.c.min_value, new.min_value),
+            "max_value": greatest(table.c.max_value, new.max_value),
+            "sum_value": table.c.sum_value + new.sum_value,
+            "last_value": case(
+                (new.last_timestamp >= table.c.last_timestamp, new.last_value),
+                else_=table.c.last_value,
+            ),
+            "last_timestamp": greatest(table.c.last_timestamp, new.last_timestamp),
+        },
+    )
+
+
+def replace_statement(dialect_name: str):
+    """INSERT … ON CONFLICT that overwrites existing buckets with recomputed ones."""
+    table = SensorRollup.__table__
+    statement, _, _ = _insert(dialect_name)
+    keys = [column.name for column in table.primary_key.columns]
+    return statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: statement.excluded[name] for name in table.c.keys() if name not in keys},
+    )
+
+
+async def apply_rollups(session, accumulator: RollupAccumulator) -> int:
+    """Merge accumulated buckets into `sensor_rollups` (caller commits)."""
+    rows = accumulator.rows()
+    if rows:
+        await session.execute(upsert_statement(session.bind.dialect.name), rows)
+    return len(rows)
+
+
+async def _accumulate_raw(session, accumulator: RollupAccumulator, start: datetime, end: datetime) -> None:
+    sensors = await session.stream(
+        select(Sensor.device_id, Sensor.sensor_type, Sensor.value, Sensor.timestamp)
+        .where(Sensor.timestamp >= start, Sensor.timestamp < end)
+        .execution_options(yield_per=10000)
+    )
+    async for device_id, sensor_type, value, timestamp in sensors:
+        accumulator.add(device_id, sensor_type, value, timestamp)
+    for point in await read_block_points(session, start=start, end=end, end_exclusive=True):
+        accumulator.add(point.device_id, point.sensor_type, point.value, point.timestamp)
+
+    payloads = await session.stream(
+        select(SensorData.device_id, SensorData.payload, SensorData.timestamp)
+        .where(SensorData.timestamp >= start, SensorData.timestamp < end)
+        .execution_options(yield_per=10000)
+    )
+    async for device_id, payload, timestamp in payloads:
+        accumulator.add_payload_rows([{"device_id": device_id, "payload": payload, "timestamp": timestamp}])
+
+
+async def _derive(session, accumulator: RollupAccumulator, source: str, target: str,
+                  start: datetime, end: datetime) -> None:
+    rows = await session.stream(
+        select(SensorRollup).where(
+            SensorRollup.resolution == source,
+            SensorRollup.bucket >= start,
+            SensorRollup.bucket < end,
+        )
+    )
+    async for (rollup,) in rows:
+        key = (rollup.device_id, rollup.sensor_type, target, truncate(rollup.bucket, target))
+        accumulator.merge(key, rollup.count, rollup.min_value, rollup.max_value,
+                          rollup.sum_value, rollup.last_value, rollup.last_timestamp)
+
+
+async def _replace(session, accumulator: RollupAccumulator) -> int:
+    rows = accumulator.rows()
+    if rows:
+        await session.execute(replace_statement(session.bind.dialect.name), rows)
+    return len(rows)
+
+
+async def recompute_rollups(session, start: datetime, end: datetime) -> Dict[str, int]:
+    """
+    Rebuild the minutes of `[start, end)` (start widened to a whole hour)
+    from raw rows, then the hours and days that closed by `end` from the
+    finer buckets.
+
+    Buckets still open at `end` are left to the writers, whose increments a
+    rebuild would overwrite. Buckets without raw rows (archived ranges) are
+    kept. Only run over windows whose raw rows are still retained. Caller
+    commits.
+    """
+    start, end = truncate(start, "1h"), truncate(end, "1m")
+    counts = {}
+
+    minutes = RollupAccumulator(resolutions=("1m",))
+    await _accumulate_raw(session, minutes, start, end)
+    counts["1m"] = await _replace(session, minutes)
+
+    hours = RollupAccumulator(resolutions=("1h",))
+    await _derive(session, hours, "1m", "1h", start, truncate(end, "1h"))
+    counts["1h"] = await _replace(session, hours)
+
+    days = RollupAccumulator(resolutions=("1d",))
+    await _derive(session, days, "1h", "1d", truncate(start, "1d"), truncate(end, "1d"))
+    counts["1d"] = await _replace(session, days)
+    return counts
+
+
+async def query_rollups(
+    session,
+    device_id: str,
+    resolution: str,
+    start: datetime,
+    end: datetime,
+    sensor_type: Optional[str] = None,
+) -> List[SensorRollup]:
+    """Buckets of one device in `[start, end)`, by sensor type then time."""
+    query = select(SensorRollup).where(
+        SensorRollup.device_id == device_id,
+        SensorRollup.resolution == resolution,
+        SensorRollup.bucket >= start,
+        SensorRollup.bucket < end,
+    )
+    if sensor_type:
+        query = query.where(SensorRollup.sensor_type == sensor_type)
+    result = await session.execute(query.order_by(SensorRollup.sensor_type, SensorRollup.bucket))
+    return list(result.scalars().all())
+
+
+def to_columns(rollups: Sequence[SensorRollup]) -> List[Dict[str, Any]]:
+    """One columnar series per sensor type: parallel arrays, one entry per bucket."""
+    series: Dict[str, Dict[str, List[Any]]] = {}
+    for rollup in rollups:
+        columns = series.get(rollup.sensor_type)
+        if columns is None:
+            columns = series[rollup.sensor_type] = {
+                "bucket": [], "count": [], "min": [], "max": [], "avg": [], "sum": [], "last": []
+            }
+        columns["bucket"].append(rollup.bucket.isoformat())
+        columns["count"].append(rollup.count)
+        columns["min"].append(rollup.min_value)
+        columns["max"].append(rollup.max_value)
+        columns["avg"].append(rollup.sum_value / rollup.count if rollup.count else None)
+        columns["sum"].append(rollup.sum_value)
+        columns["last"].append(rollup.last_value)
+    return [{"sensor_type": sensor_type, **columns} for sensor_type, columns in series.items()]
+
+
+class RollupRepairer:
+    """Periodically recomputes a trailing window so late rows reach the rollups."""
+
+    def __init__(self, session_factory, lookback_minutes: int = 120, interval_seconds: float = 600,
+                 linger_seconds: float = 60):
+        self.session_factory = session_factory
+        self.lookback = timedelta(minutes=max(1, lookback_minutes))
+        self.interval_seconds = interval_seconds
+        self.linger = timedelta(seconds=max(0, linger_seconds))
+
+    async def repair_once(self, now: Optional[datetime] = None) -> Optional[Dict[str, int]]:
+        """
+        Recompute the buckets of `[now - lookback, now - linger)` that have
+        closed; None when another process holds the lock.
+        """
+        now = now or datetime.utcnow()
+        async with self.session_factory() as session:
+            if session.bind.dialect.name == "postgresql":
+                locked = await session.execute(
+                    text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID}
+                )
+                if not locked.scalar():
+                    return None
+            counts = await recompute_rollups(session, now - self.lookback, now - self.linger)
+            await session.commit()
+        return counts
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.repair_once()
+            except Exception as e:
+                logger.error(f"Rollup repair failed: {e}")
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute sensor rollups from raw rows")
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat, required=True,
+                        help="Window start (UTC, ISO-8601)")
+    parser.add_argument("--to", dest="end", type=datetime.fromisoformat, default=None,
+                        help="Window end (UTC, ISO-8601; default now)")
+    args = parser.parse_args()
+
+    from app.db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        counts = await recompute_rollups(session, args.start, args.end or datetime.utcnow())
+        await session.commit()
+    print(", ".join(f"{resolution}: {count} buckets" for resolution, count in counts.items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
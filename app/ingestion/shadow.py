@@ -0,0 +1,278 @@
+# app/ingestion/shadow.py
+"""
+Device shadow: latest value per (device, sensor_type) plus `last_seen`.
+
+• Updated as readings are written, so reading a device's current state is
+  a lookup instead of a history query.
+• Newest wins: a reading only replaces the stored value when its timestamp
+  is newer, so late or replayed readings never roll a value back.
+  `last_seen` is the latest receive time (`created_at`).
+• `MemoryShadow` lives in the API process (dev / single process); readings
+  stored by the MQTT worker reach it through the API's `sensor_new`
+  subscriber. It holds at most `DEVICE_SHADOW_MAX_DEVICES` devices and
+  evicts the least recently updated ones.
+  `RedisShadow` keeps one hash per device and is shared by the API and the
+  MQTT worker.
+• Updates are best effort: a failing shadow never fails a write.
+"""
+
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import redis.asyncio as aioredis
+
+from app.core.codecs import json_loads
+from app.core.config import settings
+from app.ingestion.rollups import extract_readings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("memory", "redis", "off")
+KEY_PREFIX = "device:shadow:"
+LAST_SEEN_FIELD = "last_seen"
+SENSOR_FIELD_PREFIX = "s:"
+
+# Fixed-width (26 character) timestamps compare correctly as strings, in Lua too
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+# HSET each field only if its stored value has an older timestamp prefix.
+# ARGV holds (field, value) pairs; values start with the 26-character timestamp.
+NEWER_WINS_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if not current or string.sub(current, 1, 26) < string.sub(ARGV[i + 1], 1, 26) then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+
+def format_timestamp(timestamp: datetime) -> str:
+    return timestamp.strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(value: str) -> datetime:
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class Observation:
+    """Latest state seen for one device within a batch of rows."""
+
+    __slots__ = ("last_seen", "sensors")
+
+    def __init__(self):
+        self.last_seen: Optional[datetime] = None
+        self.sensors: Dict[str, tuple] = {}  # sensor_type -> (timestamp, value)
+
+    def add(self, sensor_type: str, value: float, timestamp: datetime, received_at: datetime) -> None:
+        if self.last_seen is None or received_at > self.last_seen:
+            self.last_seen = received_at
+        current = self.sensors.get(sensor_type)
+        if current is None or timestamp > current[0]:
+            self.sensors[sensor_type] = (timestamp, value)
+
+    def seen(self, received_at: datetime) -> None:
+        if self.last_seen is None or received_at > self.last_seen:
+            self.last_seen = received_at
+
+
+def observe_sensor_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, Observation]:
+    """Fold `sensors` rows into per-device observations."""
+    observations: Dict[str, Observation] = {}
+    for row in rows:
+        observation = observations.setdefault(row["device_id"], Observation())
+        observation.add(row["sensor_type"], row["value"], row["timestamp"], row.get("created_at") or row["timestamp"])
+    return observations
+
+
+def observe_payload_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, Observation]:
+    """Fold `sensor_data` rows into per-device observations."""
+    observations: Dict[str, Observation] = {}
+    for row in rows:
+        observation = observations.setdefault(row["device_id"], Observation())
+        received_at = row.get("created_at") or row["timestamp"]
+        observation.seen(received_at)
+        try:
+            payload = json_loads(row["payload"])
+        except ValueError:
+            continue
+        for sensor_type, value in extract_readings(payload):
+            observation.add(sensor_type, value, row["timestamp"], received_at)
+    return observations
+
+
+def observe_events(events: Iterable[Dict[str, Any]]) -> Dict[str, Observation]:
+    """Fold `sensor_new` events (stored `sensor_data` rows) into per-device observations."""
+    observations: Dict[str, Observation] = {}
+    for event in events:
+        device_id = event.get("device_id")
+        if not device_id or not event.get("timestamp"):
+            continue
+        timestamp = datetime.fromisoformat(event["timestamp"])
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        observation = observations.setdefault(device_id, Observation())
+        # Events carry no receive time; worker rows are stamped on receipt
+        observation.seen(timestamp)
+        payload = event.get("payload")
+        if isinstance(payload, (dict, list)):
+            for sensor_type, value in extract_readings(payload):
+                observation.add(sensor_type, value, timestamp, timestamp)
+    return observations
+
+
+def state_dict(last_seen: Optional[datetime], sensors: Dict[str, tuple]) -> Dict[str, Any]:
+    """Public shape of one device's shadow."""
+    return {
+        "last_seen": last_seen,
+        "sensors": {
+            sensor_type: {"value": value, "timestamp": timestamp}
+            for sensor_type, (timestamp, value) in sorted(sensors.items())
+        },
+    }
+
+
+class MemoryShadow:
+    """Shadows kept in the current process under an LRU cap on the devices held."""
+
+    def __init__(self, max_devices: int = 100_000):
+        self.max_devices = max(1, max_devices)
+        self._devices: "OrderedDict[str, Observation]" = OrderedDict()
+        self.evictions = 0
+
+    async def apply(self, observations: Dict[str, Observation]) -> None:
+        for device_id, observation in observations.items():
+            current = self._devices.get(device_id)
+            if current is None:
+                current = self._devices[device_id] = Observation()
+                if len(self._devices) > self.max_devices:
+                    self._devices.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._devices.move_to_end(device_id)
+            if observation.last_seen is not None:
+                current.seen(observation.last_seen)
+            for sensor_type, (timestamp, value) in observation.sensors.items():
+                known = current.sensors.get(sensor_type)
+                if known is None or timestamp > known[0]:
+                    current.sensors[sensor_type] = (timestamp, value)
+
+    async def get_many(self, device_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        states = {}
+        for device_id in device_ids:
+            observation = self._devices.get(device_id)
+            if observation is not None:
+                states[device_id] = state_dict(observation.last_seen, observation.sensors)
+        return states
+
+    async def close(self) -> None:
+        return None
+
+
+class RedisShadow:
+    """
+    One hash per device: `last_seen` and `s:<sensor_type>` fields holding
+    "<timestamp>|<value>", updated newest-wins by a Lua script.
+    """
+
+    def __init__(self, redis, key_prefix: str = KEY_PREFIX):
+        self.redis = redis
+        self.key_prefix = key_prefix
+        self._script = redis.register_script(NEWER_WINS_SCRIPT)
+
+    async def apply(self, observations: Dict[str, Observation]) -> None:
+        if not observations:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for device_id, observation in observations.items():
+                args: List[str] = []
+                if observation.last_seen is not None:
+                    args += [LAST_SEEN_FIELD, format_timestamp(observation.last_seen)]
+                for sensor_type, (timestamp, value) in observation.sensors.items():
+                    args += [SENSOR_FIELD_PREFIX + sensor_type, f"{format_timestamp(timestamp)}|{value!r}"]
+                await self._script(keys=[self.key_prefix + device_id], args=args, client=pipe)
+            await pipe.execute()
+
+    async def get_many(self, device_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        if not device_ids:
+            return {}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for device_id in device_ids:
+                pipe.hgetall(self.key_prefix + device_id)
+            hashes = await pipe.execute()
+        return {
+            device_id: decode_hash(fields)
+            for device_id, fields in zip(device_ids, hashes)
+            if fields
+        }
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+def decode_hash(fields: Dict[Any, Any]) -> Dict[str, Any]:
+    """Shadow state from a device hash (bytes or str keys)."""
+    last_seen = None
+    sensors: Dict[str, tuple] = {}
+    for field, raw in fields.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        raw = raw.decode() if isinstance(raw, bytes) else raw
+        if field == LAST_SEEN_FIELD:
+            last_seen = parse_timestamp(raw)
+        elif field.startswith(SENSOR_FIELD_PREFIX):
+            timestamp, _, value = raw.partition("|")
+            sensors[field[len(SENSOR_FIELD_PREFIX):]] = (parse_timestamp(timestamp), float(value))
+    return state_dict(last_seen, sensors)
+
+
+async def apply_observations(shadow, observations: Dict[str, Observation]) -> None:
+    """Update `shadow` (if any) without ever failing the caller."""
+    if shadow is None or not observations:
+        return
+    try:
+        await shadow.apply(observations)
+    except Exception as e:
+        logger.warning(f"Device shadow update failed: {e}")
+
+
+# ─────────────────── Process-wide instance (API) ───────── #
+
+_shadow = None
+
+
+def get_device_shadow():
+    """The API's device shadow, or None when disabled."""
+    return _shadow
+
+
+def set_device_shadow(shadow) -> None:
+    global _shadow
+    _shadow = shadow
+
+
+def build_device_shadow(backend: str, redis_client=None):
+    """Shadow for `backend` ("memory", "redis" or "off")."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown device shadow backend: {backend}")
+    if backend == "off":
+        return None
+    if backend == "redis":
+        return RedisShadow(redis_client or aioredis.from_url(settings.REDIS_URL))
+    return MemoryShadow(settings.DEVICE_SHADOW_MAX_DEVICES)
+
+
+async def start_device_shadow() -> None:
+    """Create the configured shadow (API startup)."""
+    set_device_shadow(build_device_shadow(settings.DEVICE_SHADOW_BACKEND))
+    if _shadow is not None:
+        logger.info(f"Device shadow enabled ({settings.DEVICE_SHADOW_BACKEND})")
+
+
+async def stop_device_shadow() -> None:
+    shadow = _shadow
+    set_device_shadow(None)
+    if shadow is not None:
+        await shadow.close()
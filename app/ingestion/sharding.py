@@ -0,0 +1,83 @@
+# app/ingestion/sharding.py
+"""
+Sharded MQTT consumption across several worker processes.
+
+• "shared" mode: MQTT v5 shared subscription (`$share/<group>/iot/+/+`),
+  the broker hands each message to one member of the group.
+• "hash" mode: for v3 brokers, every worker subscribes to `iot/+/+` and
+  keeps only the devices whose stable hash maps to its shard.
+• Sensor topics are `iot/{tenant}/{device_id}` with an optional trailing
+  `/{codec}` segment, so each pattern is subscribed with and without it.
+• Hash mode always keeps per-device ordering; shared mode keeps it when the
+  broker balances by topic or client (e.g. EMQX `hash_topic`), not round-robin.
+"""
+
+import zlib
+from typing import List, Optional, Tuple
+
+SENSOR_TOPIC_FILTERS = ("iot/+/+", "iot/+/+/+")
+SHARD_MODES = ("shared", "hash")
+
+
+def shard_for(device_id: str, shard_count: int) -> int:
+    """Map a device id to a shard with a hash that is stable across processes."""
+    return zlib.crc32(device_id.encode("utf-8")) % shard_count
+
+
+def parse_sensor_topic(topic: str) -> Optional[Tuple[str, str, Optional[str]]]:
+    """
+    Split `iot/{tenant}/{device_id}[/{codec}]` into (tenant, device_id, codec).
+
+    Returns None for topics that do not follow that layout.
+    """
+    parts = topic.split("/")
+    if len(parts) not in (3, 4) or parts[0] != "iot" or not all(parts[1:]):
+        return None
+    codec = parts[3] if len(parts) == 4 else None
+    return parts[1], parts[2], codec
+
+
+def device_from_topic(topic: str) -> Optional[str]:
+    """Return the device id of a sensor topic, if well-formed."""
+    parsed = parse_sensor_topic(topic)
+    return parsed[1] if parsed else None
+
+
+class ShardAssignment:
+    """Which slice of the sensor topic space one worker process consumes."""
+
+    def __init__(self, index: int = 0, count: int = 1, mode: str = "hash", group: str = "ingest"):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode: {mode}")
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index} of {count}")
+        self.index = index
+        self.count = count
+        self.mode = mode
+        self.group = group
+
+    @property
+    def topic_filters(self) -> List[str]:
+        """Topic filters this worker subscribes to."""
+        if self.mode == "shared" and self.count > 1:
+            return [f"$share/{self.group}/{f}" for f in SENSOR_TOPIC_FILTERS]
+        return list(SENSOR_TOPIC_FILTERS)
+
+    @property
+    def client_id(self) -> str:
+        """Unique MQTT client identifier for this worker."""
+        return f"{self.group}-worker-{self.index}"
+
+    def owns(self, topic: str) -> bool:
+        """
+        Return True if this worker should process a message on `topic`.
+
+        Shared-subscription workers own whatever the broker delivers. Malformed
+        topics are always owned so that they are reported exactly once, by shard 0.
+        """
+        if self.count == 1 or self.mode == "shared":
+            return True
+        device_id = device_from_topic(topic)
+        if device_id is None:
+            return self.index == 0
+        return shard_for(device_id, self.count) == self.index
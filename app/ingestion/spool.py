@@ -0,0 +1,282 @@
+# app/ingestion/spool.py
+"""
+Disk-backed write-ahead spool for sensor rows the database could not take.
+
+• Append-only segment files (`{seq}.seg`), one checksummed JSON record per line.
+• Segments rotate at a size threshold; the spool refuses writes past its size cap.
+• fsync is batched: at most once per `fsync_interval_ms` plus on rotation/close.
+• `SpoolReplayer` drains the oldest segments back into `sensor_data` at a
+  bounded rate once the database accepts writes again.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from app.core.codecs import json_dumps, json_loads
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".seg"
+DATETIME_COLUMNS = ("timestamp", "created_at")
+
+
+class SpoolFullError(Exception):
+    """Raised when an append would grow the spool past its size cap."""
+
+
+def encode_row(row: Dict[str, Any]) -> bytes:
+    """Serialize a `sensor_data` row as one checksummed spool record."""
+    record = dict(row)
+    record["id"] = str(record["id"])
+    for column in DATETIME_COLUMNS:
+        if isinstance(record.get(column), datetime):
+            record[column] = record[column].isoformat()
+    body = json_dumps(record).encode("utf-8")
+    return b"%08x " % zlib.crc32(body) + body + b"\n"
+
+
+def decode_row(line: bytes) -> Dict[str, Any]:
+    """Parse one spool record; raises ValueError on a torn or corrupt line."""
+    checksum, _, body = line.rstrip(b"\n").partition(b" ")
+    if not body or int(checksum, 16) != zlib.crc32(body):
+        raise ValueError("Spool record checksum mismatch")
+    row = json_loads(body)
+    row["id"] = UUID(row["id"])
+    for column in DATETIME_COLUMNS:
+        if row.get(column):
+            row[column] = datetime.fromisoformat(row[column])
+    return row
+
+
+class Spool:
+    """Size-capped, segmented append-only spool in one directory."""
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 1024 ** 3,
+        segment_bytes: int = 16 * 1024 ** 2,
+        fsync_interval_ms: int = 200,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = max(1, segment_bytes)
+        self.fsync_interval = max(0, fsync_interval_ms) / 1000.0
+
+        # seq → [rows, bytes] for every segment on disk, oldest first
+        self._segments: "OrderedDict[int, List[int]]" = OrderedDict()
+        self._active = None
+        self._active_seq: Optional[int] = None
+        self._dirty = False
+        self._last_fsync = 0.0
+        self._lock = threading.Lock()
+
+        self.rows_appended = 0
+        self.rows_acked = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+
+    # ─────────────────── State ─────────────────────────────── #
+
+    @property
+    def depth(self) -> int:
+        """Rows waiting to be replayed."""
+        return sum(rows for rows, _ in self._segments.values())
+
+    @property
+    def size_bytes(self) -> int:
+        """Bytes used by all segments."""
+        return sum(size for _, size in self._segments.values())
+
+    def stats(self) -> Dict[str, int]:
+        """Spool depth and counters for monitoring."""
+        with self._lock:
+            return {
+                "depth": self.depth,
+                "bytes": self.size_bytes,
+                "segments": len(self._segments),
+                "max_bytes": self.max_bytes,
+                "appended": self.rows_appended,
+                "replayed": self.rows_acked,
+            }
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _load_existing(self) -> None:
+        """Pick up segments left behind by a previous run."""
+        seqs = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        for seq in seqs:
+            path = self._path(seq)
+            with open(path, "rb") as f:
+                rows = sum(1 for _ in f)
+            self._segments[seq] = [rows, os.path.getsize(path)]
+        if seqs:
+            logger.info(f"Spool recovered {self.depth} rows in {len(seqs)} segments")
+
+    # ─────────────────── Writing ───────────────────────────── #
+
+    def append(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Append rows to the active segment and return the number written.
+
+        Blocking file I/O; call through `asyncio.to_thread` from async code.
+        Raises SpoolFullError if the rows do not fit under `max_bytes`.
+        """
+        data = b"".join(encode_row(row) for row in rows)
+        with self._lock:
+            if self.size_bytes + len(data) > self.max_bytes:
+                raise SpoolFullError(
+                    f"Spool full ({self.size_bytes} of {self.max_bytes} bytes)"
+                )
+            if self._active is None or self._segments[self._active_seq][1] >= self.segment_bytes:
+                self._rotate()
+
+            self._active.write(data)
+            self._active.flush()
+            segment = self._segments[self._active_seq]
+            segment[0] += len(rows)
+            segment[1] += len(data)
+            self.rows_appended += len(rows)
+            self._dirty = True
+
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+        return len(rows)
+
+    def sync(self) -> None:
+        """fsync the active segment if it has unsynced writes."""
+        with self._lock:
+            self._fsync()
+
+    def _fsync(self) -> None:
+        if self._active is not None and self._dirty:
+            os.fsync(self._active.fileno())
+            self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def _rotate(self) -> None:
+        """Seal the active segment and start a new one."""
+        self._seal()
+        seq = (next(reversed(self._segments)) + 1) if self._segments else 1
+        self._active = open(self._path(seq), "ab")
+        self._active_seq = seq
+        self._segments[seq] = [0, 0]
+
+    def _seal(self) -> None:
+        if self._active is not None:
+            self._fsync()
+            self._active.close()
+            self._active = None
+            self._active_seq = None
+
+    def close(self) -> None:
+        """Sync and close the active segment."""
+        with self._lock:
+            self._seal()
+
+    # ─────────────────── Reading ───────────────────────────── #
+
+    def read_oldest(self) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+        """
+        Return `(seq, rows)` of the oldest segment, or None if the spool is empty.
+
+        The active segment is sealed first when it is the only one left.
+        Corrupt or torn records (e.g. after a crash mid-write) are skipped.
+        """
+        with self._lock:
+            if not self._segments:
+                return None
+            seq = next(iter(self._segments))
+            if seq == self._active_seq:
+                self._seal()
+            path = self._path(seq)
+
+        rows = []
+        with open(path, "rb") as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    rows.append(decode_row(line))
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Skipping spool record {path}:{line_no}: {e}")
+        return seq, rows
+
+    def ack(self, seq: int) -> None:
+        """Delete a fully replayed segment."""
+        with self._lock:
+            segment = self._segments.pop(seq, None)
+            if segment is None:
+                return
+            self.rows_acked += segment[0]
+        try:
+            os.remove(self._path(seq))
+        except FileNotFoundError:
+            pass
+
+
+class SpoolReplayer:
+    """Drain spooled rows back into the database at a bounded rate."""
+
+    def __init__(
+        self,
+        spool: Spool,
+        write: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+        rows_per_second: int = 5000,
+        batch_size: int = 500,
+        idle_seconds: float = 1.0,
+        retry_seconds: float = 5.0,
+    ):
+        self.spool = spool
+        self.write = write
+        self.rows_per_second = max(1, rows_per_second)
+        self.batch_size = max(1, batch_size)
+        self.idle_seconds = idle_seconds
+        self.retry_seconds = retry_seconds
+
+    async def replay_once(self) -> int:
+        """
+        Replay the oldest segment and delete it; return the rows written.
+
+        `write` must be idempotent (the bulk writer ignores duplicate ids),
+        since a segment interrupted half-way is replayed again from the start.
+        """
+        segment = await asyncio.to_thread(self.spool.read_oldest)
+        if segment is None:
+            return 0
+        seq, rows = segment
+        for start in range(0, len(rows), self.batch_size):
+            chunk = rows[start:start + self.batch_size]
+            started = time.monotonic()
+            await self.write(chunk)
+            # Rate limit so a large backlog does not starve live ingestion
+            delay = len(chunk) / self.rows_per_second - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await asyncio.to_thread(self.spool.ack, seq)
+        if rows:
+            logger.info(f"Replayed {len(rows)} spooled rows (segment {seq})")
+        return len(rows)
+
+    async def run(self) -> None:
+        """Sync pending spool writes and replay segments until cancelled."""
+        while True:
+            await asyncio.to_thread(self.spool.sync)
+            try:
+                if self.spool.depth == 0 or await self.replay_once() == 0:
+                    await asyncio.sleep(self.idle_seconds)
+            except Exception as e:
+                logger.warning(f"Spool replay failed, retrying in {self.retry_seconds}s: {e}")
+                await asyncio.sleep(self.retry_seconds)
@@ -0,0 +1,182 @@
+# app/ingestion/throttle.py
+"""
+Per-device and per-tenant token-bucket throttling for the ingest worker.
+
+• Off unless INGEST_THROTTLE_ENABLED is set: the default plan limits below
+  would otherwise start discarding data of fleets that exceed them.
+• Rates and burst sizes come from the tenant's plan (`Tenant.plan`).
+• O(1) per message: one dict lookup and a little arithmetic per bucket.
+• Bounded memory: buckets live in LRU maps; an evicted bucket is the one
+  idle longest, which would have refilled to its burst size anyway.
+• Over-limit messages are dropped, sampled (1 in N kept) or aggregated
+  (only the latest reading per device is kept and stored periodically,
+  annotated with how many readings it stands for).
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from app.core.codecs import json_dumps, json_loads
+
+# Decisions
+ADMIT = "admit"
+DROP = "drop"
+AGGREGATE = "aggregate"
+
+POLICIES = ("drop", "sample", "aggregate")
+
+
+class PlanLimits(NamedTuple):
+    """Sustained rate (messages/second) and burst size per device and per tenant."""
+    device_rate: float
+    device_burst: float
+    tenant_rate: float
+    tenant_burst: float
+
+
+DEFAULT_PLAN_LIMITS: Dict[str, PlanLimits] = {
+    "free": PlanLimits(device_rate=1, device_burst=10, tenant_rate=100, tenant_burst=500),
+    "pro": PlanLimits(device_rate=10, device_burst=50, tenant_rate=2000, tenant_burst=10000),
+    "enterprise": PlanLimits(device_rate=100, device_burst=500, tenant_rate=50000, tenant_burst=250000),
+}
+
+
+class TokenBuckets:
+    """LRU-bounded map of token buckets: key → [tokens, last refill, over-limit count]."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max(1, max_keys)
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> bool:
+        """Take one token from `key`'s bucket; False when it is empty."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [burst, now, 0]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        bucket[2] += 1
+        return False
+
+    def refund(self, key: str) -> None:
+        """Give back a token taken for a message that was not admitted after all."""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] += 1
+
+    def over_count(self, key: str) -> int:
+        """Messages rejected for `key` since its bucket was created."""
+        bucket = self._buckets.get(key)
+        return int(bucket[2]) if bucket is not None else 0
+
+
+class Throttle:
+    """Admission control for sensor messages, per device and per tenant."""
+
+    def __init__(
+        self,
+        policy: str = "drop",
+        plan_limits: Optional[Dict[str, PlanLimits]] = None,
+        max_devices: int = 100000,
+        max_tenants: int = 10000,
+        sample_every: int = 10,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown throttle policy: {policy}")
+        self.policy = policy
+        self.plan_limits = {**DEFAULT_PLAN_LIMITS, **(plan_limits or {})}
+        self.sample_every = max(1, sample_every)
+        self.devices = TokenBuckets(max_devices)
+        self.tenants = TokenBuckets(max_tenants)
+        # device id → [latest over-limit row, readings it stands for]
+        self._aggregates: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self._max_aggregates = max(1, max_devices)
+
+        self.admitted = 0
+        self.dropped = 0
+        self.sampled = 0
+        self.aggregated = 0
+
+    def limits_for(self, plan: str) -> PlanLimits:
+        """Limits of a plan; unknown plans get the free tier."""
+        return self.plan_limits.get(plan) or self.plan_limits["free"]
+
+    def check(self, tenant: str, device_id: str, plan: Optional[str], now: Optional[float] = None) -> str:
+        """
+        Decide what to do with one message: ADMIT, DROP or AGGREGATE.
+
+        Tenants whose plan is not known yet (first sight) are admitted.
+        """
+        if plan is None:
+            self.admitted += 1
+            return ADMIT
+        now = time.monotonic() if now is None else now
+        limits = self.limits_for(plan)
+
+        if not self.devices.take(device_id, limits.device_rate, limits.device_burst, now):
+            buckets, key = self.devices, device_id
+        elif not self.tenants.take(tenant, limits.tenant_rate, limits.tenant_burst, now):
+            self.devices.refund(device_id)
+            buckets, key = self.tenants, tenant
+        else:
+            self.admitted += 1
+            return ADMIT
+
+        if self.policy == "sample":
+            if buckets.over_count(key) % self.sample_every == 0:
+                self.sampled += 1
+                return ADMIT
+        elif self.policy == "aggregate":
+            return AGGREGATE
+        self.dropped += 1
+        return DROP
+
+    def aggregate(self, row: Dict[str, Any]) -> None:
+        """Hold an over-limit row; only the latest per device is kept."""
+        self.aggregated += 1
+        entry = self._aggregates.get(row["device_id"])
+        if entry is None:
+            self._aggregates[row["device_id"]] = [row, 1]
+            if len(self._aggregates) > self._max_aggregates:
+                _, (_, count) = self._aggregates.popitem(last=False)
+                self.dropped += count
+        else:
+            entry[0] = row
+            entry[1] += 1
+
+    def drain_aggregates(self) -> List[Dict[str, Any]]:
+        """Rows standing in for held readings; payloads carry `throttled_count`."""
+        entries = list(self._aggregates.values())
+        self._aggregates.clear()
+        rows = []
+        for row, count in entries:
+            payload = json_loads(row["payload"])
+            if not isinstance(payload, dict):
+                payload = {"value": payload}
+            payload["throttled_count"] = count
+            rows.append({**row, "payload": json_dumps(payload)})
+        return rows
+
+    def metrics(self) -> Dict[str, int]:
+        """Throttle counters and bucket map sizes for monitoring."""
+        return {
+            "admitted": self.admitted,
+            "dropped": self.dropped,
+            "sampled": self.sampled,
+            "aggregated": self.aggregated,
+            "aggregates_pending": len(self._aggregates),
+            "device_buckets": len(self.devices),
+            "tenant_buckets": len(self.tenants),
+        }
@@ -0,0 +1,387 @@
+# app/ingestion/write_behind.py
+"""
+Write-behind buffering for HTTP sensor ingestion (opt-in, 202 Accepted).
+
+• Endpoints validate a reading, enqueue its `sensors` row and answer at once;
+  `WriteBehindFlusher` persists buffered rows in bulk in the background.
+• "memory" backend: bounded in-process deque. Fastest; rows still buffered
+  when the process dies are lost (at-most-once).
+• "redis" backend: a Redis Stream read through a consumer group. Rows are
+  acknowledged only after their batch commits, and entries left pending by a
+  crashed process are claimed by a live one (at-least-once; replayed rows
+  are skipped by id).
+• Buffer depth, flushed rows and enqueue-to-commit latency are published to
+  Redis next to the worker metrics.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from app.core.codecs import json_dumps
+from app.core.config import settings
+from app.ingestion.pipeline import METRICS_KEY_PREFIX
+from app.ingestion.readings import insert_readings, readings_committed
+from app.ingestion.spool import decode_row, encode_row
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("memory", "redis")
+
+
+class MemoryBuffer:
+    """Bounded in-process buffer; its contents do not survive a crash."""
+
+    durable = False
+
+    def __init__(self, max_rows: int = 100000):
+        self.max_rows = max(1, max_rows)
+        self._entries: "deque[Tuple[float, Dict[str, Any]]]" = deque()
+        self._ready = asyncio.Event()
+
+    async def put(self, rows: List[Dict[str, Any]]) -> bool:
+        """Enqueue rows; False (nothing enqueued) when they do not fit."""
+        if len(self._entries) + len(rows) > self.max_rows:
+            return False
+        now = time.time()
+        self._entries.extend((now, row) for row in rows)
+        self._ready.set()
+        return True
+
+    async def take(self, max_rows: int, timeout: float) -> Tuple[Any, List[Tuple[float, Dict[str, Any]]]]:
+        """
+        Wait up to `timeout` seconds for a row, then linger as long again for
+        the batch to fill; returns up to `max_rows` rows.
+        """
+        if not self._entries:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None, []
+        if len(self._entries) < max_rows and timeout:
+            await asyncio.sleep(timeout)
+        count = min(max_rows, len(self._entries))
+        entries = [self._entries.popleft() for _ in range(count)]
+        return entries, entries
+
+    async def ack(self, token: Any) -> None:
+        """Rows leave the buffer when taken; nothing to acknowledge."""
+
+    async def nack(self, token: Any) -> None:
+        """Put taken rows back at the front of the buffer for another attempt."""
+        if token:
+            self._entries.extendleft(reversed(token))
+            self._ready.set()
+
+    async def depth(self) -> int:
+        return len(self._entries)
+
+
+class RedisStreamBuffer:
+    """Redis Stream buffer read through a consumer group; survives API restarts."""
+
+    durable = True
+
+    def __init__(
+        self,
+        redis_client,
+        stream: str = "ingest:write-behind",
+        group: str = "flushers",
+        consumer: Optional[str] = None,
+        max_rows: int = 100000,
+        claim_idle_seconds: float = 60.0,
+    ):
+        self.redis = redis_client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.max_rows = max(1, max_rows)
+        self.claim_idle_ms = int(claim_idle_seconds * 1000)
+        self._group_ready = False
+        self._next_claim = 0.0
+        self._retry_pending = False
+
+    async def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def put(self, rows: List[Dict[str, Any]]) -> bool:
+        """Append rows to the stream; False when the stream is at capacity."""
+        if await self.redis.xlen(self.stream) + len(rows) > self.max_rows:
+            return False
+        now = str(time.time())
+        pipe = self.redis.pipeline(transaction=False)
+        for row in rows:
+            pipe.xadd(self.stream, {"row": encode_row(row), "enqueued_at": now})
+        await pipe.execute()
+        return True
+
+    @staticmethod
+    def _decode(messages) -> Tuple[List[str], List[Tuple[float, Dict[str, Any]]]]:
+        ids, entries = [], []
+        for message_id, fields in messages:
+            ids.append(message_id)
+            if not fields:  # deleted while pending
+                continue
+            try:
+                row = decode_row(fields["row"].encode() if isinstance(fields["row"], str) else fields["row"])
+            except (KeyError, ValueError) as e:
+                logger.error(f"Dropping corrupt write-behind entry {message_id}: {e}")
+                continue
+            entries.append((float(fields.get("enqueued_at") or time.time()), row))
+        return ids, entries
+
+    async def take(self, max_rows: int, timeout: float) -> Tuple[Any, List[Tuple[float, Dict[str, Any]]]]:
+        """
+        Retry this consumer's own failed entries first, then claim entries left
+        pending by dead consumers (at most every `claim_idle_seconds`), else
+        read new ones, blocking up to `timeout`.
+        """
+        await self._ensure_group()
+        if self._retry_pending:
+            self._retry_pending = False
+            response = await self.redis.xreadgroup(
+                self.group, self.consumer, {self.stream: "0"}, count=max_rows
+            )
+            if response and response[0][1]:
+                self._retry_pending = True  # until the backlog is drained
+                return self._decode(response[0][1])
+        if time.monotonic() >= self._next_claim:
+            self._next_claim = time.monotonic() + self.claim_idle_ms / 1000.0
+            claimed = await self.redis.xautoclaim(
+                self.stream, self.group, self.consumer,
+                min_idle_time=self.claim_idle_ms, start_id="0-0", count=max_rows,
+            )
+            ids, entries = self._decode(claimed[1])
+            if ids:
+                return ids, entries
+
+        response = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"},
+            count=max_rows, block=max(1, int(timeout * 1000)),
+        )
+        if not response:
+            return None, []
+        return self._decode(response[0][1])
+
+    async def ack(self, token: Any) -> None:
+        """Acknowledge and delete committed entries."""
+        if token:
+            await self.redis.xack(self.stream, self.group, *token)
+            await self.redis.xdel(self.stream, *token)
+
+    async def nack(self, token: Any) -> None:
+        """Leave entries pending and read them again on the next take."""
+        if token:
+            self._retry_pending = True
+
+    async def depth(self) -> int:
+        return await self.redis.xlen(self.stream)
+
+
+class WriteBehindFlusher:
+    """Drains a write-behind buffer into `sensors` with bulk inserts."""
+
+    def __init__(
+        self,
+        buffer,
+        session_factory,
+        backend: str = "memory",
+        batch_size: int = 500,
+        linger_ms: int = 100,
+        retry_seconds: float = 1.0,
+    ):
+        self.buffer = buffer
+        self.session_factory = session_factory
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.linger = max(0, linger_ms) / 1000.0
+        self.retry_seconds = retry_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._last_depth = 0
+
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_latency_ms = 0.0
+        self.max_flush_latency_ms = 0.0
+
+    async def enqueue(self, rows: List[Dict[str, Any]]) -> bool:
+        """Buffer rows for a later bulk write; False when the buffer is full."""
+        if not await self.buffer.put(rows):
+            self.rejected += len(rows)
+            return False
+        self.enqueued += len(rows)
+        return True
+
+    async def flush_once(self) -> int:
+        """Take one batch from the buffer and commit it; returns rows written."""
+        token, entries = await self.buffer.take(self.batch_size, self.linger)
+        if not entries:
+            await self.buffer.ack(token)  # only corrupt/deleted entries taken
+            return 0
+        try:
+            async with self.session_factory() as session:
+                inserted = await insert_readings(
+                    session, [row for _, row in entries], ignore_conflicts=self.buffer.durable
+                )
+                await session.commit()
+        except Exception:
+            self.errors += 1
+            await self.buffer.nack(token)
+            raise
+        await self.buffer.ack(token)
+        await readings_committed(inserted)
+
+        latency = (time.time() - min(enqueued_at for enqueued_at, _ in entries)) * 1000
+        self.last_flush_latency_ms = round(latency, 1)
+        self.max_flush_latency_ms = max(self.max_flush_latency_ms, self.last_flush_latency_ms)
+        self.flushed_rows += len(entries)
+        self.flushes += 1
+        return len(entries)
+
+    async def run(self) -> None:
+        """Flush until cancelled, backing off while the database fails."""
+        while True:
+            try:
+                await self.flush_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, retrying: {e}")
+                await asyncio.sleep(self.retry_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Stop the background flusher, then drain what is buffered in memory."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.buffer.durable:
+            return  # the stream keeps the rows for the next process
+        deadline = time.monotonic() + drain_timeout
+        try:
+            while await self.buffer.depth() and time.monotonic() < deadline:
+                await self.flush_once()
+        except Exception as e:
+            logger.error(f"Write-behind drain failed: {e}")
+        remaining = await self.buffer.depth()
+        if remaining:
+            logger.error(f"Write-behind shutdown lost {remaining} buffered rows")
+
+    async def metrics(self) -> Dict[str, Any]:
+        """Buffer depth, throughput and enqueue-to-commit latency."""
+        try:
+            self._last_depth = await self.buffer.depth()
+        except Exception as e:
+            logger.warning(f"Failed to read write-behind depth: {e}")
+        return {
+            "backend": self.backend,
+            "durable": self.buffer.durable,
+            "depth": self._last_depth,
+            "capacity": self.buffer.max_rows,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "flushed_rows": self.flushed_rows,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_latency_ms": self.last_flush_latency_ms,
+            "max_flush_latency_ms": self.max_flush_latency_ms,
+        }
+
+    async def report_metrics(self, redis_client, interval: float) -> None:
+        """Periodically publish metrics where the admin health overview reads them."""
+        key = f"{METRICS_KEY_PREFIX}api-{socket.gethostname()}-{os.getpid()}"
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                metrics = {"write_behind": await self.metrics()}
+                await redis_client.set(key, json_dumps(metrics), ex=int(interval * 3))
+            except Exception as e:
+                logger.warning(f"Failed to report write-behind metrics: {e}")
+
+
+# Flusher of this process, when write-behind mode is enabled
+_flusher: Optional[WriteBehindFlusher] = None
+_redis_client = None
+_metrics_task: Optional[asyncio.Task] = None
+
+
+def get_write_behind() -> Optional[WriteBehindFlusher]:
+    """The running write-behind flusher, or None when writes are synchronous."""
+    return _flusher
+
+
+def set_write_behind(flusher: Optional[WriteBehindFlusher]) -> None:
+    global _flusher
+    _flusher = flusher
+
+
+async def start_write_behind(session_factory) -> WriteBehindFlusher:
+    """Build the configured buffer and start flushing it (API startup)."""
+    global _redis_client, _metrics_task
+    backend = settings.INGEST_WRITE_BEHIND_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown write-behind backend: {backend}")
+    _redis_client = aioredis.from_url(settings.REDIS_URL)
+    if backend == "redis":
+        buffer = RedisStreamBuffer(
+            _redis_client,
+            stream=settings.INGEST_WRITE_BEHIND_STREAM,
+            max_rows=settings.INGEST_WRITE_BEHIND_MAX_ROWS,
+            claim_idle_seconds=settings.INGEST_WRITE_BEHIND_CLAIM_IDLE_SECONDS,
+        )
+    else:
+        buffer = MemoryBuffer(settings.INGEST_WRITE_BEHIND_MAX_ROWS)
+    flusher = WriteBehindFlusher(
+        buffer,
+        session_factory,
+        backend=backend,
+        batch_size=settings.INGEST_WRITE_BEHIND_BATCH_SIZE,
+        linger_ms=settings.INGEST_WRITE_BEHIND_LINGER_MS,
+    )
+    flusher.start()
+    _metrics_task = asyncio.create_task(
+        flusher.report_metrics(_redis_client, settings.INGEST_METRICS_INTERVAL_SECONDS)
+    )
+    set_write_behind(flusher)
+    logger.info(f"Write-behind ingestion enabled ({backend} buffer)")
+    return flusher
+
+
+async def stop_write_behind() -> None:
+    """Stop accepting rows, drain the buffer and stop reporting (API shutdown)."""
+    global _redis_client, _metrics_task
+    flusher = _flusher
+    if flusher is None:
+        return
+    set_write_behind(None)
+    await flusher.stop()
+    if _metrics_task is not None:
+        _metrics_task.cancel()
+        _metrics_task = None
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
@@ -4,9 +4,17 @@ Main FastAPI application entry-point.
 
 • Exposes a module-level `app` object for Uvicorn.
 • Creates DB tables on startup (demo-friendly).
+• Maintains time partitions of the sensor tables on PostgreSQL.
+• Periodically repairs recent sensor rollups.
+• Compacts cold sensor rows into compressed blocks when enabled.
+• Moves old sensor_data rows to Parquet archives when enabled.
 • Seeds a default tenant and admin user if none exist.
 • Mounts all API routers under the versioned prefix.
 • Starts Redis subscriber for sensor data broadcasting.
+• Keeps the device shadow (latest value per device and sensor type); an
+  in-process shadow is fed by the Redis subscriber.
+• Keeps recent readings per device in memory, fed by the Redis subscriber.
+• Starts the write-behind ingest flusher when enabled, draining it on shutdown.
 """
 
 import asyncio
@@ -21,16 +29,27 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from sqlmodel import SQLModel, select
+import redis.asyncio as aioredis
 
 from app.core.config import settings
 from app.db.session import engine, AsyncSessionLocal
+from app.db.partitions import PartitionManager
+from app.ingestion.archive import SensorArchiver, archive_available
+from app.ingestion.blocks import SensorCompactor
+from app.ingestion.rollups import RollupRepairer
 from app.api.v1 import api_router
 from app.api.deps import get_current_user_ws
 from app.models.user import User
 from app.models.tenant import Tenant
 from app.models.device import Device
 from app.utils.security import hash_password
-from app.core.redis import get_redis_client
+from app.core.codecs import Codec, available_codecs, get_codec, json_loads
+from app.ingestion.fanout import SENSOR_CHANNEL, unpack_events
+from app.ingestion.recent import get_recent_buffers, start_recent_buffers, stop_recent_buffers
+from app.ingestion.shadow import (
+    MemoryShadow, apply_observations, get_device_shadow, observe_events, start_device_shadow, stop_device_shadow
+)
+from app.ingestion.write_behind import start_write_behind, stop_write_behind
 
 logger = logging.getLogger(__name__)
 
@@ -43,12 +62,14 @@ class ConnectionManager:
     
     def __init__(self):
         self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self.connection_codecs: Dict[WebSocket, Codec] = {}
     
-    async def connect(self, websocket: WebSocket, tenant_id: str):
+    async def connect(self, websocket: WebSocket, tenant_id: str, codec: str = "json"):
         await websocket.accept()
         if tenant_id not in self.active_connections:
             self.active_connections[tenant_id] = set()
         self.active_connections[tenant_id].add(websocket)
+        self.connection_codecs[websocket] = get_codec(codec)
         logger.info(f"WebSocket connected for tenant {tenant_id}")
     
     def disconnect(self, websocket: WebSocket, tenant_id: str):
@@ -56,14 +77,23 @@ class ConnectionManager:
             self.active_connections[tenant_id].discard(websocket)
             if not self.active_connections[tenant_id]:
                 del self.active_connections[tenant_id]
+        self.connection_codecs.pop(websocket, None)
         logger.info(f"WebSocket disconnected for tenant {tenant_id}")
     
     async def broadcast_to_tenant(self, tenant_id: str, message: str):
         if tenant_id in self.active_connections:
             disconnected = set()
+            # Binary codecs re-encode the JSON event once per codec, not per connection
+            encoded: Dict[str, bytes] = {}
             for connection in self.active_connections[tenant_id]:
                 try:
-                    await connection.send_text(message)
+                    codec = self.connection_codecs.get(connection)
+                    if codec is None or not codec.binary:
+                        await connection.send_text(message)
+                    else:
+                        if codec.name not in encoded:
+                            encoded[codec.name] = codec.encode(json_loads(message))
+                        await connection.send_bytes(encoded[codec.name])
                 except WebSocketDisconnect:
                     disconnected.add(connection)
                 except Exception as e:
@@ -79,24 +109,36 @@ manager = ConnectionManager()
 
 
 async def redis_subscriber():
-    """Subscribe to Redis sensor_new channel and broadcast to WebSockets."""
-    redis_client = await get_redis_client()
+    """Subscribe to Redis sensor_new channel, feed the recent buffers and memory shadow, broadcast to WebSockets."""
+    redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
     pubsub = redis_client.pubsub()
+    buffers = get_recent_buffers()
     
     try:
-        await pubsub.subscribe("sensor_new")
-        logger.info("Subscribed to Redis channel: sensor_new")
+        await pubsub.subscribe(SENSOR_CHANNEL)
+        logger.info(f"Subscribed to Redis channel: {SENSOR_CHANNEL}")
+        if buffers is not None:
+            buffers.set_live(True)
         
         async for message in pubsub.listen():
             if message["type"] == "message":
                 try:
-                    data = json.loads(message["data"])
-                    tenant_id = data.get("tenant_id")
-                    
-                    if tenant_id:
-                        # Broadcast to all WebSocket connections for this tenant
-                        await manager.broadcast_to_tenant(tenant_id, message["data"])
-                        logger.info(f"Broadcasted sensor data to tenant {tenant_id}")
+                    # A Redis shadow is updated by the worker; an in-process one only sees these events
+                    shadow = get_device_shadow()
+                    events = []
+                    # Plain events and framed per-tenant batches both unpack to single events
+                    for tenant_id, event in unpack_events(message["data"]):
+                        if tenant_id:
+                            # Broadcast to all WebSocket connections for this tenant
+                            await manager.broadcast_to_tenant(tenant_id, event)
+                            logger.debug(f"Broadcasted sensor data to tenant {tenant_id}")
+                        if buffers is not None or isinstance(shadow, MemoryShadow):
+                            events.append(json_loads(event))
+                    if buffers is not None:
+                        for event in events:
+                            buffers.add_event(event)
+                    if isinstance(shadow, MemoryShadow):
+                        await apply_observations(shadow, observe_events(events))
                     
                 except json.JSONDecodeError as e:
                     logger.error(f"Invalid JSON in Redis message: {e}")
@@ -106,7 +148,10 @@ async def redis_subscriber():
     except Exception as e:
         logger.error(f"Redis subscriber error: {e}")
     finally:
-        await pubsub.unsubscribe("sensor_new")
+        # Readings published from now on would be missed
+        if buffers is not None:
+            buffers.set_live(False)
+        await pubsub.unsubscribe(SENSOR_CHANNEL)
         await pubsub.close()
 
 
@@ -121,6 +166,33 @@ def create_app() -> FastAPI:
             try:
                 async with engine.begin() as conn:
                     await conn.run_sync(SQLModel.metadata.create_all)
+                
+                # Keep time partitions of the sensor tables ahead (PostgreSQL only)
+                partitions = PartitionManager.from_settings(engine)
+                if partitions.enabled:
+                    await partitions.maintain()
+                    asyncio.create_task(partitions.run(settings.SENSOR_PARTITION_MAINTENANCE_SECONDS))
+                
+                # Periodically recompute recent rollups to pick up late rows
+                if settings.ROLLUPS_ENABLED and settings.ROLLUP_REPAIR_INTERVAL_SECONDS > 0 and AsyncSessionLocal is not None:
+                    repairer = RollupRepairer(
+                        AsyncSessionLocal,
+                        lookback_minutes=settings.ROLLUP_REPAIR_LOOKBACK_MINUTES,
+                        interval_seconds=settings.ROLLUP_REPAIR_INTERVAL_SECONDS,
+                        linger_seconds=settings.ROLLUP_REPAIR_LINGER_SECONDS,
+                    )
+                    asyncio.create_task(repairer.run())
+
+                # Compress cold sensor history into blocks
+                if settings.SENSOR_COMPACTION_ENABLED and AsyncSessionLocal is not None:
+                    asyncio.create_task(SensorCompactor.from_settings(AsyncSessionLocal).run())
+
+                # Move cold sensor_data to Parquet archives
+                if settings.SENSOR_ARCHIVE_ENABLED and AsyncSessionLocal is not None:
+                    if archive_available():
+                        asyncio.create_task(SensorArchiver.from_settings(AsyncSessionLocal).run())
+                    else:
+                        logger.warning("SENSOR_ARCHIVE_ENABLED requires pyarrow; archiving is off")
 
                 # 2) Seed default tenant and admin user if tables are empty
                 if AsyncSessionLocal is not None:
@@ -159,7 +231,11 @@ def create_app() -> FastAPI:
         else:
             print("Warning: Database not configured, skipping startup tasks")
         
-        # 3) Start Redis subscriber in background (optional)
+        # 3) Start Redis subscriber in background (optional), feeding the recent buffers
+        try:
+            await start_recent_buffers()
+        except Exception as e:
+            print(f"⚠️  Recent reading buffers failed to start: {e}")
         try:
             asyncio.create_task(redis_subscriber())
             logger.info("Started Redis subscriber background task")
@@ -167,11 +243,28 @@ def create_app() -> FastAPI:
             print(f"⚠️  Redis connection failed: {e}")
             print("   API will run without Redis functionality")
         
+        # 4) Keep the latest value per device/sensor for current-state reads
+        try:
+            await start_device_shadow()
+        except Exception as e:
+            print(f"⚠️  Device shadow failed to start: {e}")
+            print("   Current device state will be unavailable")
+        
+        # 5) Start the write-behind flusher for 202-Accepted ingestion (opt-in)
+        if settings.INGEST_WRITE_BEHIND_ENABLED and AsyncSessionLocal is not None:
+            try:
+                await start_write_behind(AsyncSessionLocal)
+            except Exception as e:
+                print(f"⚠️  Write-behind ingestion failed to start: {e}")
+                print("   Ingest endpoints will write synchronously")
+        
         yield
         
         # Shutdown
-        # Cleanup tasks if needed
-        pass
+        # Drain buffered readings before the process exits
+        await stop_write_behind()
+        await stop_device_shadow()
+        await stop_recent_buffers()
     
     application = FastAPI(
         title="SmartSecurity Cloud",
@@ -211,8 +304,11 @@ def create_app() -> FastAPI:
 
     # ─────────────────── WebSocket endpoints ────────────── #
     @application.websocket("/ws/{tenant_id}")
-    async def websocket_endpoint(websocket: WebSocket, tenant_id: str):
-        await manager.connect(websocket, tenant_id)
+    async def websocket_endpoint(websocket: WebSocket, tenant_id: str, codec: str = "json"):
+        if codec not in available_codecs(generic_only=True):
+            await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+            return
+        await manager.connect(websocket, tenant_id, codec)
         try:
             while True:
                 # Keep connection alive
@@ -224,12 +320,16 @@ def create_app() -> FastAPI:
     async def websocket_live_device(
         websocket: WebSocket, 
         device_id: str,
-        token: str = ""
+        token: str = "",
+        codec: str = "json"
     ):
         """WebSocket endpoint for live device data with authentication."""
         if not token:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
+        if codec not in available_codecs(generic_only=True):
+            await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+            return
         
         try:
             # Verify user and device access
@@ -254,7 +354,7 @@ def create_app() -> FastAPI:
                         return
             
             # Connect to tenant-specific WebSocket
-            await manager.connect(websocket, user.tenant_id)
+            await manager.connect(websocket, user.tenant_id, codec)
             
             try:
                 while True:
@@ -6,8 +6,9 @@ SQLModel database models for SmartSecurity Cloud.
 from .user import User
 from .tenant import Tenant
 from .device import Device
-from .sensor import Sensor, SensorData
+from .sensor import Sensor, SensorBlock, SensorData, SensorRollup
 from .audit import AuditLog
+from .alert import AlertRule
 
 __all__ = [
     "User",
@@ -15,5 +16,8 @@ __all__ = [
     "Device",
     "Sensor",
     "SensorData",
+    "SensorRollup",
+    "SensorBlock",
     "AuditLog",
+    "AlertRule",
 ]
\ No newline at end of file
@@ -0,0 +1,44 @@
+# app/models/alert.py
+"""
+Per-tenant alert rules evaluated by the ingest worker.
+"""
+
+from uuid import UUID, uuid4
+from datetime import datetime
+from typing import Optional
+from sqlmodel import SQLModel, Field
+
+
+class AlertRule(SQLModel, table=True):
+    """
+    One alert condition on a sensor type of a tenant's devices.
+
+    • `id` – UUID primary key.
+    • `tenant_id` – owning tenant; rules only see that tenant's readings.
+    • `name` – human-friendly label, copied into alert events.
+    • `sensor_type` – reading the rule watches.
+    • `device_id` – one device, or None for every device of the tenant.
+    • `kind` – "threshold": `value <operator> threshold` has held for
+      `duration_seconds`; "count": it matched at least `min_count` times
+      within `window_seconds`; "rate": the change per minute over
+      `window_seconds` satisfies `<operator> threshold`.
+    • `operator`, `threshold` – the comparison (">", ">=", "<", "<=", "==", "!=").
+    • `is_active` – disabled rules are not loaded.
+    • `created_at`, `updated_at` – timestamps; an update resets the rule's state.
+    """
+    __tablename__ = "alert_rules"
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
+    tenant_id: str = Field(index=True, nullable=False)
+    name: str = Field(nullable=False)
+    sensor_type: str = Field(nullable=False)
+    device_id: Optional[str] = Field(default=None, nullable=True)
+    kind: str = Field(default="threshold", nullable=False)
+    operator: str = Field(default=">", nullable=False)
+    threshold: float = Field(nullable=False)
+    duration_seconds: int = Field(default=0, nullable=False)
+    window_seconds: int = Field(default=0, nullable=False)
+    min_count: int = Field(default=1, nullable=False)
+    is_active: bool = Field(default=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -5,19 +5,30 @@ Sensor data model for IoT device readings.
 • Stores sensor measurements and metadata.
 • Links to devices and users for access control.
 • Supports various sensor types and data formats.
+• On PostgreSQL both tables are range-partitioned by `timestamp`
+  (see `app.db.partitions`), so `timestamp` is part of the primary key.
+• The `(device_id, timestamp, id)` indexes serve keyset pagination
+  (see `app.db.pagination`).
+• `sensor_rollups` holds per-bucket aggregates (see `app.ingestion.rollups`).
+• `sensor_blocks` holds compacted cold `sensors` history as compressed
+  per-device series (see `app.ingestion.blocks`).
 """
 
 from uuid import UUID, uuid4
 from datetime import datetime
 from typing import Optional
+from sqlalchemy import Column, Index, LargeBinary
 from sqlmodel import SQLModel, Field
 
+# Table options for PostgreSQL declarative partitioning; ignored by SQLite
+PARTITION_BY_TIMESTAMP = {"postgresql_partition_by": "RANGE (timestamp)"}
+
 
 class Sensor(SQLModel, table=True):
     """
     Sensor data table.
     
-    • `id` – UUID primary key.
+    • `id` – UUID primary key (with `timestamp`).
     • `device_id` – foreign key to device.
     • `sensor_type` – type of sensor (temperature, motion, etc.).
     • `value` – sensor reading value.
@@ -27,14 +38,18 @@ class Sensor(SQLModel, table=True):
     • `created_at` – record creation time.
     """
     __tablename__ = "sensors"
+    __table_args__ = (
+        Index("ix_sensors_device_id_timestamp", "device_id", "timestamp", "id"),
+        PARTITION_BY_TIMESTAMP,
+    )
     
-    id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
-    device_id: str = Field(index=True, nullable=False)
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    device_id: str = Field(nullable=False)
     sensor_type: str = Field(index=True, nullable=False)
     value: float = Field(nullable=False)
     unit: str = Field(default="")
     sensor_metadata: Optional[str] = Field(default=None)
-    timestamp: datetime = Field(default_factory=datetime.utcnow, index=True)
+    timestamp: datetime = Field(default_factory=datetime.utcnow, primary_key=True, index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -42,7 +57,7 @@ class SensorData(SQLModel, table=True):
     """
     MQTT sensor data table with JSONB payload.
     
-    • `id` – UUID primary key.
+    • `id` – UUID primary key (with `timestamp`).
     • `tenant_id` – foreign key to tenant.
     • `device_id` – device identifier.
     • `payload` – JSONB payload containing sensor data.
@@ -50,10 +65,64 @@ class SensorData(SQLModel, table=True):
     • `created_at` – record creation time.
     """
     __tablename__ = "sensor_data"
+    __table_args__ = (
+        Index("ix_sensor_data_device_id_timestamp", "device_id", "timestamp", "id"),
+        PARTITION_BY_TIMESTAMP,
+    )
     
-    id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
     tenant_id: Optional[str] = Field(index=True, nullable=True)
-    device_id: str = Field(index=True, nullable=False)
+    device_id: str = Field(nullable=False)
     payload: str = Field(default="{}")
-    timestamp: datetime = Field(default_factory=datetime.utcnow, index=True)
+    timestamp: datetime = Field(default_factory=datetime.utcnow, primary_key=True, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SensorRollup(SQLModel, table=True):
+    """
+    Incrementally maintained aggregates of numeric readings.
+
+    • `device_id`, `sensor_type` – the series.
+    • `resolution` – bucket width: "1m", "1h" or "1d".
+    • `bucket` – bucket start (UTC).
+    • `count`, `min_value`, `max_value`, `sum_value` – mergeable aggregates.
+    • `last_value`, `last_timestamp` – latest reading in the bucket.
+    """
+    __tablename__ = "sensor_rollups"
+    
+    device_id: str = Field(primary_key=True)
+    sensor_type: str = Field(primary_key=True)
+    resolution: str = Field(primary_key=True)
+    bucket: datetime = Field(primary_key=True)
+    count: int = Field(default=0, nullable=False)
+    min_value: float = Field(nullable=False)
+    max_value: float = Field(nullable=False)
+    sum_value: float = Field(nullable=False)
+    last_value: float = Field(nullable=False)
+    last_timestamp: datetime = Field(nullable=False)
+
+
+class SensorBlock(SQLModel, table=True):
+    """
+    One closed time window of a `sensors` series, compressed.
+
+    • `device_id`, `sensor_type`, `unit` – the series.
+    • `start_time`, `end_time` – the window `[start, end)`.
+    • `first_timestamp`, `last_timestamp`, `count`, `min_value`,
+      `max_value` – summary used to prune reads.
+    • `data` – Gorilla-encoded timestamps and values (`app.core.gorilla`).
+    """
+    __tablename__ = "sensor_blocks"
+    
+    device_id: str = Field(primary_key=True)
+    sensor_type: str = Field(primary_key=True)
+    unit: str = Field(default="", primary_key=True)
+    start_time: datetime = Field(primary_key=True)
+    end_time: datetime = Field(nullable=False)
+    first_timestamp: datetime = Field(nullable=False)
+    last_timestamp: datetime = Field(nullable=False)
+    count: int = Field(nullable=False)
+    min_value: float = Field(nullable=False)
+    max_value: float = Field(nullable=False)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
     created_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
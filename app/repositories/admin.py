@@ -16,6 +16,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_, desc, asc
 from sqlalchemy.orm import selectinload
 from sqlmodel import SQLModel
+import redis.asyncio as aioredis
 
 from app.models.user import User
 from app.models.device import Device
@@ -25,10 +26,14 @@ from app.schemas.admin import (
     UserCreate, UserUpdate, UserOut, UserMinimal,
     DeviceCreate, DeviceUpdate, DeviceOut, DeviceMinimal,
     TenantSnapshot, SystemHealthOverview, DatabaseHealth,
-    RedisHealth, MQTTHealth, ContainerHealth, ServiceStatus
+    RedisHealth, MQTTHealth, ContainerHealth, ServiceStatus, IngestSpoolHealth,
+    IngestWriteBehindHealth, RecentBuffersHealth
 )
+from app.core.config import settings
 from app.core.security import get_password_hash
 from app.core.redis import get_redis_client
+from app.ingestion.pipeline import METRICS_KEY_PREFIX
+from app.ingestion.shadow import get_device_shadow
 
 
 class AdminUserRepository:
@@ -232,7 +237,7 @@ class AdminDeviceRepository:
         result = await self.session.execute(query)
         devices = result.scalars().all()
         
-        return [DeviceOut.from_orm(device) for device in devices], total
+        return await self._with_last_seen([DeviceOut.from_orm(device) for device in devices]), total
     
     async def fetch_by_id(self, device_id: str) -> Optional[DeviceOut]:
         """Fetch device by ID."""
@@ -240,7 +245,24 @@ class AdminDeviceRepository:
         result = await self.session.execute(query)
         device = result.scalar_one_or_none()
         
-        return DeviceOut.from_orm(device) if device else None
+        if not device:
+            return None
+        return (await self._with_last_seen([DeviceOut.from_orm(device)]))[0]
+    
+    async def _with_last_seen(self, devices: List[DeviceOut]) -> List[DeviceOut]:
+        """Fill `last_seen` from the device shadow, in one lookup."""
+        shadow = get_device_shadow()
+        if shadow is None or not devices:
+            return devices
+        try:
+            states = await shadow.get_many([str(device.id) for device in devices])
+        except Exception:
+            return devices
+        for device in devices:
+            state = states.get(str(device.id))
+            if state is not None:
+                device.last_seen = state["last_seen"]
+        return devices
     
     async def create(self, device_data: DeviceCreate, created_by: str) -> DeviceOut:
         """Create a new device."""
@@ -390,6 +412,21 @@ class AdminSystemRepository:
         # MQTT health
         mqtt_health = await self._get_mqtt_health()
         
+        # Metric reports of the workers and API processes, read once for the sections below
+        try:
+            reports = await self._get_ingest_reports()
+        except Exception:
+            reports = None
+        
+        # Ingest spool depth, as reported by the workers
+        spool_health = self._get_spool_health(reports)
+        
+        # Write-behind buffers, as reported by the API processes
+        write_behind_health = self._get_write_behind_health(reports)
+        
+        # Recent-reading buffers, as reported by the API processes
+        recent_buffers_health = self._get_recent_buffers_health(reports)
+        
         # Container health
         containers = await self._get_container_health()
         
@@ -401,6 +438,9 @@ class AdminSystemRepository:
             postgres=db_health,
             redis=redis_health,
             mqtt=mqtt_health,
+            ingest_spool=spool_health,
+            ingest_write_behind=write_behind_health,
+            recent_buffers=recent_buffers_health,
             containers=containers
         )
     
@@ -457,6 +497,100 @@ class AdminSystemRepository:
             topic_count=150
         )
     
+    async def _get_ingest_reports(self) -> List[Dict[str, Any]]:
+        """Fresh metric reports published to Redis by workers and API processes."""
+        redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        try:
+            keys = [key async for key in redis_client.scan_iter(match=f"{METRICS_KEY_PREFIX}*")]
+            reports = await redis_client.mget(keys) if keys else []
+        finally:
+            await redis_client.aclose()
+        return [json.loads(report) for report in reports if report]
+    
+    def _get_spool_health(self, reports: Optional[List[Dict[str, Any]]]) -> IngestSpoolHealth:
+        """Sum the spool metrics that ingest workers publish to Redis (None if unreadable)."""
+        if reports is None:
+            return IngestSpoolHealth(status=ServiceStatus.UNKNOWN)
+        
+        spools = [report.get("spool") for report in reports]
+        spools = [spool for spool in spools if spool]
+        if not spools:
+            return IngestSpoolHealth(status=ServiceStatus.UNKNOWN, workers_reporting=len(reports))
+        
+        depth = sum(spool["depth"] for spool in spools)
+        size = sum(spool["bytes"] for spool in spools)
+        # Nearly full spools are about to start dropping rows
+        if any(spool["bytes"] >= 0.9 * spool["max_bytes"] for spool in spools):
+            status = ServiceStatus.ERROR
+        elif depth:
+            status = ServiceStatus.WARNING
+        else:
+            status = ServiceStatus.OK
+        return IngestSpoolHealth(
+            status=status,
+            depth_rows=depth,
+            size_bytes=size,
+            segments=sum(spool["segments"] for spool in spools),
+            workers_reporting=len(spools)
+        )
+    
+    def _get_write_behind_health(self, reports: Optional[List[Dict[str, Any]]]) -> IngestWriteBehindHealth:
+        """Sum the write-behind buffer metrics that API processes publish to Redis (None if unreadable)."""
+        if reports is None:
+            return IngestWriteBehindHealth(status=ServiceStatus.UNKNOWN)
+        
+        buffers = [report["write_behind"] for report in reports if report.get("write_behind")]
+        if not buffers:
+            return IngestWriteBehindHealth(status=ServiceStatus.UNKNOWN)
+        
+        # A shared Redis stream is reported by every process; count it once
+        streams = [b for b in buffers if b["durable"]][:1]
+        memory = [b for b in buffers if not b["durable"]]
+        depth = sum(b["depth"] for b in streams + memory)
+        capacity = sum(b["capacity"] for b in streams + memory)
+        if any(b["depth"] >= 0.9 * b["capacity"] for b in buffers):
+            status = ServiceStatus.ERROR
+        elif any(b["errors"] for b in buffers):
+            status = ServiceStatus.WARNING
+        else:
+            status = ServiceStatus.OK
+        return IngestWriteBehindHealth(
+            status=status,
+            backend=buffers[0]["backend"],
+            depth_rows=depth,
+            capacity_rows=capacity,
+            flushed_rows=sum(b["flushed_rows"] for b in buffers),
+            rejected_rows=sum(b["rejected"] for b in buffers),
+            flush_errors=sum(b["errors"] for b in buffers),
+            max_flush_latency_ms=max(b["max_flush_latency_ms"] for b in buffers),
+            processes_reporting=len(buffers)
+        )
+    
+    def _get_recent_buffers_health(self, reports: Optional[List[Dict[str, Any]]]) -> RecentBuffersHealth:
+        """Sum the recent-buffer metrics that API processes publish to Redis (None if unreadable)."""
+        if reports is None:
+            return RecentBuffersHealth(status=ServiceStatus.UNKNOWN)
+        
+        buffers = [report["recent_buffers"] for report in reports if report.get("recent_buffers")]
+        if not buffers:
+            return RecentBuffersHealth(status=ServiceStatus.UNKNOWN)
+        
+        hits = sum(b["hits"] for b in buffers)
+        misses = sum(b["misses"] for b in buffers)
+        # A process whose subscription dropped answers everything from the database
+        status = ServiceStatus.OK if all(b["live"] for b in buffers) else ServiceStatus.WARNING
+        return RecentBuffersHealth(
+            status=status,
+            devices=sum(b["devices"] for b in buffers),
+            points=sum(b["points"] for b in buffers),
+            bytes=sum(b["bytes"] for b in buffers),
+            hits=hits,
+            misses=misses,
+            hit_ratio=hits / (hits + misses) if hits + misses else None,
+            evictions=sum(b["evictions"] for b in buffers),
+            processes_reporting=len(buffers)
+        )
+    
     async def _get_container_health(self) -> List[ContainerHealth]:
         """Get container health metrics."""
         # This would typically use docker-sdk-py to get container stats
@@ -185,12 +185,50 @@ class ContainerHealth(BaseModel):
     uptime_seconds: int = Field(..., ge=0, description="Container uptime")
 
 
+class IngestSpoolHealth(BaseModel):
+    """Disk spool of sensor rows awaiting replay into the database."""
+    status: ServiceStatus
+    depth_rows: int = Field(0, ge=0, description="Spooled rows awaiting replay")
+    size_bytes: int = Field(0, ge=0, description="Disk used by spool segments")
+    segments: int = Field(0, ge=0, description="Spool segment files")
+    workers_reporting: int = Field(0, ge=0, description="Ingest workers with fresh metrics")
+
+
+class IngestWriteBehindHealth(BaseModel):
+    """Write-behind buffers of API processes accepting readings with 202."""
+    status: ServiceStatus
+    backend: Optional[str] = Field(None, description="memory or redis")
+    depth_rows: int = Field(0, ge=0, description="Buffered rows awaiting a bulk write")
+    capacity_rows: int = Field(0, ge=0, description="Total buffer capacity")
+    flushed_rows: int = Field(0, ge=0, description="Rows written since startup")
+    rejected_rows: int = Field(0, ge=0, description="Rows refused with 503 because a buffer was full")
+    flush_errors: int = Field(0, ge=0, description="Failed bulk writes")
+    max_flush_latency_ms: float = Field(0, ge=0, description="Worst enqueue-to-commit latency")
+    processes_reporting: int = Field(0, ge=0, description="API processes with fresh metrics")
+
+
+class RecentBuffersHealth(BaseModel):
+    """In-memory ring buffers of recent readings in the API processes."""
+    status: ServiceStatus
+    devices: int = Field(0, ge=0, description="Devices with buffered readings")
+    points: int = Field(0, ge=0, description="Buffered readings")
+    bytes: int = Field(0, ge=0, description="Memory held by buffered readings")
+    hits: int = Field(0, ge=0, description="Queries answered from memory")
+    misses: int = Field(0, ge=0, description="Queries that fell back to the database")
+    hit_ratio: Optional[float] = Field(None, ge=0, le=1, description="hits / (hits + misses)")
+    evictions: int = Field(0, ge=0, description="Devices evicted to stay under the cap")
+    processes_reporting: int = Field(0, ge=0, description="API processes with fresh metrics")
+
+
 class SystemHealthOverview(BaseModel):
     """Complete system health overview."""
     uptime_sec: int = Field(..., ge=0, description="System uptime in seconds")
     postgres: DatabaseHealth
     redis: RedisHealth
     mqtt: MQTTHealth
+    ingest_spool: Optional[IngestSpoolHealth] = None
+    ingest_write_behind: Optional[IngestWriteBehindHealth] = None
+    recent_buffers: Optional[RecentBuffersHealth] = None
     containers: List[ContainerHealth] = Field(default_factory=list)
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
@@ -337,4 +375,42 @@ class AuditExportResponse(BaseModel):
     record_count: Optional[int] = None
     status: str = Field(..., description="Export status")
     created_at: datetime
-    expires_at: datetime = Field(..., description="Download link expiration") 
\ No newline at end of file
+    expires_at: datetime = Field(..., description="Download link expiration") 
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# INGEST DEAD-LETTER SCHEMAS
+# ────────────────────────────────────────────────────────────────────────────────
+
+class DeadLetterOut(BaseModel):
+    """A rejected MQTT message held in the dead-letter queue."""
+    id: str = Field(..., description="Redis Stream entry id")
+    topic: str
+    reason: str = Field(..., description="Reason code, e.g. invalid_topic or decode_error")
+    error: str
+    content_type: Optional[str] = None
+    received_at: Optional[datetime] = None
+    payload_size: int = Field(..., ge=0, description="Payload size in bytes")
+    payload_preview: str = Field(..., description="Start of the payload as UTF-8 text")
+    payload_b64: str = Field(..., description="Full payload, base64-encoded")
+
+
+class DeadLetterList(BaseModel):
+    """Page of dead letters plus queue totals."""
+    total: int = Field(..., ge=0, description="Entries in the queue")
+    items: List[DeadLetterOut] = Field(default_factory=list)
+
+
+class DeadLetterReplayRequest(BaseModel):
+    """Which dead letters to replay and how fast."""
+    ids: Optional[List[str]] = Field(None, description="Specific entry ids (overrides reason/limit)")
+    reason: Optional[str] = Field(None, description="Only entries with this reason code")
+    limit: int = Field(100, ge=1, le=1000, description="Max entries to replay")
+    rate: Optional[float] = Field(None, gt=0, le=1000, description="Messages per second")
+
+
+class DeadLetterReplayResult(BaseModel):
+    """Outcome of a dead-letter replay or purge."""
+    replayed: int = Field(0, ge=0)
+    failed: int = Field(0, ge=0)
+    deleted: int = Field(0, ge=0)
\ No newline at end of file
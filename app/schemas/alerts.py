@@ -0,0 +1,57 @@
+"""
+Alert rule Pydantic schemas.
+"""
+
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+
+class AlertRuleCreate(BaseModel):
+    """Schema for creating an alert rule."""
+    name: str = Field(..., min_length=1, max_length=100, description="Label copied into alert events")
+    sensor_type: str = Field(..., min_length=1, max_length=100, description="Reading the rule watches")
+    device_id: Optional[UUID] = Field(None, description="One device; all of the tenant's devices if omitted")
+    kind: str = Field("threshold", pattern="^(threshold|count|rate)$", description="threshold, count or rate")
+    operator: str = Field(">", pattern="^(>|>=|<|<=|==|!=)$", description="Comparison against threshold")
+    threshold: float = Field(..., description="Value (or, for rate rules, change per minute) compared against")
+    duration_seconds: int = Field(0, ge=0, le=86400, description="threshold: how long the condition must hold")
+    window_seconds: int = Field(0, ge=0, le=86400, description="count/rate: window the rule looks back over")
+    min_count: int = Field(1, ge=1, le=100000, description="count: matches needed within the window")
+    is_active: bool = Field(default=True)
+
+
+class AlertRuleUpdate(BaseModel):
+    """Schema for updating an alert rule; omitted fields are kept."""
+    name: Optional[str] = Field(None, min_length=1, max_length=100)
+    sensor_type: Optional[str] = Field(None, min_length=1, max_length=100)
+    device_id: Optional[UUID] = None
+    kind: Optional[str] = Field(None, pattern="^(threshold|count|rate)$")
+    operator: Optional[str] = Field(None, pattern="^(>|>=|<|<=|==|!=)$")
+    threshold: Optional[float] = None
+    duration_seconds: Optional[int] = Field(None, ge=0, le=86400)
+    window_seconds: Optional[int] = Field(None, ge=0, le=86400)
+    min_count: Optional[int] = Field(None, ge=1, le=100000)
+    is_active: Optional[bool] = None
+
+
+class AlertRuleOut(BaseModel):
+    """Schema for alert rule output."""
+    id: UUID
+    tenant_id: str
+    name: str
+    sensor_type: str
+    device_id: Optional[str] = None
+    kind: str
+    operator: str
+    threshold: float
+    duration_seconds: int
+    window_seconds: int
+    min_count: int
+    is_active: bool
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -23,6 +23,7 @@ from app.schemas.admin import (
     SystemSetting, SystemSettingUpdate, AuditExportRequest, AuditExportResponse
 )
 from app.repositories.admin import AdminUserRepository, AdminDeviceRepository, AdminSystemRepository
+from app.core.config import settings as app_settings
 from app.core.rbac import log_audit_event
 from app.core.redis import get_redis_client
 
@@ -460,8 +461,8 @@ class AdminSettingsService:
             ),
             SystemSetting(
                 key="data_retention_days",
-                value="90",
-                description="Number of days to retain sensor data",
+                value=str(app_settings.SENSOR_ARCHIVE_AFTER_DAYS),
+                description="Days sensor data stays in the database before moving to the Parquet archive",
                 category="data",
                 is_secret=False,
                 created_at=datetime.utcnow(),
@@ -0,0 +1,232 @@
+# app/services/downsample.py
+"""
+Downsampling of time series for charts.
+
+• `lttb_indices` – Largest-Triangle-Three-Buckets: keeps the point of each
+  bucket that forms the largest triangle with its neighbours, which
+  preserves the visual shape (peaks included) with few points.
+• `minmax_indices` – the minimum and maximum of each bucket, for when
+  every extreme must survive.
+• Both return indices into the input, always keep the first and last
+  point, and return at most `max_points` indices, so callers can select
+  the original rows unchanged.
+• Vectorized with NumPy when installed; plain Python otherwise.
+• `downsample_sensors` / `downsample_sensor_data` pick the rows of a
+  device's history to chart: only (id, timestamp, value) of the range is
+  scanned, then the chosen rows are loaded by id. Compacted `sensors`
+  readings (`app.ingestion.blocks`) are decoded into the series, and
+  archived `sensor_data` rows (`app.ingestion.archive`) read into it.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+
+from app.core.codecs import json_loads
+from app.ingestion.archive import archive_root, read_archive, to_sensor_data
+from app.ingestion.blocks import BlockPoint, read_block_points
+from app.ingestion.rollups import extract_readings
+from app.models.sensor import Sensor, SensorData
+from app.services.telemetry import to_epoch
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on installed extras
+    np = None
+
+ALGORITHMS = ("lttb", "minmax")
+
+
+def _bucket_bounds(length: int, buckets: int) -> List[int]:
+    """Edges splitting points 1 … length-2 into `buckets` near-equal runs."""
+    inner = length - 2
+    return [1 + (inner * i) // buckets for i in range(buckets + 1)]
+
+
+def _lttb_python(x: Sequence[float], y: Sequence[float], max_points: int) -> List[int]:
+    bounds = _bucket_bounds(len(x), max_points - 2)
+    selected = [0]
+    for b in range(max_points - 2):
+        start, end = bounds[b], bounds[b + 1]
+        if b + 2 < len(bounds):
+            next_start, next_end = bounds[b + 1], bounds[b + 2]
+        else:
+            next_start, next_end = len(x) - 1, len(x)
+        # Average of the next bucket is the third triangle vertex
+        span = next_end - next_start
+        avg_x = sum(x[next_start:next_end]) / span
+        avg_y = sum(y[next_start:next_end]) / span
+        ax, ay = x[selected[-1]], y[selected[-1]]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((ax - avg_x) * (y[i] - ay) - (ax - x[i]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = i, area
+        selected.append(best)
+    selected.append(len(x) - 1)
+    return selected
+
+
+def _lttb_numpy(x, y, max_points: int) -> List[int]:
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bounds = np.array(_bucket_bounds(len(x), max_points - 2))
+    # Next-bucket averages for every bucket at once; the last uses the final point
+    sums_x = np.add.reduceat(x[1:-1], bounds[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:-1], bounds[:-1] - 1)
+    counts = np.diff(bounds)
+    avg_x = np.append((sums_x / counts)[1:], x[-1])
+    avg_y = np.append((sums_y / counts)[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, len(x) - 1
+    previous = 0
+    for b in range(max_points - 2):
+        start, end = bounds[b], bounds[b + 1]
+        ax, ay = x[previous], y[previous]
+        areas = np.abs((ax - avg_x[b]) * (y[start:end] - ay) - (ax - x[start:end]) * (avg_y[b] - ay))
+        previous = start + int(np.argmax(areas))
+        selected[b + 1] = previous
+    return selected.tolist()
+
+
+def lttb_indices(x: Sequence[float], y: Sequence[float], max_points: int) -> List[int]:
+    """Indices of at most `max_points` points chosen by LTTB (x ascending)."""
+    if max_points < 3:
+        raise ValueError("max_points must be at least 3")
+    if len(x) <= max_points:
+        return list(range(len(x)))
+    if np is not None:
+        return _lttb_numpy(x, y, max_points)
+    return _lttb_python(x, y, max_points)
+
+
+def minmax_indices(x: Sequence[float], y: Sequence[float], max_points: int) -> List[int]:
+    """Indices of the first, last and per-bucket min/max points, at most `max_points`."""
+    if max_points < 4:
+        raise ValueError("max_points must be at least 4")
+    if len(x) <= max_points:
+        return list(range(len(x)))
+    buckets = (max_points - 2) // 2
+    bounds = _bucket_bounds(len(x), buckets)
+    if np is not None:
+        values = np.asarray(y, dtype=np.float64)[1:-1]
+        groups = np.repeat(np.arange(buckets), np.diff(bounds))
+        order = np.lexsort((values, groups))
+        starts = np.array(bounds[:-1]) - 1
+        ends = np.array(bounds[1:]) - 2
+        picked = np.concatenate((order[starts], order[ends])) + 1
+        return [0, *np.unique(picked).tolist(), len(x) - 1]
+    picked = set()
+    for b in range(buckets):
+        run = range(bounds[b], bounds[b + 1])
+        picked.add(min(run, key=lambda i: y[i]))
+        picked.add(max(run, key=lambda i: y[i]))
+    return [0, *sorted(picked), len(x) - 1]
+
+
+def downsample_indices(x: Sequence[float], y: Sequence[float], max_points: int, algorithm: str = "lttb") -> List[int]:
+    """Dispatch to `lttb_indices` or `minmax_indices`."""
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown downsampling algorithm: {algorithm}")
+    if algorithm == "minmax":
+        return minmax_indices(x, y, max_points)
+    return lttb_indices(x, y, max_points)
+
+
+def _time_range(statement, model, start: Optional[datetime], end: Optional[datetime]):
+    if start is not None:
+        statement = statement.where(model.timestamp >= start)
+    if end is not None:
+        statement = statement.where(model.timestamp <= end)
+    return statement
+
+
+async def _load_newest_first(session, model, ids: List[Any]) -> List[Any]:
+    if not ids:
+        return []
+    result = await session.execute(
+        select(model).where(model.id.in_(ids)).order_by(model.timestamp.desc(), model.id.desc())
+    )
+    return list(result.scalars().all())
+
+
+async def downsample_sensors(
+    session,
+    device_id: str,
+    sensor_type: str,
+    max_points: int,
+    algorithm: str = "lttb",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Tuple[List[Sensor], int]:
+    """At most `max_points` `sensors` rows (newest first) and the series length."""
+    statement = select(Sensor.id, Sensor.timestamp, Sensor.value).where(
+        Sensor.device_id == device_id, Sensor.sensor_type == sensor_type
+    )
+    statement = _time_range(statement, Sensor, start, end).order_by(Sensor.timestamp, Sensor.id)
+    points: List[Any] = list((await session.execute(statement)).all())
+    # Compacted readings stand in as BlockPoints until chosen
+    compacted = await read_block_points(session, device_id, sensor_type, start, end)
+    if compacted:
+        points.extend((point, point.timestamp, point.value) for point in compacted)
+        points.sort(key=lambda point: point[1])
+    x = [to_epoch(timestamp) for _, timestamp, _ in points]
+    y = [value for _, _, value in points]
+    chosen = [points[i][0] for i in downsample_indices(x, y, max_points, algorithm)] if points else []
+    sensors = await _load_newest_first(session, Sensor, [key for key in chosen if not isinstance(key, BlockPoint)])
+    decoded = [key.to_sensor() for key in chosen if isinstance(key, BlockPoint)]
+    if decoded:
+        sensors = sorted(sensors + decoded, key=lambda sensor: (sensor.timestamp, sensor.id), reverse=True)
+    return sensors, len(points)
+
+
+async def downsample_sensor_data(
+    session,
+    device_id: str,
+    sensor_type: str,
+    max_points: int,
+    algorithm: str = "lttb",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    tenant_id: Optional[str] = None,
+) -> Tuple[List[SensorData], int]:
+    """
+    At most `max_points` `sensor_data` rows (newest first) carrying
+    `sensor_type`, chosen on that reading, and the series length.
+    """
+    statement = select(SensorData.id, SensorData.timestamp, SensorData.payload).where(
+        SensorData.device_id == device_id
+    )
+    statement = _time_range(statement, SensorData, start, end).order_by(SensorData.timestamp, SensorData.id)
+    keys: List[Any] = []
+    x: List[float] = []
+    y: List[float] = []
+
+    def add(key, timestamp, payload) -> None:
+        try:
+            readings = extract_readings(json_loads(payload))
+        except ValueError:
+            return
+        value = next((value for reading_type, value in readings if reading_type == sensor_type), None)
+        if value is not None:
+            keys.append(key)
+            x.append(to_epoch(timestamp))
+            y.append(value)
+
+    # Archived rows (older) stand in as dicts until chosen
+    archived = await asyncio.to_thread(read_archive, archive_root(), tenant_id, device_id, start, end)
+    for row in sorted(archived, key=lambda row: (row["timestamp"], row["id"])):
+        add(row, row["timestamp"], row["payload"])
+    result = await session.stream(statement.execution_options(yield_per=10000))
+    async for row_id, timestamp, payload in result:
+        add(row_id, timestamp, payload)
+
+    chosen = [keys[i] for i in downsample_indices(x, y, max_points, algorithm)] if keys else []
+    sensor_data = await _load_newest_first(session, SensorData, [key for key in chosen if not isinstance(key, dict)])
+    restored = [to_sensor_data(key, tenant_id, device_id) for key in chosen if isinstance(key, dict)]
+    if restored:
+        sensor_data = sorted(sensor_data + restored, key=lambda data: (data.timestamp, data.id), reverse=True)
+    return sensor_data, len(keys)
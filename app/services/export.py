@@ -0,0 +1,249 @@
+# app/services/export.py
+"""
+Streaming bulk export of device telemetry.
+
+• Rows are read oldest first through a server-side cursor (`yield_per`),
+  one chunk at a time, and each chunk is encoded and sent before the next
+  is fetched, so memory stays constant however long the history is.
+• Formats: CSV, NDJSON, Arrow IPC stream and Parquet (one row group per
+  chunk). Arrow and Parquet need the optional `pyarrow` package.
+• A client disconnect closes the generator, which closes the cursor, so
+  an abandoned export stops reading from the database.
+• Rows moved to the Parquet archive (`app.ingestion.archive`) are streamed
+  first, one archived day at a time.
+"""
+
+import asyncio
+import csv
+import io
+import itertools
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+
+from app.core.codecs import json_dumps
+from app.ingestion.archive import archive_root, archived_days, read_part
+from app.models.sensor import SensorData
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on installed extras
+    pa = None
+    pq = None
+
+COLUMNS = ("id", "device_id", "timestamp", "created_at", "payload")
+
+FORMATS: Dict[str, Tuple[str, str]] = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COLUMNAR_FORMATS = ("arrow", "parquet")
+
+Row = Tuple[Any, str, datetime, datetime, str]
+
+
+def format_available(name: str) -> bool:
+    """Whether the encoder for `name` can run with the installed packages."""
+    return name in FORMATS and (name not in COLUMNAR_FORMATS or pa is not None)
+
+
+async def iter_row_chunks(
+    session,
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_rows: int = 5000,
+) -> AsyncIterator[List[Row]]:
+    """`sensor_data` rows of one device in `[start, end]`, oldest first, in chunks."""
+    statement = select(
+        SensorData.id, SensorData.device_id, SensorData.timestamp, SensorData.created_at, SensorData.payload
+    ).where(SensorData.device_id == device_id)
+    if start is not None:
+        statement = statement.where(SensorData.timestamp >= start)
+    if end is not None:
+        statement = statement.where(SensorData.timestamp <= end)
+    statement = statement.order_by(SensorData.timestamp, SensorData.id)
+
+    result = await session.stream(statement.execution_options(yield_per=chunk_rows))
+    try:
+        async for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+    finally:
+        await result.close()
+
+
+def _read_archived_day(parts, start, end) -> List[Row]:
+    rows = []
+    for part in parts:
+        rows.extend(read_part(part, start, end).to_pylist())
+    rows.sort(key=lambda row: (row["timestamp"], row["id"]))
+    return rows
+
+
+async def iter_archive_chunks(
+    tenant_id: Optional[str],
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_rows: int = 5000,
+) -> AsyncIterator[List[Row]]:
+    """Archived rows of one device in `[start, end]`, oldest first, in chunks."""
+    if pq is None:
+        return
+    days = await asyncio.to_thread(archived_days, archive_root(), tenant_id, device_id)
+    for day, entries in itertools.groupby(days, key=lambda entry: entry[0]):
+        if (start is not None and start.date() > day) or (end is not None and end.date() < day):
+            continue
+        rows = await asyncio.to_thread(_read_archived_day, [part for _, part in entries], start, end)
+        for i in range(0, len(rows), chunk_rows):
+            yield [
+                (row["id"], device_id, row["timestamp"], row["created_at"], row["payload"])
+                for row in rows[i:i + chunk_rows]
+            ]
+
+
+async def iter_history_chunks(
+    session,
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_rows: int = 5000,
+    tenant_id: Optional[str] = None,
+) -> AsyncIterator[List[Row]]:
+    """Archived rows, then `sensor_data` rows, of one device in `[start, end]`."""
+    async for chunk in iter_archive_chunks(tenant_id, device_id, start, end, chunk_rows):
+        yield chunk
+    chunks = iter_row_chunks(session, device_id, start, end, chunk_rows)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+
+def _text_row(row: Row) -> List[str]:
+    row_id, device_id, timestamp, created_at, payload = row
+    return [str(row_id), device_id, timestamp.isoformat(), created_at.isoformat(), payload]
+
+
+async def encode_csv(chunks: AsyncIterator[List[Row]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    async for chunk in chunks:
+        writer.writerows(_text_row(row) for row in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def encode_ndjson(chunks: AsyncIterator[List[Row]]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        yield "".join(
+            json_dumps(dict(zip(COLUMNS, _text_row(row)))) + "\n" for row in chunk
+        ).encode()
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _record_batch(chunk: Sequence[Row], schema):
+    columns = list(zip(*chunk))
+    return pa.record_batch(
+        [
+            pa.array([str(row_id) for row_id in columns[0]], pa.string()),
+            pa.array(columns[1], pa.string()),
+            pa.array(columns[2], pa.timestamp("us")),
+            pa.array(columns[3], pa.timestamp("us")),
+            pa.array(columns[4], pa.string()),
+        ],
+        schema=schema,
+    )
+
+
+def arrow_schema():
+    return pa.schema([
+        ("id", pa.string()),
+        ("device_id", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+        ("created_at", pa.timestamp("us")),
+        ("payload", pa.string()),
+    ])
+
+
+async def encode_arrow(chunks: AsyncIterator[List[Row]]) -> AsyncIterator[bytes]:
+    schema = arrow_schema()
+    sink = _DrainableSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    async for chunk in chunks:
+        writer.write_batch(_record_batch(chunk, schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def encode_parquet(chunks: AsyncIterator[List[Row]]) -> AsyncIterator[bytes]:
+    schema = arrow_schema()
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    async for chunk in chunks:
+        writer.write_table(pa.Table.from_batches([_record_batch(chunk, schema)]))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "arrow": encode_arrow,
+    "parquet": encode_parquet,
+}
+
+
+async def stream_export(
+    session,
+    export_format: str,
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_rows: int = 5000,
+    tenant_id: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """Encoded export of one device's history, chunk by chunk."""
+    chunks = iter_history_chunks(session, device_id, start, end, chunk_rows, tenant_id)
+    try:
+        async for data in ENCODERS[export_format](chunks):
+            if data:
+                yield data
+    finally:
+        await chunks.aclose()
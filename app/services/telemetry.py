@@ -0,0 +1,403 @@
+# app/services/telemetry.py
+"""
+Time-bucket aggregation of device telemetry.
+
+• Arbitrary bucket widths ("30s", "5m", "1h", "1d" or seconds) and the
+  aggregates avg, min, max, sum, count and percentiles ("p50", "p95", "p99.9").
+• Readings of one sensor type come from `sensors` rows, compacted
+  `sensor_blocks` and `sensor_data` payloads (same extraction rules as
+  the rollups), and from archived payloads (`app.ingestion.archive`) for
+  ranges reaching past the archive cutoff.
+• Widths that are whole minutes, hours or days without percentiles are
+  served by merging the 1m/1h/1d rollups; rollup buckets only partly inside
+  the range are replaced by the raw readings of the uncovered edges.
+• Recent ranges held by the in-memory ring buffers (`app.ingestion.recent`)
+  are aggregated from memory; `recent_readings` serves raw last-N-minutes
+  series the same way.
+• Otherwise PostgreSQL aggregates in SQL (percentile_cont included); other
+  databases, and ranges that may hold archived rows, fetch the readings and
+  aggregate them with NumPy, or in plain Python when NumPy is not installed.
+• Results are columnar: one array per aggregate, aligned with `bucket`.
+"""
+
+import asyncio
+import math
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, text
+
+from app.core.codecs import json_loads
+from app.core.config import settings
+from app.ingestion.archive import archive_available, archive_root, archived_before, read_archive
+from app.ingestion.blocks import has_blocks, read_block_points
+from app.ingestion.recent import get_recent_buffers
+from app.ingestion.rollups import RESOLUTIONS, extract_readings, truncate
+from app.models.sensor import Sensor, SensorData, SensorRollup
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on installed extras
+    np = None
+
+BASIC_AGGREGATES = ("avg", "min", "max", "sum", "count")
+WIDTH_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+EPOCH = datetime(1970, 1, 1)
+
+
+def parse_width(spec: str) -> int:
+    """Bucket width in seconds from "300", "30s", "5m", "1h" or "1d"."""
+    match = re.fullmatch(r"\s*(\d+)\s*([smhd]?)\s*", str(spec))
+    if match is None:
+        raise ValueError(f"Invalid bucket width: {spec}")
+    seconds = int(match.group(1)) * WIDTH_UNITS[match.group(2) or "s"]
+    if seconds <= 0:
+        raise ValueError("Bucket width must be positive")
+    return seconds
+
+
+def parse_aggregates(spec: str) -> List[str]:
+    """Validated aggregate names from a comma-separated list."""
+    names = []
+    for name in (part.strip().lower() for part in spec.split(",")):
+        if not name:
+            continue
+        if name not in BASIC_AGGREGATES and percentile_of(name) is None:
+            raise ValueError(f"Unknown aggregate: {name}")
+        if name not in names:
+            names.append(name)
+    if not names:
+        raise ValueError("No aggregates requested")
+    return names
+
+
+def percentile_of(name: str) -> Optional[float]:
+    """Fraction for "pNN" aggregate names (p0 … p100), else None."""
+    match = re.fullmatch(r"p(\d{1,3}(?:\.\d+)?)", name)
+    if match is None or float(match.group(1)) > 100:
+        return None
+    return float(match.group(1)) / 100
+
+
+def to_epoch(timestamp: datetime) -> float:
+    """Naive-UTC datetime → unix seconds."""
+    return (timestamp - EPOCH).total_seconds()
+
+
+def from_epoch(seconds: float) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+# ─────────────────── In-memory aggregation ─────────────── #
+
+def aggregate_python(
+    epochs: Sequence[float], values: Sequence[float], width: int, aggregates: Sequence[str]
+) -> Dict[str, List[Any]]:
+    """Bucket and aggregate readings in plain Python."""
+    groups: Dict[int, List[float]] = {}
+    for epoch, value in zip(epochs, values):
+        groups.setdefault(int(epoch // width), []).append(value)
+
+    columns: Dict[str, List[Any]] = {"bucket": []}
+    for name in aggregates:
+        columns[name] = []
+    for key in sorted(groups):
+        group = sorted(groups[key])
+        columns["bucket"].append(key * width)
+        for name in aggregates:
+            if name == "count":
+                columns[name].append(len(group))
+            elif name == "sum":
+                columns[name].append(math.fsum(group))
+            elif name == "avg":
+                columns[name].append(math.fsum(group) / len(group))
+            elif name == "min":
+                columns[name].append(group[0])
+            elif name == "max":
+                columns[name].append(group[-1])
+            else:
+                position = percentile_of(name) * (len(group) - 1)
+                low, high = math.floor(position), math.ceil(position)
+                columns[name].append(group[low] + (group[high] - group[low]) * (position - low))
+    return columns
+
+
+def aggregate_numpy(
+    epochs: Sequence[float], values: Sequence[float], width: int, aggregates: Sequence[str]
+) -> Dict[str, List[Any]]:
+    """
+    Bucket and aggregate readings with one sort and array operations.
+
+    Readings are ordered by (bucket, value), so min/max/percentiles are
+    index lookups into each bucket's sorted run.
+    """
+    buckets = np.floor(np.asarray(epochs, dtype=np.float64) / width).astype(np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    order = np.lexsort((values, buckets))
+    buckets, values = buckets[order], values[order]
+
+    keys, starts, counts = np.unique(buckets, return_index=True, return_counts=True)
+    columns: Dict[str, List[Any]] = {"bucket": (keys * width).tolist()}
+    if not len(keys):
+        for name in aggregates:
+            columns[name] = []
+        return columns
+    sums = np.add.reduceat(values, starts)
+    for name in aggregates:
+        if name == "count":
+            column = counts
+        elif name == "sum":
+            column = sums
+        elif name == "avg":
+            column = sums / counts
+        elif name == "min":
+            column = values[starts]
+        elif name == "max":
+            column = values[starts + counts - 1]
+        else:
+            position = starts + percentile_of(name) * (counts - 1)
+            low, high = np.floor(position).astype(np.int64), np.ceil(position).astype(np.int64)
+            column = values[low] + (values[high] - values[low]) * (position - low)
+        columns[name] = column.tolist()
+    return columns
+
+
+def aggregate_readings(epochs, values, width: int, aggregates: Sequence[str]) -> Dict[str, List[Any]]:
+    """Aggregate with NumPy when installed, else in plain Python."""
+    if np is not None:
+        return aggregate_numpy(epochs, values, width, aggregates)
+    return aggregate_python(epochs, values, width, aggregates)
+
+
+# ─────────────────── Sources ───────────────────────────── #
+
+def rollup_resolution(width: int, aggregates: Sequence[str]) -> Optional[str]:
+    """Coarsest rollup resolution that can serve this query, if any."""
+    if not settings.ROLLUPS_ENABLED or any(name not in BASIC_AGGREGATES for name in aggregates):
+        return None
+    for resolution in ("1d", "1h", "1m"):
+        if width % int(RESOLUTIONS[resolution].total_seconds()) == 0:
+            return resolution
+    return None
+
+
+async def _from_rollups(session, device_id, sensor_type, resolution, start, end, width, aggregates, tenant_id=None):
+    # Rollup buckets wholly inside [start, end); the partial ones at either edge come from raw readings
+    covered_start = truncate(start, resolution)
+    if covered_start < start:
+        covered_start += RESOLUTIONS[resolution]
+    covered_end = max(truncate(end, resolution), covered_start)
+    merged: Dict[int, List[float]] = {}
+
+    def merge(epoch: float, count: int, low: float, high: float, total: float) -> None:
+        key = int(epoch // width)
+        agg = merged.get(key)
+        if agg is None:
+            merged[key] = [count, low, high, total]
+        else:
+            agg[0] += count
+            agg[1] = min(agg[1], low)
+            agg[2] = max(agg[2], high)
+            agg[3] += total
+
+    if covered_start < covered_end:
+        result = await session.execute(
+            select(
+                SensorRollup.bucket, SensorRollup.count, SensorRollup.min_value,
+                SensorRollup.max_value, SensorRollup.sum_value,
+            ).where(
+                SensorRollup.device_id == device_id,
+                SensorRollup.sensor_type == sensor_type,
+                SensorRollup.resolution == resolution,
+                SensorRollup.bucket >= covered_start,
+                SensorRollup.bucket < covered_end,
+            )
+        )
+        for bucket, count, low, high, total in result.all():
+            merge(to_epoch(bucket), count, low, high, total)
+    for edge_start, edge_end in ((start, min(covered_start, end)), (covered_end, end)):
+        if edge_start < edge_end:
+            epochs, values = await fetch_readings(session, device_id, sensor_type, edge_start, edge_end, tenant_id)
+            for epoch, value in zip(epochs, values):
+                merge(epoch, 1, value, value, value)
+
+    keys = sorted(merged)
+    columns: Dict[str, List[Any]] = {"bucket": [key * width for key in keys]}
+    picks = {"count": 0, "min": 1, "max": 2, "sum": 3}
+    for name in aggregates:
+        if name == "avg":
+            columns[name] = [merged[key][3] / merged[key][0] for key in keys]
+        else:
+            columns[name] = [merged[key][picks[name]] for key in keys]
+    return columns
+
+
+# Readings of one sensor type from both raw tables, for the SQL path
+PG_READINGS = """
+    SELECT timestamp AS ts, value FROM sensors
+    WHERE device_id = :device_id AND sensor_type = :sensor_type
+      AND timestamp >= :start AND timestamp < :end
+    UNION ALL
+    SELECT d.timestamp, (item ->> 'value')::float8
+    FROM sensor_data d
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(d.payload::jsonb -> 'sensor_data') = 'array'
+             THEN d.payload::jsonb -> 'sensor_data' ELSE '[]'::jsonb END
+    ) AS item
+    WHERE d.device_id = :device_id AND d.timestamp >= :start AND d.timestamp < :end
+      AND item ->> 'sensor_type' = :sensor_type AND jsonb_typeof(item -> 'value') = 'number'
+    UNION ALL
+    SELECT d.timestamp, (d.payload::jsonb ->> :sensor_type)::float8
+    FROM sensor_data d
+    WHERE d.device_id = :device_id AND d.timestamp >= :start AND d.timestamp < :end
+      AND NOT (d.payload::jsonb ? 'sensor_data')
+      AND jsonb_typeof(d.payload::jsonb -> :sensor_type) = 'number'
+"""
+
+
+def pg_aggregate_sql(aggregates: Sequence[str]) -> str:
+    """GROUP BY bucket over `PG_READINGS`, one output column per aggregate."""
+    expressions = []
+    for index, name in enumerate(aggregates):
+        if name == "count":
+            expression = "count(*)"
+        elif name in BASIC_AGGREGATES:
+            expression = f"{name}(value)"
+        else:
+            expression = f"percentile_cont({percentile_of(name)!r}) WITHIN GROUP (ORDER BY value)"
+        expressions.append(f"{expression} AS a{index}")
+    return (
+        f"SELECT floor(extract(epoch FROM ts) / :width) * :width AS bucket, {', '.join(expressions)} "
+        f"FROM ({PG_READINGS}) AS readings GROUP BY 1 ORDER BY 1"
+    )
+
+
+async def _from_postgres(session, device_id, sensor_type, start, end, width, aggregates):
+    result = await session.execute(
+        text(pg_aggregate_sql(aggregates)),
+        {"device_id": device_id, "sensor_type": sensor_type, "start": start, "end": end, "width": width},
+    )
+    rows = result.all()
+    columns: Dict[str, List[Any]] = {"bucket": [float(row[0]) for row in rows]}
+    for index, name in enumerate(aggregates):
+        columns[name] = [
+            int(row[index + 1]) if name == "count" else float(row[index + 1])
+            for row in rows
+        ]
+    return columns
+
+
+def reaches_archive(start: datetime) -> bool:
+    """Whether readings from `start` on may have moved to the archive."""
+    return archive_available() and start < archived_before()
+
+
+async def fetch_readings(
+    session, device_id, sensor_type, start, end, tenant_id: Optional[str] = None
+) -> Tuple[List[float], List[float]]:
+    """
+    Epoch seconds and values of one sensor type from both raw tables and
+    blocks, plus the archive of the device's tenant when `start` reaches it.
+    """
+    epochs: List[float] = []
+    values: List[float] = []
+
+    def add_payload(timestamp, payload) -> None:
+        try:
+            decoded = json_loads(payload)
+        except ValueError:
+            return
+        for reading_type, value in extract_readings(decoded):
+            if reading_type == sensor_type:
+                epochs.append(to_epoch(timestamp))
+                values.append(value)
+
+    sensors = await session.stream(
+        select(Sensor.timestamp, Sensor.value).where(
+            Sensor.device_id == device_id,
+            Sensor.sensor_type == sensor_type,
+            Sensor.timestamp >= start,
+            Sensor.timestamp < end,
+        ).execution_options(yield_per=10000)
+    )
+    async for timestamp, value in sensors:
+        epochs.append(to_epoch(timestamp))
+        values.append(value)
+    for point in await read_block_points(session, device_id, sensor_type, start, end, end_exclusive=True):
+        epochs.append(point.micros / 1e6)
+        values.append(point.value)
+
+    payloads = await session.stream(
+        select(SensorData.timestamp, SensorData.payload).where(
+            SensorData.device_id == device_id,
+            SensorData.timestamp >= start,
+            SensorData.timestamp < end,
+        ).execution_options(yield_per=10000)
+    )
+    async for timestamp, payload in payloads:
+        add_payload(timestamp, payload)
+
+    if reaches_archive(start):
+        archived = await asyncio.to_thread(
+            read_archive, archive_root(), tenant_id, device_id, start, end, ("timestamp", "payload")
+        )
+        for row in archived:
+            if row["timestamp"] < end:
+                add_payload(row["timestamp"], row["payload"])
+    return epochs, values
+
+
+async def recent_readings(session, device_id, sensor_type, start, end) -> Tuple[str, List[float], List[float]]:
+    """
+    Source ("memory" or "database"), epoch seconds and values of one sensor
+    type in `[start, end)`, oldest first.
+    """
+    buffers = get_recent_buffers()
+    readings = buffers.query(device_id, sensor_type, start, end) if buffers is not None else None
+    if readings is not None:
+        return "memory", readings[0], readings[1]
+    epochs, values = await fetch_readings(session, device_id, sensor_type, start, end)
+    pairs = sorted(zip(epochs, values))
+    return "database", [epoch for epoch, _ in pairs], [value for _, value in pairs]
+
+
+async def aggregate_telemetry(
+    session,
+    device_id: str,
+    sensor_type: str,
+    start: datetime,
+    end: datetime,
+    width: int,
+    aggregates: Sequence[str],
+    tenant_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Aggregate one sensor type of one device into `width`-second buckets over
+    `[start, end)`. Buckets are aligned to the unix epoch; empty ones are
+    omitted. `tenant_id` locates the device's archived rows.
+    """
+    resolution = rollup_resolution(width, aggregates)
+    buffers = get_recent_buffers()
+    recent = None
+    if resolution is None and buffers is not None:
+        recent = buffers.query(device_id, sensor_type, start, end)
+    if resolution is not None:
+        source = f"rollups_{resolution}"
+        columns = await _from_rollups(
+            session, device_id, sensor_type, resolution, start, end, width, aggregates, tenant_id
+        )
+    elif recent is not None:
+        source = "memory"
+        columns = aggregate_readings(recent[0], recent[1], width, aggregates)
+    elif session.bind.dialect.name == "postgresql" and not reaches_archive(start) and not await has_blocks(
+        session, device_id, sensor_type, start, end
+    ):
+        source = "sql"
+        columns = await _from_postgres(session, device_id, sensor_type, start, end, width, aggregates)
+    else:
+        source = "numpy" if np is not None else "python"
+        epochs, values = await fetch_readings(session, device_id, sensor_type, start, end, tenant_id)
+        columns = aggregate_readings(epochs, values, width, aggregates)
+    columns["bucket"] = [from_epoch(seconds).isoformat() for seconds in columns["bucket"]]
+    return {"source": source, **columns}
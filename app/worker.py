@@ -3,22 +3,34 @@
 MQTT consumer worker for IoT sensor data ingestion.
 """
 
+import argparse
 import asyncio
-import json
 import logging
+import multiprocessing
+import os
 import uuid
 import time
 from datetime import datetime
-from typing import Dict, Any
-from aiomqtt import Client, MqttError
+from typing import Dict, Any, List, Optional
+from aiomqtt import Client, MqttError, ProtocolVersion
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from app.core.config import settings
+from app.core.codecs import codec_for_content_type, get_codec, json_dumps
 from app.db.session import AsyncSessionLocal
-from app.models.sensor import SensorData
-from app.models.device import Device
-from app.models.tenant import Tenant
+from app.ingestion.alerts import AlertEngine, AlertMonitor
+from app.ingestion.anomaly import AnomalyDetector, AnomalyMonitor, detector_available
+from app.ingestion.batching import BulkWriter
+from app.ingestion import deadletter
+from app.ingestion.cache import DeviceResolver
+from app.ingestion.deadletter import DeadLetterQueue
+from app.ingestion.dedup import Deduplicator, message_key
+from app.ingestion.fanout import publish_batch
+from app.ingestion.pipeline import METRICS_KEY_PREFIX, IngestPipeline
+from app.ingestion.shadow import RedisShadow, apply_observations, observe_payload_rows
+from app.ingestion.spool import Spool, SpoolReplayer
+from app.ingestion.throttle import ADMIT, AGGREGATE, DROP, PlanLimits, Throttle
+from app.ingestion.sharding import SHARD_MODES, ShardAssignment, parse_sensor_topic
 import redis.asyncio as redis
 
 logging.basicConfig(
@@ -64,108 +76,401 @@ async def wait_for_services():
     return True
 
 
-async def consume():
-    """MQTT consumer with Redis fan-out."""
+# How aiomqtt logs a message it drops because its receive queue is full
+QUEUE_FULL_MESSAGE = "Message queue is full"
+
+
+class ReceiveDiscards(logging.Filter):
+    """
+    Counts messages the MQTT client discards because its receive queue is
+    full. aiomqtt only logs them (after the broker got its QoS 1 ack), so
+    this filter sits on the logger handed to the client; it keeps every record.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.getMessage().startswith(QUEUE_FULL_MESSAGE):
+            self.count += 1
+        return True
+
+
+def build_sensor_row(tenant_id: Optional[str], device_id: str, payload: Any) -> Dict[str, Any]:
+    """Build a `sensor_data` row for the bulk writer; raises if `payload` is not JSON-serializable."""
+    now = datetime.utcnow()
+    return {
+        "id": uuid.uuid4(),
+        "tenant_id": tenant_id,
+        "device_id": device_id,
+        "payload": json_dumps(payload),
+        "timestamp": now,
+        "created_at": now,
+    }
+
+
+async def decode_message(
+    message,
+    resolver: DeviceResolver,
+    dead_letters: Optional[DeadLetterQueue] = None,
+    dedup: Optional[Deduplicator] = None,
+    throttle: Optional[Throttle] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Decode/validate stage: turn an MQTT message into a `sensor_data` row.
+
+    Rejected messages are logged and, when a dead-letter queue is given,
+    stored there with a reason code. Redelivered duplicates and throttled
+    messages return None.
+    """
+    topic = message.topic.value
+    content_type = getattr(getattr(message, "properties", None), "ContentType", None)
+
+    async def reject(reason: str, error: str) -> None:
+        logger.warning(f"Rejected message on {topic} ({reason}): {error}")
+        if dead_letters is not None:
+            await dead_letters.add(topic, message.payload, reason, error, content_type)
+
+    # Parse topic: iot/{tenant}/{device_id}[/{codec}]
+    parsed = parse_sensor_topic(topic)
+    if parsed is None:
+        await reject(deadletter.INVALID_TOPIC, "Invalid topic format")
+        return None
+    
+    tenant_name, device_id, codec_name = parsed
+    
+    # Throttle before decoding so that floods cost as little as possible
+    decision = ADMIT
+    if throttle is not None:
+        decision = throttle.check(tenant_name, device_id, resolver.cached_plan(tenant_name))
+        if decision == DROP:
+            return None
+    
+    # Parse payload with the codec named by the topic suffix or MQTT v5 content type
+    try:
+        codec = get_codec(codec_name) if codec_name is not None else codec_for_content_type(content_type)
+    except ValueError as e:
+        await reject(deadletter.UNSUPPORTED_CODEC, str(e))
+        return None
+    try:
+        payload = codec.decode(message.payload)
+    except Exception as e:
+        await reject(deadletter.DECODE_ERROR, f"{codec.name}: {e}")
+        return None
+    
+    # Payloads are stored as JSON; msgpack/CBOR may carry bytes or non-string keys
+    try:
+        row = build_sensor_row(None, device_id, payload)
+    except Exception as e:
+        await reject(deadletter.ENCODE_ERROR, f"{codec.name}: {e}")
+        return None
+    
+    # Resolve tenant/device (cached, created on first sight)
+    try:
+        tenant_id = await resolver.resolve(tenant_name, device_id)
+    except ValueError as e:
+        await reject(deadletter.INVALID_DEVICE_ID, str(e))
+        return None
+    except Exception as e:
+        await reject(deadletter.RESOLVE_ERROR, str(e))
+        return None
+    
+    # Drop broker redeliveries before they reach the database
+    if dedup is not None:
+        key = message_key(
+            device_id, payload, message.payload, settings.INGEST_DEDUP_SEQUENCE_FIELD,
+            hash_payloads=dedup.hash_window > 0,
+        )
+        if key is not None and await dedup.is_duplicate(key):
+            return None
+    
+    row["tenant_id"] = tenant_id
+    if decision == AGGREGATE:
+        throttle.aggregate(row)
+        return None
+    return row
+
+
+async def publish_rows(
+    redis_client,
+    rows: List[Dict[str, Any]],
+    shadow: Optional[RedisShadow] = None,
+    anomalies: Optional[AnomalyMonitor] = None,
+    alerts: Optional[AlertMonitor] = None,
+) -> None:
+    """Fan-out stage: publish stored rows to Redis in one pipelined round trip."""
+    try:
+        await publish_batch(redis_client, rows, framed=settings.INGEST_FANOUT_FRAMED)
+    except Exception as e:
+        logger.warning(f"Failed to publish to Redis: {e}")
+    # Stored rows update the device shadow shared with the API
+    await apply_observations(shadow, observe_payload_rows(rows))
+    if alerts is not None:
+        await alerts.process(rows)
+    if anomalies is not None:
+        anomalies.submit(rows)
+
+
+async def report_metrics(
+    redis_client,
+    key: str,
+    pipeline: IngestPipeline,
+    receive_depth,
+    dead_letters: Optional[DeadLetterQueue] = None,
+    dedup: Optional[Deduplicator] = None,
+    throttle: Optional[Throttle] = None,
+    anomalies: Optional[AnomalyMonitor] = None,
+    alerts: Optional[AlertMonitor] = None,
+    receive_discards: Optional[ReceiveDiscards] = None,
+) -> None:
+    """Periodically store pipeline queue depths in Redis for monitoring."""
+    interval = settings.INGEST_METRICS_INTERVAL_SECONDS
+    while True:
+        await asyncio.sleep(interval)
+        metrics = pipeline.metrics()
+        metrics["receive"] = {"depth": receive_depth(), "capacity": settings.INGEST_RECEIVE_BUFFER}
+        if receive_discards is not None:
+            metrics["receive"]["discarded"] = receive_discards.count
+        if dead_letters is not None:
+            metrics["dead_letters"] = dict(dead_letters.counts)
+        if dedup is not None:
+            metrics["dedup"] = dedup.metrics()
+        if throttle is not None:
+            metrics["throttle"] = throttle.metrics()
+        if anomalies is not None:
+            metrics["anomaly"] = anomalies.metrics()
+        if alerts is not None:
+            metrics["alerts"] = alerts.metrics()
+        try:
+            await redis_client.set(key, json_dumps(metrics), ex=interval * 3)
+        except Exception as e:
+            logger.warning(f"Failed to report pipeline metrics: {e}")
+
+
+async def flush_throttled_aggregates(throttle: Throttle, pipeline: IngestPipeline) -> None:
+    """Periodically persist the latest reading held back from each throttled device."""
+    while True:
+        await asyncio.sleep(settings.INGEST_THROTTLE_AGGREGATE_INTERVAL_SECONDS)
+        for row in throttle.drain_aggregates():
+            await pipeline.persist.put(row)
+
+
+async def consume(shard: Optional[ShardAssignment] = None):
+    """MQTT consumer: receive → decode → persist → fan-out pipeline."""
+    shard = shard or ShardAssignment()
     # Wait for services to be ready
     if not await wait_for_services():
         logger.error("Failed to connect to required services")
         return
     
     redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
-    
-    while True:
+    resolver = DeviceResolver(
+        AsyncSessionLocal,
+        max_entries=settings.INGEST_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.INGEST_CACHE_TTL_SECONDS,
+    )
+    spool = None
+    if settings.INGEST_SPOOL_ENABLED:
+        spool = Spool(
+            os.path.join(settings.INGEST_SPOOL_DIR, shard.client_id),
+            max_bytes=settings.INGEST_SPOOL_MAX_BYTES,
+            segment_bytes=settings.INGEST_SPOOL_SEGMENT_BYTES,
+            fsync_interval_ms=settings.INGEST_SPOOL_FSYNC_INTERVAL_MS,
+        )
+    writer = BulkWriter(
+        AsyncSessionLocal,
+        batch_size=settings.INGEST_BATCH_SIZE,
+        linger_ms=settings.INGEST_BATCH_LINGER_MS,
+        use_copy=settings.INGEST_USE_COPY,
+        spool=spool,
+        write_timeout=settings.INGEST_WRITE_TIMEOUT_SECONDS,
+        rollups=settings.ROLLUPS_ENABLED,
+    )
+    dead_letters = DeadLetterQueue(redis_client) if settings.INGEST_DEAD_LETTER_ENABLED else None
+    # Only a Redis shadow is shared with the API; a memory shadow is fed by the API's sensor_new subscriber
+    shadow = RedisShadow(redis_client) if settings.DEVICE_SHADOW_BACKEND == "redis" else None
+    dedup = None
+    if settings.INGEST_DEDUP_ENABLED:
+        dedup = Deduplicator(
+            redis_client,
+            window_seconds=settings.INGEST_DEDUP_WINDOW_SECONDS,
+            capacity=settings.INGEST_DEDUP_CAPACITY,
+            error_rate=settings.INGEST_DEDUP_ERROR_RATE,
+            hash_window_seconds=settings.INGEST_DEDUP_HASH_WINDOW_SECONDS,
+            # Shared subscriptions may redeliver a message to any worker of the group
+            shared=shard.mode == "shared" and shard.count > 1,
+        )
+    throttle = None
+    if settings.INGEST_THROTTLE_ENABLED:
+        throttle = Throttle(
+            policy=settings.INGEST_THROTTLE_POLICY,
+            plan_limits={
+                plan: PlanLimits(*limits)
+                for plan, limits in settings.INGEST_THROTTLE_PLAN_LIMITS.items()
+            },
+            max_devices=settings.INGEST_THROTTLE_MAX_DEVICES,
+            sample_every=settings.INGEST_THROTTLE_SAMPLE_EVERY,
+        )
+    anomalies = None
+    if settings.ANOMALY_DETECTION_ENABLED:
+        if detector_available():
+            anomalies = AnomalyMonitor(
+                AnomalyDetector.from_settings(),
+                redis_client,
+                AsyncSessionLocal,
+                queue_size=settings.ANOMALY_QUEUE_SIZE,
+            )
+        else:
+            logger.warning("ANOMALY_DETECTION_ENABLED is set but numpy is not installed; detection disabled")
+    alerts = None
+    if settings.ALERT_RULES_ENABLED:
+        alerts = AlertMonitor(
+            AlertEngine(),
+            AsyncSessionLocal,
+            redis_client,
+            reload_seconds=settings.ALERT_RULES_RELOAD_SECONDS,
+        )
         try:
-            logger.info(f"Connecting to MQTT broker at {settings.MQTT_BROKER}:{settings.MQTT_PORT}")
-            async with Client(settings.MQTT_BROKER, port=settings.MQTT_PORT) as client:
-                await client.subscribe("iot/+/+")
-                logger.info("✅ MQTT consumer started successfully")
-                
-                async for message in client.messages:
-                    try:
-                        # Parse topic: iot/{tenant}/{device_id}
-                        topic_parts = message.topic.value.split("/")
-                        if len(topic_parts) != 3:
-                            logger.warning(f"Invalid topic format: {message.topic.value}")
-                            continue
-                        
-                        tenant_name = topic_parts[1]
-                        device_id = topic_parts[2]
-                        
-                        # Parse payload
-                        payload = json.loads(message.payload)
-                        
-                        # Get or create device
-                        async with AsyncSessionLocal() as session:
-                            # Get tenant by name
-                            tenant_query = select(Tenant).where(Tenant.name == tenant_name)
-                            result = await session.execute(tenant_query)
-                            tenant = result.scalar_one_or_none()
-                            
-                            if not tenant:
-                                # Create tenant if it doesn't exist
-                                tenant = Tenant(name=tenant_name, plan="free")
-                                session.add(tenant)
-                                await session.commit()
-                                await session.refresh(tenant)
-                                logger.info(f"Created new tenant: {tenant_name}")
-                            
-                            # Check if device exists
-                            device_query = select(Device).where(Device.id == device_id)
-                            result = await session.execute(device_query)
-                            device = result.scalar_one_or_none()
-                            
-                            if not device:
-                                # Create device if it doesn't exist
-                                device = Device(
-                                    id=device_id,
-                                    name=f"Device-{device_id[:8]}",
-                                    tenant_id=tenant.id,
-                                    is_active=True
-                                )
-                                session.add(device)
-                                await session.commit()
-                                logger.info(f"Created new device: {device_id}")
-                            
-                            # Create sensor data record
-                            sensor_data = SensorData(
-                                id=uuid.uuid4(),
-                                device_id=device_id,
-                                tenant_id=tenant.id,
-                                payload=payload,
-                                timestamp=datetime.utcnow()
-                            )
-                            session.add(sensor_data)
-                            await session.commit()
-                            
-                            # Publish to Redis for real-time updates
-                            try:
-                                await redis_client.publish(
-                                    "sensor_new", 
-                                    json.dumps({
-                                        "device_id": device_id,
-                                        "tenant_id": str(tenant.id),
-                                        "payload": payload,
-                                        "timestamp": sensor_data.timestamp.isoformat()
-                                    })
-                                )
-                            except Exception as e:
-                                logger.warning(f"Failed to publish to Redis: {e}")
-                            
-                            logger.info(f"Processed sensor data for device {device_id}: {payload}")
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing message: {e}")
-                        continue
-                        
-        except MqttError as e:
-            logger.error(f"MQTT connection error: {e}")
-            logger.info("Retrying in 5 seconds...")
-            await asyncio.sleep(5)
+            logger.info(f"Loaded {await alerts.reload()} alert rules")
         except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            logger.info("Retrying in 5 seconds...")
-            await asyncio.sleep(5)
+            # The periodic reload retries
+            logger.warning(f"Failed to load alert rules: {e}")
+    pipeline = IngestPipeline(
+        decode=lambda message: decode_message(message, resolver, dead_letters, dedup, throttle),
+        writer=writer,
+        publish=lambda rows: publish_rows(redis_client, rows, shadow, anomalies, alerts),
+        queue_size=settings.INGEST_QUEUE_SIZE,
+        decode_concurrency=settings.INGEST_DECODE_CONCURRENCY,
+        persist_concurrency=settings.INGEST_PERSIST_CONCURRENCY,
+        fanout_concurrency=settings.INGEST_FANOUT_CONCURRENCY,
+    )
+    client: Optional[Client] = None
+    receive_discards = ReceiveDiscards()
+    mqtt_logger = logging.getLogger(f"{__name__}.mqtt")
+    mqtt_logger.addFilter(receive_discards)
+    pipeline.start()
+    background = [
+        asyncio.create_task(resolver.listen(redis_client)),
+        asyncio.create_task(report_metrics(
+            redis_client,
+            f"{METRICS_KEY_PREFIX}{shard.client_id}",
+            pipeline,
+            lambda: len(client.messages) if client is not None else 0,
+            dead_letters,
+            dedup,
+            throttle,
+            anomalies,
+            alerts,
+            receive_discards,
+        )),
+    ]
+    if throttle is not None and throttle.policy == "aggregate":
+        background.append(asyncio.create_task(flush_throttled_aggregates(throttle, pipeline)))
+    if dedup is not None:
+        background.append(asyncio.create_task(dedup.run()))
+    if anomalies is not None:
+        background.append(asyncio.create_task(anomalies.run()))
+    if alerts is not None:
+        background.append(asyncio.create_task(alerts.run()))
+        background.append(asyncio.create_task(alerts.listen(redis_client)))
+    if spool is not None:
+        replayer = SpoolReplayer(
+            spool,
+            lambda rows: writer.write_rows(rows, ignore_conflicts=True),
+            rows_per_second=settings.INGEST_SPOOL_REPLAY_ROWS_PER_SEC,
+            batch_size=settings.INGEST_BATCH_SIZE,
+        )
+        background.append(asyncio.create_task(replayer.run()))
+    
+    try:
+        while True:
+            try:
+                logger.info(f"Connecting to MQTT broker at {settings.MQTT_BROKER}:{settings.MQTT_PORT}")
+                client = Client(
+                    settings.MQTT_BROKER,
+                    port=settings.MQTT_PORT,
+                    identifier=shard.client_id if shard.count > 1 else None,
+                    protocol=ProtocolVersion.V5 if shard.mode == "shared" and shard.count > 1 else None,
+                    # aiomqtt reads the socket whatever the pipeline does, and cannot defer acks,
+                    # so messages wait here while the stages are full. Unbounded by default: with
+                    # a bound the client acks and discards overflow (receive.discarded).
+                    max_queued_incoming_messages=settings.INGEST_RECEIVE_BUFFER,
+                    logger=mqtt_logger,
+                )
+                async with client:
+                    for topic_filter in shard.topic_filters:
+                        await client.subscribe(topic_filter)
+                    logger.info(
+                        f"✅ MQTT consumer started successfully "
+                        f"(shard {shard.index + 1}/{shard.count}, {', '.join(shard.topic_filters)})"
+                    )
+                    
+                    # Receive stage: blocks on the decode queue when downstream is saturated
+                    async for message in client.messages:
+                        if shard.owns(message.topic.value):
+                            await pipeline.submit(message)
+                            
+            except MqttError as e:
+                logger.error(f"MQTT connection error: {e}")
+                logger.info("Retrying in 5 seconds...")
+                await asyncio.sleep(5)
+            except Exception as e:
+                logger.error(f"Unexpected error: {e}")
+                logger.info("Retrying in 5 seconds...")
+                await asyncio.sleep(5)
+    finally:
+        for task in background:
+            task.cancel()
+        await pipeline.stop()
+        if spool is not None:
+            spool.close()
+
+
+def run_shard(index: int, count: int, mode: str) -> None:
+    """Process entry-point for one shard of a multi-worker launch."""
+    shard = ShardAssignment(index, count, mode=mode, group=settings.INGEST_SHARD_GROUP)
+    asyncio.run(consume(shard))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run one consumer, or launch `--workers N` sharded consumer processes."""
+    parser = argparse.ArgumentParser(description="MQTT ingestion worker")
+    parser.add_argument(
+        "--workers", type=int, default=settings.INGEST_WORKERS,
+        help="Number of consumer processes to launch",
+    )
+    parser.add_argument(
+        "--shard-mode", choices=SHARD_MODES, default=settings.INGEST_SHARD_MODE,
+        help="shared: MQTT v5 shared subscription; hash: device-hash partitioning (v3)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.workers <= 1:
+        asyncio.run(consume())
+        return
+
+    processes = [
+        multiprocessing.Process(
+            target=run_shard,
+            args=(index, args.workers, args.shard_mode),
+            name=f"ingest-worker-{index}",
+        )
+        for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {args.workers} {args.shard_mode}-sharded consumer processes")
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
 
 
 if __name__ == "__main__":
-    asyncio.run(consume())
+    main()
@@ -0,0 +1,6 @@
+# benchmarks/__init__.py
+"""
+Performance benchmarks.
+
+Stand-alone scripts that measure ingestion and query throughput.
+"""
@@ -0,0 +1,140 @@
+# benchmarks/bench_alert_rules.py
+"""
+Benchmark: alert rule reload latency and per-reading evaluation cost.
+
+Usage:
+    python -m benchmarks.bench_alert_rules [--tenants 1000] [--rules 10] [--readings 200000]
+
+Seeds `--tenants` × `--rules` alert rules (threshold, count and rate kinds
+over a few sensor types) into a temporary SQLite file, then reports:
+  • full reload (query + compile + index), compile-only time, and a full
+    reload when no rule changed (the periodic case),
+  • per-tenant reload latency, as after an API change notification,
+  • evaluation cost per reading through `AlertEngine.evaluate`: a sensor
+    type with no rules, the device the scoped rule watches, and another
+    device (tenant-wide rules only),
+  • `evaluate_rows` end to end per stored row, including payload decoding,
+    for tenants with and without rules.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.ingestion.alerts import AlertEngine, AlertMonitor, fetch_rules
+from app.models.alert import AlertRule
+
+START = datetime(2024, 1, 1)
+SENSOR_TYPES = ("temperature", "humidity", "co2", "pressure")
+KINDS = (
+    {"kind": "threshold", "duration_seconds": 300},
+    {"kind": "count", "window_seconds": 600, "min_count": 3},
+    {"kind": "rate", "window_seconds": 300},
+)
+
+
+def make_rules(tenants, per_tenant: int, device_id: str):
+    rows = []
+    for tenant_id in tenants:
+        for i in range(per_tenant):
+            rows.append({
+                "id": uuid.uuid4(), "tenant_id": tenant_id, "name": f"rule-{i}",
+                "sensor_type": SENSOR_TYPES[i % len(SENSOR_TYPES)],
+                # The first rule of each tenant watches one device, the others every device
+                "device_id": device_id if i == 0 else None,
+                "operator": ">", "threshold": 40.0 + i, "duration_seconds": 0, "window_seconds": 0,
+                "min_count": 1, "is_active": True, "created_at": START, "updated_at": START,
+                **KINDS[i % len(KINDS)],
+            })
+    return rows
+
+
+def per_reading(name: str, readings: int, elapsed: float) -> None:
+    print(f"{name:<34} {elapsed / readings * 1e9:>9,.0f} ns/reading  {readings / elapsed:>12,.0f}/s")
+
+
+def bench_evaluate(engine: AlertEngine, tenant_id: str, device_id: str, readings: int) -> None:
+    events = []
+    rules = engine._index.get((tenant_id, "temperature"), [])
+    tenant_wide = sum(1 for rule in rules if rule.device_id is None)
+    cases = (
+        ("evaluate: no rules for sensor", "voltage", device_id),
+        (f"evaluate: {len(rules)} rules (1 device-scoped)", "temperature", device_id),
+        (f"evaluate: {tenant_wide} tenant-wide rules", "temperature", "other-device"),
+    )
+    for name, sensor_type, device in cases:
+        started = time.perf_counter()
+        for i in range(readings):
+            engine.evaluate(tenant_id, device, sensor_type, 20.0 + (i % 50), 60.0 * i, START, events)
+        per_reading(name, readings, time.perf_counter() - started)
+
+
+def bench_rows(engine: AlertEngine, tenant_id: str, device_id: str, readings: int) -> None:
+    for name, tenant in (("evaluate_rows: tenant with rules", tenant_id), ("evaluate_rows: tenant without", "none")):
+        rows = [
+            {
+                "tenant_id": tenant, "device_id": device_id,
+                "payload": json.dumps({"temperature": 20.0 + (i % 50)}),
+                "timestamp": START + timedelta(minutes=i),
+            }
+            for i in range(readings)
+        ]
+        started = time.perf_counter()
+        for offset in range(0, readings, 1000):
+            engine.evaluate_rows(rows[offset:offset + 1000])
+        per_reading(name, readings, time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tenants", type=int, default=1000)
+    parser.add_argument("--rules", type=int, default=10, help="Rules per tenant")
+    parser.add_argument("--readings", type=int, default=200_000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with db.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    session_factory = async_sessionmaker(db, class_=AsyncSession, expire_on_commit=False)
+
+    tenants = [str(uuid.uuid4()) for _ in range(args.tenants)]
+    device_id = str(uuid.uuid4())
+    async with db.begin() as conn:
+        await conn.execute(insert(AlertRule.__table__), make_rules(tenants, args.rules, device_id))
+
+    monitor = AlertMonitor(AlertEngine(), session_factory)
+    installed = await monitor.reload()
+    print(f"full reload   {installed:>8,} rules  {monitor.last_reload_ms:8.1f} ms (query + compile + index)")
+    rules = await fetch_rules(session_factory)
+    started = time.perf_counter()
+    AlertEngine().load(rules)
+    print(f"compile only  {installed:>8,} rules  {(time.perf_counter() - started) * 1000:8.1f} ms")
+    await monitor.reload()
+    print(f"full reload   {installed:>8,} rules  {monitor.last_reload_ms:8.1f} ms (nothing changed: query + index)")
+
+    latencies = []
+    for tenant_id in random.sample(tenants, min(100, len(tenants))):
+        await monitor.reload(tenant_id)
+        latencies.append(monitor.last_reload_ms)
+    print(f"tenant reload {args.rules:>8,} rules  {statistics.median(latencies):8.2f} ms median  "
+          f"{max(latencies):8.2f} ms max")
+
+    bench_evaluate(monitor.engine, tenants[0], device_id, args.readings)
+    bench_rows(monitor.engine, tenants[0], device_id, args.readings)
+    await db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+# benchmarks/bench_bulk_writer.py
+"""
+Benchmark: per-message commits vs. the micro-batched bulk writer.
+
+Usage:
+    python -m benchmarks.bench_bulk_writer [--rows 5000] [--database-url URL]
+
+Defaults to a temporary SQLite file so the numbers include real commits.
+Pass a PostgreSQL URL (postgresql+asyncpg://...) to measure the COPY path.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.ingestion.batching import BulkWriter
+from app.models.sensor import SensorData
+from app.worker import build_sensor_row
+
+
+async def bench_per_message(session_factory, rows):
+    """Baseline: one session and one commit per reading."""
+    start = time.perf_counter()
+    for row in rows:
+        async with session_factory() as session:
+            session.add(SensorData(**row))
+            await session.commit()
+    return time.perf_counter() - start
+
+
+async def bench_bulk(session_factory, rows, batch_size):
+    """Bulk writer: one multi-row INSERT (or COPY) per batch."""
+    writer = BulkWriter(session_factory, batch_size=batch_size, linger_ms=50)
+    start = time.perf_counter()
+    for row in rows:
+        await writer.add(row)
+    await writer.flush()
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        database_url = f"sqlite+aiosqlite:///{path}"
+
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    def make_rows():
+        return [
+            build_sensor_row("bench-tenant", f"device-{i % 100}", {"sensor_type": "temperature", "value": i * 0.1})
+            for i in range(args.rows)
+        ]
+
+    results = {}
+    for name, runner in (
+        ("per-message commit", lambda rows: bench_per_message(session_factory, rows)),
+        (f"bulk writer (batch={args.batch_size})", lambda rows: bench_bulk(session_factory, rows, args.batch_size)),
+    ):
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DELETE FROM {SensorData.__tablename__}"))
+        elapsed = await runner(make_rows())
+        results[name] = args.rows / elapsed
+        print(f"{name:<32} {args.rows:>8} rows  {elapsed:8.3f}s  {results[name]:>12,.0f} rows/sec")
+
+    baseline, bulk = results.values()
+    print(f"speed-up: {bulk / baseline:.1f}x")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+# benchmarks/bench_compressed_ingest.py
+"""
+Benchmark: payload bytes and CPU per reading for compressed `/ingest/` bodies.
+
+Usage:
+    python -m benchmarks.bench_compressed_ingest [--sizes 1,10,100,1000] [--rounds 200]
+
+Builds typical `sensor_data` arrays and reports, per Content-Encoding, the
+bytes on the wire per reading, the device-side compression CPU and the
+server-side streaming decompression CPU (through `decompress_stream`, the
+code path the ingest router uses). zstd is included when `zstandard` is
+installed.
+"""
+
+import argparse
+import asyncio
+import gzip
+import random
+import time
+import uuid
+import zlib
+
+from app.core.codecs import json_dumps
+from app.core.compression import DECODERS, decompress_stream
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on installed extras
+    zstandard = None
+
+SENSORS = (("temperature", "C", 15, 30), ("humidity", "%", 20, 80), ("battery", "%", 0, 100), ("lteRssi", "dBm", -110, -60))
+
+
+def make_payload(readings: int) -> bytes:
+    """A `/ingest/` body with `readings` entries in `sensor_data`."""
+    sensor_data = []
+    for i in range(readings):
+        sensor_type, unit, low, high = SENSORS[i % len(SENSORS)]
+        sensor_data.append({
+            "sensor_type": sensor_type,
+            "value": round(random.uniform(low, high), 2),
+            "unit": unit,
+            "metadata": {"seq": i},
+        })
+    return json_dumps({
+        "device_id": str(uuid.uuid4()),
+        "sensor_data": sensor_data,
+        "timestamp": "2025-01-10T12:00:00Z",
+    }).encode()
+
+
+def compressors():
+    yield "identity", lambda data: data
+    yield "gzip", lambda data: gzip.compress(data, compresslevel=6)
+    yield "deflate", lambda data: zlib.compress(data, 6)
+    if zstandard is not None and "zstd" in DECODERS:
+        cctx = zstandard.ZstdCompressor(level=3)
+        yield "zstd", cctx.compress
+
+
+async def inflate(body: bytes, coding: str) -> int:
+    async def chunks():
+        for start in range(0, len(body), 64 * 1024):  # ASGI-sized chunks
+            yield body[start:start + 64 * 1024]
+
+    size = 0
+    async for out in decompress_stream(chunks(), coding, 1 << 30):
+        size += len(out)
+    return size
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1,10,100,1000", help="Readings per request")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'readings':>8} {'encoding':<9} {'bytes/req':>10} {'bytes/rdg':>10} {'ratio':>6} "
+          f"{'compress µs/rdg':>16} {'inflate µs/rdg':>15}")
+    for readings in (int(size) for size in args.sizes.split(",")):
+        payload = make_payload(readings)
+        for coding, compress in compressors():
+            start = time.process_time()
+            for _ in range(args.rounds):
+                body = compress(payload)
+            compress_cpu = time.process_time() - start
+
+            inflate_cpu = 0.0
+            if coding != "identity":
+                start = time.process_time()
+                for _ in range(args.rounds):
+                    assert await inflate(body, coding) == len(payload)
+                inflate_cpu = time.process_time() - start
+
+            per_reading = args.rounds * readings
+            print(
+                f"{readings:>8} {coding:<9} {len(body):>10,} {len(body) / readings:>10.1f} "
+                f"{len(payload) / len(body):>6.2f} {compress_cpu / per_reading * 1e6:>16.2f} "
+                f"{inflate_cpu / per_reading * 1e6:>15.2f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
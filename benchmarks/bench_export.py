@@ -0,0 +1,100 @@
+# benchmarks/bench_export.py
+"""
+Benchmark: streaming history export throughput per format.
+
+Usage:
+    python -m benchmarks.bench_export [--rows 2000000] [--chunk-rows 5000]
+
+Seeds a synthetic `sensor_data` history for one device into a temporary
+SQLite file (or --database-url), then drains `stream_export` for every
+available format, reporting rows/sec, output MB/sec and peak RSS so that
+constant memory can be checked against the row count.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import resource
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.core.codecs import json_dumps
+from app.models.sensor import SensorData
+from app.services.export import FORMATS, format_available, stream_export
+
+
+async def seed(engine, device_id: str, rows: int, batch: int = 50000) -> None:
+    start = datetime(2024, 1, 1)
+    for offset in range(0, rows, batch):
+        values = [
+            {
+                "id": uuid.uuid4(),
+                "tenant_id": "bench",
+                "device_id": device_id,
+                "payload": json_dumps({
+                    "sensor_data": [
+                        {"sensor_type": "temperature", "value": round(random.uniform(15, 30), 2)},
+                        {"sensor_type": "humidity", "value": round(random.uniform(30, 70), 1)},
+                    ]
+                }),
+                "timestamp": start + timedelta(seconds=i),
+                "created_at": start + timedelta(seconds=i),
+            }
+            for i in range(offset, min(offset + batch, rows))
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(insert(SensorData.__table__), values)
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--chunk-rows", type=int, default=5000)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        database_url = f"sqlite+aiosqlite:///{path}"
+
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    device_id = str(uuid.uuid4())
+    started = time.perf_counter()
+    await seed(engine, device_id, args.rows)
+    print(f"seeded {args.rows:,} rows in {time.perf_counter() - started:.1f}s (peak RSS {peak_rss_mb():.0f} MB)")
+
+    for export_format in FORMATS:
+        if not format_available(export_format):
+            print(f"{export_format:<8} skipped (pyarrow not installed)")
+            continue
+        size = 0
+        started = time.perf_counter()
+        async with session_factory() as session:
+            async for data in stream_export(session, export_format, device_id, chunk_rows=args.chunk_rows):
+                size += len(data)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{export_format:<8} {args.rows:>10,} rows  {elapsed:8.2f}s  {args.rows / elapsed:>10,.0f} rows/sec  "
+            f"{size / elapsed / 1e6:7.1f} MB/sec  {size / 1e6:8.1f} MB  peak RSS {peak_rss_mb():.0f} MB"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+# benchmarks/bench_gorilla.py
+"""
+Benchmark: storage size and decode throughput of compacted sensor blocks.
+
+Usage:
+    python -m benchmarks.bench_gorilla [--devices 20] [--days 3] [--interval 10]
+
+Seeds `sensors` rows (one temperature reading per device every --interval
+seconds, with jitter and slow drift) into a temporary SQLite file, then
+reports:
+  • database bytes per reading before and after `SensorCompactor` (VACUUM-ed),
+  • encoded block bytes per reading,
+  • `encode_series` / `decode_series` throughput in readings/sec,
+  • end-to-end time to read one device-day through the block read path.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.core.gorilla import decode_series, encode_series
+from app.ingestion.blocks import SensorCompactor, read_block_points
+from app.models.sensor import Sensor, SensorBlock
+
+START = datetime(2024, 1, 1)
+
+
+async def seed(engine, devices, days: int, interval: int, batch: int = 50000) -> int:
+    per_device = days * 86400 // interval
+    rows = []
+    total = 0
+    for device_id in devices:
+        value = random.uniform(15, 30)
+        for i in range(per_device):
+            value += random.choice((-0.1, 0.0, 0.0, 0.1))
+            timestamp = START + timedelta(seconds=i * interval, milliseconds=random.randint(0, 50))
+            rows.append({
+                "id": uuid.uuid4(), "device_id": device_id, "sensor_type": "temperature",
+                "value": round(value, 1), "unit": "C", "timestamp": timestamp, "created_at": timestamp,
+            })
+            if len(rows) >= batch:
+                async with engine.begin() as conn:
+                    await conn.execute(insert(Sensor.__table__), rows)
+                total += len(rows)
+                rows = []
+    if rows:
+        async with engine.begin() as conn:
+            await conn.execute(insert(Sensor.__table__), rows)
+        total += len(rows)
+    return total
+
+
+async def vacuumed_size(engine, path: str) -> int:
+    async with engine.connect() as conn:
+        await conn.execute(text("VACUUM"))
+    return os.path.getsize(path)
+
+
+def codec_throughput(readings: int) -> None:
+    timestamps = [i * 10_000_000 + random.randint(0, 50_000) for i in range(readings)]
+    values = [round(20 + (i % 600) / 100, 1) for i in range(readings)]
+    started = time.perf_counter()
+    data = encode_series(timestamps, values)
+    encoded = time.perf_counter() - started
+    started = time.perf_counter()
+    decode_series(data)
+    decoded = time.perf_counter() - started
+    print(
+        f"codec    {readings:>10,} readings  {len(data) / readings:5.2f} B/reading  "
+        f"encode {readings / encoded:>12,.0f}/s  decode {readings / decoded:>12,.0f}/s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--interval", type=int, default=10, help="Seconds between readings")
+    args = parser.parse_args()
+
+    codec_throughput(100_000)
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    devices = [str(uuid.uuid4()) for _ in range(args.devices)]
+    readings = await seed(engine, devices, args.days, args.interval)
+    before = await vacuumed_size(engine, path)
+    print(f"raw      {readings:>10,} readings  {before / readings:7.1f} B/reading in the database")
+
+    started = time.perf_counter()
+    compactor = SensorCompactor(session_factory, after_days=1, devices_per_pass=args.devices)
+    totals = await compactor.compact_once(now=START + timedelta(days=args.days + 2), max_windows=args.days + 1)
+    elapsed = time.perf_counter() - started
+    after = await vacuumed_size(engine, path)
+    async with session_factory() as session:
+        block_bytes = (await session.execute(select(func.sum(func.length(SensorBlock.data))))).scalar()
+    print(
+        f"blocks   {totals['rows']:>10,} readings  {after / readings:7.1f} B/reading in the database  "
+        f"{block_bytes / readings:5.2f} B/reading encoded  compacted in {elapsed:.1f}s"
+    )
+
+    async with session_factory() as session:
+        started = time.perf_counter()
+        points = await read_block_points(session, devices[0], "temperature", START, START + timedelta(days=1))
+        elapsed = time.perf_counter() - started
+    print(f"read     {len(points):>10,} readings  one device-day in {elapsed * 1000:.1f} ms "
+          f"({len(points) / elapsed:,.0f} readings/s)")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
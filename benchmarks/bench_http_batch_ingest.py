@@ -0,0 +1,126 @@
+# benchmarks/bench_http_batch_ingest.py
+"""
+Benchmark: single-reading `/ingest/ingest` vs. `/ingest/batch` (JSON and NDJSON).
+
+Usage:
+    python -m benchmarks.bench_http_batch_ingest [--readings 5000] [--batch-size 1000]
+
+Runs the real FastAPI app in-process over httpx's ASGI transport, against a
+temporary SQLite file, so numbers include request handling and commits but
+no network. Pass --database-url to measure PostgreSQL.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.api.deps import get_current_user, get_session
+from app.core.codecs import json_dumps
+from app.main import create_app
+from app.models.device import Device
+from app.models.sensor import Sensor
+
+
+async def bench_single(client, readings):
+    """Baseline: one request, one device lookup and one commit per reading."""
+    start = time.perf_counter()
+    for reading in readings:
+        response = await client.post("/api/v1/ingest/ingest", params=reading)
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def bench_batch_json(client, readings, batch_size):
+    """One JSON array request per `batch_size` readings."""
+    start = time.perf_counter()
+    for i in range(0, len(readings), batch_size):
+        response = await client.post("/api/v1/ingest/batch", json=readings[i:i + batch_size])
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def bench_batch_ndjson(client, readings, batch_size):
+    """One NDJSON request per `batch_size` readings."""
+    start = time.perf_counter()
+    for i in range(0, len(readings), batch_size):
+        body = "\n".join(json_dumps(r) for r in readings[i:i + batch_size]).encode()
+        response = await client.post(
+            "/api/v1/ingest/batch", content=body, headers={"Content-Type": "application/x-ndjson"}
+        )
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--readings", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        database_url = f"sqlite+aiosqlite:///{path}"
+
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    device_ids = [uuid.uuid4() for _ in range(args.devices)]
+    async with session_factory() as session:
+        for device_id in device_ids:
+            session.add(Device(id=device_id, name=f"bench-{device_id.hex[:8]}", tenant_id="bench"))
+        await session.commit()
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="bench")
+
+    readings = [
+        {
+            "device_id": str(random.choice(device_ids)),
+            "sensor_type": "temperature",
+            "value": round(random.uniform(15, 30), 2),
+            "unit": "C",
+        }
+        for _ in range(args.readings)
+    ]
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, runner in (
+            ("single reading", lambda: bench_single(client, readings)),
+            (f"batch JSON (batch={args.batch_size})", lambda: bench_batch_json(client, readings, args.batch_size)),
+            (f"batch NDJSON (batch={args.batch_size})", lambda: bench_batch_ndjson(client, readings, args.batch_size)),
+        ):
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DELETE FROM {Sensor.__tablename__}"))
+            elapsed = await runner()
+            results[name] = args.readings / elapsed
+            print(f"{name:<32} {args.readings:>8} readings  {elapsed:8.3f}s  {results[name]:>12,.0f} readings/sec")
+
+    baseline, *batched = results.values()
+    print("speed-up: " + ", ".join(f"{rate / baseline:.1f}x" for rate in batched))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
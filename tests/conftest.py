@@ -3,15 +3,18 @@ Test configuration and fixtures for the SmartSecurity Cloud platform.
 """
 
 import pytest
+import pytest_asyncio
 import asyncio
 from typing import AsyncGenerator
 from httpx import AsyncClient
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlmodel import SQLModel
 
 from app.main import create_app
 from app.db.session import get_session
 from app.core.config import settings
+from app.models.sensor import SensorData
 
 # Test database URL
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -77,4 +80,22 @@ def client(test_app):
     """Create a test client."""
     from fastapi.testclient import TestClient
     with TestClient(test_app) as tc:
-        yield tc 
\ No newline at end of file
+        yield tc
+
+@pytest_asyncio.fixture
+async def session_factory():
+    """Session factory over a fresh in-memory SQLite database with all tables."""
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+@pytest.fixture
+def count_rows():
+    """Count the `sensor_data` rows behind a session factory."""
+    async def count(session_factory) -> int:
+        async with session_factory() as session:
+            result = await session.execute(select(func.count()).select_from(SensorData))
+            return result.scalar_one()
+    return count
@@ -0,0 +1,161 @@
+"""
+Tests for per-tenant alert rules compiled and evaluated in the worker.
+"""
+
+import asyncio
+import json
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.api.deps import get_current_user, get_session
+from app.api.v1.endpoints import alert_rules as alert_rules_endpoints
+from app.ingestion.alerts import ALERT_CHANNEL, FIRING, RESOLVED, AlertEngine, AlertMonitor
+from app.main import create_app
+from app.models.audit import AuditLog
+from app.models.device import Device
+from app.worker import publish_rows
+from tests.test_ingest_fanout import FakeRedis
+from tests.test_rollups import DEVICE, T0, make_database
+
+
+def rule(**fields):
+    defaults = {
+        "id": uuid.uuid4(), "tenant_id": "t1", "name": "hot", "sensor_type": "temperature", "device_id": None,
+        "kind": "threshold", "operator": ">", "threshold": 40.0, "duration_seconds": 0, "window_seconds": 0,
+        "min_count": 1, "updated_at": T0,
+    }
+    defaults.update(fields)
+    return SimpleNamespace(**defaults)
+
+
+def row(value, minutes, device_id=DEVICE, tenant_id="t1", sensor_type="temperature"):
+    return {
+        "tenant_id": tenant_id,
+        "device_id": device_id,
+        "payload": json.dumps({sensor_type: value}),
+        "timestamp": T0 + timedelta(minutes=minutes),
+    }
+
+
+def states(events):
+    return [(event["state"], event["value"]) for event in events]
+
+
+def test_threshold_must_hold_for_its_duration():
+    engine = AlertEngine()
+    assert engine.load([rule(duration_seconds=300)]) == 1
+
+    assert engine.evaluate_rows([row(41, 0), row(42, 2), row(39, 3), row(45, 4), row(46, 8)]) == []
+    events = engine.evaluate_rows([row(47, 9), row(48, 10)])
+    assert states(events) == [(FIRING, 47)]
+    assert events[0]["device_id"] == DEVICE and events[0]["rule_name"] == "hot"
+    assert states(engine.evaluate_rows([row(30, 11), row(50, 12)])) == [(RESOLVED, 30)]
+
+    # Other sensor types, other tenants (not even decoded) and invalid payloads are skipped
+    other = row(99, 13, tenant_id="t2")
+    other["payload"] = "not json"
+    assert engine.evaluate_rows([row(99, 13, sensor_type="humidity"), other]) == []
+    assert engine.metrics()["evaluations"] == 9 and engine.metrics()["readings"] == 10
+
+
+def test_count_and_rate_windows():
+    engine = AlertEngine()
+    engine.load([
+        rule(kind="count", operator=">=", threshold=100, window_seconds=600, min_count=3, sensor_type="co2"),
+        rule(kind="rate", threshold=2, window_seconds=300, device_id=DEVICE),
+    ])
+    co2 = [row(value, minute, sensor_type="co2") for minute, value in ((0, 120), (4, 90), (6, 130), (9, 101))]
+    assert states(engine.evaluate_rows(co2)) == [(FIRING, 101)]
+    assert states(engine.evaluate_rows([row(80, 11, sensor_type="co2")])) == [(RESOLVED, 80)]
+
+    # +2.5/minute over the last five minutes fires; only for the rule's device
+    readings = [row(20 + 2.5 * minute, minute) for minute in range(4)]
+    readings.append(row(99, 3, device_id="other"))
+    events = engine.evaluate_rows(readings)
+    assert states(events) == [(FIRING, 22.5)] and {event["device_id"] for event in events} == {DEVICE}
+    assert states(engine.evaluate_rows([row(28, 4), row(28, 8)])) == [(RESOLVED, 28)]
+
+
+def test_reload_keeps_state_of_unchanged_rules_only():
+    engine = AlertEngine()
+    slow, other = rule(duration_seconds=300), rule(tenant_id="t2")
+    engine.load([slow, other, rule(operator="~")])
+    assert engine.metrics()["invalid_rules"] == 1
+    engine.evaluate_rows([row(41, 0)])
+
+    engine.load([slow], tenant_id="t1")
+    assert states(engine.evaluate_rows([row(41, 5)])) == [(FIRING, 41)]
+    assert engine.metrics()["tenants"] == 2
+
+    # An edited rule starts over
+    engine.load([rule(id=slow.id, duration_seconds=300, updated_at=T0 + timedelta(days=1))], tenant_id="t1")
+    assert engine.evaluate_rows([row(41, 6)]) == []
+
+    engine.load([], tenant_id="t1")
+    assert engine.evaluate_rows([row(41, 20)]) == []
+    assert engine.metrics()["rules"] == 1
+    assert engine.evaluate_rows([row(41, 20, tenant_id="t2")])[0]["tenant_id"] == "t2"
+
+
+def test_rules_api_and_worker_evaluation(tmp_path, monkeypatch):
+    engine, session_factory = asyncio.run(make_database(tmp_path))
+    changed = []
+    monkeypatch.setattr(alert_rules_endpoints, "publish_alert_rules_changed", changed.append)
+
+    async def seed():
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+            await session.commit()
+
+    asyncio.run(seed())
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="u1", tenant_id="t1")
+    client = TestClient(app)
+    url = "/api/v1/alert-rules"
+
+    created = client.post(url, json={
+        "name": "overheating", "sensor_type": "temperature", "device_id": DEVICE,
+        "threshold": 40, "duration_seconds": 300,
+    })
+    assert created.status_code == 201
+    rule_id = created.json()["id"]
+    assert client.post(url, json={"name": "x", "sensor_type": "co2", "kind": "count", "threshold": 1}).status_code == 400
+    assert client.post(url, json={"name": "x", "sensor_type": "co2", "threshold": 1,
+                                  "device_id": str(uuid.uuid4())}).status_code == 400
+    assert client.put(f"{url}/{rule_id}", json={"threshold": 45}).json()["threshold"] == 45
+    assert [item["id"] for item in client.get(url).json()] == [rule_id]
+    assert changed == ["t1", "t1"]
+
+    async def run_worker():
+        redis = FakeRedis()
+        monitor = AlertMonitor(AlertEngine(), session_factory, redis)
+        assert await monitor.reload() == 1
+        await publish_rows(redis, [row(46, 0), row(44, 4), row(47, 5)], alerts=monitor)
+        await publish_rows(redis, [row(50, 6), row(50, 11)], alerts=monitor)
+        published = [json.loads(message) for channel, message in redis.published if channel == ALERT_CHANNEL]
+        async with session_factory() as session:
+            actions = (await session.execute(
+                select(AuditLog.action).where(AuditLog.resource_type == "device")
+            )).scalars().all()
+        return published, actions, monitor.metrics()
+
+    published, actions, metrics = asyncio.run(run_worker())
+    assert [(event["state"], event["timestamp"]) for event in published] == [
+        (FIRING, (T0 + timedelta(minutes=11)).isoformat())
+    ]
+    assert published[0]["rule_id"] == rule_id and actions == ["alert_firing"]
+    assert metrics["rules"] == 1 and metrics["events"] == 1 and metrics["reloads"] == 1
+
+    assert client.delete(f"{url}/{rule_id}").status_code == 204
+    assert client.get(f"{url}/{rule_id}").status_code == 404
+    asyncio.run(engine.dispose())
@@ -0,0 +1,116 @@
+"""
+Tests for streaming anomaly detection in the MQTT worker.
+"""
+
+import json
+import random
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.ingestion.anomaly import ANOMALY_CHANNEL, AUDIT_ACTION, AnomalyDetector, AnomalyMonitor
+from app.models.audit import AuditLog
+from app.worker import publish_rows
+from tests.test_ingest_fanout import FakeRedis
+from tests.test_rollups import DEVICE, T0, make_database
+
+np = pytest.importorskip("numpy")
+
+
+def row(value, timestamp, device_id=DEVICE):
+    return {
+        "tenant_id": "t1",
+        "device_id": device_id,
+        "payload": json.dumps({"temperature": value}),
+        "timestamp": timestamp,
+    }
+
+
+def test_batch_update_matches_reading_by_reading():
+    values = [20 + random.gauss(0, 1) for _ in range(200)]
+    epochs = [60.0 * i for i in range(200)]
+    batched, sequential = AnomalyDetector(season_slots=1), AnomalyDetector(season_slots=1)
+    batched.series(DEVICE, "temperature", values[0])
+    sequential.series(DEVICE, "temperature", values[0])
+
+    # Shuffled within the batch: readings are folded in time order regardless
+    order = random.sample(range(200), 200)
+    batched.update([0] * 200, [epochs[i] for i in order], [values[i] for i in order])
+    for epoch, value in zip(epochs, values):
+        sequential.update([0], [epoch], [value])
+
+    for name in ("weight", "m1", "m2", "count"):
+        assert getattr(batched.moments, name)[0] == pytest.approx(getattr(sequential.moments, name)[0])
+    mean, variance = batched.moments.estimate(np.array([0]))
+    assert batched.reference[0] + mean[0] == pytest.approx(np.average(values, weights=0.95 ** np.arange(199, -1, -1)))
+
+
+def test_spike_is_reported_once_per_cooldown():
+    detector = AnomalyDetector(season_slots=1, cooldown_seconds=600)
+    random.seed(1)
+    rows = [row(20 + random.gauss(0, 0.5), T0 + timedelta(minutes=i)) for i in range(100)]
+    assert detector.observe_rows(rows[:50]) == []
+    assert detector.observe_rows(rows[50:]) == []
+
+    spike = T0 + timedelta(minutes=100)
+    events = detector.observe_rows([row(35.0, spike), row(36.0, spike + timedelta(minutes=1))])
+    assert len(events) == 1
+    event = events[0]
+    assert event["device_id"] == DEVICE and event["sensor_type"] == "temperature" and event["value"] == 35.0
+    assert event["z"] > 4 and event["robust_z"] > 3.5 and event["seasonal_z"] is None
+    assert event["expected"] == pytest.approx(20, abs=1)
+
+    # Still inside the cooldown, then past it
+    assert detector.observe_rows([row(37.0, spike + timedelta(minutes=5))]) == []
+    assert len(detector.observe_rows([row(60.0, spike + timedelta(minutes=11))])) == 1
+    assert detector.metrics()["anomalies"] == 2 and detector.metrics()["suppressed"] >= 1
+
+
+def test_seasonal_baseline_accepts_the_usual_daily_peak():
+    detector = AnomalyDetector(season_slots=24, season_slot_seconds=3600, season_alpha=0.05)
+    random.seed(2)
+    # Four days of readings every 5 minutes; hot from 12:00 to 13:00
+    for day in range(4):
+        rows = []
+        for i in range(288):
+            timestamp = T0.replace(hour=0) + timedelta(days=day, minutes=5 * i)
+            rows.append(row((30 if timestamp.hour == 12 else 20) + random.gauss(0, 0.3), timestamp))
+        events = detector.observe_rows(rows)
+        if day == 3:
+            assert events == []
+
+    # The same jump outside its usual hour is an anomaly
+    events = detector.observe_rows([row(30.0, T0.replace(hour=3) + timedelta(days=4))])
+    assert len(events) == 1 and events[0]["seasonal_z"] > 4
+
+
+def test_series_cap_leaves_new_devices_untracked():
+    detector = AnomalyDetector(max_series=2, capacity=1)
+    detector.observe_rows([row(1.0, T0, device_id=f"d{i}") for i in range(3)])
+    assert len(detector) == 2 and detector.metrics()["untracked"] == 1
+
+
+@pytest.mark.asyncio
+async def test_worker_publishes_and_audits_anomalies(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    redis = FakeRedis()
+    monitor = AnomalyMonitor(AnomalyDetector(season_slots=1, warmup=10), redis, session_factory, queue_size=1)
+    # Batches are scored against what came before them, so the first one only warms up
+    assert await monitor.process([row(20.0 + (i % 3) * 0.1, T0 + timedelta(minutes=i)) for i in range(20)]) == []
+    rows = [row(20.1, T0 + timedelta(minutes=20)), row(50.0, T0 + timedelta(minutes=21))]
+
+    await publish_rows(redis, rows, anomalies=monitor)
+    await publish_rows(redis, rows, anomalies=monitor)  # queue full: skipped, not awaited
+    assert monitor.metrics()["dropped_rows"] == len(rows)
+
+    events = await monitor.process(monitor.queue.get_nowait())
+    assert len(events) == 1
+    published = [json.loads(message) for channel, message in redis.published if channel == ANOMALY_CHANNEL]
+    assert published == events
+
+    async with session_factory() as session:
+        logs = (await session.execute(select(AuditLog))).scalars().all()
+    assert [(log.action, log.resource_id, log.tenant_id) for log in logs] == [(AUDIT_ACTION, DEVICE, "t1")]
+    assert json.loads(logs[0].details)["value"] == 50.0
+    await engine.dispose()
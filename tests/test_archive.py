@@ -0,0 +1,184 @@
+"""
+Tests for tiering old sensor_data rows to Parquet archives.
+"""
+
+import asyncio
+import json
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from app.api.deps import get_current_user, get_session
+from app.core.config import settings
+from app.ingestion import archive
+from app.ingestion.archive import SensorArchiver, archived_days, read_part
+from app.main import create_app
+from app.models.device import Device
+from app.models.sensor import SensorData
+from app.services.downsample import downsample_sensor_data
+from app.services.export import stream_export
+from app.services.telemetry import aggregate_telemetry
+from tests.test_rollups import DEVICE, T0, make_database
+
+pytest.importorskip("pyarrow")
+
+NOW = T0 + timedelta(days=100)
+
+
+async def seed_days(session_factory, days=3, per_day=10, start=T0):
+    """`per_day` rows an hour apart on each of `days` days; `seq` counts them all."""
+    async with session_factory() as session:
+        for i in range(days * per_day):
+            session.add(SensorData(
+                tenant_id="t1",
+                device_id=DEVICE,
+                payload=json.dumps({"seq": i, "temperature": float(i)}),
+                timestamp=start + timedelta(days=i // per_day, hours=i % per_day),
+            ))
+        await session.commit()
+
+
+async def count_rows(session_factory):
+    async with session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(SensorData))).scalar()
+
+
+@pytest.mark.asyncio
+async def test_archiver_moves_closed_days_and_prunes_row_groups(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    await seed_days(session_factory)
+    async with session_factory() as session:
+        session.add(SensorData(tenant_id="t1", device_id=DEVICE, payload="{}", timestamp=NOW))
+        await session.commit()
+
+    archiver = SensorArchiver(session_factory, tmp_path / "archive", after_days=90, row_group_rows=4)
+    assert await archiver.archive_once(now=NOW) == {"files": 3, "rows": 30}
+    assert await count_rows(session_factory) == 1
+    assert await archiver.archive_once(now=NOW) == {"files": 0, "rows": 0}
+
+    # A late row for an archived day becomes another part of that day
+    async with session_factory() as session:
+        session.add(SensorData(tenant_id=None, device_id=DEVICE, payload="{}", timestamp=T0 + timedelta(minutes=1)))
+        await session.commit()
+    assert await archiver.archive_once(now=NOW) == {"files": 1, "rows": 1}
+
+    days = archived_days(tmp_path / "archive", "t1", DEVICE)
+    assert [day for day, _ in days] == [T0.date() + timedelta(days=d) for d in (0, 0, 1, 2)]
+    assert (tmp_path / "archive" / "t1" / DEVICE).is_dir() and (tmp_path / "archive" / "_" / DEVICE).is_dir()
+
+    import pyarrow.parquet as pq
+
+    first_day = next(part for day, part in days if pq.ParquetFile(part).metadata.num_rows == 10)
+    assert pq.ParquetFile(first_day).metadata.num_row_groups == 3
+    table = read_part(first_day, T0 + timedelta(hours=5), T0 + timedelta(hours=6), ("id", "timestamp"))
+    assert table.column_names == ["id", "timestamp"] and table.num_rows == 2
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_failed_commit_leaves_no_archive_files(tmp_path, monkeypatch):
+    engine, session_factory = await make_database(tmp_path)
+    await seed_days(session_factory, days=1)
+    archiver = SensorArchiver(session_factory, tmp_path / "archive")
+
+    async def fail(self, session, start, end, written):
+        await original(self, session, start, end, written)
+        raise RuntimeError("database went away")
+
+    original = SensorArchiver.archive_window
+    monkeypatch.setattr(SensorArchiver, "archive_window", fail)
+    with pytest.raises(RuntimeError):
+        await archiver.archive_once(now=NOW)
+    assert list((tmp_path / "archive").rglob("*.parquet")) == []
+    assert await count_rows(session_factory) == 10
+    await engine.dispose()
+
+
+def test_history_pages_across_database_and_archive(tmp_path, monkeypatch):
+    engine, session_factory = asyncio.run(make_database(tmp_path))
+    asyncio.run(seed_days(session_factory))
+    monkeypatch.setattr(settings, "SENSOR_ARCHIVE_DIR", str(tmp_path / "archive"))
+
+    async def seed():
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+            await session.commit()
+        # Archive the first two days only; the third stays in the database
+        await SensorArchiver.from_settings(session_factory).archive_once(now=T0 + timedelta(days=92))
+
+    asyncio.run(seed())
+    assert asyncio.run(count_rows(session_factory)) == 10
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="u1", tenant_id="t1")
+    client = TestClient(app)
+    url = f"/api/v1/devices/{DEVICE}/sensor-data"
+
+    seqs, cursor = [], None
+    while True:
+        body = client.get(url, params={"limit": 7, **({"cursor": cursor} if cursor else {})}).json()
+        seqs.extend(json.loads(row["payload"])["seq"] for row in body["data"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seqs == list(range(29, -1, -1))
+
+    body = client.get(url, params={"from_time": "2025-01-11T17:00:00Z", "to_time": "2025-01-12T14:00:00Z"}).json()
+    assert [json.loads(row["payload"])["seq"] for row in body["data"]] == list(range(22, 14, -1))
+
+    body = client.get(url, params={"sensor_type": "temperature", "max_points": 4, "downsample": "minmax"}).json()
+    assert body["downsampled_from"] == 30
+    assert [json.loads(row["payload"])["seq"] for row in body["data"]][::len(body["data"]) - 1] == [29, 0]
+    asyncio.run(engine.dispose())
+
+
+@pytest.mark.asyncio
+async def test_export_streams_archived_rows_first(tmp_path, monkeypatch):
+    engine, session_factory = await make_database(tmp_path)
+    await seed_days(session_factory)
+    monkeypatch.setattr(settings, "SENSOR_ARCHIVE_DIR", str(tmp_path / "archive"))
+    await SensorArchiver.from_settings(session_factory).archive_once(now=T0 + timedelta(days=92))
+
+    async with session_factory() as session:
+        chunks = [
+            chunk async for chunk in stream_export(session, "ndjson", DEVICE, chunk_rows=4, tenant_id="t1")
+        ]
+        rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        assert [json.loads(row["payload"])["seq"] for row in rows] == list(range(30))
+
+        # Without pyarrow the archive is invisible rather than an error
+        monkeypatch.setattr(archive, "pq", None)
+        data, total = await downsample_sensor_data(session, DEVICE, "temperature", 4, tenant_id="t1")
+        assert total == 10
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_aggregation_reads_archived_rows(tmp_path, monkeypatch):
+    engine, session_factory = await make_database(tmp_path)
+    await seed_days(session_factory)
+    monkeypatch.setattr(settings, "SENSOR_ARCHIVE_DIR", str(tmp_path / "archive"))
+    await SensorArchiver.from_settings(session_factory).archive_once(now=T0 + timedelta(days=92))
+    async with session_factory() as session:
+        session.add(SensorData(tenant_id="t1", device_id=DEVICE, payload=json.dumps({"temperature": 99.0}),
+                               timestamp=T0 + timedelta(days=2, hours=6)))
+        await session.commit()
+
+    async with session_factory() as session:
+        # Archived days 1-2 and a late row still in the database
+        result = await aggregate_telemetry(
+            session, DEVICE, "temperature", T0 + timedelta(days=1), T0 + timedelta(days=3),
+            86400, ["count", "max", "p50"], tenant_id="t1",
+        )
+    assert result["source"] in ("numpy", "python")
+    assert result["count"] == [10, 11] and result["max"] == [19.0, 99.0]
+    await engine.dispose()
@@ -0,0 +1,162 @@
+"""
+Tests for Gorilla-compressed blocks of cold sensor history.
+"""
+
+import asyncio
+import math
+import struct
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from app.api.deps import get_current_user, get_session
+from app.core.gorilla import decode_series, encode_series
+from app.ingestion.blocks import SensorCompactor, block_points
+from app.ingestion.readings import insert_readings
+from app.ingestion.rollups import recompute_rollups
+from app.main import create_app
+from app.models.device import Device
+from app.models.sensor import Sensor, SensorBlock
+from app.services.downsample import downsample_sensors
+from app.services.telemetry import aggregate_telemetry
+from tests.test_rollups import DEVICE, T0, make_database, reading
+
+NOW = T0 + timedelta(days=10)
+
+
+def test_gorilla_roundtrip_is_lossless():
+    timestamps = [0, 1_000_000, 2_000_000, 2_000_000, 2_999_999, 10 ** 12, 10 ** 12 + 5, -(2 ** 40)]
+    timestamps = sorted(timestamps)
+    values = [21.5, 21.5, 21.25, -0.0, math.inf, 1e-300, 123456.789, math.nan]
+    decoded_timestamps, decoded_values = decode_series(encode_series(timestamps, values))
+    assert decoded_timestamps == timestamps
+    assert [struct.pack(">d", v) for v in decoded_values] == [struct.pack(">d", v) for v in values]
+
+    assert decode_series(encode_series([], [])) == ([], [])
+    assert decode_series(encode_series([7], [1.0])) == ([7], [1.0])
+    with pytest.raises(ValueError):
+        decode_series(encode_series(timestamps, values)[:10])
+
+
+def test_regular_series_compress_well():
+    timestamps = [i * 10_000_000 for i in range(10000)]
+    values = [20.0 + (i % 40) * 0.25 for i in range(10000)]
+    data = encode_series(timestamps, values)
+    assert len(data) / len(timestamps) < 4
+    assert decode_series(data) == (timestamps, values)
+
+
+async def seed_history(session_factory, count=30):
+    """`count` temperature readings a minute apart, two on the same instant, plus a humidity reading."""
+    rows = [reading(float(i), T0 + timedelta(minutes=i)) for i in range(count)]
+    rows.append(reading(99.0, T0 + timedelta(minutes=5)))
+    rows.append(reading(55.0, T0, "humidity"))
+    async with session_factory() as session:
+        session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+        await insert_readings(session, rows)
+        await session.commit()
+
+
+async def count_rows(session_factory, model):
+    async with session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(model))).scalar()
+
+
+@pytest.mark.asyncio
+async def test_compaction_replaces_rows_and_merges_late_ones(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    await seed_history(session_factory)
+    async with session_factory() as session:
+        await insert_readings(session, [reading(1.0, NOW), {**reading(2.0, T0), "sensor_metadata": '{"k": "v"}'}])
+        await session.commit()
+
+    compactor = SensorCompactor(session_factory, after_days=7)
+    assert await compactor.compact_once(now=NOW) == {"blocks": 2, "rows": 32}
+    # The recent row and the one carrying metadata stay raw
+    assert await count_rows(session_factory, Sensor) == 2
+    assert await compactor.compact_once(now=NOW) == {"blocks": 0, "rows": 0}
+
+    async with session_factory() as session:
+        await insert_readings(session, [reading(-1.0, T0 - timedelta(minutes=1))])
+        await session.commit()
+    assert await compactor.compact_once(now=NOW) == {"blocks": 1, "rows": 1}
+
+    async with session_factory() as session:
+        blocks = (await session.execute(select(SensorBlock).order_by(SensorBlock.sensor_type))).scalars().all()
+    humidity, temperature = blocks
+    assert (humidity.count, humidity.min_value) == (1, 55.0)
+    assert (temperature.count, temperature.min_value, temperature.max_value) == (32, -1.0, 99.0)
+    assert temperature.start_time == T0.replace(hour=0) and temperature.first_timestamp == T0 - timedelta(minutes=1)
+    points = block_points(temperature, start=T0 + timedelta(minutes=5), end=T0 + timedelta(minutes=6),
+                          end_exclusive=True)
+    assert sorted(point.value for point in points) == [5.0, 99.0]
+    assert points[0].id != points[1].id
+    await engine.dispose()
+
+
+def test_history_endpoint_pages_across_rows_and_blocks(tmp_path):
+    engine, session_factory = asyncio.run(make_database(tmp_path))
+    asyncio.run(seed_history(session_factory, count=20))
+
+    async def compact_first_half():
+        async with session_factory() as session:
+            await SensorCompactor(session_factory).compact_window(session, T0, T0 + timedelta(minutes=10))
+            await session.commit()
+
+    asyncio.run(compact_first_half())
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="u1", tenant_id="t1")
+    client = TestClient(app)
+
+    url = f"/api/v1/ingest/sensors/{DEVICE}"
+    readings, cursor = [], None
+    while True:
+        params = {"sensor_type": "temperature", "limit": 4, **({"cursor": cursor} if cursor else {})}
+        response = client.get(url, params=params)
+        readings.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert len(readings) == 21 and len({r["id"] for r in readings}) == 21
+    keys = [(r["timestamp"], r["id"]) for r in readings]
+    assert keys == sorted(keys, reverse=True)
+    assert [r["value"] for r in readings[:10]] == [float(i) for i in range(19, 9, -1)]
+    assert sorted(r["value"] for r in readings[10:]) == [*map(float, range(10)), 99.0]
+    # Decoded readings keep their ids from one request to the next
+    assert client.get(url, params={"sensor_type": "temperature"}).json() == readings
+
+    downsampled = client.get(url, params={"sensor_type": "temperature", "max_points": 5})
+    assert downsampled.headers["X-Downsampled-From"] == "21"
+    assert len(downsampled.json()) <= 5 and 99.0 in [r["value"] for r in downsampled.json()]
+    asyncio.run(engine.dispose())
+
+
+@pytest.mark.asyncio
+async def test_aggregates_downsampling_and_rollups_read_blocks(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    await seed_history(session_factory)
+    await SensorCompactor(session_factory).compact_once(now=NOW)
+
+    async with session_factory() as session:
+        start, end = T0, T0 + timedelta(minutes=30)
+        aggregated = await aggregate_telemetry(session, DEVICE, "temperature", start, end, 600, ["count", "max"])
+        assert aggregated["count"] == [11, 10, 10] and aggregated["max"] == [99.0, 19.0, 29.0]
+
+        sensors, total = await downsample_sensors(session, DEVICE, "temperature", 4, "minmax", start, end)
+        assert total == 31 and sensors[0].value == 29.0 and 99.0 in [sensor.value for sensor in sensors]
+
+        counts = await recompute_rollups(session, T0, T0 + timedelta(hours=1))
+        await session.commit()
+        assert counts["1m"] == 31
+    await engine.dispose()
@@ -0,0 +1,112 @@
+"""
+Tests for the payload codec registry and its use in MQTT and HTTP ingestion.
+"""
+
+import json
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from aiomqtt import Topic
+from fastapi.testclient import TestClient
+
+from app.core.codecs import (
+    available_codecs,
+    codec_for_content_type,
+    decode_compact,
+    encode_compact,
+    get_codec,
+    json_dumps,
+    json_loads,
+)
+from app.main import app
+from app.worker import decode_message
+
+PAYLOAD = {
+    "timestamp": "2025-01-10T12:00:00+00:00",
+    "sensor_data": [
+        {"sensor_type": "temperature", "value": 23.5},
+        {"sensor_type": "humidity", "value": 45.25},
+    ],
+}
+
+
+def test_json_round_trip():
+    codec = get_codec("json")
+    assert codec.decode(codec.encode(PAYLOAD)) == PAYLOAD
+    assert json_loads(json_dumps(PAYLOAD)) == PAYLOAD
+
+
+def test_compact_round_trip_and_size():
+    data = encode_compact(PAYLOAD)
+    assert len(data) == 6 + 5 * len(PAYLOAD["sensor_data"])
+    assert len(data) < len(json.dumps(PAYLOAD))
+    assert decode_compact(data) == PAYLOAD
+
+
+def test_compact_rejects_bad_payloads():
+    with pytest.raises(ValueError):
+        decode_compact(b"\x01\x00")
+    with pytest.raises(ValueError):
+        decode_compact(encode_compact(PAYLOAD) + b"\x00")
+    with pytest.raises(ValueError):
+        encode_compact({"timestamp": 0, "sensor_data": [{"sensor_type": "co2", "value": 1}]})
+
+
+def test_lookup_by_name_and_content_type():
+    assert get_codec().name == "json"
+    assert codec_for_content_type(None).name == "json"
+    assert codec_for_content_type("application/json; charset=utf-8").name == "json"
+    assert codec_for_content_type("application/vnd.smartsecurity.compact").name == "compact"
+    assert "compact" not in available_codecs(generic_only=True)
+    with pytest.raises(ValueError):
+        get_codec("xml")
+    with pytest.raises(ValueError):
+        codec_for_content_type("application/xml")
+
+
+@pytest.mark.asyncio
+async def test_worker_decodes_codec_from_topic_suffix():
+    device_id = str(uuid.uuid4())
+    resolver = SimpleNamespace(resolve=AsyncMock(return_value="tenant-id"))
+    message = SimpleNamespace(
+        topic=Topic(f"iot/tenant1/{device_id}/compact"),
+        payload=encode_compact(PAYLOAD),
+        properties=None,
+    )
+
+    row = await decode_message(message, resolver)
+
+    assert row["device_id"] == device_id
+    assert json_loads(row["payload"]) == PAYLOAD
+
+
+@pytest.mark.asyncio
+async def test_worker_drops_unknown_codec():
+    resolver = SimpleNamespace(resolve=AsyncMock(return_value="tenant-id"))
+    message = SimpleNamespace(
+        topic=Topic(f"iot/tenant1/{uuid.uuid4()}/xml"), payload=b"<x/>", properties=None
+    )
+    assert await decode_message(message, resolver) is None
+    resolver.resolve.assert_not_awaited()
+
+
+def test_http_ingest_rejects_unsupported_content_type():
+    client = TestClient(app)
+    response = client.post(
+        "/api/v1/ingest/root/v1/health",
+        content=b"<beacon/>",
+        headers={"Content-Type": "application/xml"},
+    )
+    assert response.status_code == 415
+
+
+def test_http_ingest_rejects_undecodable_body():
+    client = TestClient(app)
+    response = client.post(
+        "/api/v1/ingest/root/v1/health",
+        content=b"{not json",
+        headers={"Content-Type": "application/json"},
+    )
+    assert response.status_code == 400
@@ -0,0 +1,183 @@
+"""
+Tests for the device shadow (latest value per device and sensor type).
+"""
+
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_current_user, get_session
+from app.ingestion import shadow as shadow_module
+from app.ingestion.readings import insert_readings, readings_committed
+from app.ingestion.shadow import (
+    MemoryShadow,
+    decode_hash,
+    format_timestamp,
+    observe_events,
+    observe_payload_rows,
+    observe_sensor_rows,
+)
+from app import main as main_module
+from app.ingestion.fanout import sensor_event
+from app.main import create_app
+from app.models.device import Device
+from app.repositories.admin import AdminDeviceRepository
+from app.schemas.admin import DeviceOut, DeviceStatus
+from tests.test_rollups import DEVICE, T0, make_database, reading
+
+
+@pytest.fixture
+def memory_shadow(monkeypatch):
+    shadow = MemoryShadow()
+    monkeypatch.setattr(shadow_module, "_shadow", shadow)
+    return shadow
+
+
+@pytest.mark.asyncio
+async def test_newest_reading_wins():
+    shadow = MemoryShadow()
+    rows = [reading(5.0, T0 + timedelta(minutes=1)), reading(40.0, T0, "humidity"), reading(1.0, T0)]
+    for row in rows:
+        row["created_at"] = row["timestamp"]
+    *first, late = rows
+    late["created_at"] = T0 + timedelta(minutes=10)
+    await shadow.apply(observe_sensor_rows(first))
+    # Received later but measured earlier: last_seen moves, the value does not
+    await shadow.apply(observe_sensor_rows([late]))
+
+    state = (await shadow.get_many([DEVICE, "unknown"]))[DEVICE]
+    assert state["last_seen"] == late["created_at"]
+    assert state["sensors"]["temperature"] == {"value": 5.0, "timestamp": T0 + timedelta(minutes=1)}
+    assert list(state["sensors"]) == ["humidity", "temperature"]
+
+
+@pytest.mark.asyncio
+async def test_memory_shadow_evicts_least_recently_updated_devices():
+    shadow = MemoryShadow(max_devices=2)
+    for device_id in ("a", "b", "a", "c"):
+        row = {**reading(1.0, T0), "device_id": device_id}
+        await shadow.apply(observe_sensor_rows([row]))
+
+    assert set(await shadow.get_many(["a", "b", "c"])) == {"a", "c"}
+    assert shadow.evictions == 1
+
+
+def test_payload_rows_and_redis_hash_encoding():
+    rows = [
+        {"device_id": DEVICE, "timestamp": T0, "created_at": T0,
+         "payload": json.dumps({"sensor_data": [{"sensor_type": "co2", "value": 410}]})},
+        {"device_id": DEVICE, "timestamp": T0 + timedelta(seconds=1), "created_at": T0 + timedelta(seconds=1),
+         "payload": "not json"},
+    ]
+    observation = observe_payload_rows(rows)[DEVICE]
+    assert observation.last_seen == T0 + timedelta(seconds=1)
+    assert observation.sensors == {"co2": (T0, 410.0)}
+
+    stamp = format_timestamp(T0)
+    assert len(stamp) == 26 and stamp < format_timestamp(T0 + timedelta(microseconds=1))
+    state = decode_hash({b"last_seen": stamp.encode(), b"s:co2": f"{stamp}|410.0".encode()})
+    assert state == {"last_seen": T0, "sensors": {"co2": {"value": 410.0, "timestamp": T0}}}
+
+
+@pytest.mark.asyncio
+async def test_inserted_readings_update_the_shadow(tmp_path, memory_shadow):
+    engine, session_factory = await make_database(tmp_path)
+    async with session_factory() as session:
+        inserted = await insert_readings(session, [reading(21.5, T0)])
+        # Nothing is visible before the commit
+        assert await memory_shadow.get_many([DEVICE]) == {}
+        await session.commit()
+    await readings_committed(inserted)
+    assert (await memory_shadow.get_many([DEVICE]))[DEVICE]["sensors"]["temperature"]["value"] == 21.5
+    await engine.dispose()
+
+
+def test_devices_state_endpoint(tmp_path, memory_shadow):
+    engine, session_factory = asyncio.run(make_database(tmp_path))
+    quiet = uuid.uuid4()
+
+    async def seed():
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+            session.add(Device(id=quiet, name="attic", tenant_id="t1"))
+            session.add(Device(name="elsewhere", tenant_id="t2"))
+            inserted = await insert_readings(session, [reading(21.5, T0), reading(22.0, T0 + timedelta(seconds=30))])
+            await session.commit()
+        await readings_committed(inserted)
+
+    asyncio.run(seed())
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="u1", tenant_id="t1")
+    client = TestClient(app)
+
+    body = client.get("/api/v1/devices/state").json()
+    assert body["total"] == 2
+    attic, gateway = body["devices"]
+    assert attic == {"id": str(quiet), "name": "attic", "is_active": True, "last_seen": None, "sensors": {}}
+    assert gateway["sensors"] == {"temperature": {"value": 22.0, "timestamp": "2025-01-10T12:00:30"}}
+    assert gateway["last_seen"] is not None
+
+    shadow_module.set_device_shadow(None)
+    assert client.get("/api/v1/devices/state").status_code == 503
+    asyncio.run(engine.dispose())
+
+
+@pytest.mark.asyncio
+async def test_admin_device_out_gets_last_seen(memory_shadow):
+    row = reading(20.0, T0)
+    row["created_at"] = T0 + timedelta(seconds=2)
+    await memory_shadow.apply(observe_sensor_rows([row]))
+    devices = [
+        DeviceOut(id=device_id, name="d", description=None, serial_no="s", specifications=None, is_active=True,
+                  status=DeviceStatus.ACTIVE, tenant_id="t1", created_at=datetime(2025, 1, 1))
+        for device_id in (DEVICE, str(uuid.uuid4()))
+    ]
+    devices = await AdminDeviceRepository(None)._with_last_seen(devices)
+    assert [device.last_seen for device in devices] == [T0 + timedelta(seconds=2), None]
+
+
+class FakePubSub:
+    """Yields the given `sensor_new` messages, then ends."""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def subscribe(self, channel):
+        return None
+
+    async def listen(self):
+        for data in self.messages:
+            yield {"type": "message", "data": data}
+
+    async def unsubscribe(self, channel):
+        return None
+
+    async def close(self):
+        return None
+
+
+@pytest.mark.asyncio
+async def test_subscriber_feeds_memory_shadow_with_worker_readings(monkeypatch, memory_shadow):
+    row = {"device_id": DEVICE, "tenant_id": "t1", "timestamp": T0, "payload": json.dumps({"temperature": 19.0})}
+    messages = [json.dumps(sensor_event(row)), "not json"]
+    monkeypatch.setattr(
+        main_module.aioredis, "from_url",
+        lambda *args, **kwargs: SimpleNamespace(pubsub=lambda: FakePubSub(messages)),
+    )
+    monkeypatch.setattr(main_module, "get_recent_buffers", lambda: None)
+
+    await main_module.redis_subscriber()
+    state = (await memory_shadow.get_many([DEVICE]))[DEVICE]
+    assert state == {"last_seen": T0, "sensors": {"temperature": {"value": 19.0, "timestamp": T0}}}
+    assert observe_events([{"device_id": DEVICE}]) == {}
@@ -0,0 +1,97 @@
+"""
+Tests for LTTB and min/max downsampling of sensor history.
+"""
+
+import asyncio
+import json
+import math
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_current_user, get_session
+from app.main import create_app
+from app.models.device import Device
+from app.models.sensor import Sensor, SensorData
+from app.services import downsample
+from app.services.downsample import downsample_indices, lttb_indices, minmax_indices
+from tests.test_rollups import DEVICE, T0, make_database
+
+
+def series(length=1000, spike_at=437):
+    x = list(range(length))
+    y = [math.sin(i / 50) for i in x]
+    y[spike_at] = 25.0
+    return x, y
+
+
+@pytest.mark.parametrize("algorithm", ["lttb", "minmax"])
+def test_bounded_and_keeps_the_peak(algorithm):
+    x, y = series()
+    indices = downsample_indices(x, y, 50, algorithm)
+    assert len(indices) <= 50
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert indices == sorted(set(indices))
+    assert 437 in indices
+
+
+def test_short_series_are_returned_whole():
+    assert lttb_indices([0, 1, 2], [1, 2, 3], 10) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        lttb_indices([0, 1], [0, 1], 2)
+    with pytest.raises(ValueError):
+        downsample_indices([0], [0], 10, "average")
+
+
+def test_python_fallback_matches_numpy(monkeypatch):
+    pytest.importorskip("numpy")
+    x, y = series(5000)
+    vectorized = (lttb_indices(x, y, 300), minmax_indices(x, y, 300))
+    monkeypatch.setattr(downsample, "np", None)
+    assert (lttb_indices(x, y, 300), minmax_indices(x, y, 300)) == vectorized
+
+
+def test_history_endpoints_downsample(tmp_path):
+    engine, session_factory = asyncio.run(make_database(tmp_path))
+    x, y = series(600, spike_at=250)
+
+    async def seed():
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+            for i, value in zip(x, y):
+                timestamp = T0 + timedelta(seconds=i)
+                session.add(Sensor(device_id=DEVICE, sensor_type="temperature", value=value, timestamp=timestamp))
+                session.add(SensorData(tenant_id="t1", device_id=DEVICE, timestamp=timestamp,
+                                       payload=json.dumps({"temperature": value, "seq": i})))
+            await session.commit()
+
+    asyncio.run(seed())
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="u1", tenant_id="t1")
+    client = TestClient(app)
+
+    response = client.get(f"/api/v1/ingest/sensors/{DEVICE}", params={"sensor_type": "temperature", "max_points": 40})
+    readings = response.json()
+    assert response.headers["X-Downsampled-From"] == "600"
+    assert len(readings) <= 40 and max(r["value"] for r in readings) == 25.0
+    assert readings[0]["timestamp"] > readings[-1]["timestamp"]
+
+    url = f"/api/v1/devices/{DEVICE}/sensor-data"
+    body = client.get(url, params={"sensor_type": "temperature", "max_points": 40, "downsample": "minmax",
+                                   "from_time": "2025-01-10T12:00:00Z", "to_time": "2025-01-10T12:05:00Z"}).json()
+    seqs = [json.loads(row["payload"])["seq"] for row in body["data"]]
+    assert body["downsampled_from"] == 301
+    assert len(seqs) <= 40 and 250 in seqs and seqs[0] == 300 and seqs[-1] == 0
+
+    assert client.get(url, params={"max_points": 40}).status_code == 400
+    assert client.get(url, params={"sensor_type": "temperature", "max_points": 10 ** 6}).status_code == 422
+    asyncio.run(engine.dispose())
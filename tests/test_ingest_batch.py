@@ -0,0 +1,143 @@
+"""
+Tests for the `/ingest/batch` endpoint (JSON array and NDJSON stream).
+"""
+
+import asyncio
+import json
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.api.deps import get_current_user, get_session
+from app.core.codecs import iter_ndjson
+from app.core.config import settings
+from app.main import create_app
+from app.models.device import Device
+from app.models.sensor import Sensor
+
+ACTIVE = str(uuid.uuid4())
+INACTIVE = str(uuid.uuid4())
+UNKNOWN = str(uuid.uuid4())
+
+
+def make_client(tmp_path):
+    """App wired to a fresh SQLite file with one active and one inactive device."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'batch.db'}")
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(ACTIVE), name="active", tenant_id="t1"))
+            session.add(Device(id=uuid.UUID(INACTIVE), name="inactive", tenant_id="t1", is_active=False))
+            await session.commit()
+
+    asyncio.run(setup())
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="gateway")
+    return TestClient(app), engine, session_factory
+
+
+def count_sensors(session_factory) -> int:
+    async def count():
+        async with session_factory() as session:
+            return (await session.execute(select(func.count()).select_from(Sensor))).scalar_one()
+
+    return asyncio.run(count())
+
+
+ITEMS = [
+    {"device_id": ACTIVE, "sensor_type": "temperature", "value": 21.5, "unit": "C"},
+    {"device_id": ACTIVE, "sensor_type": "humidity", "value": "40", "timestamp": "2025-01-10T12:00:00Z"},
+    {"device_id": INACTIVE, "sensor_type": "temperature", "value": 1},
+    {"device_id": UNKNOWN, "sensor_type": "temperature", "value": 1},
+    {"device_id": "not-a-uuid", "sensor_type": "temperature", "value": 1},
+    {"device_id": ACTIVE, "value": 1},
+]
+
+
+def assert_per_item_status(body):
+    assert body["accepted"] == 2
+    assert body["rejected"] == 4
+    assert [item["status"] for item in body["items"]] == ["ok", "ok", "error", "error", "error", "error"]
+    assert [item.get("detail") for item in body["items"][2:]] == [
+        "Device is not active",
+        "Device not found",
+        "Invalid device ID format",
+        "Missing required field: sensor_type",
+    ]
+
+
+def test_json_array_batch_with_single_query_and_insert(tmp_path):
+    client, engine, session_factory = make_client(tmp_path)
+    statements = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.split()[:3]).upper())
+
+    response = client.post("/api/v1/ingest/batch", json=ITEMS)
+
+    assert response.status_code == 200
+    assert_per_item_status(response.json())
+    assert sum(statement.startswith("SELECT") for statement in statements) == 1
+    assert statements.count("INSERT INTO SENSORS") == 1
+    assert count_sensors(session_factory) == 2
+
+
+def test_ndjson_stream_batch(tmp_path):
+    client, _, session_factory = make_client(tmp_path)
+
+    def chunks():
+        body = "\n".join(json.dumps(item) for item in ITEMS).encode()
+        for start in range(0, len(body), 37):  # split lines across chunks
+            yield body[start:start + 37]
+
+    response = client.post(
+        "/api/v1/ingest/batch",
+        content=chunks(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == 200
+    assert_per_item_status(response.json())
+    assert count_sensors(session_factory) == 2
+
+
+def test_batch_rejects_bad_bodies(tmp_path):
+    client, _, _ = make_client(tmp_path)
+    assert client.post("/api/v1/ingest/batch", json={"device_id": ACTIVE}).status_code == 400
+    response = client.post(
+        "/api/v1/ingest/batch",
+        content=b'{"a": 1}\n{oops\n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 400
+    assert "line 2" in response.json()["detail"]
+
+
+def test_batch_size_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_HTTP_BATCH_MAX_ITEMS", 3)
+    client, _, _ = make_client(tmp_path)
+    assert client.post("/api/v1/ingest/batch", json=ITEMS).status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_iter_ndjson_handles_split_lines_and_trailing_value():
+    async def chunks():
+        for chunk in (b'{"a":', b' 1}\n\n{"b"', b': 2}'):
+            yield chunk
+
+    assert [value async for value in iter_ndjson(chunks())] == [{"a": 1}, {"b": 2}]
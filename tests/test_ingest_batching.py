@@ -0,0 +1,65 @@
+"""
+Tests for the micro-batched sensor data writer.
+"""
+
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app.ingestion.batching import BulkWriter
+from app.models.sensor import SensorData
+from app.worker import build_sensor_row
+
+
+@pytest.mark.asyncio
+async def test_flushes_when_batch_is_full(session_factory, count_rows):
+    """A full batch is written in one flush."""
+    writer = BulkWriter(session_factory, batch_size=3, linger_ms=10_000)
+
+    for i in range(7):
+        await writer.add(build_sensor_row("tenant1", f"device{i}", {"value": i}))
+
+    assert writer.flush_count == 2
+    assert writer.pending == 1
+    assert await count_rows(session_factory) == 6
+
+    await writer.flush()
+    assert await count_rows(session_factory) == 7
+
+
+@pytest.mark.asyncio
+async def test_linger_flushes_partial_batch(session_factory):
+    """Rows are flushed by the background loop after the linger time."""
+    writer = BulkWriter(session_factory, batch_size=100, linger_ms=5)
+    task = asyncio.create_task(writer.run())
+    try:
+        await writer.add(build_sensor_row("tenant1", "device1", {"value": 1.5}))
+        # Rows leave `pending` before their flush commits
+        for _ in range(100):
+            if writer.rows_written == 1:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+
+    assert writer.rows_written == 1
+    async with session_factory() as session:
+        row = (await session.execute(select(SensorData))).scalar_one()
+    assert json.loads(row.payload) == {"value": 1.5}
+
+
+@pytest.mark.asyncio
+async def test_on_flush_receives_written_rows(session_factory):
+    """The flush callback sees exactly the rows that were persisted."""
+    flushed = []
+
+    async def on_flush(rows):
+        flushed.extend(rows)
+
+    writer = BulkWriter(session_factory, batch_size=2, linger_ms=10_000, on_flush=on_flush)
+    await writer.add(build_sensor_row("tenant1", "device1", {"value": 1}))
+    await writer.add(build_sensor_row("tenant1", "device2", {"value": 2}))
+
+    assert [row["device_id"] for row in flushed] == ["device1", "device2"]
@@ -0,0 +1,109 @@
+"""
+Tests for the worker's tenant/device resolution cache.
+"""
+
+import json
+import time
+import uuid
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.ingestion.cache import DeviceResolver, TTLCache
+
+DEVICE_ID = str(uuid.uuid4())
+
+
+async def make_engine():
+    """Create an in-memory SQLite engine with all tables."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    return engine
+
+
+def count_selects(engine):
+    """Attach a counter of SELECT statements to an engine."""
+    counter = {"selects": 0}
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            counter["selects"] += 1
+
+    return counter
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_entries=10, ttl_seconds=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_resolver_runs_no_selects_when_warm():
+    """After the first message, resolving the same topic never queries the DB."""
+    engine = await make_engine()
+    resolver = DeviceResolver(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    counter = count_selects(engine)
+
+    tenant_id = await resolver.resolve("tenant1", DEVICE_ID)
+    cold_selects = counter["selects"]
+    assert cold_selects > 0
+
+    for _ in range(10):
+        assert await resolver.resolve("tenant1", DEVICE_ID) == tenant_id
+
+    assert counter["selects"] == cold_selects
+    assert resolver.hits == 10
+    assert resolver.misses == 1
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_invalidation_message_forces_lookup():
+    engine = await make_engine()
+    resolver = DeviceResolver(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    tenant_id = await resolver.resolve("tenant1", DEVICE_ID)
+
+    resolver.handle_message(json.dumps({"kind": "device", "key": DEVICE_ID}))
+    assert resolver.devices.get(DEVICE_ID) is None
+    assert resolver.tenants.get("tenant1") == tenant_id
+
+    resolver.handle_message(json.dumps({"kind": "tenant", "key": None}))
+    assert len(resolver.tenants) == 0
+
+    # Re-resolving finds the existing records instead of creating new ones
+    assert await resolver.resolve("tenant1", DEVICE_ID) == tenant_id
+    assert resolver.misses == 2
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_resolver_caches_tenant_plan():
+    engine = await make_engine()
+    resolver = DeviceResolver(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    assert resolver.cached_plan("tenant1") is None
+
+    await resolver.resolve("tenant1", DEVICE_ID)
+    assert resolver.cached_plan("tenant1") == "free"
+
+    resolver.handle_message(json.dumps({"kind": "tenant", "key": "tenant1"}))
+    assert resolver.cached_plan("tenant1") is None
+    await engine.dispose()
@@ -0,0 +1,123 @@
+"""
+Tests for compressed (`Content-Encoding`) ingest request bodies.
+"""
+
+import gzip
+import json
+import zlib
+
+import pytest
+
+from app.core import compression
+from app.core.compression import DecompressedTooLarge, decompress_stream, parse_content_encoding
+from app.core.config import settings
+from tests.test_ingest_batch import ACTIVE, ITEMS, assert_per_item_status, count_sensors, make_client
+
+READING = {"device_id": ACTIVE, "sensor_data": [{"sensor_type": "temperature", "value": 21.5}], "timestamp": 1}
+
+
+async def inflate(body: bytes, coding: str, limit: int = 1 << 20, chunk_size: int = 7) -> bytes:
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    return b"".join([out async for out in decompress_stream(chunks(), coding, limit)])
+
+
+@pytest.mark.asyncio
+async def test_gzip_and_deflate_round_trip_across_chunks():
+    data = json.dumps(ITEMS).encode() * 20
+    assert await inflate(gzip.compress(data), "gzip") == data
+    assert await inflate(zlib.compress(data), "deflate") == data
+
+
+@pytest.mark.asyncio
+async def test_zip_bomb_is_stopped_at_the_limit():
+    bomb = gzip.compress(b"\0" * (64 * 1024 * 1024))
+    assert len(bomb) < 100 * 1024
+    with pytest.raises(DecompressedTooLarge):
+        await inflate(bomb, "gzip", limit=1024 * 1024, chunk_size=len(bomb))
+
+
+@pytest.mark.asyncio
+async def test_corrupt_and_truncated_bodies():
+    with pytest.raises(ValueError):
+        await inflate(b"not gzip at all", "gzip")
+    with pytest.raises(ValueError):
+        await inflate(gzip.compress(b"{}" * 1000)[:-12], "gzip")
+
+
+@pytest.mark.asyncio
+async def test_zstd_rejects_truncated_bodies():
+    zstandard = pytest.importorskip("zstandard")
+    data = json.dumps(ITEMS).encode() * 20
+    frames = [
+        zstandard.ZstdCompressor().compress(data),
+        zstandard.ZstdCompressor(write_checksum=True, write_content_size=False).compress(data),
+    ]
+    for frame in frames:
+        assert await inflate(frame, "zstd") == data
+        for cut in (1, 4, len(frame) // 2):
+            with pytest.raises(ValueError):
+                await inflate(frame[:-cut], "zstd")
+    # Concatenated frames form one body
+    assert await inflate(frames[0] + frames[1], "zstd") == data * 2
+    with pytest.raises(ValueError):
+        await inflate(frames[0] + frames[1][:10], "zstd")
+
+
+def test_parse_content_encoding():
+    assert parse_content_encoding(None) == []
+    assert parse_content_encoding("identity") == []
+    assert parse_content_encoding("deflate, GZIP") == ["deflate", "gzip"]
+
+
+def test_compressed_json_ingest(tmp_path, monkeypatch):
+    client, _, session_factory = make_client(tmp_path)
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+    response = client.post("/api/v1/ingest/", content=gzip.compress(json.dumps(READING).encode()), headers=headers)
+    assert response.status_code == 200
+    assert response.json()["sensors_processed"] == 1
+
+    # Codings applied in sequence are undone in reverse
+    body = gzip.compress(zlib.compress(json.dumps(READING).encode()))
+    response = client.post(
+        "/api/v1/ingest/", content=body, headers={**headers, "Content-Encoding": "deflate, gzip"}
+    )
+    assert response.status_code == 200
+    assert count_sensors(session_factory) == 2
+
+    monkeypatch.setattr(settings, "INGEST_MAX_DECOMPRESSED_BYTES", 64)
+    response = client.post("/api/v1/ingest/", content=gzip.compress(b" " * 1000 + b"{}"), headers=headers)
+    assert response.status_code == 413
+
+    response = client.post("/api/v1/ingest/", content=b"garbage", headers=headers)
+    assert response.status_code == 400
+
+
+def test_compressed_ndjson_batch(tmp_path):
+    client, _, session_factory = make_client(tmp_path)
+    body = gzip.compress("\n".join(json.dumps(item) for item in ITEMS).encode())
+
+    response = client.post(
+        "/api/v1/ingest/batch",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+    )
+
+    assert response.status_code == 200
+    assert_per_item_status(response.json())
+    assert count_sensors(session_factory) == 2
+
+
+def test_unsupported_encoding(tmp_path, monkeypatch):
+    monkeypatch.delitem(compression.DECODERS, "zstd", raising=False)
+    client, _, _ = make_client(tmp_path)
+    response = client.post(
+        "/api/v1/ingest/",
+        content=b"\x28\xb5\x2f\xfd",
+        headers={"Content-Type": "application/json", "Content-Encoding": "zstd"},
+    )
+    assert response.status_code == 415
+    assert "gzip" in response.headers["Accept-Encoding"]
@@ -0,0 +1,172 @@
+"""
+Tests for the ingest dead-letter queue, its worker hook and admin endpoint.
+"""
+
+import asyncio
+import itertools
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from aiomqtt import Topic
+from fastapi.testclient import TestClient
+
+from app.api.deps import require_sys_admin
+from app.api.v1.endpoints.dead_letters import get_dead_letter_queue
+from app.ingestion import deadletter
+from app.ingestion.deadletter import DeadLetterQueue
+from app import worker
+from app.main import create_app
+from app.worker import decode_message
+
+
+class FakeStreamRedis:
+    """In-memory stand-in for the Redis Stream commands the queue uses."""
+
+    def __init__(self):
+        self.entries = []
+        self._ids = itertools.count(1)
+
+    async def xadd(self, stream, fields, maxlen=None, approximate=True):
+        entry_id = f"{next(self._ids)}-0"
+        self.entries.append((entry_id, dict(fields)))
+        if maxlen is not None:
+            self.entries = self.entries[-maxlen:]
+        return entry_id
+
+    async def xlen(self, stream):
+        return len(self.entries)
+
+    async def xrange(self, stream, min="-", max="+", count=None):
+        def seq(entry_id):
+            return int(entry_id.lstrip("(").split("-")[0])
+
+        low = 0 if min == "-" else seq(min) + (1 if min.startswith("(") else 0)
+        high = float("inf") if max == "+" else seq(max)
+        found = [e for e in self.entries if low <= seq(e[0]) <= high]
+        return found[:count] if count else found
+
+    async def xdel(self, stream, *ids):
+        before = len(self.entries)
+        self.entries = [e for e in self.entries if e[0] not in ids]
+        return before - len(self.entries)
+
+
+def make_message(topic: str, payload: bytes, content_type=None):
+    return SimpleNamespace(
+        topic=Topic(topic),
+        payload=payload,
+        properties=SimpleNamespace(ContentType=content_type) if content_type else None,
+    )
+
+
+async def reject_reason(message, resolver=None) -> str:
+    queue = DeadLetterQueue(FakeStreamRedis(), stream="dlq", maxlen=100)
+    resolver = resolver or SimpleNamespace(resolve=AsyncMock(return_value="tenant-id"))
+    assert await decode_message(message, resolver, queue) is None
+    (entry,) = await queue.entries()
+    return entry["reason"]
+
+
+@pytest.mark.asyncio
+async def test_rejections_are_dead_lettered_with_reason_codes():
+    device = str(uuid.uuid4())
+    assert await reject_reason(make_message("iot/tenant1", b"{}")) == deadletter.INVALID_TOPIC
+    assert await reject_reason(make_message(f"iot/t/{device}/xml", b"<x/>")) == deadletter.UNSUPPORTED_CODEC
+    assert await reject_reason(
+        make_message(f"iot/t/{device}", b"{}", content_type="text/plain")
+    ) == deadletter.UNSUPPORTED_CODEC
+    assert await reject_reason(make_message(f"iot/t/{device}", b"{not json")) == deadletter.DECODE_ERROR
+
+    invalid = SimpleNamespace(resolve=AsyncMock(side_effect=ValueError("badly formed hexadecimal UUID")))
+    assert await reject_reason(make_message("iot/t/not-a-uuid", b"{}"), invalid) == deadletter.INVALID_DEVICE_ID
+
+    db_down = SimpleNamespace(resolve=AsyncMock(side_effect=ConnectionError("db down")))
+    assert await reject_reason(make_message(f"iot/t/{device}", b"{}"), db_down) == deadletter.RESOLVE_ERROR
+
+
+@pytest.mark.asyncio
+async def test_payload_that_is_not_json_serializable_is_dead_lettered(monkeypatch):
+    # What msgpack yields for a bin value under an integer key
+    binary = SimpleNamespace(name="msgpack", decode=lambda data: {1: b"\x00\xff"})
+    monkeypatch.setattr(worker, "get_codec", lambda name: binary)
+    resolver = SimpleNamespace(resolve=AsyncMock(return_value="tenant-id"))
+    message = make_message(f"iot/t/{uuid.uuid4()}/msgpack", b"\x81\x01\xc4\x02\x00\xff")
+
+    assert await reject_reason(message, resolver) == deadletter.ENCODE_ERROR
+    resolver.resolve.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_binary_payload_and_content_type_survive_round_trip():
+    queue = DeadLetterQueue(FakeStreamRedis(), stream="dlq", maxlen=100)
+    await queue.add("iot/t/d", b"\x00\xff\x10", deadletter.DECODE_ERROR, "bad", "application/cbor")
+
+    (entry,) = await queue.entries()
+    assert entry["payload"] == b"\x00\xff\x10"
+    assert entry["content_type"] == "application/cbor"
+    assert queue.counts == {deadletter.DECODE_ERROR: 1}
+
+
+@pytest.mark.asyncio
+async def test_stream_is_capped():
+    queue = DeadLetterQueue(FakeStreamRedis(), stream="dlq", maxlen=3)
+    for i in range(5):
+        await queue.add(f"iot/t/{i}", b"x", deadletter.INVALID_TOPIC)
+    assert await queue.size() == 3
+
+
+@pytest.mark.asyncio
+async def test_replay_filters_by_reason_deletes_and_keeps_failures():
+    queue = DeadLetterQueue(FakeStreamRedis(), stream="dlq", maxlen=100)
+    for i in range(4):
+        await queue.add(f"iot/t/d{i}", b"{}", deadletter.RESOLVE_ERROR)
+    await queue.add("bad", b"{}", deadletter.INVALID_TOPIC)
+
+    published = []
+
+    async def publish(entry):
+        if entry["topic"] == "iot/t/d2":
+            raise ConnectionError("broker down")
+        published.append(entry["topic"])
+
+    result = await queue.replay(publish, count=10, reason=deadletter.RESOLVE_ERROR, rate=1000)
+
+    assert result == {"replayed": 3, "failed": 1}
+    assert published == ["iot/t/d0", "iot/t/d1", "iot/t/d3"]
+    assert [e["topic"] for e in await queue.entries()] == ["iot/t/d2", "bad"]
+
+
+@pytest.mark.asyncio
+async def test_replay_is_rate_limited():
+    queue = DeadLetterQueue(FakeStreamRedis(), stream="dlq", maxlen=100)
+    for i in range(5):
+        await queue.add(f"iot/t/d{i}", b"{}", deadletter.RESOLVE_ERROR)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await queue.replay(AsyncMock(), count=5, rate=50)
+    assert loop.time() - started >= 0.09
+
+
+def test_admin_endpoint_lists_dead_letters():
+    redis_client = FakeStreamRedis()
+    queue = DeadLetterQueue(redis_client, stream="dlq", maxlen=100)
+    asyncio.run(queue.add("iot/t/d", b"{not json", deadletter.DECODE_ERROR, "json: bad"))
+    asyncio.run(queue.add("iot/t", b"{}", deadletter.INVALID_TOPIC))
+
+    app = create_app()
+    app.dependency_overrides[require_sys_admin] = lambda: SimpleNamespace(id="admin")
+    app.dependency_overrides[get_dead_letter_queue] = lambda: queue
+    client = TestClient(app)
+
+    response = client.get("/api/v1/admin/dead-letters", params={"reason": "decode_error"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 2
+    assert [item["topic"] for item in body["items"]] == ["iot/t/d"]
+    assert body["items"][0]["payload_preview"] == "{not json"
+
+    response = client.get("/api/v1/admin/dead-letters", params={"reason": "nope"})
+    assert response.status_code == 400
@@ -0,0 +1,175 @@
+"""
+Tests for ingest deduplication of redelivered MQTT messages.
+"""
+
+import json
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from aiomqtt import Topic
+
+from app.ingestion.dedup import KEY_PREFIX, BloomFilter, Deduplicator, message_key
+from app.worker import decode_message
+
+
+class FakeRedis:
+    """In-memory `SET NX` with pipelining."""
+
+    def __init__(self):
+        self.keys = {}
+        self.expiry = {}
+        self.set_calls = 0
+
+    async def set(self, key, value, nx=False, ex=None):
+        self.set_calls += 1
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = value
+        self.expiry[key] = ex
+        return True
+
+    def pipeline(self, transaction=True):
+        redis = self
+        calls = []
+
+        class Pipeline:
+            def set(self, *args, **kwargs):
+                calls.append((args, kwargs))
+
+            async def execute(self):
+                return [await redis.set(*a, **kw) for a, kw in calls]
+
+        return Pipeline()
+
+
+def test_message_key_prefers_sequence_number():
+    assert message_key("d1", {"seq": 7, "v": 1}, b"a") == message_key("d1", {"seq": 7, "v": 2}, b"b")
+    # Without a sequence number only an opted-in content hash identifies a message
+    assert message_key("d1", {"v": 1}, b"a") is None
+    assert message_key("d1", {"v": 1}, b"a", hash_payloads=True) != message_key("d1", {"v": 1}, b"b", hash_payloads=True)
+    assert message_key("d1", {"v": 1}, b"a", hash_payloads=True) != message_key("d2", {"v": 1}, b"a", hash_payloads=True)
+
+
+@pytest.mark.asyncio
+async def test_content_hashes_expire_after_the_hash_window():
+    redis = FakeRedis()
+    dedup = Deduplicator(redis, window_seconds=600, capacity=1000, hash_window_seconds=5, cold_seconds=0)
+    hashed = message_key("d1", {"v": 1}, b"a", hash_payloads=True)
+    await dedup.is_duplicate(hashed)
+    await dedup.is_duplicate("d1:s:1")
+    await dedup.flush()
+    assert redis.expiry[KEY_PREFIX + hashed] == 5
+    assert redis.expiry[KEY_PREFIX + "d1:s:1"] == 1200
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+    for i in range(10_000):
+        bloom.add(f"k{i}")
+    assert all(f"k{i}" in bloom for i in range(10_000))
+    false_positives = sum(f"other{i}" in bloom for i in range(10_000))
+    assert false_positives < 300
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_suppressed_and_new_keys_skip_redis():
+    redis = FakeRedis()
+    dedup = Deduplicator(redis, window_seconds=60, capacity=1000, cold_seconds=0)
+
+    assert not await dedup.is_duplicate("d1:s:1")
+    assert not await dedup.is_duplicate("d1:s:2")
+    assert redis.set_calls == 0  # definitely-new keys cost no round trip
+
+    assert await dedup.is_duplicate("d1:s:1")  # still pending → exact hit locally
+    await dedup.flush()
+    assert KEY_PREFIX + "d1:s:2" in redis.keys
+    assert await dedup.is_duplicate("d1:s:2")  # confirmed by Redis
+    assert dedup.metrics()["suppressed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_new_keys_are_claimed_in_redis_while_cold_or_shared():
+    redis = FakeRedis()
+    redis.keys[KEY_PREFIX + "d1:s:1"] = 1  # stored by a predecessor or another worker
+
+    cold = Deduplicator(redis, window_seconds=60, capacity=1000)
+    assert await cold.is_duplicate("d1:s:1")
+    assert not await cold.is_duplicate("d1:s:2")
+    assert KEY_PREFIX + "d1:s:2" in redis.keys and not cold._pending
+
+    shared = Deduplicator(redis, window_seconds=60, capacity=1000, shared=True, cold_seconds=0)
+    assert await shared.is_duplicate("d1:s:2")
+    assert shared.suppressed == 1
+
+
+@pytest.mark.asyncio
+async def test_flush_counts_keys_already_stored_elsewhere():
+    redis = FakeRedis()
+    redis.keys[KEY_PREFIX + "d1:s:1"] = 1
+    dedup = Deduplicator(redis, window_seconds=60, capacity=1000, cold_seconds=0)
+    assert not await dedup.is_duplicate("d1:s:1")
+    assert not await dedup.is_duplicate("d1:s:2")
+    await dedup.flush()
+    assert dedup.metrics()["late_duplicates"] == 1
+
+
+@pytest.mark.asyncio
+async def test_false_positive_is_resolved_by_redis():
+    redis = FakeRedis()
+    dedup = Deduplicator(redis, window_seconds=60, capacity=1000)
+    dedup._current.add("d1:s:9")  # simulate a filter collision
+
+    assert not await dedup.is_duplicate("d1:s:9")
+    assert dedup.false_positives == 1
+    assert await dedup.is_duplicate("d1:s:9")
+
+
+@pytest.mark.asyncio
+async def test_filter_window_rotates():
+    dedup = Deduplicator(FakeRedis(), window_seconds=0, capacity=1000)
+    await dedup.is_duplicate("a")
+    dedup._rotate()
+    dedup._rotate()
+    assert "a" not in dedup._current and "a" not in dedup._previous
+
+
+@pytest.mark.asyncio
+async def test_redis_failure_accepts_suspected_duplicate():
+    redis = FakeRedis()
+    redis.set = AsyncMock(side_effect=ConnectionError("redis down"))
+    dedup = Deduplicator(redis, window_seconds=60, capacity=1000)
+    dedup._current.add("k")
+    assert not await dedup.is_duplicate("k")
+
+
+@pytest.mark.asyncio
+async def test_worker_drops_redelivered_message():
+    device_id = str(uuid.uuid4())
+    resolver = SimpleNamespace(resolve=AsyncMock(return_value="tenant-id"))
+    dedup = Deduplicator(FakeRedis(), window_seconds=60, capacity=1000)
+    message = SimpleNamespace(
+        topic=Topic(f"iot/tenant1/{device_id}"),
+        payload=json.dumps({"seq": 1, "temperature": 21.5}).encode(),
+        properties=None,
+    )
+
+    assert await decode_message(message, resolver, dedup=dedup) is not None
+    assert await decode_message(message, resolver, dedup=dedup) is None
+    assert dedup.suppressed == 1
+
+
+@pytest.mark.asyncio
+async def test_worker_keeps_repeated_readings_without_sequence_number():
+    resolver = SimpleNamespace(resolve=AsyncMock(return_value="tenant-id"))
+    dedup = Deduplicator(FakeRedis(), window_seconds=60, capacity=1000)
+    message = SimpleNamespace(
+        topic=Topic(f"iot/tenant1/{uuid.uuid4()}"),
+        payload=json.dumps({"temperature": 21.5}).encode(),
+        properties=None,
+    )
+
+    assert await decode_message(message, resolver, dedup=dedup) is not None
+    assert await decode_message(message, resolver, dedup=dedup) is not None
+    assert dedup.checked == 0
@@ -0,0 +1,81 @@
+"""
+Tests for batched Redis fan-out of sensor data.
+"""
+
+import json
+
+import pytest
+
+from app.ingestion.fanout import SENSOR_CHANNEL, publish_batch, unpack_events
+from app.worker import build_sensor_row
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def publish(self, channel, message):
+        self.commands.append((channel, message))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        self.redis.published.extend(self.commands)
+        return [1] * len(self.commands)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.round_trips = 0
+        self.published = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def make_rows(count):
+    return [
+        build_sensor_row(f"tenant{i % 3}", f"device{i}", {"value": i})
+        for i in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_batch_is_one_round_trip():
+    redis = FakeRedis()
+    sent = await publish_batch(redis, make_rows(100))
+
+    assert sent == 100
+    assert redis.round_trips == 1
+    assert all(channel == SENSOR_CHANNEL for channel, _ in redis.published)
+
+
+@pytest.mark.asyncio
+async def test_framed_batch_publishes_one_message_per_tenant():
+    redis = FakeRedis()
+    rows = make_rows(30)
+    sent = await publish_batch(redis, rows, framed=True)
+
+    assert sent == 3
+    assert redis.round_trips == 1
+    unpacked = [pair for _, message in redis.published for pair in unpack_events(message)]
+    assert len(unpacked) == 30
+    assert {tenant for tenant, _ in unpacked} == {"tenant0", "tenant1", "tenant2"}
+    assert all(json.loads(event)["tenant_id"] == tenant for tenant, event in unpacked)
+
+
+@pytest.mark.asyncio
+async def test_empty_batch_skips_redis():
+    redis = FakeRedis()
+    assert await publish_batch(redis, []) == 0
+    assert redis.round_trips == 0
+
+
+def test_unpack_plain_event_passes_through():
+    data = json.dumps({"device_id": "d1", "tenant_id": "t1", "payload": {}, "timestamp": "x"})
+    assert unpack_events(data) == [("t1", data)]
+
+
+def test_unpack_rejects_invalid_json():
+    with pytest.raises(ValueError):
+        unpack_events("{not json")
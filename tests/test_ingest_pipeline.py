@@ -0,0 +1,165 @@
+"""
+Tests for the staged ingest pipeline and its backpressure.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from aiomqtt import Client, Topic
+from paho.mqtt.client import MQTTMessage
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.ingestion.batching import BulkWriter
+from app.ingestion.cache import DeviceResolver
+from app.ingestion.pipeline import IngestPipeline, PipelineStage
+from app.worker import ReceiveDiscards, decode_message
+
+
+def make_message(topic: str, payload) -> SimpleNamespace:
+    return SimpleNamespace(topic=Topic(topic), payload=json.dumps(payload).encode())
+
+
+class BlockingWriter:
+    """Writer stand-in whose `add` waits until the test releases it."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.rows = []
+        self.on_flush = None
+        self.pending = 0
+        self.rows_written = 0
+        self.rows_spooled = 0
+        self.spool = None
+
+    async def add(self, row):
+        await self.release.wait()
+        self.rows.append(row)
+
+    async def flush(self):
+        return 0
+
+    async def run(self):
+        await asyncio.Event().wait()
+
+
+async def passthrough_decode(message):
+    return {"device_id": message.topic.value.split("/")[2], "seq": json.loads(message.payload)}
+
+
+async def noop_publish(rows):
+    return None
+
+
+@pytest.mark.asyncio
+async def test_slow_persist_blocks_receive():
+    """Once every queue is full, submitting more messages waits instead of buffering."""
+    writer = BlockingWriter()
+    pipeline = IngestPipeline(passthrough_decode, writer, noop_publish, queue_size=2)
+    pipeline.start()
+
+    accepted = 0
+    for seq in range(50):
+        try:
+            await asyncio.wait_for(pipeline.submit(make_message("iot/t1/d1", seq)), timeout=0.05)
+            accepted += 1
+        except asyncio.TimeoutError:
+            break
+
+    metrics = pipeline.metrics()
+    assert accepted < 50
+    assert metrics["decode"]["depth"] <= metrics["decode"]["capacity"]
+    assert metrics["persist"]["depth"] <= metrics["persist"]["capacity"]
+
+    writer.release.set()
+    await pipeline.stop()
+    assert [row["seq"] for row in writer.rows] == list(range(len(writer.rows)))
+
+
+@pytest.mark.asyncio
+async def test_keyed_stage_keeps_per_key_order():
+    """Concurrent workers never reorder items that share a key."""
+    seen = {}
+
+    async def handler(item):
+        key, seq = item
+        await asyncio.sleep(0.001 * (seq % 3))
+        seen.setdefault(key, []).append(seq)
+
+    stage = PipelineStage("test", handler, concurrency=4, queue_size=10, key=lambda item: item[0])
+    stage.start()
+    for seq in range(30):
+        for key in ("a", "b", "c", "d", "e"):
+            await stage.put((key, seq))
+    await stage.join()
+    await stage.stop()
+
+    assert all(seqs == list(range(30)) for seqs in seen.values())
+    assert stage.metrics()["processed"] == 150
+
+
+@pytest.mark.asyncio
+async def test_stage_counts_handler_errors():
+    async def handler(item):
+        if item % 2:
+            raise ValueError("bad item")
+
+    stage = PipelineStage("test", handler, concurrency=2, queue_size=5)
+    stage.start()
+    for item in range(10):
+        await stage.put(item)
+    await stage.join()
+    await stage.stop()
+
+    assert stage.metrics()["processed"] == 5
+    assert stage.metrics()["errors"] == 5
+
+
+@pytest.mark.asyncio
+async def test_pipeline_persists_and_fans_out():
+    """Messages flow through decode, bulk persistence and fan-out."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    resolver = DeviceResolver(session_factory)
+    writer = BulkWriter(session_factory, batch_size=4, linger_ms=5)
+    published = []
+
+    async def publish(rows):
+        published.extend(rows)
+
+    pipeline = IngestPipeline(
+        lambda message: decode_message(message, resolver), writer, publish,
+        queue_size=8, decode_concurrency=2, persist_concurrency=2,
+    )
+    pipeline.start()
+
+    device_id = str(uuid.uuid4())
+    for seq in range(10):
+        await pipeline.submit(make_message(f"iot/tenant1/{device_id}", {"value": seq}))
+    await pipeline.submit(make_message("iot/tenant1", {"value": 0}))  # invalid topic
+    await pipeline.submit(SimpleNamespace(topic=Topic(f"iot/tenant1/{device_id}"), payload=b"{not json"))
+    await pipeline.stop()
+
+    assert writer.rows_written == 10
+    assert [json.loads(row["payload"])["value"] for row in published] == list(range(10))
+    assert pipeline.metrics()["decode"]["processed"] == 12
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_client_discards_are_counted():
+    """Messages aiomqtt drops on a full receive queue show up in the worker metrics."""
+    discards = ReceiveDiscards()
+    mqtt_logger = logging.getLogger("tests.mqtt_discards")
+    mqtt_logger.addFilter(discards)
+    client = Client("localhost", max_queued_incoming_messages=1, logger=mqtt_logger)
+    for _ in range(3):
+        client._on_message(None, None, MQTTMessage(topic=b"iot/t/d"))
+    assert len(client.messages) == 1 and discards.count == 2
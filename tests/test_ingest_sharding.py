@@ -0,0 +1,130 @@
+"""
+Tests for sharded MQTT consumption, run against an in-process broker stand-in.
+"""
+
+import itertools
+import zlib
+from collections import defaultdict
+from unittest.mock import patch
+
+import pytest
+from aiomqtt import Topic
+
+from app.ingestion.sharding import ShardAssignment, shard_for
+from app import worker
+
+
+class FakeBroker:
+    """
+    Minimal broker: plain subscriptions get every matching message, members of a
+    `$share/<group>/` subscription get one copy per group.
+    """
+
+    def __init__(self, strategy: str = "hash_topic"):
+        self.strategy = strategy
+        self.subscriptions = []
+        self._round_robin = defaultdict(itertools.count)
+
+    def subscribe(self, consumer, topic_filter: str):
+        self.subscriptions.append((topic_filter, consumer))
+
+    def publish(self, topic: str, payload):
+        groups = defaultdict(list)
+        for topic_filter, consumer in self.subscriptions:
+            if topic_filter.startswith("$share/"):
+                _, group, real_filter = topic_filter.split("/", 2)
+                if Topic(topic).matches(real_filter):
+                    groups[group].append(consumer)
+            elif Topic(topic).matches(topic_filter):
+                consumer.deliver(topic, payload)
+
+        for group, members in groups.items():
+            if self.strategy == "hash_topic":
+                pick = zlib.crc32(topic.encode()) % len(members)
+            else:
+                pick = next(self._round_robin[group]) % len(members)
+            members[pick].deliver(topic, payload)
+
+
+class FakeConsumer:
+    """Worker stand-in that applies the shard ownership check like `consume()`."""
+
+    def __init__(self, shard: ShardAssignment):
+        self.shard = shard
+        self.processed = []
+
+    def deliver(self, topic, payload):
+        if self.shard.owns(topic):
+            self.processed.append((topic, payload))
+
+
+def run_fleet(mode: str, workers: int, strategy: str = "hash_topic"):
+    broker = FakeBroker(strategy)
+    consumers = [FakeConsumer(ShardAssignment(i, workers, mode=mode)) for i in range(workers)]
+    for consumer in consumers:
+        for topic_filter in consumer.shard.topic_filters:
+            broker.subscribe(consumer, topic_filter)
+
+    devices = [f"device-{n}" for n in range(25)]
+    for seq in range(20):
+        for device in devices:
+            broker.publish(f"iot/tenant1/{device}", seq)
+    return consumers, len(devices) * 20
+
+
+def assert_partitioned_in_order(consumers, total):
+    owners = defaultdict(set)
+    sequences = defaultdict(list)
+    for index, consumer in enumerate(consumers):
+        for topic, seq in consumer.processed:
+            owners[topic].add(index)
+            sequences[topic].append(seq)
+
+    assert sum(len(c.processed) for c in consumers) == total
+    assert all(len(workers) == 1 for workers in owners.values())
+    assert all(seqs == sorted(seqs) for seqs in sequences.values())
+    assert all(c.processed for c in consumers)
+
+
+def test_hash_mode_partitions_devices_and_keeps_order():
+    consumers, total = run_fleet("hash", workers=3)
+    assert all(c.shard.topic_filters == ["iot/+/+", "iot/+/+/+"] for c in consumers)
+    assert_partitioned_in_order(consumers, total)
+
+
+def test_shared_mode_with_topic_hashing_broker():
+    consumers, total = run_fleet("shared", workers=3)
+    assert all(c.shard.topic_filters[0] == "$share/ingest/iot/+/+" for c in consumers)
+    assert_partitioned_in_order(consumers, total)
+
+
+def test_shared_mode_round_robin_delivers_each_message_once():
+    consumers, total = run_fleet("shared", workers=4, strategy="round_robin")
+    assert sum(len(c.processed) for c in consumers) == total
+
+
+def test_malformed_topics_are_owned_by_first_shard_only():
+    shards = [ShardAssignment(i, 3) for i in range(3)]
+    assert [s.owns("iot/tenant1") for s in shards] == [True, False, False]
+
+
+def test_shard_for_is_stable_and_in_range():
+    assert shard_for("device-1", 8) == shard_for("device-1", 8)
+    assert all(0 <= shard_for(f"d{i}", 8) < 8 for i in range(100))
+
+
+def test_invalid_shard_assignment():
+    with pytest.raises(ValueError):
+        ShardAssignment(3, 3)
+    with pytest.raises(ValueError):
+        ShardAssignment(0, 2, mode="random")
+
+
+def test_launcher_starts_one_process_per_worker():
+    with patch("app.worker.multiprocessing.Process") as process_class:
+        worker.main(["--workers", "3", "--shard-mode", "shared"])
+
+    calls = process_class.call_args_list
+    assert [c.kwargs["args"] for c in calls] == [(0, 3, "shared"), (1, 3, "shared"), (2, 3, "shared")]
+    assert process_class.return_value.start.call_count == 3
+    assert process_class.return_value.join.call_count == 3
@@ -0,0 +1,96 @@
+"""
+Tests for per-device and per-tenant ingest throttling.
+"""
+
+import json
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from aiomqtt import Topic
+
+from app.ingestion.throttle import ADMIT, AGGREGATE, DROP, PlanLimits, Throttle, TokenBuckets
+from app.worker import build_sensor_row, decode_message
+
+LIMITS = {"test": PlanLimits(device_rate=1, device_burst=3, tenant_rate=100, tenant_burst=5)}
+
+
+def test_device_bucket_allows_burst_then_refills():
+    throttle = Throttle(plan_limits=LIMITS)
+    decisions = [throttle.check("t1", "d1", "test", now=0.0) for _ in range(4)]
+    assert decisions == [ADMIT, ADMIT, ADMIT, DROP]
+
+    assert throttle.check("t1", "d1", "test", now=1.0) == ADMIT
+    assert throttle.check("t1", "d1", "test", now=1.0) == DROP
+    assert throttle.metrics()["dropped"] == 2
+
+
+def test_tenant_bucket_limits_many_devices():
+    throttle = Throttle(plan_limits=LIMITS)
+    decisions = [throttle.check("t1", f"d{i}", "test", now=0.0) for i in range(8)]
+    assert decisions.count(ADMIT) == 5
+    # A device rejected by its tenant keeps its own token
+    assert throttle.devices._buckets["d6"][0] == 3
+
+
+def test_limits_come_from_plan():
+    throttle = Throttle()
+    free = sum(throttle.check("t1", "d1", "free", now=0.0) == ADMIT for _ in range(100))
+    pro = sum(throttle.check("t2", "d2", "pro", now=0.0) == ADMIT for _ in range(100))
+    unknown = sum(throttle.check("t3", "d3", "platinum", now=0.0) == ADMIT for _ in range(100))
+    assert (free, pro, unknown) == (10, 50, 10)
+
+
+def test_unknown_tenant_plan_is_admitted():
+    throttle = Throttle(plan_limits=LIMITS)
+    assert all(throttle.check("t1", "d1", None, now=0.0) == ADMIT for _ in range(10))
+
+
+def test_sample_policy_keeps_one_in_n():
+    throttle = Throttle(policy="sample", plan_limits=LIMITS, sample_every=5)
+    decisions = [throttle.check("t1", "d1", "test", now=0.0) for _ in range(3 + 20)]
+    assert decisions[3:].count(ADMIT) == 4
+    assert throttle.sampled == 4
+
+
+def test_aggregate_policy_keeps_latest_row_with_count():
+    throttle = Throttle(policy="aggregate", plan_limits=LIMITS)
+    for _ in range(3):
+        throttle.check("t1", "d1", "test", now=0.0)
+    assert throttle.check("t1", "d1", "test", now=0.0) == AGGREGATE
+
+    for value in (1, 2, 3):
+        throttle.aggregate(build_sensor_row("tenant-id", "d1", {"value": value}))
+
+    (row,) = throttle.drain_aggregates()
+    assert json.loads(row["payload"]) == {"value": 3, "throttled_count": 3}
+    assert throttle.drain_aggregates() == []
+
+
+def test_bucket_memory_is_bounded():
+    buckets = TokenBuckets(max_keys=1000)
+    for i in range(50_000):
+        buckets.take(f"d{i}", rate=1, burst=1, now=0.0)
+    assert len(buckets) == 1000
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        Throttle(policy="queue")
+
+
+@pytest.mark.asyncio
+async def test_worker_drops_flood_before_decoding():
+    device_id = str(uuid.uuid4())
+    resolver = SimpleNamespace(
+        resolve=AsyncMock(return_value="tenant-id"),
+        cached_plan=lambda tenant: "test",
+    )
+    throttle = Throttle(plan_limits=LIMITS)
+    message = SimpleNamespace(topic=Topic(f"iot/tenant1/{device_id}"), payload=b"{}", properties=None)
+
+    rows = [await decode_message(message, resolver, throttle=throttle) for _ in range(10)]
+
+    assert sum(row is not None for row in rows) == 3
+    assert resolver.resolve.await_count == 3
@@ -0,0 +1,218 @@
+"""
+Tests for write-behind (202 Accepted) HTTP ingestion.
+"""
+
+import asyncio
+import itertools
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.api.deps import get_current_user, get_session
+from app.ingestion.readings import build_reading_row
+from app.ingestion.write_behind import (
+    MemoryBuffer,
+    RedisStreamBuffer,
+    WriteBehindFlusher,
+    get_write_behind,
+)
+from app.main import create_app
+from app.models.device import Device
+from app.models.sensor import Sensor
+
+DEVICE = str(uuid.uuid4())
+
+
+class FakeGroupRedis:
+    """In-memory stand-in for the Redis Stream consumer-group commands."""
+
+    def __init__(self):
+        self.entries = {}
+        self.pending = {}  # id → [consumer, delivered at]
+        self.last_delivered = 0
+        self._ids = itertools.count(1)
+        self.clock = 0.0
+
+    async def xgroup_create(self, stream, group, id="0", mkstream=False):
+        pass
+
+    async def xlen(self, stream):
+        return len(self.entries)
+
+    def pipeline(self, transaction=True):
+        redis, calls = self, []
+
+        class Pipeline:
+            def xadd(self, stream, fields):
+                calls.append(fields)
+
+            async def execute(self):
+                for fields in calls:
+                    entry_id = f"{next(redis._ids)}-0"
+                    redis.entries[entry_id] = {k: v.decode() if isinstance(v, bytes) else v for k, v in fields.items()}
+
+        return Pipeline()
+
+    def _deliver(self, ids, consumer):
+        for entry_id in ids:
+            self.pending[entry_id] = [consumer, self.clock]
+        return [(entry_id, self.entries.get(entry_id)) for entry_id in ids]
+
+    async def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        (stream, start), = streams.items()
+        if start == ">":
+            ids = [i for i in self.entries if int(i.split("-")[0]) > self.last_delivered][:count]
+            if ids:
+                self.last_delivered = int(ids[-1].split("-")[0])
+        else:
+            ids = [i for i, (owner, _) in self.pending.items() if owner == consumer][:count]
+        return [[stream, self._deliver(ids, consumer)]] if ids else []
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, start_id="0-0", count=None):
+        ids = [i for i, (_, at) in self.pending.items() if (self.clock - at) * 1000 >= min_idle_time][:count]
+        return ["0-0", self._deliver(ids, consumer), []]
+
+    async def xack(self, stream, group, *ids):
+        for entry_id in ids:
+            self.pending.pop(entry_id, None)
+
+    async def xdel(self, stream, *ids):
+        for entry_id in ids:
+            self.entries.pop(entry_id, None)
+
+
+def make_database(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'write_behind.db'}")
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+            await session.commit()
+
+    asyncio.run(setup())
+    return engine, session_factory
+
+
+async def count_sensors(session_factory) -> int:
+    async with session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(Sensor))).scalar_one()
+
+
+def reading(value=1.0):
+    return build_reading_row({"device_id": DEVICE, "sensor_type": "temperature", "value": value})
+
+
+def test_ingest_returns_202_and_flushes_later(tmp_path):
+    _, session_factory = make_database(tmp_path)
+    flusher = WriteBehindFlusher(MemoryBuffer(max_rows=4), session_factory, linger_ms=0)
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="gateway")
+    app.dependency_overrides[get_write_behind] = lambda: flusher
+    client = TestClient(app)
+
+    params = {"device_id": DEVICE, "sensor_type": "temperature", "value": 21.5, "unit": "C"}
+    response = client.post("/api/v1/ingest/ingest", params=params)
+    assert response.status_code == 202
+    assert response.json()["status"] == "accepted"
+
+    beacon = {"deviceId": DEVICE, "timestamp": 1, "batteryPercent": 80, "lteRssi": -70, "wifiRssi": -50}
+    assert client.post("/api/v1/ingest/root/v1/health", json=beacon).status_code == 202
+
+    # Nothing is written until the flusher runs
+    assert asyncio.run(count_sensors(session_factory)) == 0
+    response = client.post("/api/v1/ingest/root/v1/health", json=beacon)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    # Validation still happens before buffering
+    params["device_id"] = str(uuid.uuid4())
+    assert client.post("/api/v1/ingest/ingest", params=params).status_code == 404
+
+    assert asyncio.run(flusher.flush_once()) == 4
+    assert asyncio.run(count_sensors(session_factory)) == 4
+
+
+@pytest.mark.asyncio
+async def test_memory_flusher_metrics_and_retry(tmp_path):
+    engine, session_factory = await asyncio.to_thread(make_database, tmp_path)
+    flusher = WriteBehindFlusher(MemoryBuffer(max_rows=10), session_factory, batch_size=2, linger_ms=0)
+    assert await flusher.enqueue([reading(i) for i in range(3)])
+
+    def broken_factory():
+        raise RuntimeError("database down")
+
+    flusher.session_factory = broken_factory
+    with pytest.raises(RuntimeError):
+        await flusher.flush_once()
+    assert await flusher.buffer.depth() == 3  # returned to the buffer
+
+    flusher.session_factory = session_factory
+    assert await flusher.flush_once() == 2
+    await flusher.stop()  # drains the rest
+    assert await count_sensors(session_factory) == 3
+
+    metrics = await flusher.metrics()
+    assert metrics["depth"] == 0
+    assert metrics["flushed_rows"] == 3
+    assert metrics["flushes"] == 2
+    assert metrics["errors"] == 1
+    assert metrics["max_flush_latency_ms"] >= metrics["last_flush_latency_ms"] >= 0
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_redis_stream_survives_a_crashed_flusher(tmp_path):
+    engine, session_factory = await asyncio.to_thread(make_database, tmp_path)
+    redis = FakeGroupRedis()
+    crashed = RedisStreamBuffer(redis, consumer="api-1", max_rows=3)
+    assert await crashed.put([reading(1), reading(2)])
+    assert not await crashed.put([reading(3), reading(4)])  # over capacity
+
+    # First process takes the rows, then dies before committing
+    ids, entries = await crashed.take(10, timeout=0)
+    assert len(entries) == 2 and redis.pending
+
+    redis.clock = 120.0
+    survivor = WriteBehindFlusher(
+        RedisStreamBuffer(redis, consumer="api-2", claim_idle_seconds=60), session_factory, backend="redis"
+    )
+    assert await survivor.flush_once() == 2
+    assert await count_sensors(session_factory) == 2
+    assert redis.entries == {} and redis.pending == {}
+
+    # A retried batch that was already committed is skipped by id
+    row = reading(5)
+    await survivor.enqueue([row])
+    async with session_factory() as session:
+        session.add(Sensor(**row))
+        await session.commit()
+    assert await survivor.flush_once() == 1
+    assert await count_sensors(session_factory) == 3
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_redis_stream_retries_own_failed_batch():
+    redis = FakeGroupRedis()
+    buffer = RedisStreamBuffer(redis, consumer="api-1")
+    await buffer.put([reading(1)])
+    token, _ = await buffer.take(10, timeout=0)
+    await buffer.nack(token)
+
+    retry_token, entries = await buffer.take(10, timeout=0)
+    assert retry_token == token and len(entries) == 1
+    await buffer.ack(retry_token)
+    assert await buffer.depth() == 0
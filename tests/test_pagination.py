@@ -0,0 +1,109 @@
+"""
+Tests for keyset (cursor) pagination of sensor history.
+"""
+
+import asyncio
+import json
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.api.deps import get_current_user, get_session
+from app.db.pagination import decode_cursor, encode_cursor, iter_keyset_pages, keyset_page
+from app.main import create_app
+from app.models.device import Device
+from app.models.sensor import Sensor, SensorData
+from tests.test_rollups import DEVICE, T0, make_database
+
+
+def test_cursor_round_trip():
+    row_id = uuid.uuid4()
+    cursor = encode_cursor(T0, row_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (T0, row_id)
+    for bad in ("", "not-a-cursor", encode_cursor(T0, row_id)[:-3], "WzFd"):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+async def seed_payloads(session_factory, count, same_timestamp_every=1):
+    """`count` sensor_data rows; groups of `same_timestamp_every` share a timestamp."""
+    async with session_factory() as session:
+        for i in range(count):
+            session.add(SensorData(
+                tenant_id="t1",
+                device_id=DEVICE,
+                payload=json.dumps({"seq": i}),
+                timestamp=T0 + timedelta(seconds=i // same_timestamp_every),
+            ))
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_pages_cover_every_row_once_including_timestamp_ties(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    await seed_payloads(session_factory, 25, same_timestamp_every=4)
+    statement = select(SensorData).where(SensorData.device_id == DEVICE)
+
+    seen, cursor = [], None
+    async with session_factory() as session:
+        while True:
+            rows, cursor = await keyset_page(session, statement, SensorData, cursor, 7)
+            seen.extend(rows)
+            if cursor is None:
+                break
+    assert len(seen) == 25
+    assert len({row.id for row in seen}) == 25
+    keys = [(row.timestamp, row.id.hex) for row in seen]
+    assert keys == sorted(keys, reverse=True)
+
+    async with session_factory() as session:
+        pages = [page async for page in iter_keyset_pages(session, statement, SensorData, page_size=10)]
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sorted(json.loads(row.payload)["seq"] for row in pages[0][:4]) == [0, 1, 2, 3]
+    assert pages[0][0].timestamp == T0 and pages[-1][-1].timestamp == T0 + timedelta(seconds=6)
+    await engine.dispose()
+
+
+def test_history_endpoints_return_and_accept_cursors(tmp_path):
+    engine, session_factory = asyncio.run(make_database(tmp_path))
+
+    async def seed():
+        await seed_payloads(session_factory, 5)
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+            for i in range(5):
+                session.add(Sensor(device_id=DEVICE, sensor_type="temperature", value=float(i),
+                                   timestamp=T0 + timedelta(seconds=i)))
+            await session.commit()
+
+    asyncio.run(seed())
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="u1", tenant_id="t1")
+    client = TestClient(app)
+
+    url = f"/api/v1/devices/{DEVICE}/sensor-data"
+    first = client.get(url, params={"limit": 3}).json()
+    assert [json.loads(row["payload"])["seq"] for row in first["data"]] == [4, 3, 2]
+    second = client.get(url, params={"limit": 3, "cursor": first["next_cursor"]}).json()
+    assert [json.loads(row["payload"])["seq"] for row in second["data"]] == [1, 0]
+    assert second["next_cursor"] is None
+    assert client.get(url, params={"cursor": "garbage"}).status_code == 400
+
+    url = f"/api/v1/ingest/sensors/{DEVICE}"
+    response = client.get(url, params={"limit": 4})
+    assert [row["value"] for row in response.json()] == [4.0, 3.0, 2.0, 1.0]
+    response = client.get(url, params={"limit": 4, "cursor": response.headers["X-Next-Cursor"]})
+    assert [row["value"] for row in response.json()] == [0.0]
+    assert "X-Next-Cursor" not in response.headers
+    asyncio.run(engine.dispose())
@@ -0,0 +1,69 @@
+"""
+Tests for time-range partitioning of the sensor tables.
+"""
+
+from datetime import date
+
+import pytest
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.schema import CreateTable
+from sqlmodel import SQLModel
+
+from app.db.partitions import PartitionManager, parse_partition, partition_for, plan_partitions
+from app.models.sensor import Sensor, SensorData
+
+
+def test_postgresql_tables_are_range_partitioned_on_timestamp():
+    for table in (Sensor.__table__, SensorData.__table__):
+        ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+        assert "PARTITION BY RANGE (timestamp)" in ddl
+        assert [column.name for column in table.primary_key.columns] == ["id", "timestamp"]
+
+
+def test_sqlite_tables_stay_plain():
+    ddl = str(CreateTable(Sensor.__table__).compile(dialect=sqlite.dialect()))
+    assert "PARTITION" not in ddl
+
+
+def test_daily_and_weekly_partition_bounds():
+    assert partition_for("sensors", date(2025, 1, 10), "day") == ("sensors_p20250110", date(2025, 1, 10), date(2025, 1, 11))
+    # 2025-01-10 is a Friday; weeks start on Monday
+    assert partition_for("sensors", date(2025, 1, 10), "week") == ("sensors_p20250106", date(2025, 1, 6), date(2025, 1, 13))
+    assert parse_partition("sensors", "sensors_p20250106", "week").end == date(2025, 1, 13)
+    assert parse_partition("sensors", "sensors_default", "day") is None
+    assert parse_partition("sensors", "sensor_data_p20250106", "day") is None
+
+
+def test_plan_creates_ahead_and_expires_old():
+    existing = ["sensors_default", "sensors_p20250101", "sensors_p20250108", "sensors_p20250110", "sensors_p20250111"]
+    to_create, to_expire = plan_partitions(
+        "sensors", existing, date(2025, 1, 10), interval="day", premake=3, retention_days=2
+    )
+    assert [p.name for p in to_create] == ["sensors_p20250112", "sensors_p20250113"]
+    # Only partitions entirely before the cutoff (2025-01-08) expire
+    assert [p.name for p in to_expire] == ["sensors_p20250101"]
+
+
+def test_plan_keeps_everything_without_retention():
+    _, to_expire = plan_partitions("sensors", ["sensors_p20000101"], date(2025, 1, 10), retention_days=0)
+    assert to_expire == []
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        PartitionManager(None, interval="month")
+    with pytest.raises(ValueError):
+        PartitionManager(None, retention_action="archive")
+
+
+@pytest.mark.asyncio
+async def test_maintenance_is_a_no_op_on_sqlite(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'partitions.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    manager = PartitionManager(engine, retention_days=1)
+    assert not manager.enabled
+    assert await manager.maintain() == {}
+    await engine.dispose()
@@ -0,0 +1,119 @@
+"""
+Tests for the in-memory ring buffers of recent readings.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_current_user, get_session
+from app.ingestion import recent as recent_module
+from app.ingestion.readings import insert_readings, readings_committed
+from app.ingestion.recent import RecentBuffers, SeriesRing, to_epoch
+from app.main import create_app
+from app.models.device import Device
+from tests.test_rollups import DEVICE, T0, make_database, reading
+
+
+@pytest.fixture
+def buffers(monkeypatch):
+    buffers = RecentBuffers(series_points=8, max_points=20)
+    buffers.set_live(True)
+    monkeypatch.setattr(recent_module, "_buffers", buffers)
+    return buffers
+
+
+def test_ring_overwrites_oldest_and_sorts_late_readings():
+    ring = SeriesRing(4, covered_since=0.0)
+    for epoch in (1.0, 2.0, 4.0, 3.0):
+        assert ring.append(epoch, epoch * 10)
+    assert ring.window(0.0, 10.0) == ([1.0, 2.0, 3.0, 4.0], [10.0, 20.0, 30.0, 40.0])
+
+    assert not ring.append(5.0, 50.0)
+    assert ring.covered_since > 1.0
+    assert ring.window(2.0, 5.0) == ([2.0, 3.0, 4.0], [20.0, 30.0, 40.0])
+    assert ring.window(0.0, 6.0)[0] == [2.0, 3.0, 4.0, 5.0]
+
+
+def test_coverage_misses_and_lru_eviction(buffers):
+    created = T0
+    buffers.add(DEVICE, "temperature", T0 - timedelta(minutes=1), 1.0, now=created)  # before the buffer existed
+    for i in range(5):
+        buffers.add(DEVICE, "temperature", T0 + timedelta(minutes=i), float(i), now=created)
+    buffers.add_event({"device_id": DEVICE, "payload": {"humidity": 40}, "timestamp": "2025-01-10T12:02:00+00:00"})
+
+    assert buffers.query(DEVICE, "temperature", T0 - timedelta(minutes=5), T0 + timedelta(hours=1)) is None
+    assert buffers.query(DEVICE, "temperature", T0, T0 + timedelta(minutes=3)) == (
+        [to_epoch(T0 + timedelta(minutes=i)) for i in range(3)], [0.0, 1.0, 2.0]
+    )
+    assert buffers.query(DEVICE, "humidity", T0, T0 + timedelta(hours=1))[1] == [40.0]
+    # Covered but never reported: an empty answer, not a miss
+    assert buffers.query(DEVICE, "co2", T0, T0 + timedelta(hours=1)) == ([], [])
+    assert buffers.query("other", "temperature", T0, T0 + timedelta(hours=1)) is None
+
+    # Filling the ring moves the temperature coverage past what was overwritten
+    for i in range(5, 10):
+        buffers.add(DEVICE, "temperature", T0 + timedelta(minutes=i), float(i), now=created)
+    assert buffers.query(DEVICE, "temperature", T0, T0 + timedelta(hours=1)) is None
+    assert buffers.query(DEVICE, "temperature", T0 + timedelta(minutes=2), T0 + timedelta(hours=1))[1] == [
+        float(i) for i in range(2, 10)
+    ]
+
+    # 9 readings held; 12 more for two other devices push the least recently used out
+    for device_id in ("a", "b"):
+        for i in range(6):
+            buffers.add(device_id, "temperature", T0 + timedelta(minutes=i), float(i), now=created)
+    metrics = buffers.metrics()
+    assert metrics["evictions"] == 1 and metrics["devices"] == 2 and metrics["points"] == 12
+    assert metrics["hits"] == 4 and metrics["misses"] == 3
+
+    buffers.set_live(False)
+    assert buffers.metrics()["points"] == 0
+    assert buffers.query("a", "temperature", T0, T0 + timedelta(hours=1)) is None
+
+
+def test_recent_endpoint_and_aggregates_answer_from_memory(tmp_path, buffers):
+    engine, session_factory = asyncio.run(make_database(tmp_path))
+    now = datetime.utcnow()
+
+    async def seed():
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+            # Written through this process, so it reaches the buffers too
+            inserted = await insert_readings(session, [reading(float(i), now - timedelta(minutes=i)) for i in range(20)])
+            await session.commit()
+        await readings_committed(inserted)
+
+    buffers.series_points, buffers.max_points = 64, 1000
+    buffers.add(DEVICE, "temperature", now - timedelta(hours=1), 0.0, now=now - timedelta(hours=1))
+    asyncio.run(seed())
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="u1", tenant_id="t1")
+    client = TestClient(app)
+    url = f"/api/v1/devices/{DEVICE}/sensor-data"
+
+    body = client.get(f"{url}/recent", params={"sensor_type": "temperature", "minutes": 5}).json()
+    assert body["source"] == "memory" and body["value"] == [4.0, 3.0, 2.0, 1.0, 0.0]
+    assert body["timestamp"] == sorted(body["timestamp"])
+
+    aggregate = client.get(f"{url}/aggregate", params={
+        "sensor_type": "temperature", "bucket": "30s", "aggregates": "count,p50",
+        "from_time": (now - timedelta(minutes=30)).isoformat(), "to_time": (now + timedelta(seconds=1)).isoformat(),
+    }).json()
+    assert aggregate["source"] == "memory" and sum(aggregate["count"]) == 20
+
+    # Without the subscription the database answers the same
+    buffers.set_live(False)
+    fallback = client.get(f"{url}/recent", params={"sensor_type": "temperature", "minutes": 5}).json()
+    assert fallback["source"] == "database" and fallback["value"] == body["value"]
+    asyncio.run(engine.dispose())
@@ -0,0 +1,208 @@
+"""
+Tests for incrementally maintained 1m/1h/1d sensor rollups.
+"""
+
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.api.deps import get_current_user, get_session
+from app.ingestion.batching import BulkWriter
+from app.ingestion.readings import build_reading_row, insert_readings
+from app.ingestion.rollups import RollupAccumulator, RollupRepairer, extract_readings, recompute_rollups
+from app.main import create_app
+from app.models.device import Device
+from app.models.sensor import Sensor, SensorRollup
+
+DEVICE = str(uuid.uuid4())
+T0 = datetime(2025, 1, 10, 12, 0, 0)
+
+
+async def make_database(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'rollups.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    return engine, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def reading(value, timestamp, sensor_type="temperature"):
+    row = build_reading_row({"device_id": DEVICE, "sensor_type": sensor_type, "value": value})
+    row["timestamp"] = timestamp
+    return row
+
+
+async def rollups(session_factory, resolution):
+    async with session_factory() as session:
+        result = await session.execute(
+            select(SensorRollup).where(SensorRollup.resolution == resolution).order_by(SensorRollup.bucket)
+        )
+        return [
+            (r.bucket, r.count, r.min_value, r.max_value, r.sum_value, r.last_value)
+            for r in result.scalars().all()
+        ]
+
+
+def test_extract_readings_from_payloads():
+    assert list(extract_readings({"sensor_data": [{"sensor_type": "t", "value": 1}, {"value": 2}]})) == [("t", 1.0)]
+    assert list(extract_readings({"temperature": 21.5, "on": True, "seq": 7, "timestamp": 1, "label": "x"})) == [
+        ("temperature", 21.5)
+    ]
+    assert list(extract_readings([1, 2])) == []
+
+
+def test_accumulator_folds_all_resolutions():
+    acc = RollupAccumulator()
+    acc.add("d", "t", 3.0, T0 + timedelta(seconds=50))
+    acc.add("d", "t", 1.0, T0 + timedelta(seconds=10))  # out of order: not the last value
+    acc.add("d", "t", 5.0, T0 + timedelta(minutes=1))
+    rows = {(row["resolution"], row["bucket"]): row for row in acc.rows()}
+
+    assert len(rows) == 4
+    minute = rows[("1m", T0)]
+    assert (minute["count"], minute["min_value"], minute["max_value"], minute["sum_value"], minute["last_value"]) == (
+        2, 1.0, 3.0, 4.0, 3.0
+    )
+    day = rows[("1d", T0.replace(hour=0))]
+    assert (day["count"], day["sum_value"], day["last_value"]) == (3, 9.0, 5.0)
+
+
+@pytest.mark.asyncio
+async def test_writes_update_rollups_incrementally(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    async with session_factory() as session:
+        await insert_readings(session, [reading(2.0, T0), reading(4.0, T0 + timedelta(seconds=30))])
+        await session.commit()
+    async with session_factory() as session:
+        # A later batch, including a late reading for an earlier minute
+        await insert_readings(session, [reading(1.0, T0 + timedelta(seconds=5)), reading(9.0, T0 + timedelta(hours=1))])
+        await session.commit()
+
+    assert await rollups(session_factory, "1m") == [
+        (T0, 3, 1.0, 4.0, 7.0, 4.0),
+        (T0 + timedelta(hours=1), 1, 9.0, 9.0, 9.0, 9.0),
+    ]
+    assert [row[:2] for row in await rollups(session_factory, "1h")] == [(T0, 3), (T0 + timedelta(hours=1), 1)]
+    assert await rollups(session_factory, "1d") == [(T0.replace(hour=0), 4, 1.0, 9.0, 16.0, 9.0)]
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_replayed_batches_are_not_counted_twice(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    writer = BulkWriter(session_factory, use_copy=False)
+    row = {
+        "id": uuid.uuid4(),
+        "tenant_id": "t1",
+        "device_id": DEVICE,
+        "payload": json.dumps({"sensor_data": [{"sensor_type": "temperature", "value": 20.0}]}),
+        "timestamp": T0,
+        "created_at": T0,
+    }
+    await writer.write_rows([row])
+    await writer.write_rows([row], ignore_conflicts=True)  # spool replay after an ambiguous failure
+
+    assert await rollups(session_factory, "1m") == [(T0, 1, 20.0, 20.0, 20.0, 20.0)]
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_recompute_repairs_drifted_buckets(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    async with session_factory() as session:
+        await insert_readings(session, [reading(float(i), T0 + timedelta(minutes=i)) for i in range(90)])
+        await session.commit()
+    expected = {resolution: await rollups(session_factory, resolution) for resolution in ("1m", "1h", "1d")}
+
+    async with session_factory() as session:
+        # A row written behind the rollups' back, and a drifted bucket
+        session.add(Sensor(**reading(100.0, T0 + timedelta(minutes=30, seconds=1))))
+        await session.execute(update(SensorRollup).where(SensorRollup.resolution == "1h").values(count=0))
+        await session.commit()
+
+    async with session_factory() as session:
+        counts = await recompute_rollups(session, T0 + timedelta(minutes=20), T0 + timedelta(minutes=65, seconds=30))
+        await session.commit()
+
+    # Existing buckets are overwritten; the open minute, hour and day are left alone
+    assert counts == {"1m": 65, "1h": 1, "1d": 0}
+    minutes = await rollups(session_factory, "1m")
+    assert minutes[30] == (T0 + timedelta(minutes=30), 2, 30.0, 100.0, 130.0, 100.0)
+    assert len(minutes) == len(expected["1m"])
+    assert [row[1] for row in await rollups(session_factory, "1h")] == [61, 0]
+    assert (await rollups(session_factory, "1d"))[0][1] == 90
+
+    async with session_factory() as session:
+        counts = await recompute_rollups(session, T0, T0 + timedelta(hours=12))
+        await session.commit()
+    assert counts == {"1m": 90, "1h": 2, "1d": 1}
+    assert (await rollups(session_factory, "1d"))[0][1] == 91
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_repair_stops_short_of_buckets_still_being_written(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    async with session_factory() as session:
+        await insert_readings(session, [reading(float(i), T0 + timedelta(minutes=i)) for i in range(90)])
+        await session.commit()
+
+    repairer = RollupRepairer(session_factory, lookback_minutes=120, linger_seconds=60)
+    # 13:30:30 less a minute's linger: minute 13:29 may still receive rows
+    counts = await repairer.repair_once(now=T0 + timedelta(minutes=90, seconds=30))
+    assert counts == {"1m": 89, "1h": 1, "1d": 0}
+    assert [row[1] for row in await rollups(session_factory, "1m")] == [1] * 90
+    await engine.dispose()
+
+
+def test_rollup_query_endpoint(tmp_path):
+    engine, session_factory = asyncio.run(make_database(tmp_path))
+
+    async def seed():
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+            await insert_readings(session, [
+                reading(1.0, T0), reading(3.0, T0 + timedelta(minutes=5)), reading(50.0, T0, "humidity")
+            ])
+            await session.commit()
+
+    asyncio.run(seed())
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    user = SimpleNamespace(id="u1", tenant_id="t1")
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: user
+    client = TestClient(app)
+    url = f"/api/v1/devices/{DEVICE}/sensor-data/rollups"
+    window = {"from_time": "2025-01-10T00:00:00Z", "to_time": "2025-01-11T00:00:00Z"}
+
+    body = client.get(url, params={**window, "resolution": "1h"}).json()
+    assert body["resolution"] == "1h"
+    assert body["series"] == [
+        {"sensor_type": "humidity", "bucket": ["2025-01-10T12:00:00"], "count": [1], "min": [50.0],
+         "max": [50.0], "avg": [50.0], "sum": [50.0], "last": [50.0]},
+        {"sensor_type": "temperature", "bucket": ["2025-01-10T12:00:00"], "count": [2], "min": [1.0],
+         "max": [3.0], "avg": [2.0], "sum": [4.0], "last": [3.0]},
+    ]
+
+    body = client.get(url, params={**window, "resolution": "1m", "sensor_type": "temperature"}).json()
+    assert body["series"][0]["bucket"] == ["2025-01-10T12:00:00", "2025-01-10T12:05:00"]
+
+    too_wide = {"from_time": "2020-01-01T00:00:00", "to_time": "2025-01-01T00:00:00", "resolution": "1m"}
+    assert client.get(url, params=too_wide).status_code == 400
+    assert client.get(url, params={"resolution": "5m"}).status_code == 422
+
+    user.tenant_id = "t2"
+    assert client.get(url, params=window).status_code == 404
+    asyncio.run(engine.dispose())
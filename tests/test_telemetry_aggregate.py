@@ -0,0 +1,178 @@
+"""
+Tests for time-bucket aggregation of device telemetry.
+"""
+
+import asyncio
+import json
+import random
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_current_user, get_session
+from app.ingestion.readings import insert_readings
+from app.main import create_app
+from app.models.device import Device
+from app.models.sensor import SensorData
+from app.services.telemetry import (
+    aggregate_python,
+    aggregate_telemetry,
+    parse_aggregates,
+    parse_width,
+    pg_aggregate_sql,
+    rollup_resolution,
+)
+from tests.test_rollups import DEVICE, T0, make_database, reading
+
+
+def test_parse_width_and_aggregates():
+    assert [parse_width(spec) for spec in ("300", "30s", "5m", "2h", "1d")] == [300, 30, 300, 7200, 86400]
+    assert parse_aggregates("avg, P95,count,avg,p99.9") == ["avg", "p95", "count", "p99.9"]
+    for bad in ("0", "5w", "-1m", "m"):
+        with pytest.raises(ValueError):
+            parse_width(bad)
+    for bad in ("median", "p101", " , "):
+        with pytest.raises(ValueError):
+            parse_aggregates(bad)
+
+
+def test_python_aggregation_matches_percentile_cont():
+    epochs = [0, 10, 20, 30, 60, 61]
+    values = [4.0, 1.0, 3.0, 2.0, 10.0, 20.0]
+    columns = aggregate_python(epochs, values, 60, ["count", "avg", "min", "max", "sum", "p50", "p90"])
+    assert columns == {
+        "bucket": [0, 60],
+        "count": [4, 2],
+        "avg": [2.5, 15.0],
+        "min": [1.0, 10.0],
+        "max": [4.0, 20.0],
+        "sum": [10.0, 30.0],
+        "p50": [2.5, 15.0],
+        "p90": [pytest.approx(3.7), pytest.approx(19.0)],
+    }
+
+
+def test_numpy_aggregation_matches_python():
+    pytest.importorskip("numpy")
+    from app.services.telemetry import aggregate_numpy
+
+    rng = random.Random(7)
+    epochs = [rng.uniform(0, 3600) for _ in range(2000)]
+    values = [rng.gauss(20, 5) for _ in range(2000)]
+    names = ["count", "avg", "min", "max", "sum", "p5", "p50", "p99"]
+    expected = aggregate_python(epochs, values, 300, names)
+    actual = aggregate_numpy(epochs, values, 300, names)
+    assert actual["bucket"] == expected["bucket"]
+    for name in names:
+        assert actual[name] == pytest.approx(expected[name])
+
+
+def test_rollups_serve_whole_minute_widths_without_percentiles():
+    assert rollup_resolution(300, ["avg", "max"]) == "1m"
+    assert rollup_resolution(7200, ["count"]) == "1h"
+    assert rollup_resolution(86400 * 7, ["sum"]) == "1d"
+    assert rollup_resolution(90, ["avg"]) is None
+    assert rollup_resolution(300, ["avg", "p95"]) is None
+
+
+def test_postgresql_query_pushes_percentiles_down():
+    sql = pg_aggregate_sql(["avg", "count", "p95"])
+    assert "avg(value) AS a0" in sql and "count(*) AS a1" in sql
+    assert "percentile_cont(0.95) WITHIN GROUP (ORDER BY value) AS a2" in sql
+
+
+@pytest.mark.asyncio
+async def test_raw_and_rollup_sources_agree(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    async with session_factory() as session:
+        await insert_readings(session, [reading(float(i), T0 + timedelta(seconds=20 * i)) for i in range(30)])
+        session.add(SensorData(
+            tenant_id="t1",
+            device_id=DEVICE,
+            payload=json.dumps({"sensor_data": [{"sensor_type": "temperature", "value": 100.0}]}),
+            timestamp=T0 + timedelta(seconds=5),
+        ))
+        await session.commit()
+
+    end = T0 + timedelta(hours=1)
+    async with session_factory() as session:
+        raw = await aggregate_telemetry(session, DEVICE, "temperature", T0, end, 150, ["count", "max", "p50"])
+        rolled = await aggregate_telemetry(session, DEVICE, "temperature", T0, end, 300, ["count", "avg", "max"])
+
+    assert raw["source"] in ("numpy", "python")
+    assert raw["bucket"][:2] == ["2025-01-10T12:00:00", "2025-01-10T12:02:30"]
+    # The payload reading lands in the first bucket alongside 0, 20, ... 140
+    assert raw["count"][:2] == [9, 7]
+    assert raw["max"][0] == 100.0
+    assert raw["p50"][0] == 4.0
+
+    assert rolled["source"] == "rollups_1m"
+    # Only rows written through insert_readings are in the rollups
+    assert rolled["bucket"] == ["2025-01-10T12:00:00", "2025-01-10T12:05:00"]
+    assert rolled["count"] == [15, 15]
+    assert rolled["avg"] == [7.0, 22.0]
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_rollups_take_unaligned_edges_from_raw_readings(tmp_path):
+    engine, session_factory = await make_database(tmp_path)
+    async with session_factory() as session:
+        await insert_readings(session, [reading(float(i), T0 + timedelta(seconds=20 * i)) for i in range(60)])
+        await session.commit()
+
+    # 12:00:30 – 12:10:30 cuts into the first and last minute rollups
+    start, end = T0 + timedelta(seconds=30), T0 + timedelta(seconds=630)
+    async with session_factory() as session:
+        rolled = await aggregate_telemetry(session, DEVICE, "temperature", start, end, 300, ["count", "min", "max"])
+
+    assert rolled["source"] == "rollups_1m"
+    assert rolled["bucket"] == ["2025-01-10T12:00:00", "2025-01-10T12:05:00", "2025-01-10T12:10:00"]
+    assert rolled["count"] == [13, 15, 2]
+    assert (rolled["min"], rolled["max"]) == ([2.0, 15.0, 30.0], [14.0, 29.0, 31.0])
+    await engine.dispose()
+
+
+def test_aggregate_endpoint(tmp_path):
+    engine, session_factory = asyncio.run(make_database(tmp_path))
+
+    async def seed():
+        async with session_factory() as session:
+            session.add(Device(id=uuid.UUID(DEVICE), name="gateway", tenant_id="t1"))
+            await insert_readings(session, [
+                reading(1.0, T0), reading(3.0, T0 + timedelta(seconds=40)), reading(50.0, T0, "humidity")
+            ])
+            await session.commit()
+
+    asyncio.run(seed())
+
+    async def override_session():
+        async with session_factory() as session:
+            yield session
+
+    user = SimpleNamespace(id="u1", tenant_id="t1")
+    app = create_app()
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_current_user] = lambda: user
+    client = TestClient(app)
+    url = f"/api/v1/devices/{DEVICE}/sensor-data/aggregate"
+    window = {"from_time": "2025-01-10T12:00:00Z", "to_time": "2025-01-10T13:00:00Z", "sensor_type": "temperature"}
+
+    body = client.get(url, params={**window, "bucket": "30s", "aggregates": "avg,count,p50"}).json()
+    assert body["bucket_seconds"] == 30
+    assert body["bucket"] == ["2025-01-10T12:00:00", "2025-01-10T12:00:30"]
+    assert (body["avg"], body["count"], body["p50"]) == ([1.0, 3.0], [1, 1], [1.0, 3.0])
+
+    body = client.get(url, params={**window, "bucket": "1h", "aggregates": "min,max"}).json()
+    assert (body["source"], body["min"], body["max"]) == ("rollups_1h", [1.0], [3.0])
+
+    assert client.get(url, params={**window, "aggregates": "median"}).status_code == 400
+    assert client.get(url, params={**window, "bucket": "1s", "from_time": "2025-01-01T00:00:00"}).status_code == 400
+    assert client.get(url, params={"bucket": "5m"}).status_code == 422
+
+    user.tenant_id = "t2"
+    assert client.get(url, params=window).status_code == 404
+    asyncio.run(engine.dispose())